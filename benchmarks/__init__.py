@@ -0,0 +1,4 @@
+"""
+性能基准
+旧实现对照、吞吐与内存测量，以及合成数据生成；不属于生产代码路径
+"""
@@ -0,0 +1,156 @@
+"""
+数据库基准
+旧表结构（每行保存文本列）与维度表结构的写入、存储与查询对照，以及供查询剖析使用的典型读取负载
+
+    python -m benchmarks.database
+"""
+
+import os
+import sqlite3
+import tempfile
+import time
+from typing import Dict, List, Optional, Union
+
+from src.processor import RecordBatch, TransactionRecord
+from src.processor.processor import row_adapter
+from src.storage.database import DatabaseManager
+from benchmarks.synthetic import synthetic_records
+
+
+# 维度表之前的 market_data 表结构，用于迁移测试与基准对照
+_LEGACY_SCHEMA = '''
+    CREATE TABLE market_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        capture_time DATETIME NOT NULL,
+        message_time DATETIME,
+        group_name TEXT,
+        sender_nickname TEXT,
+        raw_text TEXT,
+        action TEXT,
+        item_category TEXT,
+        specs TEXT,
+        price REAL,
+        quantity INTEGER,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        price_flag TEXT DEFAULT '',
+        cluster_id TEXT
+    );
+    CREATE INDEX idx_market_data_group ON market_data(group_name);
+    CREATE INDEX idx_market_data_time ON market_data(message_time);
+    CREATE INDEX idx_market_data_action ON market_data(action);
+    CREATE INDEX idx_market_data_cluster ON market_data(cluster_id);
+    CREATE INDEX idx_market_data_capture ON market_data(capture_time, id);
+    CREATE INDEX idx_market_data_sender ON market_data(sender_nickname);
+    CREATE INDEX idx_market_data_item ON market_data(item_category);
+'''
+
+
+def legacy_database(db_path: str, records: Union[List[TransactionRecord], RecordBatch]) -> None:
+    """按旧表结构（每行保存文本列）建库并写入记录"""
+    columns = DatabaseManager.INSERT_COLUMNS
+    rows = records.db_rows(columns) if isinstance(records, RecordBatch) else map(row_adapter(columns), records)
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.executescript(_LEGACY_SCHEMA)
+        conn.executemany(
+            f"INSERT INTO market_data ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})", rows
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _storage_bytes(db_path: str) -> Dict[str, int]:
+    """表与索引各自占用的字节数（dbstat 统计）"""
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT m.type, SUM(s.pgsize) FROM dbstat s JOIN sqlite_master m ON m.name = s.name "
+            "WHERE m.name NOT LIKE 'sqlite_%' GROUP BY m.type"
+        ).fetchall()
+    finally:
+        conn.close()
+    return dict(rows)
+
+
+def benchmark(count: int = 200000) -> Dict[str, Dict[str, float]]:
+    """
+    对比旧表结构与维度表结构：写入耗时、表/索引大小、按发送者查询耗时
+
+    旧表结构为对照补上了 sender_nickname / item_category 的文本索引。
+
+    Returns:
+        结构 -> {"insert_seconds", "table_mb", "index_mb", "row_bytes", "sender_query_ms"}
+    """
+    batch = synthetic_records(count)
+    senders = sorted(set(batch.column("sender")))
+    results: Dict[str, Dict[str, float]] = {}
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        legacy_path = os.path.join(tmpdir, "legacy.db")
+        start = time.perf_counter()
+        legacy_database(legacy_path, batch)
+        legacy_seconds = time.perf_counter() - start
+
+        current_path = os.path.join(tmpdir, "current.db")
+        db = DatabaseManager(current_path, wal=False)
+        start = time.perf_counter()
+        db.insert_records(batch)
+        current_seconds = time.perf_counter() - start
+
+        for name, path, seconds in (("legacy", legacy_path, legacy_seconds), ("dimension", current_path, current_seconds)):
+            sizes = _storage_bytes(path)
+            conn = sqlite3.connect(path)
+            try:
+                start = time.perf_counter()
+                for sender in senders:
+                    conn.execute("SELECT COUNT(*), AVG(price) FROM market_data WHERE sender_nickname = ?",
+                                 (sender,)).fetchone()
+                query_seconds = time.perf_counter() - start
+            finally:
+                conn.close()
+            results[name] = {
+                "insert_seconds": seconds,
+                "table_mb": sizes.get("table", 0) / 1024 / 1024,
+                "index_mb": sizes.get("index", 0) / 1024 / 1024,
+                "row_bytes": sizes.get("table", 0) / count,
+                "sender_query_ms": query_seconds / len(senders) * 1000,
+            }
+    return results
+
+
+def sample_workload(db: DatabaseManager, repeat: int = 3) -> None:
+    """
+    按典型读取路径查询一遍（分页、趋势、最新报价、搜索、统计），供查询剖析使用
+
+    过滤值取数据中最常见的群组与商品。
+    """
+    conn = sqlite3.connect(db.db_path)
+    try:
+        def most_common(column: str) -> Optional[str]:
+            row = conn.execute(
+                f"SELECT {column} FROM market_data WHERE {column} IS NOT NULL "
+                f"GROUP BY {column} ORDER BY COUNT(*) DESC LIMIT 1"
+            ).fetchone()
+            return row[0] if row else None
+
+        group, item = most_common("group_name"), most_common("item_category")
+    finally:
+        conn.close()
+
+    for _ in range(repeat):
+        db.query_records(limit=500)
+        db.query_records(group_name=group, limit=200)
+        db.query_records(action="SELL", limit=200)
+        db.get_price_trend(days=30)
+        db.latest_offers(item=item, limit=50)
+        db.latest_offers(action="BUY", limit=50)
+        db.search_records((item or "iPhone").split()[0], days=30)
+        db.get_statistics()
+
+
+if __name__ == "__main__":
+    for name, result in benchmark().items():
+        print(f"{name:10s} 写入 {result['insert_seconds']:5.2f}s  表 {result['table_mb']:6.1f} MB  "
+              f"索引 {result['index_mb']:6.1f} MB  每行 {result['row_bytes']:5.0f} B  "
+              f"按发送者查询 {result['sender_query_ms']:6.3f} ms")
@@ -0,0 +1,50 @@
+"""
+消息提取基准
+逐个模式匹配的旧实现与 MessageExtractor.extract_batch 的吞吐对照
+
+    python -m benchmarks.extractor
+"""
+
+import re
+import time
+from typing import Dict, List
+
+from src.collector.extractor import MessageExtractor
+from benchmarks.synthetic import synthetic_snapshot
+
+
+def _legacy_extract(texts: List[str]) -> int:
+    """逐个模式匹配、逐行切分的旧实现，仅作吞吐对照"""
+    patterns = [re.compile(pattern) for pattern in MessageExtractor.SYSTEM_MESSAGE_PATTERNS]
+    times = [re.compile(pattern) for pattern in MessageExtractor.TIME_PATTERNS]
+    count = 0
+    for text in texts:
+        if any(pattern.search(text) for pattern in patterns):
+            continue
+        for pattern in times:
+            if pattern.search(text):
+                break
+        lines = text.split("\n")
+        if len(lines) >= 2 and ": " in lines[1]:
+            count += 1
+    return count
+
+
+def benchmark(count: int = 200000) -> Dict[str, float]:
+    """比较旧实现与 extract_batch 的吞吐（条/秒）"""
+    texts = synthetic_snapshot(count)
+    extractor = MessageExtractor()
+
+    start = time.perf_counter()
+    _legacy_extract(texts)
+    legacy = count / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    extractor.extract_batch(texts)
+    unified = count / (time.perf_counter() - start)
+    return {"legacy": legacy, "extract_batch": unified}
+
+
+if __name__ == "__main__":
+    result = benchmark()
+    print(f"旧实现: {result['legacy']:.0f} 条/秒, extract_batch: {result['extract_batch']:.0f} 条/秒")
@@ -0,0 +1,70 @@
+"""
+报表基准
+比较各报表格式与 pandas 旧实现的耗时与峰值内存
+
+    python -m benchmarks.reports
+"""
+
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, Optional
+
+import pandas as pd
+
+from src.processor import RecordBatch
+from src.storage.reports import ReportGenerator
+from src.storage.writers import formats
+from benchmarks.synthetic import synthetic_records
+
+
+def _legacy_session_excel(batch: RecordBatch, filepath: str) -> None:
+    """旧实现：pandas DataFrame + openpyxl，仅用于基准对照"""
+    df = batch.to_frame(ReportGenerator.SESSION_COLUMNS, list(ReportGenerator.SESSION_COLUMNS))
+    df.insert(df.columns.get_loc("价格") + 1, "价格(格式化)",
+              [ReportGenerator._format_price(None, p) for p in df["价格"]])
+    df = df.sort_values('价格', ascending=True)
+    with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
+        df.to_excel(writer, sheet_name='交易记录', index=False)
+
+
+def benchmark(count: int = 50000, output_dir: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    """
+    比较各报表格式的耗时与峰值内存（tracemalloc 测得，包含 pandas 旧实现）
+
+    Returns:
+        格式 -> {"seconds", "peak_mb", "size_mb"}
+    """
+    batch = synthetic_records(count)
+    generator = ReportGenerator.__new__(ReportGenerator)
+    generator.auto_open = False
+    results: Dict[str, Dict[str, float]] = {}
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        generator.output_dir = output_dir or tmpdir
+        cases = [(fmt, lambda fmt=fmt: generator.generate_session_report(batch, fmt=fmt)) for fmt in formats()]
+        legacy_path = os.path.join(generator.output_dir, "legacy.xlsx")
+        cases.append(("xlsx (pandas)", lambda: _legacy_session_excel(batch, legacy_path) or legacy_path))
+
+        for name, run in cases:
+            start = time.perf_counter()
+            path = run()
+            seconds = time.perf_counter() - start
+
+            # tracemalloc 拖慢执行，内存单独测一遍
+            tracemalloc.start()
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results[name] = {
+                "seconds": seconds,
+                "peak_mb": peak / 1024 / 1024,
+                "size_mb": os.path.getsize(path) / 1024 / 1024,
+            }
+    return results
+
+
+if __name__ == "__main__":
+    for name, result in benchmark().items():
+        print(f"{name:14s} {result['seconds']:6.2f}s  峰值内存 {result['peak_mb']:7.1f} MB  文件 {result['size_mb']:6.1f} MB")
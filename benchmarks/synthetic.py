@@ -0,0 +1,69 @@
+"""
+合成数据
+为吞吐与内存基准、测试生成可复现的记录、消息文本快照与聊天记录导出
+"""
+
+import random
+from typing import List
+
+from src.processor import RecordBatch, TransactionRecord
+
+
+def synthetic_records(count: int, seed: int = 0) -> RecordBatch:
+    """生成用于基准测试的记录批"""
+    rng = random.Random(seed)
+    items = ["iPhone 15 Pro Max", "iPhone 14", "iPad Air 5", "华为 Mate 60 Pro", "AirPods Pro 2", "小米 14"]
+    groups = ["数码群", "回收群", "华强北群"]
+    batch = RecordBatch()
+    for index in range(count):
+        item = rng.choice(items)
+        price = float(rng.randint(800, 12000))
+        batch.append(TransactionRecord(
+            action=rng.choice(("SELL", "BUY")),
+            item=item,
+            specs=rng.choice(("128G 黑色", "256G 白色", "512G 原色")),
+            price=price,
+            quantity=rng.randint(1, 5),
+            raw_text=f"出 {item} {price:.0f} 第{index}条",
+            sender=f"卖家{rng.randint(1, 200)}",
+            group=rng.choice(groups),
+            message_time=f"2024-05-01 {index // 3600 % 24:02d}:{index // 60 % 60:02d}",
+            capture_time=f"2024-05-01T12:00:{index % 60:02d}",
+            price_flag="" if rng.random() > 0.02 else "outlier",
+            cluster_id=f"c{rng.randint(1, count // 3 + 1)}" if rng.random() < 0.3 else "",
+        ))
+    return batch
+
+
+def synthetic_snapshot(count: int, seed: int = 0) -> List[str]:
+    """生成模拟的消息文本快照（含系统消息与时间戳），用于吞吐测试"""
+    rng = random.Random(seed)
+    senders = ["老王", "小李 手机回收", "深圳阿杰", "数码港-陈姐", "Kevin"]
+    contents = [
+        "出两台14pm 256 紫色 电池90 5800到付", "收13 128 白色 4k", "甩 ipad air5 64 蓝 2.8k\n包邮",
+        "今天行情怎么样", "要 switch oled 白 1650 5台", "好的 收到",
+    ]
+    system = ["李四撤回了一条消息", "\"老王\" 拍了拍 \"小李\"", "张三邀请李四加入了群聊", "以下为新消息"]
+    texts = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.1:
+            texts.append(rng.choice(system))
+        elif roll < 0.2:
+            texts.append(f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}")
+        else:
+            texts.append(f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}\n"
+                         f"{rng.choice(senders)}: {rng.choice(contents)}")
+    return texts
+
+
+def synthetic_export(path: str, count: int, seed: int = 0) -> None:
+    """生成 "时间 发送者 / 内容" 格式的文本导出，用于吞吐测试"""
+    rng = random.Random(seed)
+    senders = ["华强北老王数码批发", "小李 手机回收", "深圳阿杰", "数码港-陈姐"]
+    lines = ["出 14pm 256 紫色 5800", "收13 128 白色 4k\n有的私聊", "甩 ipad air5 64 2.8k", "早上好", "李四撤回了一条消息"]
+    with open(path, "w", encoding="utf-8") as f:
+        for index in range(count):
+            minute = index // 60
+            f.write(f"2024-05-{1 + minute // 1440 % 28:02d} {minute // 60 % 24:02d}:{minute % 60:02d}:{index % 60:02d} "
+                    f"{rng.choice(senders)}\n{rng.choice(lines)} #{index}\n\n")
@@ -5,15 +5,182 @@
 WeChat Market Intelligence System
 
 入口文件
+
+用法:
+    python main.py                      采集并解析（默认）
+    python main.py process              只解析队列中积压的消息，不采集
+    python main.py reprocess            用当前模型/提示词重新解析已存储的消息
+    python main.py benchmark --stub     在标注语料上评测解析质量、延迟与成本
+    python main.py serve                启动本地 HTTP 查询服务
+    python main.py import FILE...       导入导出的聊天记录（文本/HTML/CSV）
+    python main.py query-report         查询剖析报告：慢查询、执行计划与索引建议
 """
 
-from src.pipeline import ETLPipeline
+import argparse
+
+
+def run(args: argparse.Namespace) -> None:
+    """采集 -> 解析 -> 存储 -> 报表"""
+    from src.pipeline import ETLPipeline
+
+    pipeline = ETLPipeline(args.config)
+    try:
+        pipeline.run(collect=args.command != "process")
+    finally:
+        # 后台报表生成完毕后再退出
+        pipeline.close()
+
+
+def reprocess(args: argparse.Namespace) -> None:
+    """重放已存储的 raw_text，生成新版本解析结果"""
+    from src.config import Config
+    from src.processor import ReplayRunner
+    from src.storage import DatabaseManager
+
+    config = Config(args.config)
+    runner = ReplayRunner(config, DatabaseManager.from_config(config))
+    runner.run(version=args.version, concurrency=args.concurrency, limit=args.limit)
+
+
+def benchmark(args: argparse.Namespace) -> None:
+    """在标注语料上评测解析质量与成本"""
+    import json
+    from src.config import Config
+    from src.processor.benchmark import format_report, run_benchmark
+
+    report = run_benchmark(
+        Config(args.config),
+        corpus_path=args.corpus,
+        responses=args.responses,
+        record=args.record,
+        stub_latency=args.stub_latency if args.stub else None,
+        concurrency=args.concurrency,
+        limit=args.limit,
+    )
+    print(format_report(report))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def serve(args: argparse.Namespace) -> None:
+    """启动本地只读查询服务"""
+    from src.config import Config
+    from src.storage import QueryServer
+
+    QueryServer.from_config(Config(args.config), host=args.host, port=args.port).serve_forever()
+
+
+def import_logs(args: argparse.Namespace) -> None:
+    """把导出的聊天记录写入原始消息队列，可选随后解析"""
+    from src.config import Config
+    from src.collector.importer import ChatLogImporter
+    from src.storage import DatabaseManager, MessageQueue
+
+    config = Config(args.config)
+    importer = ChatLogImporter(config, MessageQueue(DatabaseManager.from_config(config)), workers=args.workers)
+
+    for path in args.files:
+        result = importer.import_file(path, group=args.group, fmt=args.format)
+        rate = result["parsed"] / result["seconds"] if result["seconds"] else 0
+        resumed = f"，从位置 {result['resumed_from']} 继续" if result["resumed_from"] else ""
+        print(f"{path}: 解析 {result['parsed']} 条, 新入队 {result['queued']} 条, "
+              f"{result['seconds']:.2f}s ({rate:.0f} 条/秒){resumed}")
+
+    if args.process:
+        args.command = "process"
+        run(args)
+
+
+def query_report(args: argparse.Namespace) -> None:
+    """打印查询剖析报告"""
+    from src.config import Config
+    from src.storage import DatabaseManager, QueryProfiler
+    from benchmarks.database import sample_workload
+    from src.storage.profiler import format_report
+
+    config = Config(args.config)
+    db = DatabaseManager.from_config(config, profile=False)
+
+    if args.workload:
+        # 在当前数据库上跑一遍典型查询，现场剖析
+        db.profiler = QueryProfiler(slow_ms=args.slow_ms or 0, keep=args.top)
+        sample_workload(db)
+        profile = db.profiler.snapshot()
+        db.profiler = None
+    else:
+        log_path = args.log or config.database.query_log
+        profile = QueryProfiler.load(log_path)
+        print(f"剖析结果: {log_path}")
+
+    conn = db.reader()._connect()
+    try:
+        print(format_report(profile, conn, DatabaseManager.VIEW_ALIASES, top=args.top))
+    finally:
+        conn.close()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="微信市场情报自动化系统 (WMIS)")
+    parser.add_argument("--config", default="./config.yaml", help="配置文件路径")
+    parser.set_defaults(handler=run)
+
+    subparsers = parser.add_subparsers(dest="command")
+
+    run_parser = subparsers.add_parser("run", help="采集并解析群消息")
+    run_parser.set_defaults(handler=run)
+
+    process_parser = subparsers.add_parser("process", help="只解析原始消息队列中积压的消息")
+    process_parser.set_defaults(handler=run)
+
+    replay_parser = subparsers.add_parser("reprocess", help="重新解析已存储的消息")
+    replay_parser.add_argument("--version", help="解析版本，默认由模型名与提示词生成")
+    replay_parser.add_argument("--concurrency", type=int, help="并发 LLM 请求数")
+    replay_parser.add_argument("--limit", type=int, help="本次最多处理的记录数")
+    replay_parser.set_defaults(handler=reprocess)
+
+    bench_parser = subparsers.add_parser("benchmark", help="在标注语料上评测解析质量、延迟与成本")
+    bench_parser.add_argument("--corpus", default="./benchmarks/golden_corpus.jsonl", help="标注语料 (JSONL)")
+    source = bench_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--stub", action="store_true", help="使用按标注作答的本地桩")
+    source.add_argument("--responses", help="录制的响应文件 (JSONL)，默认只回放")
+    bench_parser.add_argument("--record", action="store_true", help="调用真实端点并把响应录制到 --responses")
+    bench_parser.add_argument("--stub-latency", type=float, default=0.0, help="本地桩每次调用的模拟延迟 (秒)")
+    bench_parser.add_argument("--concurrency", type=int, default=1, help="并发批次数")
+    bench_parser.add_argument("--limit", type=int, help="只使用语料前 N 条")
+    bench_parser.add_argument("--output", help="把 JSON 报告写入该文件")
+    bench_parser.set_defaults(handler=benchmark)
+
+    serve_parser = subparsers.add_parser("serve", help="启动本地 HTTP 查询服务")
+    serve_parser.add_argument("--host", help="监听地址，默认 service.host 或 127.0.0.1")
+    serve_parser.add_argument("--port", type=int, help="监听端口，默认 service.port 或 8765")
+    serve_parser.set_defaults(handler=serve)
+
+    import_parser = subparsers.add_parser("import", help="导入导出的聊天记录（文本/HTML/CSV）")
+    import_parser.add_argument("files", nargs="+", help="导出文件")
+    import_parser.add_argument("--group", help="群名称，默认取文件名（CSV 中有群名列时以列为准）")
+    import_parser.add_argument("--format", choices=["text", "html", "csv"], help="导出格式，默认按扩展名判断")
+    import_parser.add_argument("--workers", type=int, help="解析进程数，默认 importer.workers 或 CPU 核数")
+    import_parser.add_argument("--process", action="store_true", help="导入后立即解析队列")
+    import_parser.set_defaults(handler=import_logs)
+
+    report_parser = subparsers.add_parser("query-report", help="查询剖析报告（慢查询、执行计划、索引建议）")
+    report_parser.add_argument("--log", help="剖析结果文件，默认 database.query_log")
+    report_parser.add_argument("--workload", action="store_true", help="在当前数据库上运行典型查询并现场剖析")
+    report_parser.add_argument("--slow-ms", type=float, help="--workload 时的慢查询阈值 (毫秒)，默认 0")
+    report_parser.add_argument("--top", type=int, default=10, help="每部分列出的条数")
+    report_parser.set_defaults(handler=query_report)
+
+    return parser
 
 
 def main():
     """主入口"""
-    pipeline = ETLPipeline("./config.yaml")
-    pipeline.run()
+    parser = build_parser()
+    args = parser.parse_args()
+    if getattr(args, "record", False) and not args.responses:
+        parser.error("--record 需要同时指定 --responses")
+    args.handler(args)
 
 
 if __name__ == "__main__":
@@ -1,9 +1,10 @@
 """
 消息采集模块
-负责从微信群聊中抓取消息
+负责从微信群聊中抓取消息，或从导出的聊天记录批量导入
 """
 
 from .collector import WeChatCollector, Message, CheckpointManager
 from .extractor import MessageExtractor
+from .importer import ChatLogImporter, ImportCheckpoint
 
-__all__ = ['WeChatCollector', 'Message', 'CheckpointManager', 'MessageExtractor']
+__all__ = ['WeChatCollector', 'Message', 'CheckpointManager', 'MessageExtractor', 'ChatLogImporter', 'ImportCheckpoint']
@@ -4,6 +4,7 @@
 """
 
 import json
+import sys
 import time
 import random
 from datetime import datetime
@@ -13,22 +14,31 @@ from pathlib import Path
 import uiautomation as auto
 
 from src.config import Config
+from src.collector.extractor import MessageExtractor
 
 
 class Message:
-    """消息数据结构"""
+    """
+    消息数据结构
+
+    使用 __slots__，群名与发送者字符串驻留（sys.intern），大批量消息共享同一对象。
+    capture_time 为采集时间（ISO 格式），为空时由入队时间补齐；导入的历史消息取消息自身的时间。
+    """
+    __slots__ = ("sender", "time", "content", "group", "capture_time")
 
     def __init__(
         self,
         sender: str,
         time: str,
         content: str,
-        group: str = ""
+        group: str = "",
+        capture_time: str = ""
     ):
-        self.sender = sender
+        self.sender = sys.intern(sender) if type(sender) is str else sender
         self.time = time
         self.content = content
-        self.group = group
+        self.group = sys.intern(group) if type(group) is str else group
+        self.capture_time = capture_time
 
     def to_dict(self) -> Dict[str, str]:
         return {
@@ -84,11 +94,21 @@ class WeChatCollector:
         self.config = config
         self.wechat_config = config.wechat
         self.groups = config.groups
-        self.checkpoint_manager = CheckpointManager(config.checkpoint['path'])
+        self.checkpoint_manager = CheckpointManager(config.checkpoint.path)
+        # 解析消息文本并过滤撤回、拍一拍、入群等系统消息
+        self.extractor = MessageExtractor()
 
         # 随机延迟设置
-        self.delay_min = self.wechat_config.get('random_delay_min', 1)
-        self.delay_max = self.wechat_config.get('random_delay_max', 3)
+        self.delay_min = self.wechat_config.random_delay_min
+        self.delay_max = self.wechat_config.random_delay_max
+        config.subscribe(self.apply_config, ("wechat", "groups"))
+
+    def apply_config(self, config: Config) -> None:
+        """热加载：群列表、窗口标题、滚动与随机延迟设置"""
+        self.wechat_config = config.wechat
+        self.groups = config.groups
+        self.delay_min = self.wechat_config.random_delay_min
+        self.delay_max = self.wechat_config.random_delay_max
 
     def _random_delay(self) -> None:
         """随机延迟，模拟人类操作"""
@@ -97,7 +117,7 @@ class WeChatCollector:
 
     def _connect_wechat(self) -> auto.Control:
         """连接微信窗口"""
-        window_title = self.wechat_config.get('window_title', '微信')
+        window_title = self.wechat_config.window_title
 
         # 查找微信窗口
         wechat_window = auto.WindowControl(searchDepth=5, Name=window_title)
@@ -110,8 +130,8 @@ class WeChatCollector:
 
     def _scroll_to_top(self, chat_control: auto.Control) -> None:
         """滚动到顶部加载更多消息"""
-        max_scroll = self.wechat_config.get('max_scroll_attempts', 50)
-        scroll_pause = self.wechat_config.get('scroll_pause', 0.5)
+        max_scroll = self.wechat_config.max_scroll_attempts
+        scroll_pause = self.wechat_config.scroll_pause
 
         for _ in range(max_scroll):
             # 尝试点击滚动条向上
@@ -127,38 +147,6 @@ class WeChatCollector:
                 # 没有滚动条，可能已经到顶
                 break
 
-    def _extract_message_from_element(self, element: auto.Control, group_name: str) -> Optional[Message]:
-        """从 UI 元素中提取消息"""
-        try:
-            # 消息元素通常包含发送者和内容
-            # 这里需要根据实际 UI 结构调整
-            # 常见的结构是：列表项包含发送者名称和消息内容
-
-            # 尝试获取文本
-            name = element.Name or ""
-            description = element.GetValuePattern().Value if element.GetValuePattern() else ""
-
-            # 简单解析 - 实际需要根据微信 UI 结构调整
-            # 微信消息通常格式: "时间\n发送者: 消息内容"
-            lines = name.split('\n') if name else []
-
-            if len(lines) >= 2:
-                time_str = lines[0]
-                sender_content = lines[1]
-
-                if ': ' in sender_content:
-                    sender, content = sender_content.split(': ', 1)
-                    return Message(
-                        sender=sender.strip(),
-                        time=time_str.strip(),
-                        content=content.strip(),
-                        group=group_name
-                    )
-
-            return None
-        except Exception:
-            return None
-
     def _find_chat_list(self, wechat_window: auto.Control) -> Optional[auto.Control]:
         """找到聊天消息列表区域"""
         # 聊天列表通常在消息区域
@@ -214,26 +202,28 @@ class WeChatCollector:
             anchor = self.checkpoint_manager.get_anchor(group_name)
 
             # 滚动并提取消息
-            max_scroll = self.wechat_config.get('max_scroll_attempts', 50)
-            scroll_pause = self.wechat_config.get('scroll_pause', 0.5)
+            max_scroll = self.wechat_config.max_scroll_attempts
+            scroll_pause = self.wechat_config.scroll_pause
             found_anchor = anchor is None  # 如果没有锚点，采集所有消息
 
             for scroll_attempt in range(max_scroll):
-                # 获取当前可见的消息元素
-                message_items = chat_list.GetChildren()
-
-                for item in message_items:
-                    message = self._extract_message_from_element(item, group_name)
-                    if message:
-                        # 检查是否到达锚点
-                        if anchor and not found_anchor:
-                            if (message.time == anchor.get('last_message_time') and
-                                message.content == anchor.get('last_message_content')):
-                                found_anchor = True
-                                break
-
-                        if not found_anchor or scroll_attempt == 0:
-                            messages.append(message)
+                # 获取当前可见的消息元素，整屏一次解析
+                for parsed in self.extractor.extract_batch(chat_list.GetChildren()):
+                    message = Message(
+                        sender=parsed["sender"],
+                        time=parsed["time"] or "",
+                        content=parsed["content"],
+                        group=group_name
+                    )
+                    # 检查是否到达锚点
+                    if anchor and not found_anchor:
+                        if (message.time == anchor.get('last_message_time') and
+                            message.content == anchor.get('last_message_content')):
+                            found_anchor = True
+                            break
+
+                    if not found_anchor or scroll_attempt == 0:
+                        messages.append(message)
 
                 if found_anchor:
                     break
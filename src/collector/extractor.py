@@ -4,14 +4,27 @@
 """
 
 import re
-from typing import Optional, Tuple, List
-from datetime import datetime
+from typing import Any, Dict, Iterable, Optional, Tuple, List
 
 import uiautomation as auto
 
 
+# 时间戳：可带日期 / 昨天 / 星期 / 上下午前缀，或只有日期
+_TIME = (
+    r"(?:(?:\d{4}[-/]\d{1,2}[-/]\d{1,2}|\d{4}年\d{1,2}月\d{1,2}日|昨天|前天|星期[一二三四五六日天]|周[一二三四五六日天])\s?)?"
+    r"(?:(?:上午|下午|凌晨|早上|中午|晚上)\s?)?\d{1,2}:\d{2}(?::\d{2})?"
+    r"|\d{4}-\d{2}-\d{2}|\d{4}年\d{1,2}月\d{1,2}日"
+)
+
+
 class MessageExtractor:
-    """消息提取器 - 从 UI 元素中提取消息"""
+    """
+    消息提取器 - 从 UI 元素或其文本快照中提取消息
+
+    系统消息的各个模式合并为一个正则，时间、发送者、内容由一个正则一次解析。
+    支持的文本格式: "时间\n发送者: 内容"、"时间 发送者: 内容"、"发送者: 内容"，
+    以及没有冒号时的 "发送者 内容"。
+    """
 
     # 系统消息模式（需要过滤）
     SYSTEM_MESSAGE_PATTERNS = [
@@ -36,45 +49,80 @@ class MessageExtractor:
 
     def _compile_patterns(self) -> None:
         """编译正则表达式"""
-        self.system_patterns = [
-            re.compile(pattern, re.IGNORECASE)
-            for pattern in self.SYSTEM_MESSAGE_PATTERNS
-        ]
-        self.time_patterns = [
-            re.compile(pattern)
-            for pattern in self.TIME_PATTERNS
-        ]
+        # 各模式首尾的 .* 对 search 没有意义，去掉后合并为一个分支正则
+        alternatives = []
+        for pattern in self.SYSTEM_MESSAGE_PATTERNS:
+            while pattern.startswith(".*"):
+                pattern = pattern[2:]
+            while pattern.endswith(".*"):
+                pattern = pattern[:-2]
+            alternatives.append(f"(?:{pattern})")
+        self.system_pattern = re.compile("|".join(alternatives), re.IGNORECASE)
+
+        self.time_pattern = re.compile("|".join(f"(?:{pattern})" for pattern in self.TIME_PATTERNS))
+        self.timestamp_only = re.compile(rf"\s*(?:{_TIME})\s*")
+        # 时间（可选）+ 发送者 + ": " + 内容，内容可跨行
+        self.message_pattern = re.compile(
+            rf"\s*(?:(?P<time>{_TIME})\s+)?(?P<sender>[^\n]+?): (?P<content>.+)",
+            re.DOTALL
+        )
+        # 备选格式: "发送者 消息内容" (空格分隔)
+        self.fallback_pattern = re.compile(
+            rf"\s*(?:(?P<time>{_TIME})\s+)?(?P<sender>\S+) (?P<content>.+)",
+            re.DOTALL
+        )
 
     def is_system_message(self, text: str) -> bool:
         """判断是否为系统消息"""
-        for pattern in self.system_patterns:
-            if pattern.search(text):
-                return True
-        return False
+        return self.system_pattern.search(text) is not None
 
     def extract_time(self, text: str) -> Optional[str]:
         """从文本中提取时间"""
-        for pattern in self.time_patterns:
-            match = pattern.search(text)
-            if match:
-                return match.group()
-        return None
+        match = self.time_pattern.search(text)
+        return match.group() if match else None
 
     def parse_sender_content(self, text: str) -> Tuple[Optional[str], Optional[str]]:
         """
         解析发送者和内容
-        格式通常为: "发送者: 消息内容"
+        格式通常为: "发送者: 消息内容"，开头的时间戳会被跳过
         """
-        if ': ' in text:
-            parts = text.split(': ', 1)
-            return parts[0].strip(), parts[1].strip()
+        parsed = self.parse(text, skip_system=False)
+        if parsed is None:
+            return None, text.strip()
+        return parsed["sender"], parsed["content"]
 
-        # 备选格式: "发送者 消息内容" (空格分隔)
-        parts = text.split(' ', 1)
-        if len(parts) == 2:
-            return parts[0].strip(), parts[1].strip()
+    def parse(self, text: str, skip_system: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        解析一条消息文本
+
+        Args:
+            text: UI 元素的文本快照
+            skip_system: 是否过滤系统消息
+
+        Returns:
+            {"sender", "time", "content"}，系统消息、纯时间戳或无法解析时返回 None
+        """
+        if not text or (skip_system and self.system_pattern.search(text)):
+            return None
+        return self._parse(text)
+
+    def _parse(self, text: str) -> Optional[Dict[str, Any]]:
+        match = self.message_pattern.match(text)
+        if match is None:
+            match = self.fallback_pattern.match(text)
+            # "昨天 14:02" 之类的时间分隔条不是消息
+            if match is None or self.timestamp_only.fullmatch(text):
+                return None
 
-        return None, text.strip()
+        sender = match.group("sender").strip()
+        content = match.group("content").strip()
+        if not sender or not content:
+            return None
+        return {
+            "sender": sender,
+            "time": match.group("time") or self.extract_time(text),
+            "content": content,
+        }
 
     def extract_message(self, element: auto.Control) -> Optional[dict]:
         """
@@ -88,48 +136,37 @@ class MessageExtractor:
         """
         try:
             # 获取元素名称（通常包含消息内容）
-            name = element.Name or ""
-
-            if not name:
-                return None
-
-            # 过滤系统消息
-            if self.is_system_message(name):
-                return None
-
-            # 提取时间
-            time_str = self.extract_time(name)
-
-            # 解析发送者和内容
-            sender, content = self.parse_sender_content(name)
-
-            if not sender or not content:
-                return None
-
-            return {
-                "sender": sender,
-                "time": time_str,
-                "content": content
-            }
-
+            return self.parse(element.Name or "")
         except Exception:
             return None
 
-    def extract_batch(self, elements: List[auto.Control]) -> List[dict]:
+    def extract_batch(self, items: Iterable[Any]) -> List[dict]:
         """
         批量提取消息
 
         Args:
-            elements: uiautomation 控件元素列表
+            items: 文本快照或 uiautomation 控件元素
 
         Returns:
-            消息字典列表
+            消息字典列表（已过滤系统消息）
         """
+        system = self.system_pattern.search
+        parse = self._parse
+
         messages = []
-        for element in elements:
-            msg = self.extract_message(element)
-            if msg:
-                messages.append(msg)
+        for item in items:
+            if isinstance(item, str):
+                text = item
+            else:
+                try:
+                    text = item.Name or ""
+                except Exception:
+                    continue
+            if not text or system(text):
+                continue
+            message = parse(text)
+            if message is not None:
+                messages.append(message)
         return messages
 
 
@@ -0,0 +1,393 @@
+"""
+聊天记录批量导入
+从导出的聊天记录文件（文本 / HTML / CSV）解析消息并写入原始消息队列，
+用于回填历史数据，替代逐屏滚动的 UI 采集
+"""
+
+import csv
+import html
+import json
+import mmap
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from src.config import Config
+from src.collector.collector import Message
+from src.collector.extractor import MessageExtractor
+
+# 消息头: "2024-05-01 14:02:03 老王" 或 "老王 2024-05-01 14:02:03"，可带同一行的内容 "老王: 内容"
+_TIME = rb"\d{4}[-/]\d{1,2}[-/]\d{1,2}[ T]\d{1,2}:\d{2}(?::\d{2})?"
+HEADER_PATTERNS = {
+    "time_first": re.compile(rb"^(?P<time>" + _TIME + rb")[ \t]+(?P<sender>[^\r\n]+?)[ \t]*\r?$", re.M),
+    "sender_first": re.compile(rb"^(?P<sender>[^\r\n]+?)[ \t]+(?P<time>" + _TIME + rb")[ \t]*\r?$", re.M),
+}
+_INLINE = re.compile(r"^(?P<sender>[^:：]{1,40}?)\s*[:：]\s*(?P<content>.*)$", re.S)
+
+# CSV 导出中常见的列名
+CSV_COLUMNS = {
+    "time": ("time", "StrTime", "CreateTime", "createTime", "时间", "发送时间"),
+    "sender": ("sender", "NickName", "nickname", "Sender", "发送者", "发送人", "昵称"),
+    "content": ("content", "StrContent", "Message", "message", "消息内容", "内容"),
+    "group": ("group", "talker", "群名", "群聊", "会话"),
+    "type": ("Type", "type", "消息类型"),
+}
+
+_HTML_DROP = re.compile(r"<(script|style)\b.*?</\1>", re.S | re.I)
+_HTML_BREAK = re.compile(r"<br\s*/?>|</(?:p|div|tr|li|h\d)>", re.I)
+_HTML_TAG = re.compile(r"<[^>]+>")
+
+
+def detect_format(path: str) -> str:
+    """按扩展名判断导出格式: csv / html / text"""
+    suffix = Path(path).suffix.lower()
+    if suffix == ".csv":
+        return "csv"
+    if suffix in (".html", ".htm"):
+        return "html"
+    return "text"
+
+
+def detect_layout(sample: bytes) -> str:
+    """按样本中匹配的消息头数量判断文本布局"""
+    counts = {name: len(pattern.findall(sample)) for name, pattern in HEADER_PATTERNS.items()}
+    layout = max(counts, key=counts.get)
+    if not counts[layout]:
+        raise ValueError("无法识别的聊天记录格式：未找到 \"时间 发送者\" 形式的消息头")
+    return layout
+
+
+def _decode(raw: bytes) -> str:
+    return raw.decode("utf-8", errors="replace")
+
+
+def parse_buffer(
+    buffer: Any,
+    layout: str,
+    start: int = 0,
+    end: Optional[int] = None
+) -> List[Tuple[str, str, str]]:
+    """
+    解析文本导出中 [start, end) 范围内的消息
+
+    start 必须位于消息头行首；最后一条消息的内容截止到 end。
+
+    Returns:
+        [(时间, 发送者, 内容)]，已过滤系统消息与空消息
+    """
+    end = len(buffer) if end is None else end
+    pattern = HEADER_PATTERNS[layout]
+    extractor = MessageExtractor()
+    is_system = extractor.is_system_message
+
+    messages: List[Tuple[str, str, str]] = []
+    previous = None
+    for match in pattern.finditer(buffer, start, end):
+        if previous is not None:
+            messages.append(previous + (buffer[previous_end:match.start()],))
+        previous = (match.group("time"), match.group("sender"))
+        previous_end = match.end()
+    if previous is not None:
+        messages.append(previous + (buffer[previous_end:end],))
+
+    parsed = []
+    for raw_time, raw_sender, raw_content in messages:
+        sender = _decode(raw_sender).strip()
+        content = _decode(raw_content).strip()
+        if not content:
+            # "时间 发送者: 内容" 写在同一行
+            inline = _INLINE.match(sender)
+            if inline is None:
+                continue
+            sender, content = inline.group("sender").strip(), inline.group("content").strip()
+        if not content or is_system(content):
+            continue
+        parsed.append((_decode(raw_time).replace("/", "-").replace("T", " "), sender, content))
+    return parsed
+
+
+def plan_shards(buffer: Any, layout: str, shard_bytes: int, start: int = 0) -> List[Tuple[int, int]]:
+    """
+    按字节把文本导出切分为若干分片，每个分片的起点对齐到消息头
+
+    Returns:
+        [(start, end)]，首尾相接覆盖 [start, 文件末尾)
+    """
+    pattern = HEADER_PATTERNS[layout]
+    size = len(buffer)
+    first = pattern.search(buffer, start)
+    if first is None:
+        return []
+
+    bounds = [first.start()]
+    while True:
+        target = bounds[-1] + shard_bytes
+        if target >= size:
+            break
+        match = pattern.search(buffer, target)
+        if match is None:
+            break
+        bounds.append(match.start())
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _parse_shard(path: str, layout: str, start: int, end: int) -> List[Tuple[str, str, str]]:
+    """进程池任务：映射文件并解析一个分片"""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        return parse_buffer(buffer, layout, start, end)
+
+
+def html_to_text(markup: str) -> str:
+    """把 HTML 导出转为逐行文本（块级标签与 <br> 换行，其余标签去除）"""
+    markup = _HTML_DROP.sub("", markup)
+    markup = _HTML_BREAK.sub("\n", markup)
+    text = html.unescape(_HTML_TAG.sub("", markup))
+    return "\n".join(line.strip() for line in text.splitlines() if line.strip())
+
+
+def _csv_time(value: str) -> str:
+    """CSV 的时间列可能是 Unix 时间戳"""
+    value = value.strip()
+    if value.isdigit():
+        stamp = int(value)
+        if stamp > 10 ** 11:  # 毫秒
+            stamp //= 1000
+        return datetime.fromtimestamp(stamp).strftime("%Y-%m-%d %H:%M:%S")
+    return value.replace("/", "-").replace("T", " ")
+
+
+def _capture_time(time_str: str) -> str:
+    """
+    消息时间 -> 采集时间（ISO 格式）
+
+    导入的是历史消息，采集时间取消息自身的时间，使盘口过期、去重窗口与按月分区
+    都按消息发生的时间处理；无法解析时返回空串，由入队时间补齐。
+    """
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M"):
+        try:
+            return datetime.strptime(time_str, fmt).isoformat()
+        except ValueError:
+            continue
+    return ""
+
+
+def _pick(fieldnames: Sequence[str], role: str) -> Optional[str]:
+    for candidate in CSV_COLUMNS[role]:
+        if candidate in fieldnames:
+            return candidate
+    return None
+
+
+class ImportCheckpoint:
+    """
+    导入检查点
+
+    按文件记录已写入队列的位置（文本为字节偏移，CSV 为行数，HTML 为消息数）；
+    文件大小或修改时间变化后从头导入，重复的消息由队列去重。
+    """
+
+    def __init__(self, checkpoint_path: str):
+        self.checkpoint_path = checkpoint_path
+        self.checkpoints: Dict[str, Dict[str, Any]] = {}
+        path = Path(checkpoint_path)
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                self.checkpoints = json.load(f)
+
+    @staticmethod
+    def _identity(path: str) -> Dict[str, int]:
+        stat = os.stat(path)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def position(self, path: str) -> int:
+        entry = self.checkpoints.get(os.path.abspath(path))
+        if not entry or {key: entry.get(key) for key in ("size", "mtime_ns")} != self._identity(path):
+            return 0
+        return entry["position"]
+
+    def update(self, path: str, position: int, messages: int) -> None:
+        key = os.path.abspath(path)
+        previous = self.checkpoints.get(key, {}).get("messages", 0) if position else 0
+        self.checkpoints[key] = {
+            **self._identity(path),
+            "position": position,
+            "messages": previous + messages,
+            "updated_at": datetime.now().isoformat(),
+        }
+        Path(self.checkpoint_path).parent.mkdir(parents=True, exist_ok=True)
+        temp = self.checkpoint_path + ".tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(self.checkpoints, f, ensure_ascii=False, indent=2)
+        os.replace(temp, self.checkpoint_path)
+
+
+class ChatLogImporter:
+    """
+    聊天记录导入器
+
+    文本导出按字节分片，分片起点对齐到消息头，由进程池各自映射文件并解析；
+    CSV 与 HTML 在本进程流式解析。解析出的消息按分片顺序写入原始消息队列
+    （与 UI 采集相同的 Message 流，由 NLPProcessor 消费），每个分片提交后更新检查点。
+    消息的采集时间取自消息时间，历史报价不会作为实时报价进入盘口与撮合。
+    """
+
+    def __init__(self, config: Config, queue: Any, workers: Optional[int] = None):
+        """
+        Args:
+            config: 配置（读取 importer 节）
+            queue: 原始消息队列
+            workers: 解析进程数，覆盖 importer.workers，默认 CPU 核数
+        """
+        import_config = config.importer
+        self.queue = queue
+        self.checkpoint = ImportCheckpoint(import_config.checkpoint_path)
+        self.workers = workers or import_config.workers or os.cpu_count() or 1
+        self.shard_bytes = int(import_config.shard_mb * 1024 * 1024)
+        self.batch_size = import_config.batch_size
+
+    def _enqueue(self, rows: Sequence[Tuple[str, str, str]], group: str, capture_time: str) -> int:
+        return self.queue.enqueue(
+            (Message(sender=sender, time=time_str, content=content, group=group, capture_time=_capture_time(time_str))
+             for time_str, sender, content in rows),
+            capture_time=capture_time
+        )
+
+    def import_file(self, path: str, group: Optional[str] = None, fmt: Optional[str] = None) -> Dict[str, Any]:
+        """
+        导入一个导出文件
+
+        Args:
+            path: 文件路径
+            group: 群名称（CSV 中有群名列时以列为准），默认取文件名
+            fmt: text / html / csv，默认按扩展名判断
+
+        Returns:
+            {"parsed": 解析出的消息数, "queued": 新入队数, "seconds": 耗时, "resumed_from": 起始位置}
+        """
+        fmt = fmt or detect_format(path)
+        group = group or Path(path).stem
+        capture_time = datetime.now().isoformat()
+        start = self.checkpoint.position(path)
+        began = time.perf_counter()
+
+        if fmt == "csv":
+            parsed, queued = self._import_csv(path, group, capture_time, start)
+        elif fmt == "html":
+            parsed, queued = self._import_html(path, group, capture_time, start)
+        elif fmt == "text":
+            parsed, queued = self._import_text(path, group, capture_time, start)
+        else:
+            raise ValueError(f"未知的导出格式: {fmt}")
+
+        return {
+            "parsed": parsed,
+            "queued": queued,
+            "seconds": time.perf_counter() - began,
+            "resumed_from": start,
+        }
+
+    def _import_text(self, path: str, group: str, capture_time: str, start: int) -> Tuple[int, int]:
+        if os.path.getsize(path) == 0:
+            return 0, 0
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            layout = detect_layout(buffer[:65536])
+            shards = plan_shards(buffer, layout, self.shard_bytes, start)
+
+        parsed = queued = 0
+        if len(shards) <= 1 or self.workers <= 1:
+            results = (_parse_shard(path, layout, begin, end) for begin, end in shards)
+            for (_, end), rows in zip(shards, results):
+                parsed, queued = self._commit(path, group, capture_time, rows, end, parsed, queued)
+            return parsed, queued
+
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(shards))) as pool:
+            results = pool.map(
+                _parse_shard,
+                [path] * len(shards), [layout] * len(shards),
+                [begin for begin, _ in shards], [end for _, end in shards]
+            )
+            # map 按分片顺序返回，检查点单调前进
+            for (_, end), rows in zip(shards, results):
+                parsed, queued = self._commit(path, group, capture_time, rows, end, parsed, queued)
+        return parsed, queued
+
+    def _commit(
+        self,
+        path: str,
+        group: str,
+        capture_time: str,
+        rows: List[Tuple[str, str, str]],
+        position: int,
+        parsed: int,
+        queued: int
+    ) -> Tuple[int, int]:
+        added = self._enqueue(rows, group, capture_time)
+        self.checkpoint.update(path, position, len(rows))
+        return parsed + len(rows), queued + added
+
+    def _import_html(self, path: str, group: str, capture_time: str, start: int) -> Tuple[int, int]:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            buffer = html_to_text(f.read()).encode("utf-8")
+        layout = detect_layout(buffer[:65536])
+        rows = parse_buffer(buffer, layout)
+
+        parsed = queued = 0
+        for offset in range(start, len(rows), self.batch_size):
+            batch = rows[offset:offset + self.batch_size]
+            parsed, queued = self._commit(path, group, capture_time, batch, offset + len(batch), parsed, queued)
+        return parsed, queued
+
+    def _iter_csv(self, path: str, group: str, start: int) -> Iterator[Tuple[int, Optional[Tuple[str, str, str, str]]]]:
+        """逐行产出 (行号, (群名, 时间, 发送者, 内容))，不需要导入的行为 None"""
+        is_system = MessageExtractor().is_system_message
+        with open(path, "r", encoding="utf-8-sig", errors="replace", newline="") as f:
+            reader = csv.DictReader(f)
+            fieldnames = reader.fieldnames or []
+            columns = {role: _pick(fieldnames, role) for role in CSV_COLUMNS}
+            missing = [role for role in ("time", "sender", "content") if columns[role] is None]
+            if missing:
+                raise ValueError(f"CSV 缺少列: {', '.join(missing)}（表头: {', '.join(fieldnames)}）")
+
+            for row_number, row in enumerate(reader, 1):
+                if row_number <= start:
+                    continue
+                content = (row.get(columns["content"]) or "").strip()
+                message_type = row.get(columns["type"]) if columns["type"] else None
+                # 只导入文本消息（微信消息类型 1）
+                if not content or (message_type not in (None, "", "1")) or is_system(content):
+                    yield row_number, None
+                    continue
+                row_group = (row.get(columns["group"]) or "").strip() if columns["group"] else ""
+                yield row_number, (
+                    row_group or group,
+                    _csv_time(row.get(columns["time"]) or ""),
+                    (row.get(columns["sender"]) or "").strip(),
+                    content,
+                )
+
+    def _import_csv(self, path: str, group: str, capture_time: str, start: int) -> Tuple[int, int]:
+        parsed = queued = 0
+        batch: List[Message] = []
+        row_number = start
+        for row_number, item in self._iter_csv(path, group, start):
+            if item is not None:
+                row_group, time_str, sender, content = item
+                batch.append(Message(
+                    sender=sender, time=time_str, content=content, group=row_group,
+                    capture_time=_capture_time(time_str)
+                ))
+            if len(batch) >= self.batch_size:
+                queued += self.queue.enqueue(batch, capture_time=capture_time)
+                parsed += len(batch)
+                self.checkpoint.update(path, row_number, len(batch))
+                batch = []
+        if batch or row_number > start:
+            queued += self.queue.enqueue(batch, capture_time=capture_time)
+            parsed += len(batch)
+            self.checkpoint.update(path, row_number, len(batch))
+        return parsed, queued
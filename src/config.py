@@ -1,62 +1,552 @@
 """
 配置加载模块
-负责读取和解析 config.yaml 配置文件
+负责读取、校验 config.yaml 配置文件，并支持运行中热加载
 """
 
 import os
+import threading
 import yaml
-from typing import Any, Dict, List, Optional
+from dataclasses import dataclass, field, fields, replace
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
 from pathlib import Path
 
 
+class ConfigError(ValueError):
+    """配置文件内容不合法"""
+
+
+def _number(minimum: Optional[float] = None, maximum: Optional[float] = None, **extra) -> Dict[str, Any]:
+    return {"type": "number", "min": minimum, "max": maximum, **extra}
+
+
+def _int(minimum: Optional[int] = None) -> Dict[str, Any]:
+    return {"type": "int", "min": minimum}
+
+
+_STR = {"type": "str"}
+_BOOL = {"type": "bool"}
+
+
+def _setting(default: Any, rule: Dict[str, Any]) -> Any:
+    """配置节字段：默认值与校验规则（规则存于字段 metadata，CONFIG_SCHEMA 由此生成）"""
+    return field(default=default, metadata=rule)
+
+
+def _schema(cls: type) -> Dict[str, Dict[str, Any]]:
+    return {item.name: dict(item.metadata) for item in fields(cls)}
+
+
+def _build(cls: type, values: Dict[str, Any], base: Any = None) -> Any:
+    """
+    由配置字典构造配置节
+
+    未设置（或为 null）的项取默认值，base 给出时取 base 中的值；未知键忽略（原样保留在 Config.get 中）
+    """
+    names = {item.name for item in fields(cls)}
+    settings = {key: value for key, value in values.items() if key in names and value is not None}
+    return replace(base, **settings) if base is not None else cls(**settings)
+
+
+@dataclass(frozen=True)
+class EndpointConfig:
+    """LLM 端点设置；llm.endpoints 中每项未设置的字段沿用 llm.* 的值"""
+    name: str = _setting("", _STR)
+    api_base: str = _setting("https://api.openai.com/v1", _STR)
+    api_key: str = field(default="", repr=False, metadata=_STR)
+    model: str = _setting("gpt-3.5-turbo", _STR)
+    timeout: float = _setting(60, _number(0))
+    weight: float = _setting(1.0, _number(0))
+    cost: float = _setting(0.0, _number(0))  # 每千 Token 成本
+    max_concurrency: int = _setting(8, _int(1))
+    tier: int = _setting(0, _int(0))
+    max_retries: int = _setting(4, _int(0))
+    retry_base_delay: float = _setting(1.0, _number(0))
+    retry_max_delay: float = _setting(30.0, _number(0))
+    circuit_threshold: int = _setting(5, _int(1))
+    circuit_reset_seconds: float = _setting(30.0, _number(0))
+    requests_per_minute: Optional[float] = _setting(None, _number(0))
+    tokens_per_minute: Optional[float] = _setting(None, _number(0))
+
+
+# 端点可覆盖的设置
+ENDPOINT_SCHEMA: Dict[str, Dict[str, Any]] = _schema(EndpointConfig)
+
+
+@dataclass(frozen=True)
+class LLMConfig(EndpointConfig):
+    """LLM API 配置；endpoints 为合并了 llm.* 默认值的端点列表，未配置时即 llm.* 本身"""
+    batch_size: int = _setting(20, _int(1))
+    stream: bool = _setting(False, _BOOL)
+    prompt_format: str = _setting("compact", {"type": "enum", "values": ("compact", "verbose")})
+    cache_path: Optional[str] = _setting(None, _STR)
+    endpoints: Tuple[EndpointConfig, ...] = _setting((), {"type": "list", "items": ENDPOINT_SCHEMA})
+    hedge_after: Union[float, str, None] = _setting(None, _number(0, values=("auto",)))
+    health_check_interval: float = _setting(0, _number(0))
+
+    @classmethod
+    def from_dict(cls, values: Dict[str, Any]) -> "LLMConfig":
+        defaults = _build(EndpointConfig, values)
+        endpoints = tuple(_build(EndpointConfig, item, defaults) for item in values.get("endpoints") or [{}])
+        return replace(_build(cls, {key: value for key, value in values.items() if key != "endpoints"}),
+                       endpoints=endpoints)
+
+
+@dataclass(frozen=True)
+class WeChatConfig:
+    """微信配置"""
+    window_title: str = _setting("微信", _STR)
+    max_scroll_attempts: int = _setting(50, _int(0))
+    scroll_pause: float = _setting(0.5, _number(0))
+    random_delay_min: float = _setting(1, _number(0))
+    random_delay_max: float = _setting(3, _number(0))
+
+
+@dataclass(frozen=True)
+class DatabaseConfig:
+    """数据库配置"""
+    path: str = _setting("./data/market_data.db", _STR)
+    partition_dir: Optional[str] = _setting(None, _STR)
+    archive_codec: str = _setting("zlib", {"type": "enum", "values": ("zlib", "zstd")})
+    auto_archive: bool = _setting(False, _BOOL)
+    hot_months: int = _setting(2, _int(1))
+    wal: bool = _setting(True, _BOOL)
+    profile: bool = _setting(False, _BOOL)
+    slow_query_ms: float = _setting(100, _number(0))
+    query_log: str = _setting("./data/query_profile.json", _STR)
+
+
+@dataclass(frozen=True)
+class CheckpointConfig:
+    """Checkpoint 配置"""
+    path: str = _setting("./data/checkpoint.json", _STR)
+
+
+@dataclass(frozen=True)
+class ReportsConfig:
+    """报表配置"""
+    output_dir: str = _setting("./output", _STR)
+    auto_open: bool = _setting(True, _BOOL)
+    format: str = _setting("xlsx", {"type": "enum", "values": ("xlsx", "excel", "csv", "jsonl", "html")})
+    background: bool = _setting(True, _BOOL)
+
+
+@dataclass(frozen=True)
+class AnomalyConfig:
+    """价格异常检测配置"""
+    enabled: bool = _setting(True, _BOOL)
+    threshold: float = _setting(3.5, _number(0))
+    window_size: int = _setting(500, _int(1))
+    min_samples: int = _setting(5, _int(1))
+    min_log_mad: float = _setting(0.05, _number(0))
+    warm_up_rows: int = _setting(20000, _int(0))
+
+
+@dataclass(frozen=True)
+class DedupConfig:
+    """近似重复聚类配置"""
+    enabled: bool = _setting(True, _BOOL)
+    similarity_threshold: float = _setting(0.6, _number(0, 1))
+    price_tolerance: float = _setting(0.02, _number(0))
+    window_hours: float = _setting(72, _number(0))
+    max_clusters: int = _setting(200000, _int(1))
+    bands: int = _setting(16, _int(1))
+    num_perm: int = _setting(64, _int(1))
+
+
+@dataclass(frozen=True)
+class OrderBookConfig:
+    """买卖盘配置"""
+    max_age_hours: float = _setting(24, _number(0))
+    rebuild_on_start: bool = _setting(True, _BOOL)
+
+
+@dataclass(frozen=True)
+class MatchingConfig:
+    """撮合/套利提醒配置"""
+    min_spread: float = _setting(0, _number())
+    min_margin: float = _setting(0.0, _number())
+    max_candidates: int = _setting(5, _int(1))
+    include_same_group: bool = _setting(True, _BOOL)
+    webhook_url: Optional[str] = _setting(None, _STR)
+    webhook_timeout: float = _setting(3.0, _number(0))
+
+
+@dataclass(frozen=True)
+class ExportConfig:
+    """列式导出配置"""
+    output_dir: str = _setting("./output/parquet", _STR)
+    watermark_path: str = _setting("./data/export_watermark.json", _STR)
+    batch_size: int = _setting(50000, _int(1))
+    include_raw_text: bool = _setting(True, _BOOL)
+
+
+@dataclass(frozen=True)
+class QueueConfig:
+    """原始消息队列配置"""
+    claim_size: int = _setting(200, _int(1))
+    lease_seconds: float = _setting(600, _number(0))
+    max_attempts: int = _setting(3, _int(1))
+    retry_delay: float = _setting(30, _number(0))
+
+
+@dataclass(frozen=True)
+class ReplayConfig:
+    """重放解析配置；batch_size 缺省时取 llm.batch_size"""
+    concurrency: int = _setting(4, _int(1))
+    batch_size: Optional[int] = _setting(None, _int(1))
+    page_size: int = _setting(2000, _int(1))
+    cache_path: str = _setting("./data/llm_cache.db", _STR)
+
+
+@dataclass(frozen=True)
+class ServiceConfig:
+    """查询服务配置"""
+    host: str = _setting("127.0.0.1", _STR)
+    port: int = _setting(8765, _int(0))
+    cache_size: int = _setting(256, _int(1))
+
+
+@dataclass(frozen=True)
+class ImporterConfig:
+    """聊天记录导入配置；workers 缺省时取 CPU 核数"""
+    checkpoint_path: str = _setting("./data/import_checkpoint.json", _STR)
+    workers: Optional[int] = _setting(None, _int(1))
+    shard_mb: float = _setting(8, _number(0))
+    batch_size: int = _setting(5000, _int(1))
+
+
+# 配置节及其数据类
+SECTIONS: Dict[str, type] = {
+    "llm": LLMConfig,
+    "wechat": WeChatConfig,
+    "database": DatabaseConfig,
+    "checkpoint": CheckpointConfig,
+    "reports": ReportsConfig,
+    "anomaly": AnomalyConfig,
+    "dedup": DedupConfig,
+    "orderbook": OrderBookConfig,
+    "matching": MatchingConfig,
+    "export": ExportConfig,
+    "queue": QueueConfig,
+    "replay": ReplayConfig,
+    "service": ServiceConfig,
+    "importer": ImporterConfig,
+}
+
+# 已知配置项的类型与取值范围；未列出的键原样保留
+CONFIG_SCHEMA: Dict[str, Dict[str, Dict[str, Any]]] = {name: _schema(cls) for name, cls in SECTIONS.items()}
+
+
+def build_sections(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    由校验过的配置字典构造全部配置节（默认值在此一次性补齐）
+
+    Returns:
+        {节名: 配置节数据类实例}
+    """
+    sections = {}
+    for name, cls in SECTIONS.items():
+        values = raw.get(name) or {}
+        sections[name] = cls.from_dict(values) if hasattr(cls, "from_dict") else _build(cls, values)
+    return sections
+
+
+def _check_value(rule: Dict[str, Any], value: Any) -> Optional[str]:
+    kind = rule["type"]
+    values = rule.get("values", ())
+    if value in values:
+        return None
+    if kind == "enum":
+        return f"必须为 {' / '.join(values)} 之一"
+    if kind == "str":
+        return None if isinstance(value, str) else "必须为字符串"
+    if kind == "bool":
+        return None if isinstance(value, bool) else "必须为 true/false"
+    if kind == "list":
+        return None if isinstance(value, list) else "必须为列表"
+
+    numeric = (int,) if kind == "int" else (int, float)
+    if isinstance(value, bool) or not isinstance(value, numeric):
+        return "必须为整数" if kind == "int" else "必须为数字"
+    if rule.get("min") is not None and value < rule["min"]:
+        return f"不能小于 {rule['min']}"
+    if rule.get("max") is not None and value > rule["max"]:
+        return f"不能大于 {rule['max']}"
+    return None
+
+
+def _check_section(name: str, section: Any, schema: Dict[str, Dict[str, Any]], errors: List[str]) -> None:
+    if not isinstance(section, dict):
+        errors.append(f"{name} 必须为映射")
+        return
+    for key, value in section.items():
+        rule = schema.get(key)
+        if rule is None or value is None:
+            continue
+        error = _check_value(rule, value)
+        if error:
+            errors.append(f"{name}.{key} {error}")
+        elif rule["type"] == "list" and "items" in rule:
+            for index, item in enumerate(value):
+                _check_section(f"{name}.{key}[{index}]", item, rule["items"], errors)
+
+
+def validate_config(raw: Any) -> Dict[str, Any]:
+    """
+    校验配置内容
+
+    Args:
+        raw: yaml.safe_load 的结果（空文件为 None）
+
+    Returns:
+        配置字典
+
+    Raises:
+        ConfigError: 列出全部不合法的配置项
+    """
+    if raw is None:
+        return {}
+    if not isinstance(raw, dict):
+        raise ConfigError("配置文件顶层必须为映射")
+
+    errors: List[str] = []
+    for name, schema in CONFIG_SCHEMA.items():
+        if raw.get(name) is not None:
+            _check_section(name, raw[name], schema, errors)
+
+    groups = raw.get("groups")
+    if groups is not None and not (isinstance(groups, list) and all(isinstance(group, str) for group in groups)):
+        errors.append("groups 必须为群名称列表")
+    interval = raw.get("reload_interval")
+    if interval is not None:
+        error = _check_value(_number(0), interval)
+        if error:
+            errors.append(f"reload_interval {error}")
+
+    if isinstance(raw.get("wechat"), dict) and not errors:
+        wechat = _build(WeChatConfig, raw["wechat"])
+        if wechat.random_delay_min > wechat.random_delay_max:
+            errors.append("wechat.random_delay_min 不能大于 wechat.random_delay_max")
+
+    if errors:
+        raise ConfigError("配置不合法: " + "; ".join(errors))
+    return raw
+
+
+def changed_keys(old: Dict[str, Any], new: Dict[str, Any], prefix: str = "") -> List[str]:
+    """两份配置之间变化的键（点分路径，列表整体比较）"""
+    changed = []
+    for key in sorted(set(old) | set(new), key=str):
+        path = f"{prefix}{key}"
+        before, after = old.get(key), new.get(key)
+        if isinstance(before, dict) and isinstance(after, dict):
+            changed.extend(changed_keys(before, after, path + "."))
+        elif before != after:
+            changed.append(path)
+    return changed
+
+
+def _covers(keys: Sequence[str], key: str) -> bool:
+    return any(key == prefix or key.startswith(prefix + ".") for prefix in keys)
+
+
 class Config:
-    """配置管理类"""
+    """
+    配置管理类
+
+    加载时按 CONFIG_SCHEMA 校验，并构造各配置节的数据类实例（默认值已补齐），
+    组件直接读取字段。reload() / watch() 在运行中重新读取配置文件，新配置校验通过后
+    整体替换配置节实例，并通知订阅了变化项的组件；校验失败时沿用当前配置。
+    """
 
     def __init__(self, config_path: str = "./config.yaml"):
         self.config_path = config_path
         self._config: Dict[str, Any] = {}
+        self._sections: Dict[str, Any] = build_sections({})
+        # 每次成功重新加载后加一，组件可据此判断缓存的配置是否过期
+        self.generation = 0
+        self._signature: Optional[Tuple[int, int]] = None
+        self._subscribers: List[Tuple[Tuple[str, ...], Callable[["Config"], None]]] = []
+        self._lock = threading.Lock()
+        self._watch_stop: Optional[threading.Event] = None
         self._load_config()
 
     def _load_config(self) -> None:
         """加载配置文件"""
+        self._config, self._sections, self._signature = self._read()
+
+    def _read(self) -> Tuple[Dict[str, Any], Dict[str, Any], Tuple[int, int]]:
         if not os.path.exists(self.config_path):
             raise FileNotFoundError(f"配置文件不存在: {self.config_path}")
 
+        signature = self._stat()
         with open(self.config_path, 'r', encoding='utf-8') as f:
-            self._config = yaml.safe_load(f)
+            raw = validate_config(yaml.safe_load(f))
+        return raw, build_sections(raw), signature
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.config_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def subscribe(self, callback: Callable[["Config"], None], keys: Sequence[str]) -> None:
+        """
+        订阅配置变化
+
+        Args:
+            callback: callback(config)，在重新加载的线程中调用
+            keys: 关心的配置项，点分路径或其前缀，如 ("groups", "wechat.random_delay_min")
+        """
+        with self._lock:
+            self._subscribers.append((tuple(keys), callback))
+
+    def reload(self) -> List[str]:
+        """
+        重新读取配置文件并通知订阅者
+
+        Returns:
+            变化的配置项；读取或校验失败时为空列表
+        """
+        try:
+            new_config, sections, signature = self._read()
+        except (OSError, yaml.YAMLError, ConfigError) as e:
+            print(f"配置重新加载失败，沿用当前配置: {e}")
+            return []
+
+        with self._lock:
+            self._signature = signature
+            changed = changed_keys(self._config, new_config)
+            if not changed:
+                return []
+            self._config, self._sections = new_config, sections
+            self.generation += 1
+            subscribers = list(self._subscribers)
+
+        print(f"配置已重新加载 (第 {self.generation} 版): {', '.join(changed)}")
+        applied = set()
+        for keys, callback in subscribers:
+            hits = [key for key in changed if _covers(keys, key)]
+            if not hits:
+                continue
+            applied.update(hits)
+            try:
+                callback(self)
+            except Exception as e:
+                print(f"应用新配置失败 ({', '.join(hits)}): {e}")
+
+        pending = [key for key in changed if key not in applied]
+        if pending:
+            print(f"以下配置项需重启后生效: {', '.join(pending)}")
+        return changed
+
+    def check_for_changes(self) -> List[str]:
+        """配置文件有改动（修改时间或大小变化）时重新加载"""
+        signature = self._stat()
+        if signature is None or signature == self._signature:
+            return []
+        return self.reload()
+
+    def watch(self, interval: float = 5.0) -> None:
+        """启动后台线程，每 interval 秒检查一次配置文件"""
+        self.stop_watching()
+        stop = self._watch_stop = threading.Event()
+
+        def loop() -> None:
+            while not stop.wait(interval):
+                self.check_for_changes()
+
+        threading.Thread(target=loop, name="config-watch", daemon=True).start()
+
+    def stop_watching(self) -> None:
+        if self._watch_stop is not None:
+            self._watch_stop.set()
+            self._watch_stop = None
 
     @property
-    def llm(self) -> Dict[str, Any]:
+    def llm(self) -> LLMConfig:
         """LLM API 配置"""
-        return self._config.get('llm', {})
+        return self._sections['llm']
 
     @property
-    def wechat(self) -> Dict[str, Any]:
+    def wechat(self) -> WeChatConfig:
         """微信配置"""
-        return self._config.get('wechat', {})
+        return self._sections['wechat']
 
     @property
     def groups(self) -> List[str]:
         """目标群组列表"""
-        return self._config.get('groups', [])
+        return self._config.get('groups') or []
 
     @property
-    def database(self) -> Dict[str, Any]:
+    def reload_interval(self) -> float:
+        """检查配置文件改动的间隔（秒），0 为关闭"""
+        interval = self._config.get('reload_interval')
+        return 5 if interval is None else interval
+
+    @property
+    def database(self) -> DatabaseConfig:
         """数据库配置"""
-        return self._config.get('database', {})
+        return self._sections['database']
 
     @property
-    def reports(self) -> Dict[str, Any]:
+    def reports(self) -> ReportsConfig:
         """报表配置"""
-        return self._config.get('reports', {})
+        return self._sections['reports']
 
     @property
-    def checkpoint(self) -> Dict[str, Any]:
+    def checkpoint(self) -> CheckpointConfig:
         """Checkpoint 配置"""
-        return self._config.get('checkpoint', {})
+        return self._sections['checkpoint']
+
+    @property
+    def export(self) -> ExportConfig:
+        """列式导出配置"""
+        return self._sections['export']
+
+    @property
+    def anomaly(self) -> AnomalyConfig:
+        """价格异常检测配置"""
+        return self._sections['anomaly']
+
+    @property
+    def orderbook(self) -> OrderBookConfig:
+        """买卖盘配置"""
+        return self._sections['orderbook']
+
+    @property
+    def matching(self) -> MatchingConfig:
+        """撮合/套利提醒配置"""
+        return self._sections['matching']
+
+    @property
+    def dedup(self) -> DedupConfig:
+        """近似重复聚类配置"""
+        return self._sections['dedup']
+
+    @property
+    def replay(self) -> ReplayConfig:
+        """重放解析配置"""
+        return self._sections['replay']
+
+    @property
+    def queue(self) -> QueueConfig:
+        """原始消息队列配置"""
+        return self._sections['queue']
+
+    @property
+    def service(self) -> ServiceConfig:
+        """查询服务配置"""
+        return self._sections['service']
+
+    @property
+    def importer(self) -> ImporterConfig:
+        """聊天记录导入配置"""
+        return self._sections['importer']
 
     def get(self, key: str, default: Any = None) -> Any:
-        """获取配置值"""
+        """获取原始配置值（含未列入 CONFIG_SCHEMA 的键）"""
         return self._config.get(key, default)
 
 
@@ -0,0 +1,9 @@
+"""
+实时行情模块
+基于采集到的交易记录维护每个商品的买卖盘，并撮合套利机会
+"""
+
+from .orderbook import OrderBook, Offer
+from .matching import MatchingEngine, MarketEvent, StagedMatches, WebhookNotifier
+
+__all__ = ['OrderBook', 'Offer', 'MatchingEngine', 'MarketEvent', 'StagedMatches', 'WebhookNotifier']
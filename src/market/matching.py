@@ -0,0 +1,268 @@
+"""
+撮合与套利提醒
+新报价到达时与对手盘比对，发现可成交/跨群套利机会即产生事件
+"""
+
+import json
+import queue
+import threading
+import urllib.request
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Sequence
+
+from src.config import Config, MatchingConfig
+from src.processor import TransactionRecord
+from src.market.orderbook import OrderBook, Offer, SIDE_SELL, SIDE_BUY
+
+
+EVENT_MATCH = "match"          # 同群内买价 >= 卖价
+EVENT_ARBITRAGE = "arbitrage"  # 跨群买价 >= 卖价
+
+
+@dataclass
+class MarketEvent:
+    """撮合/套利事件"""
+    event_type: str
+    key: str
+    buy: Offer
+    sell: Offer
+    spread: float
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "event_type": self.event_type,
+            "key": self.key,
+            "item": self.sell.item,
+            "specs": self.sell.specs,
+            "spread": self.spread,
+            "created_at": self.created_at,
+            "buy": self.buy.to_dict(),
+            "sell": self.sell.to_dict(),
+        }
+
+    def to_db_dict(self) -> Dict[str, Any]:
+        """转换为数据库插入格式"""
+        return {
+            "created_at": self.created_at,
+            "event_type": self.event_type,
+            "item_key": self.key,
+            "item": self.sell.item,
+            "specs": self.sell.specs,
+            "buy_price": self.buy.price,
+            "sell_price": self.sell.price,
+            "spread": self.spread,
+            "buy_group": self.buy.group,
+            "sell_group": self.sell.group,
+            "buy_sender": self.buy.sender,
+            "sell_sender": self.sell.sender,
+            "buy_record_id": self.buy.record_id,
+            "sell_record_id": self.sell.record_id,
+            "buy_text": self.buy.raw_text,
+            "sell_text": self.sell.raw_text,
+        }
+
+
+class WebhookNotifier:
+    """在后台线程中把事件 POST 到本地 webhook"""
+
+    def __init__(self, url: str, timeout: float = 3.0):
+        self.url = url
+        self.timeout = timeout
+        self._queue: "queue.Queue[Optional[MarketEvent]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def notify(self, event: MarketEvent) -> None:
+        self._queue.put(event)
+
+    def close(self) -> None:
+        """发送完队列中的事件后停止"""
+        self._queue.put(None)
+        self._thread.join(timeout=self.timeout * 2)
+
+    def _run(self) -> None:
+        while True:
+            event = self._queue.get()
+            if event is None:
+                break
+            body = json.dumps(event.to_dict(), ensure_ascii=False).encode("utf-8")
+            request = urllib.request.Request(
+                self.url, data=body, headers={"Content-Type": "application/json"}
+            )
+            try:
+                urllib.request.urlopen(request, timeout=self.timeout).close()
+            except Exception as e:
+                print(f"webhook 推送失败: {e}")
+
+
+class MatchingEngine:
+    """撮合引擎"""
+
+    def __init__(
+        self,
+        config: Optional[Config] = None,
+        order_book: Optional[OrderBook] = None,
+        db: Optional[Any] = None
+    ):
+        matching_config = config.matching if config is not None else MatchingConfig()
+        self.min_spread = matching_config.min_spread
+        self.min_margin = matching_config.min_margin
+        self.max_candidates = matching_config.max_candidates
+        self.include_same_group = matching_config.include_same_group
+
+        self.order_book = order_book or OrderBook(config)
+        self.db = db
+
+        self.notifier = WebhookNotifier(
+            matching_config.webhook_url, matching_config.webhook_timeout
+        ) if matching_config.webhook_url else None
+
+    def _is_profitable(self, buy: Offer, sell: Offer) -> bool:
+        """买价是否足够覆盖卖价"""
+        spread = buy.price - sell.price
+        if spread < self.min_spread:
+            return False
+        return spread >= sell.price * self.min_margin
+
+    def _match_offer(self, offer: Offer) -> List[MarketEvent]:
+        """用对手盘的前 max_candidates 档与新报价比对"""
+        opposite = SIDE_BUY if offer.action == SIDE_SELL else SIDE_SELL
+        events = []
+
+        for counter in self.order_book.top(offer.key, opposite, self.max_candidates):
+            buy, sell = (counter, offer) if offer.action == SIDE_SELL else (offer, counter)
+            # 对手盘按价格有序，第一档不满足即可停止
+            if not self._is_profitable(buy, sell):
+                break
+            if buy.sender == sell.sender and buy.group == sell.group:
+                continue
+
+            event_type = EVENT_MATCH if buy.group == sell.group else EVENT_ARBITRAGE
+            if event_type == EVENT_MATCH and not self.include_same_group:
+                continue
+            events.append(MarketEvent(
+                event_type=event_type,
+                key=offer.key,
+                buy=buy,
+                sell=sell,
+                spread=buy.price - sell.price,
+            ))
+
+        return events
+
+    def on_record(
+        self,
+        record: TransactionRecord,
+        record_id: Optional[int] = None,
+        now: Optional[datetime] = None
+    ) -> List[MarketEvent]:
+        """
+        处理一条新记录：先入盘，再与对手盘撮合
+
+        新报价只与对手盘比对，先入盘不会与自身成交。
+
+        Args:
+            record_id: 记录在 market_data 中的 ID，写入事件的 buy/sell_record_id
+
+        Returns:
+            产生的事件列表
+        """
+        offer = self.order_book.add(record, record_id=record_id, now=now)
+        if offer is None:
+            return []
+        return self._match_offer(offer)
+
+    def process(
+        self,
+        records: Sequence[TransactionRecord],
+        record_ids: Optional[Sequence[int]] = None,
+        now: Optional[datetime] = None
+    ) -> List[MarketEvent]:
+        """
+        批量处理新记录，持久化并推送事件
+
+        Args:
+            records: 刚入库的记录
+            record_ids: 与 records 一一对应的记录 ID（insert_records / MessageQueue.complete 的返回值）
+
+        Returns:
+            产生的事件列表
+        """
+        now = now or datetime.now()
+        if record_ids is None:
+            record_ids = [None] * len(records)
+        events: List[MarketEvent] = []
+        for record, record_id in zip(records, record_ids):
+            events.extend(self.on_record(record, record_id=record_id, now=now))
+        return self._publish(events, now)
+
+    def stage(self, now: Optional[datetime] = None) -> "StagedMatches":
+        """开始一个流式批次：记录到达即撮合，提交后再持久化与推送"""
+        return StagedMatches(self, now)
+
+    def _publish(self, events: List[MarketEvent], now: datetime) -> List[MarketEvent]:
+        """清理过期报价，持久化并推送事件"""
+        self.order_book.expire(now)
+
+        if events:
+            if self.db is not None:
+                self.db.insert_events(events)
+            if self.notifier is not None:
+                for event in events:
+                    self.notifier.notify(event)
+
+            arbitrage = sum(1 for event in events if event.event_type == EVENT_ARBITRAGE)
+            print(f"撮合引擎: {len(events)} 个事件, 其中跨群套利 {arbitrage} 个")
+
+        return events
+
+    def close(self) -> None:
+        """停止 webhook 推送线程"""
+        if self.notifier is not None:
+            self.notifier.close()
+
+
+class StagedMatches:
+    """
+    一个批次的流式撮合
+
+    记录到达即入盘并与对手盘比对；批次入库后用 commit() 补上记录 ID，再持久化与推送事件，
+    重试的批次不会重复提醒。批次未能入库时 rollback() 撤回已入盘的报价。
+    """
+
+    def __init__(self, engine: MatchingEngine, now: Optional[datetime] = None):
+        self.engine = engine
+        self.now = now or datetime.now()
+        self.offers: List[Optional[Offer]] = []
+        self.events: List[MarketEvent] = []
+
+    def add(self, record: TransactionRecord) -> List[MarketEvent]:
+        """加入一条刚解析出的记录"""
+        offer = self.engine.order_book.add(record, now=self.now)
+        self.offers.append(offer)
+        if offer is None:
+            return []
+        events = self.engine._match_offer(offer)
+        self.events.extend(events)
+        return events
+
+    def commit(self, record_ids: Sequence[int]) -> List[MarketEvent]:
+        """
+        批次已入库：回填记录 ID，持久化并推送事件
+
+        Args:
+            record_ids: 与 add() 的记录一一对应的记录 ID
+        """
+        for offer, record_id in zip(self.offers, record_ids):
+            if offer is not None:
+                offer.record_id = record_id
+        return self.engine._publish(self.events, self.now)
+
+    def rollback(self) -> None:
+        """撤回本批次已入盘的报价并丢弃事件"""
+        for offer in self.offers:
+            if offer is not None:
+                self.engine.order_book.discard(offer)
+        self.offers, self.events = [], []
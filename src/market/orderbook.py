@@ -0,0 +1,277 @@
+"""
+买卖盘
+按 规范化商品+规格 维护卖盘（最小堆）与买盘（最大堆），支持按时效过期
+"""
+
+import heapq
+import itertools
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Deque, Iterable, Optional, Tuple
+
+from src.config import Config, OrderBookConfig
+from src.processor import TransactionRecord, canonical_key
+
+
+SIDE_SELL = "SELL"
+SIDE_BUY = "BUY"
+
+
+@dataclass
+class Offer:
+    """盘口中的一条报价"""
+    key: str             # 规范化商品+规格
+    action: str          # SELL / BUY
+    price: float
+    quantity: int
+    item: str
+    specs: str
+    sender: str
+    group: str
+    raw_text: str
+    capture_time: str
+    timestamp: float     # capture_time 对应的 epoch 秒
+    record_id: Optional[int] = None
+    alive: bool = True   # 过期后置为 False，由堆惰性清除
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "action": self.action,
+            "item": self.item,
+            "specs": self.specs,
+            "price": self.price,
+            "quantity": self.quantity,
+            "sender": self.sender,
+            "group": self.group,
+            "raw_text": self.raw_text,
+            "capture_time": self.capture_time,
+            "record_id": self.record_id,
+        }
+
+
+def _parse_timestamp(value: str) -> Optional[float]:
+    """ISO 时间 -> epoch 秒"""
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class _SideHeap:
+    """单边盘口堆，过期条目惰性删除"""
+
+    def __init__(self, is_buy: bool):
+        self.is_buy = is_buy
+        self.heap: List[Tuple[float, int, Offer]] = []
+        self.live = 0
+
+    def push(self, offer: Offer, seq: int) -> None:
+        # 买盘取负价格实现最大堆；同价按先到先得
+        price = -offer.price if self.is_buy else offer.price
+        heapq.heappush(self.heap, (price, seq, offer))
+        self.live += 1
+
+    def mark_dead(self) -> None:
+        """某条报价过期后调用，必要时压缩堆"""
+        self.live -= 1
+        if len(self.heap) > 64 and self.live * 2 < len(self.heap):
+            self.heap = [entry for entry in self.heap if entry[2].alive]
+            heapq.heapify(self.heap)
+
+    def _prune(self) -> None:
+        """弹出堆顶的过期条目"""
+        while self.heap and not self.heap[0][2].alive:
+            heapq.heappop(self.heap)
+
+    def best(self) -> Optional[Offer]:
+        self._prune()
+        return self.heap[0][2] if self.heap else None
+
+    def top(self, n: int) -> List[Offer]:
+        """取前 n 条报价：弹出后再压回，O(n log size)"""
+        popped = []
+        result = []
+        while self.heap and len(result) < n:
+            entry = heapq.heappop(self.heap)
+            if entry[2].alive:
+                popped.append(entry)
+                result.append(entry[2])
+        for entry in popped:
+            heapq.heappush(self.heap, entry)
+        return result
+
+
+class OrderBook:
+    """买卖盘管理器"""
+
+    def __init__(self, config: Optional[Config] = None):
+        book_config = config.orderbook if config is not None else OrderBookConfig()
+        self.max_age = timedelta(hours=book_config.max_age_hours)
+
+        self._books: Dict[str, Dict[str, _SideHeap]] = {}
+        # 按到达顺序记录报价，用于按时效过期
+        self._arrivals: Deque[Tuple[float, Offer]] = deque()
+        self._seq = itertools.count()
+
+    def __len__(self) -> int:
+        return sum(side.live for book in self._books.values() for side in book.values())
+
+    def _side(self, key: str, action: str) -> _SideHeap:
+        book = self._books.get(key)
+        if book is None:
+            book = self._books[key] = {
+                SIDE_SELL: _SideHeap(is_buy=False),
+                SIDE_BUY: _SideHeap(is_buy=True),
+            }
+        return book[action]
+
+    def add(
+        self,
+        record: TransactionRecord,
+        record_id: Optional[int] = None,
+        now: Optional[datetime] = None
+    ) -> Optional[Offer]:
+        """
+        加入一条交易记录
+
+        无效价格、被标记为异常的价格以及已过期的记录会被忽略。
+
+        Returns:
+            加入盘口的报价，未加入时为 None
+        """
+        action = (record.action or "").upper()
+        if action not in (SIDE_SELL, SIDE_BUY):
+            return None
+        if not record.price or record.price <= 0 or getattr(record, 'price_flag', ''):
+            return None
+
+        timestamp = _parse_timestamp(record.capture_time)
+        if timestamp is None:
+            return None
+
+        now = now or datetime.now()
+        cutoff = (now - self.max_age).timestamp()
+        if timestamp < cutoff:
+            return None
+
+        offer = Offer(
+            key=canonical_key(record.item, record.specs),
+            action=action,
+            price=float(record.price),
+            quantity=record.quantity,
+            item=record.item,
+            specs=record.specs,
+            sender=record.sender,
+            group=record.group,
+            raw_text=record.raw_text,
+            capture_time=record.capture_time,
+            timestamp=timestamp,
+            record_id=record_id,
+        )
+        self._side(offer.key, action).push(offer, next(self._seq))
+        self._arrivals.append((timestamp, offer))
+        return offer
+
+    def add_records(self, records: Iterable[TransactionRecord], now: Optional[datetime] = None) -> int:
+        """批量加入交易记录，并清理过期报价"""
+        now = now or datetime.now()
+        added = sum(1 for record in records if self.add(record, now=now) is not None)
+        self.expire(now)
+        return added
+
+    def expire(self, now: Optional[datetime] = None) -> int:
+        """
+        移除超过时效的报价
+
+        到达队列按时间有序时只需检查队首；回填的旧记录可能乱序，
+        因此遇到未过期的队首即停止，其余的在之后的调用中继续清理。
+        """
+        cutoff = ((now or datetime.now()) - self.max_age).timestamp()
+        expired = 0
+        while self._arrivals and self._arrivals[0][0] < cutoff:
+            _, offer = self._arrivals.popleft()
+            if offer.alive:
+                offer.alive = False
+                self._books[offer.key][offer.action].mark_dead()
+                expired += 1
+        return expired
+
+    def discard(self, offer: Offer) -> None:
+        """撤回一条报价（所属批次未能入库时调用）"""
+        if offer.alive:
+            offer.alive = False
+            self._books[offer.key][offer.action].mark_dead()
+
+    def best_ask(self, key: str) -> Optional[Offer]:
+        """最低卖价"""
+        book = self._books.get(key)
+        return book[SIDE_SELL].best() if book else None
+
+    def best_bid(self, key: str) -> Optional[Offer]:
+        """最高买价"""
+        book = self._books.get(key)
+        return book[SIDE_BUY].best() if book else None
+
+    def top(self, key: str, action: str, n: int = 5) -> List[Offer]:
+        """某一侧的前 n 条报价（卖盘按价格升序，买盘按价格降序）"""
+        book = self._books.get(key)
+        return book[action.upper()].top(n) if book else []
+
+    def spread(self, key: str) -> Optional[float]:
+        """买卖价差（最低卖价 - 最高买价），任一侧为空时返回 None"""
+        ask = self.best_ask(key)
+        bid = self.best_bid(key)
+        if ask is None or bid is None:
+            return None
+        return ask.price - bid.price
+
+    def keys(self) -> List[str]:
+        """当前有报价的商品键"""
+        return [key for key, book in self._books.items() if any(side.live for side in book.values())]
+
+    def lookup_key(self, item: str, specs: str = "") -> str:
+        """商品名称/规格 -> 盘口键"""
+        return canonical_key(item, specs)
+
+    def rebuild(self, db: Any, now: Optional[datetime] = None) -> int:
+        """
+        从 market_data 重建盘口（仅加载时效窗口内的记录）
+
+        Args:
+            db: DatabaseManager
+            now: 当前时间
+
+        Returns:
+            加入盘口的报价数
+        """
+        now = now or datetime.now()
+        cutoff = (now - self.max_age).isoformat()
+
+        self._books.clear()
+        self._arrivals.clear()
+
+        columns = [
+            "id", "capture_time", "action", "item_category", "specs", "price",
+            "quantity", "sender_nickname", "group_name", "raw_text", "price_flag",
+        ]
+        added = 0
+        # 以 (cutoff, 0) 为游标正序遍历，正好落在 capture_time 索引上
+        for row in db.iter_records(columns=columns, after=(cutoff, 0), descending=False, page_size=2000):
+            record = TransactionRecord(
+                action=row["action"] or "",
+                item=row["item_category"] or "",
+                specs=row["specs"] or "",
+                price=row["price"] or 0,
+                quantity=row["quantity"] or 1,
+                raw_text=row["raw_text"] or "",
+                sender=row["sender_nickname"] or "",
+                group=row["group_name"] or "",
+                capture_time=row["capture_time"],
+                price_flag=row["price_flag"] or "",
+            )
+            if self.add(record, record_id=row["id"], now=now) is not None:
+                added += 1
+
+        print(f"盘口已重建: {added} 条有效报价, {len(self.keys())} 个商品")
+        return added
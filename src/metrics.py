@@ -0,0 +1,85 @@
+"""
+运行指标
+进程内的计数器与直方图，供运行统计与性能分析使用
+"""
+
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+
+class Histogram:
+    """保留最近 N 个观测值的直方图"""
+
+    def __init__(self, max_samples: int = 10000):
+        self.samples: Deque[float] = deque(maxlen=max_samples)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float) -> None:
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "max": max(self.samples) if self.samples else None,
+        }
+
+
+class MetricsRegistry:
+    """指标注册表（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, float] = {}
+        self.histograms: Dict[str, Histogram] = {}
+
+    def inc(self, name: str, amount: float = 1) -> None:
+        """计数器累加"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name: str, value: float) -> None:
+        """记录一次观测值"""
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value)
+
+    def counter(self, name: str) -> float:
+        with self._lock:
+            return self.counters.get(name, 0)
+
+    def histogram(self, name: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            histogram = self.histograms.get(name)
+            return histogram.summary() if histogram else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """全部指标的快照"""
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "histograms": {name: h.summary() for name, h in self.histograms.items()},
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+# 全局注册表
+metrics = MetricsRegistry()
@@ -5,13 +5,15 @@ ETL 管道主流程
 
 import sys
 import time
-from datetime import datetime
-from typing import Dict, List
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
 
 from src.config import Config
+from src.metrics import metrics
 from src.collector import WeChatCollector, Message
 from src.processor import NLPProcessor, TransactionRecord
-from src.storage import DatabaseManager, ReportGenerator
+from src.storage import DatabaseManager, MessageQueue, ReportGenerator, ReportWorker, load_columns
+from src.market import OrderBook, MatchingEngine
 
 
 class ETLPipeline:
@@ -23,8 +25,30 @@ class ETLPipeline:
         # 初始化各模块
         self.collector = WeChatCollector(self.config)
         self.processor = NLPProcessor(self.config)
-        self.db = DatabaseManager(self.config.database['path'])
+        self.db = DatabaseManager.from_config(self.config)
+        queue_config = self.config.queue
+        self.queue = MessageQueue(
+            self.db,
+            lease_seconds=queue_config.lease_seconds,
+            max_attempts=queue_config.max_attempts,
+            retry_delay=queue_config.retry_delay
+        )
         self.reporter = ReportGenerator(self.config)
+        # 报表默认在后台线程生成，不阻塞下一轮采集
+        self.report_worker = ReportWorker(self.reporter) if self.config.reports.background else None
+        self._warm_up_anomaly_detector()
+        self._warm_up_duplicate_detector()
+
+        # 实时买卖盘，启动时从数据库重建
+        self.order_book = OrderBook(self.config)
+        if self.config.orderbook.rebuild_on_start:
+            self.order_book.rebuild(self.db)
+        self.matching_engine = MatchingEngine(self.config, self.order_book, self.db)
+
+        # 配置热加载：群列表、采集节奏、LLM 端点与并发等修改无需重启
+        self.config.subscribe(self._apply_config, ("queue", "database.auto_archive", "database.hot_months",
+                                                   "reload_interval"))
+        self._watch_config()
 
         # 统计
         self.stats = {
@@ -32,11 +56,32 @@ class ETLPipeline:
             "end_time": None,
             "total_messages": 0,
             "total_records": 0,
-            "groups_processed": 0
+            "groups_processed": 0,
+            "total_events": 0
         }
 
-    def run(self) -> None:
-        """执行完整的 ETL 流程"""
+    def _watch_config(self) -> None:
+        interval = self.config.reload_interval
+        if interval:
+            self.config.watch(interval)
+        else:
+            self.config.stop_watching()
+
+    def _apply_config(self, config: Config) -> None:
+        """热加载队列参数与检查间隔；claim_size、归档设置在每次使用时读取"""
+        queue_config = config.queue
+        self.queue.lease_seconds = queue_config.lease_seconds
+        self.queue.max_attempts = queue_config.max_attempts
+        self.queue.retry_delay = queue_config.retry_delay
+        self._watch_config()
+
+    def run(self, collect: bool = True) -> None:
+        """
+        执行完整的 ETL 流程
+
+        Args:
+            collect: 是否采集新消息；为 False 时只处理队列中积压的消息
+        """
         print("=" * 60)
         print("微信市场情报自动化系统 (WMIS)")
         print("=" * 60)
@@ -45,32 +90,41 @@ class ETLPipeline:
         self.stats["start_time"] = datetime.now()
 
         try:
-            # Step 1: 采集消息
-            print("[1/4] 开始采集消息...")
-            all_messages = self._collect_messages()
-            self.stats["total_messages"] = sum(len(msgs) for msgs in all_messages.values())
+            # Step 1: 采集消息并写入原始消息队列
+            if collect:
+                print("[1/4] 开始采集消息...")
+                self.stats["total_messages"] = self._collect_messages()
 
-            if self.stats["total_messages"] == 0:
-                print("没有采集到任何消息，程序退出")
+            # 包括上次运行崩溃遗留、租约已过期的处理中消息
+            pending = self.queue.claimable()
+            if pending == 0:
+                print("没有待处理的消息，程序退出")
                 return
 
-            # Step 2: 解析消息
-            print("\n[2/4] 开始解析消息...")
-            all_records = self._process_messages(all_messages)
+            # Step 2 + 3: 从队列领取消息解析，结果与处理状态同事务入库，每批提交后立即撮合
+            print(f"\n[2/4] 开始解析消息 (待处理 {pending} 条)...")
+            all_records = self._process_queue()
 
-            # Step 3: 存储数据
-            print("\n[3/4] 存储数据到数据库...")
+            print("\n[3/4] 入库与撮合...")
             if all_records:
-                count = self.db.insert_records(all_records)
-                print(f"已存储 {count} 条交易记录")
-                self.stats["total_records"] = count
+                print(f"已存储 {len(all_records)} 条交易记录, 撮合事件 {self.stats['total_events']} 个")
+                self.stats["total_records"] = len(all_records)
+
+            # 冷数据归档到月度分区
+            if self.config.database.auto_archive:
+                self.db.archive(self.config.database.hot_months)
 
             # Step 4: 生成报表
             print("\n[4/4] 生成报表...")
             if all_records:
-                self.reporter.generate_session_report(all_records)
+                if self.report_worker is not None:
+                    self.report_worker.submit(all_records)
+                    print("报表在后台生成")
+                else:
+                    self.reporter.generate_session_report(all_records)
 
             # 输出统计
+            self.stats["end_time"] = datetime.now()
             self._print_summary()
 
         except KeyboardInterrupt:
@@ -81,33 +135,150 @@ class ETLPipeline:
             traceback.print_exc()
         finally:
             self.stats["end_time"] = datetime.now()
+            self.config.stop_watching()
+            self.matching_engine.close()
+
+    def close(self) -> None:
+        """等待后台报表生成完毕（进程退出前调用）"""
+        if self.report_worker is not None:
+            self.report_worker.close()
+
+    def _warm_up_anomaly_detector(self) -> None:
+        """用最近的历史价格初始化异常检测的滚动分布"""
+        rows = self.config.anomaly.warm_up_rows
+        if not rows:
+            return
+
+        columns = load_columns(self.db, columns=['item_category', 'price', 'price_flag'], limit=rows)
+        clean = [not flag for flag in columns['price_flag']]
+        # 按时间正序放入滚动窗口
+        self.processor.anomaly_detector.warm_up(
+            columns['item_category'][clean][::-1],
+            columns['price'][clean][::-1]
+        )
+
+    def _warm_up_duplicate_detector(self) -> None:
+        """用时间窗口内的历史报价初始化近似重复索引"""
+        detector = self.processor.duplicate_detector
+        if not detector.enabled:
+            return
+
+        cutoff = (datetime.now() - timedelta(seconds=detector.window_seconds)).isoformat()
+        columns = load_columns(
+            self.db,
+            columns=['raw_text', 'sender_nickname', 'item_category', 'price', 'capture_time', 'cluster_id'],
+            after=(cutoff, 0),
+            descending=False
+        )
+        if len(columns['capture_time']) == 0:
+            return
+
+        detector.assign(
+            columns['raw_text'],
+            columns['sender_nickname'],
+            columns['item_category'],
+            columns['price'],
+            columns['capture_time'],
+            cluster_ids=columns['cluster_id']
+        )
 
-    def _collect_messages(self) -> Dict[str, List[Message]]:
-        """采集所有群的消息"""
-        all_messages: Dict[str, List[Message]] = {}
+    def _collect_messages(self) -> int:
+        """采集所有群的消息，逐群写入原始消息队列"""
+        total = 0
 
         for group_name in self.config.groups:
             try:
                 messages = self.collector.collect_from_group(group_name)
                 if messages:
-                    all_messages[group_name] = messages
+                    for msg in messages:
+                        if not msg.group:
+                            msg.group = group_name
+                    queued = self.queue.enqueue(messages)
+                    print(f"  群 {group_name}: 采集 {len(messages)} 条, 新入队 {queued} 条")
+                    total += len(messages)
                     self.stats["groups_processed"] += 1
             except Exception as e:
                 print(f"采集群 {group_name} 失败: {e}")
 
-        return all_messages
+        return total
 
-    def _process_messages(self, all_messages: Dict[str, List[Message]]) -> List[TransactionRecord]:
-        """处理所有消息"""
+    def _process_queue(self) -> List[TransactionRecord]:
+        """
+        消费原始消息队列
+
+        每个 LLM 批次单独提交，提交后立即按记录 ID 撮合；
+        失败的批次退回队列，退避到期后（通常是下次运行）重试。
+        """
         all_records: List[TransactionRecord] = []
 
-        for group_name, messages in all_messages.items():
-            print(f"  解析群: {group_name}, {len(messages)} 条消息")
-            records = self.processor.process_group_messages(group_name, messages)
-            all_records.extend(records)
+        while True:
+            # 每轮重新读取，热加载的修改在下一轮生效
+            claim_size = self.config.queue.claim_size
+            batch_size = self.processor.batch_size
+            token, claimed = self.queue.claim(claim_size)
+            if not claimed:
+                break
+
+            # 批次不跨群，保证记录的群名称正确
+            by_group: Dict[str, List[Tuple[int, Message]]] = {}
+            for message_id, msg in claimed:
+                by_group.setdefault(msg.group, []).append((message_id, msg))
+
+            for group_name, items in by_group.items():
+                print(f"  解析群: {group_name}, {len(items)} 条消息")
+                for i in range(0, len(items), batch_size):
+                    all_records.extend(self._process_batch(token, items[i:i + batch_size]))
+
+            if len(claimed) < claim_size:
+                break
 
         return all_records
 
+    def _process_batch(self, token: str, batch: List[Tuple[int, Message]]) -> List[TransactionRecord]:
+        """
+        解析并提交一个 LLM 批次
+
+        记录逐条到达（llm.stream 开启时随响应流式到达）即进入盘口撮合；
+        整批与处理状态同事务入库后回填记录 ID，再持久化与推送事件。
+        响应无法解析或请求被拒绝时撤回已入盘的报价，二分重试，只丢弃真正出问题的消息。
+
+        Returns:
+            已入库的交易记录
+        """
+        ids = [message_id for message_id, _ in batch]
+        messages = [msg for _, msg in batch]
+        staged = self.matching_engine.stage()
+        records: List[TransactionRecord] = []
+        dropped: List[Message] = []
+        try:
+            for record in self.processor.iter_batch(messages):
+                records.append(record)
+                staged.add(record)
+        except Exception as e:
+            staged.rollback()
+            try:
+                records = self.processor.bisect_batch(messages, e, dropped)
+            except Exception as error:
+                print(f"LLM 处理出错: {error}")
+                self.queue.fail(token, ids, str(error))
+                return []
+            for record in records:
+                staged.add(record)
+
+        # 二分后仍无法解析的消息单独标记失败，其余正常提交
+        if dropped:
+            dropped_ids = {id(msg) for msg in dropped}
+            failed_ids = [message_id for message_id, msg in batch if id(msg) in dropped_ids]
+            self.queue.fail(token, failed_ids, "无法解析的 LLM 响应")
+            ids = [message_id for message_id in ids if message_id not in failed_ids]
+
+        record_ids = self.queue.complete(token, ids, records)
+        if record_ids is None:
+            staged.rollback()
+            return []
+        self.stats["total_events"] += len(staged.commit(record_ids))
+        return records
+
     def _print_summary(self) -> None:
         """打印运行统计"""
         duration = self.stats["end_time"] - self.stats["start_time"]
@@ -120,6 +291,31 @@ class ETLPipeline:
         print(f"处理群组: {self.stats['groups_processed']}")
         print(f"采集消息: {self.stats['total_messages']}")
         print(f"有效记录: {self.stats['total_records']}")
+        queue_stats = self.queue.stats()
+        print(f"队列积压: {queue_stats['pending'] + queue_stats['processing']} 条, 失败 {queue_stats['failed']} 条")
+        print(f"盘口报价: {len(self.order_book)}")
+        print(f"撮合事件: {self.stats['total_events']}")
+        for endpoint in self.processor.llm_client.router.stats():
+            latency = f"{endpoint['latency_ewma']:.2f}s" if endpoint['latency_ewma'] is not None else "-"
+            print(f"LLM 端点 {endpoint['name']}: 请求 {endpoint['requests']}, "
+                  f"失败 {endpoint['failures']}, 重试 {endpoint['retries']}, "
+                  f"对冲 {endpoint['hedged']}/{endpoint['hedge_wins']}, 延迟 {latency}, "
+                  f"成本 {endpoint['cost']:.4f}")
+        ttfr = metrics.histogram("llm_time_to_first_record_seconds")
+        batch = metrics.histogram("llm_batch_seconds")
+        if ttfr and batch:
+            print(f"LLM 首条记录耗时: p50 {ttfr['p50']:.2f}s, p95 {ttfr['p95']:.2f}s; "
+                  f"整批耗时: p50 {batch['p50']:.2f}s, p95 {batch['p95']:.2f}s")
+        tokens = metrics.histogram("llm_input_tokens_per_message")
+        if tokens:
+            cached = metrics.counter("llm_cached_prompt_tokens")
+            prompt_tokens = metrics.counter("llm_prompt_tokens")
+            hit_rate = f", 前缀缓存命中 {cached / prompt_tokens:.0%}" if prompt_tokens else ""
+            print(f"LLM 输入: 每条消息约 {tokens['mean']:.1f} Token{hit_rate}")
+        report = metrics.histogram("report_seconds")
+        if report:
+            print(f"报表生成: {report['count']} 份, p50 {report['p50']:.2f}s, "
+                  f"合并跳过 {metrics.counter('reports_coalesced'):.0f} 份")
         print("=" * 60)
 
 
@@ -137,7 +333,10 @@ def main():
         config_path = config_path + '.yaml'
 
     pipeline = ETLPipeline(config_path)
-    pipeline.run()
+    try:
+        pipeline.run()
+    finally:
+        pipeline.close()
 
 
 if __name__ == "__main__":
@@ -4,6 +4,18 @@ LLM 智能解析模块
 """
 
 from .processor import NLPProcessor, TransactionRecord, LLMClient
-from .prompt import LLM_PROMPT
+from .batch import RecordBatch
+from .normalize import parse_price, parse_quantity, normalize_prices, normalize_quantities
+from .prompt import LLM_PROMPT, PromptBuilder
+from .anomaly import PriceAnomalyDetector
+from .canonical import canonical_item, canonical_specs, canonical_key
+from .dedup import NearDuplicateDetector
+from .cache import ResponseCache
+from .replay import ReplayRunner
 
-__all__ = ['NLPProcessor', 'TransactionRecord', 'LLMClient', 'LLM_PROMPT']
+__all__ = [
+    'NLPProcessor', 'TransactionRecord', 'RecordBatch', 'LLMClient', 'LLM_PROMPT', 'PromptBuilder',
+    'PriceAnomalyDetector', 'NearDuplicateDetector', 'ResponseCache', 'ReplayRunner',
+    'canonical_item', 'canonical_specs', 'canonical_key',
+    'parse_price', 'parse_quantity', 'normalize_prices', 'normalize_quantities'
+]
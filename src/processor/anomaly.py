@@ -0,0 +1,206 @@
+"""
+价格异常检测
+基于每个商品的滚动价格分布（对数空间中位数/MAD）标记离群价格
+"""
+
+from collections import deque
+from typing import Any, List, Dict, Deque, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.config import AnomalyConfig, Config
+from src.processor.canonical import canonical_item
+
+
+# 价格标记
+FLAG_OK = ""
+FLAG_INVALID = "invalid"   # 价格缺失或非正数
+FLAG_LOW = "low"           # 显著低于该商品的常见价格（如 5800 被解析为 58）
+FLAG_HIGH = "high"         # 显著高于该商品的常见价格
+
+
+def _group_medians(codes: np.ndarray, values: np.ndarray, n_groups: int) -> np.ndarray:
+    """按组求中位数（一次排序完成，不逐组循环）"""
+    order = np.lexsort((values, codes))
+    sorted_values = values[order]
+    counts = np.bincount(codes, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    medians = np.full(n_groups, np.nan)
+    present = counts > 0
+    lo = starts[present] + (counts[present] - 1) // 2
+    hi = starts[present] + counts[present] // 2
+    medians[present] = (sorted_values[lo] + sorted_values[hi]) / 2
+    return medians
+
+
+class PriceAnomalyDetector:
+    """
+    价格异常检测器
+
+    在对数价格上计算修正 Z 分数 0.6745 * (x - median) / MAD，
+    超过阈值即标记。对数空间让"少了两个零"这类量级错误格外显眼。
+    """
+
+    def __init__(self, config: Optional[Config] = None):
+        anomaly_config = config.anomaly if config is not None else AnomalyConfig()
+        self.enabled = anomaly_config.enabled
+        self.threshold = anomaly_config.threshold
+        self.window_size = anomaly_config.window_size
+        self.min_samples = anomaly_config.min_samples
+        # 对数 MAD 下限，避免价格高度一致时微小波动也被标记
+        self.min_mad = anomaly_config.min_log_mad
+
+        # 每个规范化商品最近的正常价格（log10）
+        self.history: Dict[str, Deque[float]] = {}
+
+    def warm_up(self, items: Iterable[str], prices: Iterable[float]) -> None:
+        """用历史数据初始化滚动分布（不做检测）"""
+        for item, price in zip(items, prices):
+            if price and price > 0:
+                key = canonical_item(item or "")
+                window = self.history.get(key)
+                if window is None:
+                    window = self.history[key] = deque(maxlen=self.window_size)
+                window.append(float(np.log10(price)))
+
+    def detect(
+        self,
+        items: Sequence[str],
+        prices: Sequence[float],
+        update: bool = True
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        批量检测价格
+
+        Args:
+            items: 商品名称列
+            prices: 价格列
+            update: 是否把正常价格并入滚动分布
+
+        Returns:
+            (标记数组, 修正 Z 分数数组)
+        """
+        n = len(prices)
+        flags = np.full(n, FLAG_OK, dtype=object)
+        scores = np.zeros(n)
+        if n == 0:
+            return flags, scores
+
+        prices_arr = np.asarray(prices, dtype=np.float64)
+        valid = np.isfinite(prices_arr) & (prices_arr > 0)
+        flags[~valid] = FLAG_INVALID
+
+        # 商品编码（按出现顺序）
+        index: Dict[str, int] = {}
+        codes = np.fromiter(
+            (index.setdefault(canonical_item(item or ""), len(index)) for item in items),
+            dtype=np.int64,
+            count=n
+        )
+        keys = list(index)
+        n_groups = len(keys)
+
+        # 历史窗口与本批次的有效价格合并计算分布
+        hist_codes: List[np.ndarray] = []
+        hist_values: List[np.ndarray] = []
+        for code, key in enumerate(keys):
+            window = self.history.get(key)
+            if window:
+                hist_values.append(np.fromiter(window, dtype=np.float64, count=len(window)))
+                hist_codes.append(np.full(len(window), code, dtype=np.int64))
+
+        log_prices = np.zeros(n)
+        log_prices[valid] = np.log10(prices_arr[valid])
+        all_codes = np.concatenate(hist_codes + [codes[valid]])
+        all_values = np.concatenate(hist_values + [log_prices[valid]])
+
+        if len(all_values) == 0:
+            return flags, scores
+
+        counts = np.bincount(all_codes, minlength=n_groups)
+        medians = _group_medians(all_codes, all_values, n_groups)
+        deviations = np.abs(all_values - medians[all_codes])
+        mads = np.maximum(_group_medians(all_codes, deviations, n_groups), self.min_mad)
+
+        # 样本不足的商品不做判断
+        judged = valid & (counts[codes] >= self.min_samples)
+        scores[judged] = 0.6745 * (log_prices[judged] - medians[codes[judged]]) / mads[codes[judged]]
+        flags[judged & (scores > self.threshold)] = FLAG_HIGH
+        flags[judged & (scores < -self.threshold)] = FLAG_LOW
+
+        if update:
+            self._update_history(keys, codes, log_prices, valid & (flags == FLAG_OK))
+
+        return flags, scores
+
+    def _update_history(
+        self,
+        keys: List[str],
+        codes: np.ndarray,
+        log_prices: np.ndarray,
+        mask: np.ndarray
+    ) -> None:
+        """把正常价格追加到各商品的滚动窗口"""
+        ok_codes = codes[mask]
+        ok_values = log_prices[mask]
+        if len(ok_codes) == 0:
+            return
+
+        # 稳定排序保持组内原始顺序，再按组切分
+        order = np.argsort(ok_codes, kind="stable")
+        ok_codes = ok_codes[order]
+        ok_values = ok_values[order]
+        boundaries = np.flatnonzero(np.diff(ok_codes)) + 1
+
+        for group_codes, group_values in zip(
+            np.split(ok_codes, boundaries), np.split(ok_values, boundaries)
+        ):
+            key = keys[group_codes[0]]
+            window = self.history.get(key)
+            if window is None:
+                window = self.history[key] = deque(maxlen=self.window_size)
+            window.extend(group_values[-self.window_size:].tolist())
+
+    def check_records(self, records: List[Any]) -> int:
+        """
+        检测交易记录并写入 price_flag
+
+        Args:
+            records: TransactionRecord 列表
+
+        Returns:
+            被标记的记录数
+        """
+        if not self.enabled or not records:
+            return 0
+
+        flags, _ = self.detect(
+            [record.item for record in records],
+            [record.price for record in records]
+        )
+        for record, flag in zip(records, flags):
+            record.price_flag = flag
+
+        flagged = int(np.count_nonzero(flags != FLAG_OK))
+        if flagged:
+            print(f"价格异常检测: 标记 {flagged} 条可疑记录")
+        return flagged
+
+
+if __name__ == "__main__":
+    # 对数据库中的历史记录重新打标
+    import time
+
+    from src.config import load_config
+    from src.storage import DatabaseManager, load_columns
+
+    config = load_config("./config.yaml")
+    db = DatabaseManager.from_config(config)
+
+    start = time.perf_counter()
+    columns = load_columns(db, columns=["id", "item_category", "price"], descending=False)
+    detector = PriceAnomalyDetector(config)
+    flags, _ = detector.detect(columns["item_category"], columns["price"])
+    updated = db.update_price_flags(zip(flags.tolist(), columns["id"].tolist()))
+    print(f"重新打标 {updated} 条记录，耗时 {time.perf_counter() - start:.2f}s")
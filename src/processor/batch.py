@@ -0,0 +1,84 @@
+"""
+列式记录批
+把大量 TransactionRecord 按字段存为列，数值列使用紧凑数组
+"""
+
+from array import array
+from dataclasses import fields
+from typing import Any, List, Dict, Iterable, Iterator, Optional, Sequence
+
+from src.processor.processor import DB_COLUMN_ATTRS, TransactionRecord, _intern
+
+
+class RecordBatch:
+    """
+    列式交易记录批
+
+    每个字段一列：价格为 array('d')，数量为 array('q')，字符串列为驻留字符串的列表。
+    相比逐条对象省去每条记录的对象头与槽位，可直接生成数据库行元组或 DataFrame。
+    """
+
+    FIELDS = tuple(field.name for field in fields(TransactionRecord))
+
+    # 取值重复度高、值得驻留的列
+    INTERNED = ("action", "item", "sender", "group", "message_time", "capture_time", "price_flag")
+
+    __slots__ = ("columns",)
+
+    def __init__(self):
+        self.columns: Dict[str, Any] = {name: [] for name in self.FIELDS}
+        self.columns["price"] = array("d")
+        self.columns["quantity"] = array("q")
+
+    @classmethod
+    def from_records(cls, records: Iterable[TransactionRecord]) -> "RecordBatch":
+        batch = cls()
+        batch.extend(records)
+        return batch
+
+    def __len__(self) -> int:
+        return len(self.columns["price"])
+
+    def append(self, record: TransactionRecord) -> None:
+        for name, column in self.columns.items():
+            value = getattr(record, name)
+            column.append(_intern(value) if name in self.INTERNED else value)
+
+    def extend(self, records: Iterable[TransactionRecord]) -> None:
+        for record in records:
+            self.append(record)
+
+    def column(self, name: str) -> Any:
+        """某个字段的整列"""
+        return self.columns[name]
+
+    def record(self, index: int) -> TransactionRecord:
+        """按需还原第 index 条记录"""
+        return TransactionRecord(**{name: column[index] for name, column in self.columns.items()})
+
+    def __iter__(self) -> Iterator[TransactionRecord]:
+        for index in range(len(self)):
+            yield self.record(index)
+
+    def db_rows(self, columns: Sequence[str]) -> Iterator[tuple]:
+        """
+        按 market_data 列名逐行产出元组（供 executemany）
+
+        Args:
+            columns: market_data 列名，如 DatabaseManager.INSERT_COLUMNS
+        """
+        return zip(*(self.columns[DB_COLUMN_ATTRS[column]] for column in columns))
+
+    def to_frame(self, rename: Optional[Dict[str, str]] = None, names: Optional[List[str]] = None) -> Any:
+        """
+        转为 pandas DataFrame（直接由列构建）
+
+        Args:
+            rename: 字段名 -> 列标题
+            names: 只取这些字段，默认全部
+        """
+        import pandas as pd
+
+        names = names or list(self.FIELDS)
+        rename = rename or {}
+        return pd.DataFrame({rename.get(name, name): self.columns[name] for name in names})
@@ -0,0 +1,417 @@
+"""
+解析质量与成本基准
+把标注语料送入 LLMClient（录制的响应或本地桩），按字段统计准确率/召回率，
+并报告延迟、吞吐、Token 与每千条消息的成本
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Any, List, Dict, Optional, Tuple
+
+from src.config import Config
+from src.collector import Message
+from src.metrics import Histogram
+from src.processor.cache import cache_key
+from src.processor.canonical import canonical_item, canonical_specs
+from src.processor.processor import LLMClient, TransactionRecord
+from src.processor.prompt import compact_text, estimate_tokens
+
+
+DEFAULT_CORPUS = "./benchmarks/golden_corpus.jsonl"
+
+# 参与评分的字段
+FIELDS = ("action", "item", "specs", "price", "quantity")
+
+# 价格相对误差容忍度
+PRICE_TOLERANCE = 0.005
+
+# 紧凑格式的消息行: 编号 发送者代号: 内容
+_COMPACT_LINE = re.compile(r"^(\d+) [^:]*: (.*)$")
+
+
+class CorpusMessage:
+    """一条标注消息"""
+    __slots__ = ("id", "message", "records")
+
+    def __init__(self, id: str, message: Message, records: List[Dict[str, Any]]):
+        self.id = id
+        self.message = message
+        self.records = records
+
+
+def load_corpus(path: str) -> List[CorpusMessage]:
+    """
+    读取标注语料（JSONL，每行一条消息）
+
+    每行字段: id, group, sender, time, content, records（期望提取的记录列表）
+    """
+    corpus = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            message = Message(
+                sender=item.get("sender", ""),
+                time=item.get("time", ""),
+                content=item["content"],
+                group=item.get("group", ""),
+            )
+            corpus.append(CorpusMessage(item["id"], message, item.get("records", [])))
+    return corpus
+
+
+def _field_equal(field: str, predicted: Any, expected: Any) -> bool:
+    if field == "item":
+        return canonical_item(str(predicted or "")) == canonical_item(str(expected or ""))
+    if field == "specs":
+        return canonical_specs(str(predicted or "")) == canonical_specs(str(expected or ""))
+    if field == "price":
+        try:
+            predicted, expected = float(predicted), float(expected)
+        except (TypeError, ValueError):
+            return False
+        return abs(predicted - expected) <= abs(expected) * PRICE_TOLERANCE
+    if field == "quantity":
+        return int(predicted or 1) == int(expected or 1)
+    return str(predicted or "").upper() == str(expected or "").upper()
+
+
+def _pair(
+    predicted: List[Dict[str, Any]],
+    expected: List[Dict[str, Any]]
+) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """
+    同一消息内把预测记录与标注记录配对
+
+    商品相同，或方向与价格都相同才视为同一笔报价；多个候选时取字段一致数最多的。
+    """
+    pairs = []
+    unused = list(expected)
+    for record in predicted:
+        best, best_agreement = None, 0
+        for gold in unused:
+            same_item = _field_equal("item", record.get("item"), gold.get("item"))
+            same_quote = (_field_equal("action", record.get("action"), gold.get("action"))
+                          and _field_equal("price", record.get("price"), gold.get("price")))
+            if not (same_item or same_quote):
+                continue
+            agreement = sum(_field_equal(field, record.get(field), gold.get(field)) for field in FIELDS)
+            if agreement > best_agreement:
+                best, best_agreement = gold, agreement
+        if best is not None:
+            unused.remove(best)
+            pairs.append((record, best))
+    return pairs
+
+
+def _ratio(numerator: float, denominator: float) -> Optional[float]:
+    return numerator / denominator if denominator else None
+
+
+def score(
+    corpus: List[CorpusMessage],
+    predictions: Dict[str, List[Dict[str, Any]]]
+) -> Dict[str, Any]:
+    """
+    计算准确率与召回率
+
+    字段级: 配对后该字段一致的记录数 / 预测记录数（准确率）或标注记录数（召回率）；
+    记录级: 全部字段一致才算正确。
+
+    Args:
+        corpus: 标注语料
+        predictions: 消息 ID -> 预测记录列表
+
+    Returns:
+        {"records": {...}, "fields": {字段: {...}}, "predicted": n, "expected": n}
+    """
+    predicted_total = sum(len(records) for records in predictions.values())
+    expected_total = sum(len(item.records) for item in corpus)
+    correct = {field: 0 for field in FIELDS}
+    exact = 0
+
+    for item in corpus:
+        for record, gold in _pair(predictions.get(item.id, []), item.records):
+            matches = [field for field in FIELDS if _field_equal(field, record.get(field), gold.get(field))]
+            for field in matches:
+                correct[field] += 1
+            if len(matches) == len(FIELDS):
+                exact += 1
+
+    def summary(hits: int) -> Dict[str, Optional[float]]:
+        precision = _ratio(hits, predicted_total)
+        recall = _ratio(hits, expected_total)
+        f1 = 2 * precision * recall / (precision + recall) if precision and recall else 0.0
+        return {"precision": precision, "recall": recall, "f1": f1}
+
+    return {
+        "predicted": predicted_total,
+        "expected": expected_total,
+        "records": summary(exact),
+        "fields": {field: summary(correct[field]) for field in FIELDS},
+    }
+
+
+class _BenchCompletions:
+    """
+    替换端点 client.chat.completions 的基类
+
+    统计调用次数、输入/输出 Token 与成本；子类实现 _respond。
+    """
+
+    def __init__(self, cost_per_1k: float = 0.0):
+        self.cost_per_1k = cost_per_1k
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self._lock = threading.Lock()
+
+    def create(self, model: str, messages: List[Dict[str, str]], **kwargs) -> Any:
+        system, user = messages[0]["content"], messages[-1]["content"]
+        text, usage = self._respond(model, system, user, kwargs)
+        input_tokens = getattr(usage, "prompt_tokens", None) or estimate_tokens(system) + estimate_tokens(user)
+        output_tokens = getattr(usage, "completion_tokens", None) or estimate_tokens(text)
+        with self._lock:
+            self.calls += 1
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=text))],
+            usage=usage,
+        )
+
+    def _respond(self, model: str, system: str, user: str, kwargs: Dict[str, Any]) -> Tuple[str, Any]:
+        raise NotImplementedError
+
+    @property
+    def cost(self) -> float:
+        return (self.input_tokens + self.output_tokens) / 1000 * self.cost_per_1k
+
+
+class StubCompletions(_BenchCompletions):
+    """
+    本地桩：按标注答案作答，可模拟延迟
+
+    用于校验评测流程本身以及测量 LLM 以外的开销；紧凑格式下回填消息编号，
+    verbose 格式没有编号，记录会归属批次第一条消息。
+    """
+
+    def __init__(self, corpus: List[CorpusMessage], latency: float = 0.0, cost_per_1k: float = 0.0):
+        super().__init__(cost_per_1k)
+        self.latency = latency
+        self.answers = {compact_text(item.message.content): item.records for item in corpus}
+        self.verbose_answers = [(item.message.content, item.records) for item in corpus]
+
+    def _respond(self, model, system, user, kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        results = []
+        if user.startswith("#"):
+            for line in user.splitlines()[1:]:
+                match = _COMPACT_LINE.match(line)
+                if match:
+                    number = int(match.group(1))
+                    results.extend({"id": number, **record} for record in self.answers.get(match.group(2), []))
+        else:
+            for content, records in self.verbose_answers:
+                if content and content in user:
+                    results.extend(records)
+        return json.dumps(results, ensure_ascii=False), None
+
+
+class RecordedCompletions(_BenchCompletions):
+    """
+    录制/回放的响应
+
+    响应按 (模型, 系统提示词, 输入) 的哈希保存在 JSONL 文件中。
+    提供 upstream 时调用真实端点并追加录制；否则只回放，缺少录制时报错。
+    """
+
+    def __init__(self, path: str, upstream: Any = None, cost_per_1k: float = 0.0, lock: Optional[threading.Lock] = None):
+        super().__init__(cost_per_1k)
+        self.path = path
+        self.upstream = upstream
+        self._file_lock = lock or threading.Lock()
+        self.responses: Dict[str, str] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        item = json.loads(line)
+                        self.responses[item["key"]] = item["response"]
+
+    def _respond(self, model, system, user, kwargs):
+        key = cache_key(model, system, user)
+        if self.upstream is None:
+            text = self.responses.get(key)
+            if text is None:
+                raise LookupError(f"没有录制的响应 (模型 {model}，输入 {user[:40]!r})")
+            return text, None
+
+        response = self.upstream.chat.completions.create(
+            model=model,
+            messages=[{"role": "system", "content": system}, {"role": "user", "content": user}],
+            **kwargs
+        )
+        text = response.choices[0].message.content or ""
+        with self._file_lock:
+            self.responses[key] = text
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "model": model, "response": text}, ensure_ascii=False) + "\n")
+        return text, getattr(response, "usage", None)
+
+
+def _batches(corpus: List[CorpusMessage], batch_size: int) -> List[List[Message]]:
+    """与实时流程一致：按群分组，再按批大小切分"""
+    groups: Dict[str, List[Message]] = {}
+    for item in corpus:
+        groups.setdefault(item.message.group, []).append(item.message)
+    return [
+        messages[i:i + batch_size]
+        for messages in groups.values()
+        for i in range(0, len(messages), batch_size)
+    ]
+
+
+def _as_dict(record: TransactionRecord) -> Dict[str, Any]:
+    return {field: getattr(record, field) for field in FIELDS}
+
+
+def run_benchmark(
+    config: Config,
+    corpus_path: str = DEFAULT_CORPUS,
+    responses: Optional[str] = None,
+    record: bool = False,
+    stub_latency: Optional[float] = None,
+    concurrency: int = 1,
+    limit: Optional[int] = None,
+    llm_client: Optional[LLMClient] = None
+) -> Dict[str, Any]:
+    """
+    运行基准
+
+    Args:
+        config: 配置（模型、提示词格式、批大小、端点成本）
+        corpus_path: 标注语料路径
+        responses: 录制响应文件；record=True 时调用真实端点并写入该文件
+        record: 是否录制
+        stub_latency: 不为 None 时使用本地桩，值为每次调用的模拟延迟（秒）
+        concurrency: 并发批次数
+        limit: 只使用语料前 N 条
+        llm_client: 自定义客户端（测试用）
+
+    Returns:
+        评测报告
+    """
+    corpus = load_corpus(corpus_path)[:limit]
+    client = llm_client or LLMClient(config)
+    # 基准测的是真实调用，不走响应缓存；录制/回放按整批响应进行
+    client.cache = None
+    client.stream = False
+
+    file_lock = threading.Lock()
+    fakes: List[_BenchCompletions] = []
+    for endpoint in client.router.endpoints:
+        if stub_latency is not None:
+            fake = StubCompletions(corpus, stub_latency, endpoint.cost)
+        elif responses:
+            fake = RecordedCompletions(responses, endpoint.client if record else None, endpoint.cost, file_lock)
+        else:
+            raise ValueError("需要指定本地桩或录制响应文件")
+        wrapper = SimpleNamespace(chat=SimpleNamespace(completions=fake))
+        endpoint.client = wrapper
+        fakes.append(fake)
+
+    sources = {
+        (item.message.sender, item.message.time, item.message.content): item.id
+        for item in corpus
+    }
+    predictions: Dict[str, List[Dict[str, Any]]] = {}
+    latency = Histogram()
+    failed: List[Message] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def process(batch: List[Message]) -> None:
+        nonlocal errors
+        start = time.perf_counter()
+        dropped: List[Message] = []
+        try:
+            records = client.extract_batch(batch, dropped)
+        except Exception as e:
+            print(f"批次失败: {e}")
+            with lock:
+                errors += 1
+                failed.extend(batch)
+            return
+        elapsed = time.perf_counter() - start
+        with lock:
+            latency.observe(elapsed)
+            failed.extend(dropped)
+            for record in records:
+                source = sources.get((record.sender, record.message_time, record.raw_text))
+                if source is not None:
+                    predictions.setdefault(source, []).append(_as_dict(record))
+
+    batches = _batches(corpus, client.batch_size)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        list(executor.map(process, batches))
+    wall = time.perf_counter() - start
+
+    per_1k = 1000 / len(corpus) if corpus else 0.0
+    input_tokens = sum(fake.input_tokens for fake in fakes)
+    output_tokens = sum(fake.output_tokens for fake in fakes)
+    report = score(corpus, predictions)
+    report.update({
+        "messages": len(corpus),
+        "batches": len(batches),
+        "calls": sum(fake.calls for fake in fakes),
+        "failed_messages": len(failed),
+        "errors": errors,
+        "prompt_format": client.prompt.style,
+        "latency": latency.summary(),
+        "wall_seconds": wall,
+        "messages_per_second": len(corpus) / wall if wall else None,
+        "tokens": {"input": input_tokens, "output": output_tokens},
+        "tokens_per_1k_messages": (input_tokens + output_tokens) * per_1k,
+        "cost_per_1k_messages": sum(fake.cost for fake in fakes) * per_1k,
+    })
+    return report
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """评测报告的文本形式"""
+    def pct(value: Optional[float]) -> str:
+        return f"{value:.1%}" if value is not None else "-"
+
+    def secs(value: Optional[float]) -> str:
+        return f"{value:.2f}s" if value is not None else "-"
+
+    lines = [
+        f"语料 {report['messages']} 条消息, 标注 {report['expected']} 条记录, 预测 {report['predicted']} 条 "
+        f"(提示词 {report['prompt_format']}, {report['batches']} 批, {report['calls']} 次调用)",
+        f"失败: {report['errors']} 批, 丢弃 {report['failed_messages']} 条消息",
+        "",
+        f"{'字段':<10}{'准确率':>10}{'召回率':>10}{'F1':>10}",
+    ]
+    rows = [("记录", report["records"])] + list(report["fields"].items())
+    for name, value in rows:
+        lines.append(f"{name:<10}{pct(value['precision']):>10}{pct(value['recall']):>10}{pct(value['f1']):>10}")
+
+    latency = report["latency"]
+    lines += [
+        "",
+        f"批次延迟: p50 {secs(latency['p50'])}, p95 {secs(latency['p95'])}, 最大 {secs(latency['max'])}",
+        f"总耗时 {report['wall_seconds']:.2f}s, 吞吐 {report['messages_per_second'] or 0:.1f} 条/秒",
+        f"Token: 输入 {report['tokens']['input']}, 输出 {report['tokens']['output']}, "
+        f"每千条消息 {report['tokens_per_1k_messages']:.0f}",
+        f"每千条消息成本: {report['cost_per_1k_messages']:.4f}",
+    ]
+    return "\n".join(lines)
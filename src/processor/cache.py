@@ -0,0 +1,67 @@
+"""
+LLM 响应缓存
+以 模型+提示词+输入 的哈希为键缓存原始响应，重放时避免重复调用
+"""
+
+import hashlib
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+
+def cache_key(model: str, prompt: str, input_text: str) -> str:
+    """计算缓存键"""
+    digest = hashlib.sha256()
+    for part in (model, prompt, input_text):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """基于 SQLite 的响应缓存（线程安全）"""
+
+    def __init__(self, cache_path: str = "./data/llm_cache.db"):
+        self.cache_path = cache_path
+        Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                created_at DATETIME NOT NULL
+            )
+        ''')
+        self._conn.commit()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，未命中返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        """写入缓存"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response, created_at) VALUES (?, ?, ?)",
+                (key, response, datetime.now().isoformat())
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,45 @@
+"""
+商品规范化
+将 LLM 输出的商品名称/规格归一为可比较的键
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+
+# 分隔符与标点
+_SEPARATOR_PATTERN = re.compile(r"[\s\-_/,，、;；:：|()（）\[\]【】]+")
+
+
+@lru_cache(maxsize=65536)
+def canonical_item(item: str) -> str:
+    """
+    规范化商品名称
+
+    全角转半角、统一小写并去掉空白和标点，
+    例如 "iPhone 14 Pro Max" 与 "iphone14promax" 归为同一键。
+    """
+    if not item:
+        return ""
+    text = unicodedata.normalize("NFKC", item).lower()
+    return _SEPARATOR_PATTERN.sub("", text)
+
+
+@lru_cache(maxsize=65536)
+def canonical_specs(specs: str) -> str:
+    """
+    规范化规格
+
+    规格中的各项顺序不固定（"256G 紫色" / "紫色 256g"），
+    因此拆分后排序再拼接。
+    """
+    if not specs:
+        return ""
+    text = unicodedata.normalize("NFKC", specs).lower()
+    tokens = [token for token in _SEPARATOR_PATTERN.split(text) if token]
+    return " ".join(sorted(tokens))
+
+
+def canonical_key(item: str, specs: str = "") -> str:
+    """商品 + 规格的组合键"""
+    return f"{canonical_item(item)}|{canonical_specs(specs)}"
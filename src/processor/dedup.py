@@ -0,0 +1,273 @@
+"""
+近似重复报价聚类
+基于 MinHash + LSH 识别同一卖家跨群/跨时间转发的相同报价
+"""
+
+import hashlib
+import re
+import unicodedata
+from datetime import datetime
+from typing import Any, List, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.config import Config, DedupConfig
+from src.processor.canonical import canonical_item
+
+
+# shingle 哈希取低 32 位
+_MASK32 = (1 << 32) - 1
+
+# 归一化时去掉的字符：空白、标点、符号与表情
+_NOISE_PATTERN = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def normalize_text(text: str) -> str:
+    """归一化消息文本，只保留文字和数字"""
+    if not text:
+        return ""
+    return _NOISE_PATTERN.sub("", unicodedata.normalize("NFKC", text).lower())
+
+
+def shingle_hashes(text: str, size: int = 3) -> np.ndarray:
+    """
+    字符 n-gram 的哈希集合
+
+    使用内置 hash()：签名只在进程内比较（预热时会重新计算），
+    不需要跨进程稳定。
+    """
+    normalized = normalize_text(text)
+    if len(normalized) <= size:
+        grams = {normalized}
+    else:
+        grams = {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+    hashes = np.fromiter(map(hash, grams), dtype=np.int64, count=len(grams))
+    return hashes.view(np.uint64) & np.uint64(_MASK32)
+
+
+class MinHasher:
+    """批量计算 MinHash 签名"""
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 3, seed: int = 42):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        # multiply-shift 哈希族：a 取奇数，uint64 乘法自然回绕，取高 32 位
+        self.a = rng.integers(1, 1 << 63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)
+
+    def signatures(self, texts: Sequence[str], chunk_size: int = 2000) -> np.ndarray:
+        """
+        计算一批文本的签名
+
+        同一块内的 shingle 拼接成一个数组，一次完成所有哈希置换，
+        再用 minimum.reduceat 按文本分段求最小值。
+
+        Returns:
+            形状为 (len(texts), num_perm) 的 uint64 数组
+        """
+        result = np.empty((len(texts), self.num_perm), dtype=np.uint64)
+
+        for start in range(0, len(texts), chunk_size):
+            chunk = [shingle_hashes(text, self.shingle_size) for text in texts[start:start + chunk_size]]
+            lengths = np.fromiter((len(h) for h in chunk), dtype=np.int64, count=len(chunk))
+            offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+            values = np.concatenate(chunk)
+
+            permuted = (self.a[:, None] * values[None, :] + self.b[:, None]) >> np.uint64(32)
+            result[start:start + len(chunk)] = np.minimum.reduceat(permuted, offsets, axis=1).T
+
+        return result
+
+
+class _Cluster:
+    """聚类代表"""
+    __slots__ = ("cluster_id", "signature", "band_keys", "price", "last_seen")
+
+    def __init__(self, cluster_id: str, signature: np.ndarray, band_keys: List[bytes],
+                 price: float, last_seen: float):
+        self.cluster_id = cluster_id
+        self.signature = signature
+        self.band_keys = band_keys
+        self.price = price
+        self.last_seen = last_seen
+
+
+def _timestamp(value: str) -> float:
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return datetime.now().timestamp()
+
+
+class NearDuplicateDetector:
+    """
+    近似重复检测器
+
+    候选报价由 LSH 分桶给出，再要求 发送者相同、商品相同、价格在容差内、
+    估计 Jaccard 相似度达到阈值，才归入同一聚类。
+    """
+
+    def __init__(self, config: Optional[Config] = None):
+        dedup_config = config.dedup if config is not None else DedupConfig()
+        self.enabled = dedup_config.enabled
+        self.threshold = dedup_config.similarity_threshold
+        self.price_tolerance = dedup_config.price_tolerance
+        self.window_seconds = dedup_config.window_hours * 3600
+        self.max_clusters = dedup_config.max_clusters
+        self.bands = dedup_config.bands
+
+        self.hasher = MinHasher(num_perm=dedup_config.num_perm)
+        self.rows = self.hasher.num_perm // self.bands
+
+        self.clusters: Dict[str, _Cluster] = {}
+        self.band_index: List[Dict[bytes, List[str]]] = [{} for _ in range(self.bands)]
+
+    def _band_keys(self, signature: np.ndarray, prefix: bytes) -> List[bytes]:
+        """LSH 分桶键；发送者和商品作为前缀，候选只来自同一卖家的同一商品"""
+        raw = signature.tobytes()
+        width = self.rows * signature.itemsize
+        return [prefix + raw[band * width:(band + 1) * width] for band in range(self.bands)]
+
+    def _is_duplicate(self, cluster: _Cluster, signature: np.ndarray,
+                      price: float, timestamp: float) -> bool:
+        """候选聚类已按发送者+商品分桶，这里只校验时间、价格和相似度"""
+        if abs(timestamp - cluster.last_seen) > self.window_seconds:
+            return False
+        if cluster.price > 0 and abs(price - cluster.price) > cluster.price * self.price_tolerance:
+            return False
+        matches = np.count_nonzero(cluster.signature == signature)
+        return matches >= self.threshold * len(signature)
+
+    def _new_cluster_id(self, sender: str, item: str, price: float, text: str, capture_time: str) -> str:
+        # 同一条消息中的多条报价原文与时间相同，以商品和价格区分
+        digest = hashlib.blake2b(f"{sender}|{item}|{price}|{text}|{capture_time}".encode("utf-8"), digest_size=8)
+        return digest.hexdigest()
+
+    def _evict(self) -> None:
+        """超过容量时淘汰最早的聚类，并从分桶中移除"""
+        overflow = len(self.clusters) - self.max_clusters
+        if overflow <= 0:
+            return
+        for cluster_id in list(self.clusters)[:overflow]:
+            cluster = self.clusters.pop(cluster_id)
+            for band, key in enumerate(cluster.band_keys):
+                bucket = self.band_index[band].get(key)
+                if bucket is None:
+                    continue
+                if cluster_id in bucket:
+                    bucket.remove(cluster_id)
+                if not bucket:
+                    del self.band_index[band][key]
+
+    def assign(
+        self,
+        texts: Sequence[str],
+        senders: Sequence[str],
+        items: Sequence[str],
+        prices: Sequence[float],
+        capture_times: Sequence[str],
+        cluster_ids: Optional[Sequence[str]] = None
+    ) -> List[str]:
+        """
+        为一批报价分配聚类 ID
+
+        Args:
+            texts: 原始消息列
+            senders: 发送者列
+            items: 商品名称列
+            prices: 价格列
+            capture_times: 采集时间列
+            cluster_ids: 已知的聚类 ID（预热时使用），为空则新分配
+
+        Returns:
+            聚类 ID 列表
+        """
+        return self._assign(texts, senders, items, prices, capture_times, cluster_ids)[0]
+
+    def _assign(
+        self,
+        texts: Sequence[str],
+        senders: Sequence[str],
+        items: Sequence[str],
+        prices: Sequence[float],
+        capture_times: Sequence[str],
+        cluster_ids: Optional[Sequence[str]] = None
+    ) -> Tuple[List[str], List[bool]]:
+        """分配聚类 ID，并给出每条报价是否归入了已有聚类"""
+        signatures = self.hasher.signatures(texts)
+        assigned: List[str] = []
+        joined: List[bool] = []
+
+        for i, signature in enumerate(signatures):
+            sender = senders[i] or ""
+            item = canonical_item(items[i] or "")
+            price = float(prices[i] or 0)
+            timestamp = _timestamp(capture_times[i])
+            band_keys = self._band_keys(signature, f"{sender}|{item}|".encode("utf-8"))
+
+            match: Optional[_Cluster] = None
+            if cluster_ids is None or not cluster_ids[i]:
+                checked = set()
+                for band, key in enumerate(band_keys):
+                    for candidate_id in self.band_index[band].get(key, ()):
+                        if candidate_id in checked:
+                            continue
+                        checked.add(candidate_id)
+                        cluster = self.clusters.get(candidate_id)
+                        if cluster is not None and self._is_duplicate(
+                                cluster, signature, price, timestamp):
+                            match = cluster
+                            break
+                    if match is not None:
+                        break
+
+            if match is not None:
+                match.last_seen = max(match.last_seen, timestamp)
+                assigned.append(match.cluster_id)
+                joined.append(True)
+                continue
+
+            cluster_id = (cluster_ids[i] if cluster_ids is not None and cluster_ids[i]
+                          else self._new_cluster_id(sender, item, price, texts[i], capture_times[i]))
+            joined.append(cluster_id in self.clusters)
+            if cluster_id not in self.clusters:
+                self.clusters[cluster_id] = _Cluster(cluster_id, signature, band_keys, price, timestamp)
+                for band, key in enumerate(band_keys):
+                    bucket = self.band_index[band].setdefault(key, [])
+                    bucket.append(cluster_id)
+                    if len(bucket) > 32:
+                        del bucket[0]
+            assigned.append(cluster_id)
+
+        self._evict()
+        return assigned, joined
+
+    def check_records(self, records: List[Any]) -> int:
+        """
+        为交易记录写入 cluster_id
+
+        Args:
+            records: TransactionRecord 列表
+
+        Returns:
+            归入已有聚类（即判定为重复）的记录数
+        """
+        if not self.enabled or not records:
+            return 0
+
+        cluster_ids, joined = self._assign(
+            [record.raw_text for record in records],
+            [record.sender for record in records],
+            [record.item for record in records],
+            [record.price for record in records],
+            [record.capture_time for record in records],
+        )
+
+        for record, cluster_id in zip(records, cluster_ids):
+            record.cluster_id = cluster_id
+        duplicates = sum(joined)
+
+        if duplicates:
+            print(f"近似重复检测: {duplicates} 条记录归入已有报价")
+        return duplicates
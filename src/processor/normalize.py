@@ -0,0 +1,196 @@
+"""
+价格与数量规范化
+把 "5.8k"、"5.8千"、"1万2"、"五千八"、"5800元"、"三台" 等写法解析为数值，
+既可逐条调用，也可对整列批量处理并返回 NumPy 数组
+"""
+
+import re
+from functools import lru_cache
+from typing import Any, Iterable, Optional
+
+import numpy as np
+
+
+# 中文数字
+_DIGITS = {
+    "零": 0, "〇": 0, "一": 1, "壹": 1, "二": 2, "贰": 2, "两": 2, "俩": 2, "三": 3, "叁": 3,
+    "四": 4, "肆": 4, "五": 5, "伍": 5, "六": 6, "陆": 6, "七": 7, "柒": 7, "八": 8, "捌": 8, "九": 9, "玖": 9,
+}
+# 节内单位（十/百/千，k 视同千）与节单位（万/亿，w 视同万）
+_SMALL_UNITS = {"十": 10, "拾": 10, "百": 100, "佰": 100, "千": 1000, "仟": 1000, "k": 1000}
+_BIG_UNITS = {"万": 10000, "萬": 10000, "w": 10000, "亿": 100000000}
+
+_TOKEN_CHARS = "".join(_DIGITS) + "".join(_SMALL_UNITS) + "".join(_BIG_UNITS) + "点"
+_TOKEN = re.compile(rf"\d+(?:\.\d+)?|[{_TOKEN_CHARS}]")
+_NUMBER = re.compile(rf"(?:\d+(?:\.\d+)?|[{_TOKEN_CHARS}])+")
+_NUMBER_RUN = re.compile(rf"(?:\d+(?:\.\d+)?|[{''.join(_DIGITS)}十拾百佰千仟万萬])+")
+
+# 价格前后缀：货币符号、元/块、每台、左右/起
+_PRICE_PREFIX = re.compile(r"^(?:[¥￥$]|rmb|价格?|单价)")
+_PRICE_SUFFIX = re.compile(r"(?:元|块钱|块|rmb|r)?(?:/[^\d]*|每[台个部只件套])?(?:左右|上下|起|出头)?$")
+# 数量前后缀：x3 / ×3 / 共3台
+_QUANTITY_PREFIX = re.compile(r"^(?:[x×*]|共|数量)")
+_QUANTITY_SUFFIX = re.compile(r"(?:台|个|部|只|件|套|箱|支|块|张|盒|副|对|pcs|pc)$")
+_SEPARATORS = re.compile(r"[\s,，_]")
+
+
+def parse_number(text: str) -> Optional[float]:
+    """
+    解析阿拉伯数字、中文数字及其混合写法
+
+    支持单位 十/百/千/万/亿 及 k/w、小数（"1.5万"、"一点五万"）、
+    省略末位单位的口语写法（"1万2" = 12000、"五千八" = 5800、"十二" = 12），
+    以及以 "零" 分隔的数位（"1万零5" = 10005）。
+
+    Returns:
+        数值；文本中含有语法以外的字符时返回 None
+    """
+    if not text or not _NUMBER.fullmatch(text):
+        return None
+
+    total = 0.0          # 已完成的 万/亿 节
+    section = 0.0        # 当前节内（万以下）的累计值
+    number: Optional[float] = None
+    last_unit = 0        # 最近一个单位的大小
+    zero = False         # 最近一个单位之后出现过 "零"，末位数字不按省略单位处理
+    fraction = 0         # "点" 之后的中文小数位数
+    seen_digit = False
+
+    for token in _TOKEN.findall(text):
+        if token[0].isdigit():
+            if number is not None:
+                return None
+            number = float(token)
+            seen_digit = True
+        elif token in _DIGITS:
+            digit = float(_DIGITS[token])
+            seen_digit = True
+            if fraction:
+                if number is None:
+                    return None
+                number += digit / 10 ** fraction
+                fraction += 1
+            elif token in ("零", "〇") and number is None:
+                # 单位之后的 "零" 只起分隔作用："一千零五"、"1万零5"
+                zero = True
+                continue
+            elif number is not None and number == 0:
+                number = digit
+            elif number is not None:
+                # "一二" 这类连写按十进制拼接
+                number = number * 10 + digit
+            else:
+                number = digit
+            if token in ("零", "〇"):
+                zero = True
+        elif token == "点":
+            if fraction or number is None:
+                return None
+            fraction = 1
+        elif token in _SMALL_UNITS:
+            unit = _SMALL_UNITS[token]
+            section += (number if number is not None else 1) * unit
+            if not token.isascii():
+                # 中文单位前省略的 "一"："十"、"十台"、"十万"；单独的 "k" 不是数字
+                seen_digit = True
+            number, last_unit, zero, fraction = None, unit, False, 0
+        else:
+            unit = _BIG_UNITS[token]
+            value = section + (number or 0)
+            if number is None and not section:
+                value = 1
+            if unit > 10000:
+                # 亿 作用于此前的全部数值: "1万亿"
+                total = (total + value) * unit
+            else:
+                total += value * unit
+            section, number, last_unit, zero, fraction = 0.0, None, unit, False, 0
+
+    if not seen_digit:
+        return None
+    if number is not None:
+        if last_unit >= 10 and not zero and number.is_integer() and 0 < number < 10:
+            # 省略末位单位："1万2" 的 2 表示 2 千
+            number *= last_unit / 10
+        section += number
+    return total + section
+
+
+@lru_cache(maxsize=65536)
+def _price_text(text: str) -> Optional[float]:
+    cleaned = _SEPARATORS.sub("", text.strip().lower())
+    cleaned = _PRICE_SUFFIX.sub("", _PRICE_PREFIX.sub("", cleaned))
+    return parse_number(cleaned)
+
+
+@lru_cache(maxsize=4096)
+def _quantity_text(text: str) -> Optional[int]:
+    cleaned = _SEPARATORS.sub("", text.strip().lower())
+    cleaned = _QUANTITY_SUFFIX.sub("", _QUANTITY_PREFIX.sub("", cleaned))
+    value = parse_number(cleaned)
+    if value is None:
+        # 带其他文字时取第一个数字，如 "两台以上"、"共3台左右"
+        match = _NUMBER_RUN.search(cleaned)
+        value = parse_number(match.group()) if match else None
+    if value is None or value < 1 or not value.is_integer():
+        return None
+    return int(value)
+
+
+def parse_price(value: Any) -> Optional[float]:
+    """
+    解析单个价格
+
+    Returns:
+        价格；无法解析时返回 None
+    """
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    return _price_text(str(value))
+
+
+def parse_quantity(value: Any, default: Optional[int] = 1) -> Optional[int]:
+    """
+    解析单个数量
+
+    Returns:
+        正整数数量；无法解析时返回 default
+    """
+    if isinstance(value, bool) or value is None:
+        return default
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value) if value.is_integer() and value >= 1 else default
+    parsed = _quantity_text(str(value))
+    return parsed if parsed is not None else default
+
+
+def normalize_prices(values: Iterable[Any]) -> np.ndarray:
+    """
+    批量解析一列价格
+
+    数值数组直接转换；其余逐项解析（高频写法走缓存）。
+
+    Returns:
+        float64 数组，无法解析的位置为 NaN
+    """
+    if isinstance(values, np.ndarray) and values.dtype.kind in "iuf":
+        return values.astype(np.float64)
+    nan = float("nan")
+    parsed = (parse_price(value) for value in values)
+    return np.fromiter((nan if value is None else value for value in parsed), dtype=np.float64)
+
+
+def normalize_quantities(values: Iterable[Any], default: int = 1) -> np.ndarray:
+    """
+    批量解析一列数量
+
+    Returns:
+        int64 数组，无法解析的位置为 default
+    """
+    if isinstance(values, np.ndarray) and values.dtype.kind in "iu":
+        return values.astype(np.int64)
+    return np.fromiter((parse_quantity(value, default) for value in values), dtype=np.int64)
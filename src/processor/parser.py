@@ -0,0 +1,254 @@
+"""
+LLM 响应解析
+增量扫描 JSON 数组中的记录对象，逐条按模式校验，收集被拒记录及原因
+"""
+
+import json
+import re
+from typing import Any, Callable, List, Dict, Optional, Tuple
+
+from src.processor.normalize import parse_price, parse_quantity
+
+
+# 结构字符；字符串内只关心引号与转义
+_STRUCTURAL = re.compile(r'["\[\]{}]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+
+_PAIRS = {"]": "[", "}": "{"}
+
+
+class Reject:
+    """被拒绝的记录"""
+    __slots__ = ("raw", "reason")
+
+    def __init__(self, raw: str, reason: str):
+        self.raw = raw
+        self.reason = reason
+
+    def __repr__(self):
+        return f"Reject({self.reason}: {self.raw[:60]!r})"
+
+
+# 记录模式：字段 -> 规则 (type / required / default / values)
+RECORD_SCHEMA: Dict[str, Dict[str, Any]] = {
+    "id": {"type": "int", "default": None},   # 来源消息编号（紧凑格式）
+    "action": {"type": "enum", "values": ("SELL", "BUY"), "required": True},
+    "item": {"type": "str", "required": True},
+    "specs": {"type": "str", "default": ""},
+    "price": {"type": "number", "required": True},
+    "quantity": {"type": "int", "default": 1},
+}
+
+
+def _check_enum(values: Tuple[str, ...]) -> Callable[[Any], Tuple[Any, Optional[str]]]:
+    def check(value):
+        if isinstance(value, str) and value.strip().upper() in values:
+            return value.strip().upper(), None
+        return None, f"取值必须为 {'/'.join(values)}"
+    return check
+
+
+def _check_str(value):
+    if isinstance(value, str) and value.strip():
+        return value.strip(), None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value), None
+    return None, "必须为非空字符串"
+
+
+def _check_number(value):
+    # 数字或可解析的价格字符串（"5.8k"、"1万2"、"五千八" 等），换算由 LLMClient._normalize_price 完成
+    if isinstance(value, bool):
+        return None, "必须为数字"
+    if isinstance(value, (int, float)):
+        return value, None
+    if isinstance(value, str) and parse_price(value) is not None:
+        return value.strip(), None
+    return None, "必须为数字"
+
+
+def _check_int(value):
+    if isinstance(value, bool):
+        return None, "必须为整数"
+    if isinstance(value, int):
+        return value, None
+    if isinstance(value, float) and value.is_integer():
+        return int(value), None
+    if isinstance(value, str):
+        parsed = parse_quantity(value, default=None)
+        if parsed is not None:
+            return parsed, None
+    return None, "必须为整数"
+
+
+_CHECKS = {"str": _check_str, "number": _check_number, "int": _check_int}
+
+
+def compile_schema(schema: Dict[str, Dict[str, Any]]) -> Callable[[Any], Tuple[Optional[Dict[str, Any]], Optional[str]]]:
+    """
+    把模式编译为校验函数
+
+    Returns:
+        validate(obj) -> (规范化后的记录, None) 或 (None, 拒绝原因)
+    """
+    fields = []
+    for name, rule in schema.items():
+        check = _check_enum(rule["values"]) if rule["type"] == "enum" else _CHECKS[rule["type"]]
+        fields.append((name, check, rule.get("required", False), rule.get("default")))
+
+    def validate(obj: Any) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        if not isinstance(obj, dict):
+            return None, "记录必须为 JSON 对象"
+        record = {}
+        for name, check, required, default in fields:
+            value = obj.get(name)
+            if value is None or value == "":
+                if required:
+                    return None, f"缺少字段 {name}"
+                record[name] = default
+                continue
+            value, error = check(value)
+            if error:
+                return None, f"字段 {name} {error}"
+            record[name] = value
+        return record, None
+
+    return validate
+
+
+validate_record = compile_schema(RECORD_SCHEMA)
+
+
+class StreamingRecordParser:
+    """
+    增量记录解析器
+
+    逐块喂入响应文本，每当数组中的一个对象闭合即解析并校验，
+    不必等待完整响应；数组外的说明文字被忽略。
+    """
+
+    def __init__(self, validate: Callable = validate_record):
+        self.validate = validate
+        self.records: List[Dict[str, Any]] = []
+        self.rejects: List[Reject] = []
+
+        self._buffer = ""
+        self._pos = 0
+        self._stack: List[Tuple[str, int]] = []   # (括号, 在缓冲区中的位置)
+        self._in_string = False
+        self._object_start: Optional[int] = None
+        self._object_depth = 0
+        self._seen_array = False
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        喂入一段文本
+
+        Returns:
+            本次新解析出的合法记录
+        """
+        self._buffer += chunk
+        emitted: List[Dict[str, Any]] = []
+        buf = self._buffer
+        n = len(buf)
+        i = self._pos
+
+        while i < n:
+            if self._in_string:
+                match = _STRING_SPECIAL.search(buf, i)
+                if match is None:
+                    i = n
+                    break
+                j = match.start()
+                if buf[j] == "\\":
+                    if j + 1 >= n:
+                        # 转义符在块末尾，等待下一块
+                        i = j
+                        break
+                    i = j + 2
+                    continue
+                self._in_string = False
+                i = j + 1
+                continue
+
+            match = _STRUCTURAL.search(buf, i)
+            if match is None:
+                i = n
+                break
+            j = match.start()
+            char = buf[j]
+
+            if char == '"':
+                # 容器外的引号属于说明文字
+                if self._stack:
+                    self._in_string = True
+            elif char in "[{":
+                if char == "{" and self._object_start is None and self._stack and self._stack[-1][0] == "[":
+                    self._object_start = j
+                    self._object_depth = len(self._stack)
+                self._stack.append((char, j))
+            elif self._stack and self._stack[-1][0] == _PAIRS[char]:
+                _, opened = self._stack.pop()
+                if char == "}" and self._object_start is not None and len(self._stack) == self._object_depth:
+                    record = self._emit(buf[self._object_start:j + 1])
+                    if record is not None:
+                        emitted.append(record)
+                    self._object_start = None
+                elif char == "]" and not buf[opened + 1:j].strip():
+                    self._seen_array = True
+            i = j + 1
+
+        self._pos = i
+        # 不在任何容器内时丢弃已消费的文本
+        if not self._stack and not self._in_string:
+            self._buffer = buf[i:]
+            self._pos = 0
+
+        return emitted
+
+    def _emit(self, text: str) -> Optional[Dict[str, Any]]:
+        self._seen_array = True
+        try:
+            obj = json.loads(text)
+        except json.JSONDecodeError as e:
+            self.rejects.append(Reject(text, f"JSON 解析失败: {e.msg}"))
+            return None
+
+        record, reason = self.validate(obj)
+        if reason:
+            self.rejects.append(Reject(text, reason))
+            return None
+        self.records.append(record)
+        return record
+
+    @property
+    def complete(self) -> bool:
+        """是否见到了数组且所有括号都已闭合"""
+        return self._seen_array and not self._stack and not self._in_string
+
+
+def parse_records(response: str, validate: Callable = validate_record) -> StreamingRecordParser:
+    """
+    解析完整响应
+
+    合法 JSON 时直接 json.loads 后逐条校验；否则回退到增量扫描，跳过说明文字。
+    """
+    parser = StreamingRecordParser(validate)
+    try:
+        data = json.loads(response)
+    except (json.JSONDecodeError, TypeError):
+        parser.feed(response or "")
+        return parser
+
+    if isinstance(data, dict):
+        data = data.get('results', data.get('data'))
+    if isinstance(data, list):
+        parser._seen_array = True
+        for obj in data:
+            record, reason = validate(obj)
+            if reason:
+                parser.rejects.append(Reject(json.dumps(obj, ensure_ascii=False), reason))
+            else:
+                parser.records.append(record)
+    return parser
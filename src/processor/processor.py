@@ -3,23 +3,61 @@ LLM 处理器
 使用大语言模型解析聊天消息
 """
 
-import json
-import re
-from typing import List, Dict, Any, Optional
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from operator import attrgetter
+from typing import Any, Callable, List, Dict, Deque, Iterator, Optional, Sequence, Tuple
 from dataclasses import dataclass
 from datetime import datetime
 
-from openai import OpenAI, AsyncOpenAI
+from openai import APIStatusError
 from openai.types.chat import ChatCompletion
 
 from src.config import Config
 from src.collector import Message
-from src.processor.prompt import LLM_PROMPT
-
-
-@dataclass
+from src.metrics import metrics
+from src.processor.prompt import PromptBuilder, estimate_tokens
+from src.processor.normalize import parse_price, parse_quantity
+from src.processor.cache import ResponseCache, cache_key
+from src.processor.resilience import ResponseFormatError, StreamInterruptedError, is_retryable
+from src.processor.router import LLMRouter
+from src.processor.parser import Reject, StreamingRecordParser, parse_records
+from src.processor.anomaly import PriceAnomalyDetector
+from src.processor.dedup import NearDuplicateDetector
+
+
+# market_data 列 -> TransactionRecord 属性（顺序即 to_db_dict 的键顺序）
+DB_COLUMN_ATTRS = {
+    "action": "action",
+    "item_category": "item",
+    "specs": "specs",
+    "price": "price",
+    "quantity": "quantity",
+    "raw_text": "raw_text",
+    "sender_nickname": "sender",
+    "group_name": "group",
+    "message_time": "message_time",
+    "capture_time": "capture_time",
+    "price_flag": "price_flag",
+    "cluster_id": "cluster_id",
+}
+
+
+def _intern(value: Any) -> Any:
+    return sys.intern(value) if type(value) is str else value
+
+
+@dataclass(slots=True)
 class TransactionRecord:
-    """交易记录数据结构"""
+    """
+    交易记录数据结构
+
+    slots 数据类；方向、商品、发送者、群名等高度重复的字符串驻留，
+    重放与回填时大量记录共享同一字符串对象。
+    """
     action: str          # SELL / BUY
     item: str           # 商品名称
     specs: str          # 规格详情
@@ -33,6 +71,18 @@ class TransactionRecord:
     message_time: str = ""
     capture_time: str = ""
 
+    # 价格异常标记，空字符串表示正常
+    price_flag: str = ""
+
+    # 近似重复聚类 ID，同一报价的多次转发共享该 ID
+    cluster_id: str = ""
+
+    def __post_init__(self):
+        self.action = _intern(self.action)
+        self.item = _intern(self.item)
+        self.sender = _intern(self.sender)
+        self.group = _intern(self.group)
+
     def to_dict(self) -> Dict[str, Any]:
         return {
             "action": self.action,
@@ -44,119 +94,114 @@ class TransactionRecord:
             "sender": self.sender,
             "group": self.group,
             "message_time": self.message_time,
-            "capture_time": self.capture_time
+            "capture_time": self.capture_time,
+            "price_flag": self.price_flag,
+            "cluster_id": self.cluster_id
         }
 
     def to_db_dict(self) -> Dict[str, Any]:
         """转换为数据库插入格式"""
-        return {
-            "action": self.action,
-            "item_category": self.item,
-            "specs": self.specs,
-            "price": self.price,
-            "quantity": self.quantity,
-            "raw_text": self.raw_text,
-            "sender_nickname": self.sender,
-            "group_name": self.group,
-            "message_time": self.message_time,
-            "capture_time": self.capture_time
-        }
+        return {column: getattr(self, attr) for column, attr in DB_COLUMN_ATTRS.items()}
+
+
+def row_adapter(columns: Sequence[str]) -> Callable[[TransactionRecord], tuple]:
+    """
+    生成 记录 -> 数据库行元组 的取值函数
+
+    直接按属性取值，不构造中间字典。
+
+    Args:
+        columns: market_data 列名
+    """
+    getter = attrgetter(*(DB_COLUMN_ATTRS[column] for column in columns))
+    if len(columns) == 1:
+        # 单个属性时 attrgetter 返回标量
+        return lambda record: (getter(record),)
+    return getter
 
 
 class LLMClient:
     """LLM API 客户端"""
 
+    # 可在运行中热加载的配置项，其余 llm.* 的修改需重启
+    RELOADABLE = (
+        "llm.api_base", "llm.api_key", "llm.model", "llm.timeout", "llm.batch_size", "llm.stream",
+        "llm.endpoints", "llm.hedge_after", "llm.weight", "llm.cost", "llm.tier", "llm.max_concurrency",
+        "llm.max_retries", "llm.retry_base_delay", "llm.retry_max_delay", "llm.circuit_threshold",
+        "llm.circuit_reset_seconds", "llm.requests_per_minute", "llm.tokens_per_minute",
+    )
+
     def __init__(self, config: Config):
         llm_config = config.llm
-        self.api_base = llm_config.get('api_base', 'https://api.openai.com/v1')
-        self.api_key = llm_config.get('api_key', '')
-        self.model = llm_config.get('model', 'gpt-3.5-turbo')
-        self.batch_size = llm_config.get('batch_size', 20)
-        self.timeout = llm_config.get('timeout', 60)
-
-        # 同步客户端
-        self.client = OpenAI(
-            api_key=self.api_key,
-            base_url=self.api_base,
-            timeout=self.timeout
-        )
+        self.api_base = llm_config.api_base
+        self.api_key = llm_config.api_key
+        self.batch_size = llm_config.batch_size
+        self.timeout = llm_config.timeout
+        # 流式响应：记录随 Token 到达逐条解析
+        self.stream = llm_config.stream
+        # 提示词格式：compact（默认，固定前缀 + 紧凑编码）或 verbose
+        self.prompt = PromptBuilder(llm_config.prompt_format)
+
+        # 响应缓存（可选）
+        self.cache = ResponseCache(llm_config.cache_path) if llm_config.cache_path else None
+
+        # 未通过模式校验的记录（保留最近 1000 条）
+        self.rejects: Deque[Reject] = deque(maxlen=1000)
+        self.reject_count = 0
+        self._rejects_lock = threading.Lock()
+
+        # 端点路由（未配置 llm.endpoints 时即为上面的单一端点）
+        self.router = LLMRouter(llm_config)
+        self.model = self.router.primary.model
+        config.subscribe(self.apply_config, self.RELOADABLE)
+
+    def apply_config(self, config: Config) -> None:
+        """热加载：更新批大小、流式开关与端点，保留缓存与已有连接"""
+        llm_config = config.llm
+        self.api_base = llm_config.api_base
+        self.api_key = llm_config.api_key
+        self.batch_size = llm_config.batch_size
+        self.timeout = llm_config.timeout
+        self.stream = llm_config.stream
+        self.router.reconfigure(llm_config)
+        self.model = self.router.primary.model
 
     def _normalize_price(self, price_str: str) -> float:
         """
         标准化价格单位
-        支持: 5k, 5K, 5w, 5W, 5000, 5,000 等
+        支持: 5k, 5w, 5,000, 5.8千, 1万2, 五千八, 5800元 等，无法解析时为 0
         """
-        if isinstance(price_str, (int, float)):
-            return float(price_str)
-
-        price_str = str(price_str).strip().lower()
-
-        # 处理 k (千)
-        if 'k' in price_str:
-            price_str = price_str.replace('k', '').replace(' ', '')
-            try:
-                return float(price_str) * 1000
-            except ValueError:
-                return 0.0
-
-        # 处理 w (万)
-        if 'w' in price_str:
-            price_str = price_str.replace('w', '').replace(' ', '')
-            try:
-                return float(price_str) * 10000
-            except ValueError:
-                return 0.0
-
-        # 移除逗号和空格
-        price_str = price_str.replace(',', '').replace(' ', '')
-
-        try:
-            return float(price_str)
-        except ValueError:
-            return 0.0
+        price = parse_price(price_str)
+        return price if price is not None else 0.0
 
     def _parse_quantity(self, qty_str: str) -> int:
-        """解析数量"""
-        if isinstance(qty_str, int):
-            return qty_str
-
-        qty_str = str(qty_str).strip()
-
-        # 提取数字
-        numbers = re.findall(r'\d+', qty_str)
-        if numbers:
-            return int(numbers[0])
-
-        # 中文数字
-        chinese_nums = {'一': 1, '两': 2, '二': 2, '三': 3, '四': 4, '五': 5}
-        for cn, num in chinese_nums.items():
-            if cn in qty_str:
-                return num
-
-        return 1  # 默认数量为1
+        """解析数量，支持 "3"、"三台"、"十二个"、"x3" 等，默认数量为 1"""
+        return parse_quantity(qty_str)
 
-    def _parse_response(self, response: str) -> List[Dict[str, Any]]:
-        """解析 LLM 响应"""
-        try:
-            # 尝试直接解析 JSON
-            data = json.loads(response)
-            if isinstance(data, list):
-                return data
-            elif isinstance(data, dict):
-                return data.get('results', data.get('data', []))
-            return []
-        except json.JSONDecodeError:
-            pass
-
-        # 尝试从文本中提取 JSON
-        json_match = re.search(r'\[.*\]', response, re.DOTALL)
-        if json_match:
-            try:
-                return json.loads(json_match.group())
-            except json.JSONDecodeError:
-                pass
+    def _parse_response(self, response: str, strict: bool = False) -> List[Dict[str, Any]]:
+        """
+        解析 LLM 响应，返回通过模式校验的记录
 
-        return []
+        Args:
+            response: 响应文本
+            strict: 为 True 时找不到完整 JSON 数组则抛出 ResponseFormatError，而不是返回空列表
+        """
+        parser = parse_records(response)
+        self._record_rejects(parser.rejects)
+
+        if strict and not parser.complete:
+            raise ResponseFormatError(f"无法解析的 LLM 响应: {response[:80]!r}")
+        return parser.records
+
+    def _record_rejects(self, rejects: List[Reject]) -> None:
+        """记录未通过校验的记录"""
+        if not rejects:
+            return
+        with self._rejects_lock:
+            self.rejects.extend(rejects)
+            self.reject_count += len(rejects)
+        for reject in rejects:
+            print(f"LLM 记录被拒绝: {reject.reason} {reject.raw[:60]}")
 
     def _enhance_record(self, record: Dict[str, Any], message: Message) -> TransactionRecord:
         """增强记录，添加额外字段"""
@@ -176,15 +221,217 @@ class LLMClient:
             sender=message.sender,
             group=message.group,
             message_time=message.time,
-            capture_time=datetime.now().isoformat()
+            capture_time=message.capture_time or datetime.now().isoformat()
         )
 
-    def process_batch(self, messages: List[Message]) -> List[TransactionRecord]:
+    def _build_input(self, messages: List[Message]) -> str:
+        """构建输入文本"""
+        return self.prompt.build(messages)
+
+    def _chat_messages(self, input_text: str) -> List[Dict[str, str]]:
+        # 系统提示词在前且固定不变，服务端可缓存该前缀
+        return [
+            {"role": "system", "content": self.prompt.system},
+            {"role": "user", "content": input_text}
+        ]
+
+    def _estimate_tokens(self, input_text: str) -> int:
+        return self.prompt.system_tokens + estimate_tokens(input_text)
+
+    @staticmethod
+    def _record_usage(response: Any) -> None:
+        """记录服务端返回的 Token 用量及前缀缓存命中的 Token 数"""
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        metrics.inc("llm_prompt_tokens", usage.prompt_tokens or 0)
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) if details is not None else None
+        if cached:
+            metrics.inc("llm_cached_prompt_tokens", cached)
+
+    def _complete(self, input_text: str, tier: int = 0) -> str:
+        """经路由器调用某一级端点（含限流、熔断、重试与对冲）"""
+        response = self.router.complete(
+            lambda client, model: client.chat.completions.create(
+                model=model,
+                messages=self._chat_messages(input_text),
+                temperature=0.1,  # 低温度以获得更一致的输出
+            ),
+            tier=tier,
+            tokens=self._estimate_tokens(input_text)
+        )
+        self._record_usage(response)
+        return response.choices[0].message.content or ""
+
+    def _complete_stream(self, input_text: str, tier: int, on_text: Callable[[str], None]) -> str:
+        """
+        流式调用某一级端点，每收到一段文本即回调 on_text
+
+        收到首段文本之前的失败照常重试；之后中断则抛出 StreamInterruptedError，
+        避免重试导致已推送的记录重复。流式请求不做对冲。
+        """
+        def request(client, model):
+            stream = client.chat.completions.create(
+                model=model,
+                messages=self._chat_messages(input_text),
+                temperature=0.1,
+                stream=True,
+            )
+            parts: List[str] = []
+            try:
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        parts.append(delta)
+                        on_text(delta)
+            except Exception as e:
+                if parts:
+                    raise StreamInterruptedError(f"LLM 流式响应中断: {e}") from e
+                raise
+            return "".join(parts)
+
+        return self.router.complete(
+            request, tier=tier, tokens=self._estimate_tokens(input_text), hedging=False
+        )
+
+    def _stream_records(self, input_text: str, tier: int) -> Iterator[Any]:
+        """
+        在后台线程中流式调用，边接收边解析
+
+        Yields:
+            通过校验的记录字典；最后产出 StreamingRecordParser 与完整响应文本
+        """
+        parser = StreamingRecordParser()
+        sink: "queue.Queue[Tuple[str, Any]]" = queue.Queue()
+
+        def on_text(delta: str) -> None:
+            for record in parser.feed(delta):
+                sink.put(("record", record))
+
+        def worker() -> None:
+            try:
+                sink.put(("done", self._complete_stream(input_text, tier, on_text)))
+            except Exception as e:
+                sink.put(("error", e))
+
+        threading.Thread(target=worker, daemon=True).start()
+        while True:
+            kind, value = sink.get()
+            if kind == "record":
+                yield value
+            elif kind == "error":
+                raise value
+            else:
+                self._record_rejects(parser.rejects)
+                yield parser, value
+                return
+
+    def _iter_raw(self, messages: List[Message]) -> Iterator[Dict[str, Any]]:
+        """逐条产出记录，并把首条记录与整批的耗时记入指标"""
+        start = time.perf_counter()
+        first = True
+        for raw in self._iter_tiers(messages):
+            if first:
+                metrics.observe("llm_time_to_first_record_seconds", time.perf_counter() - start)
+                first = False
+            yield raw
+        metrics.observe("llm_batch_seconds", time.perf_counter() - start)
+
+    def _iter_tiers(self, messages: List[Message]) -> Iterator[Dict[str, Any]]:
+        """
+        调用 LLM 并逐条产出通过校验的记录
+
+        从最便宜的一级端点开始，响应无法解析时升级到下一级模型；
+        配置了缓存时优先读取缓存，只缓存可解析的响应。
+        流式模式下记录在对象闭合时即产出；已产出记录后再发现响应不完整则抛出
+        StreamInterruptedError。
+        """
+        input_text = self._build_input(messages)
+        metrics.observe("llm_input_tokens_per_message", estimate_tokens(input_text) / len(messages))
+        error: Optional[Exception] = None
+
+        for tier in self.router.tiers:
+            key = None
+            if self.cache is not None:
+                key = cache_key(",".join(self.router.tier_models(tier)), self.prompt.system, input_text)
+                cached = self.cache.get(key)
+                if cached is not None:
+                    yield from self._parse_response(cached)
+                    return
+
+            if self.stream:
+                emitted = 0
+                for item in self._stream_records(input_text, tier):
+                    if isinstance(item, tuple):
+                        parser, response_text = item
+                        break
+                    emitted += 1
+                    yield item
+                if not parser.complete:
+                    if emitted:
+                        # 已推送部分记录，响应被截断，不能回退或二分重试
+                        raise StreamInterruptedError(f"LLM 流式响应不完整: {response_text[-80:]!r}")
+                    error = ResponseFormatError(f"无法解析的 LLM 响应: {response_text[:80]!r}")
+                    continue
+            else:
+                response_text = self._complete(input_text, tier)
+                try:
+                    raw_records = self._parse_response(response_text, strict=True)
+                except ResponseFormatError as e:
+                    error = e
+                    continue
+                yield from raw_records
+
+            if key is not None:
+                self.cache.put(key, response_text)
+            return
+
+        raise error
+
+    def _extract_once(self, messages: List[Message]) -> List[Dict[str, Any]]:
+        """调用 LLM 并解析整批响应"""
+        return list(self._iter_raw(messages))
+
+    def iter_batch(self, messages: List[Message]) -> Iterator[TransactionRecord]:
+        """
+        逐条产出一批消息的交易记录
+
+        流式模式下每条记录在其 JSON 对象闭合时即产出，不等待完整响应。
+        出错时直接抛出异常（不做二分）。
+        """
+        if not messages:
+            return
+        for raw in self._iter_raw(messages):
+            yield self._enhance_record(raw, self._source_message(raw, messages))
+
+    def _source_message(self, record: Dict[str, Any], messages: List[Message]) -> Message:
+        """记录的来源消息（verbose 格式或编号无效时为批次第一条）"""
+        return messages[self.prompt.source_index(record, len(messages))]
+
+    @staticmethod
+    def _is_batch_error(error: Exception) -> bool:
+        """是否为与批次内容相关的错误（二分后可能只影响部分消息）"""
+        if isinstance(error, ResponseFormatError):
+            return True
+        return isinstance(error, APIStatusError) and not is_retryable(error)
+
+    def extract_batch(
+        self,
+        messages: List[Message],
+        failed: Optional[List[Message]] = None
+    ) -> List[TransactionRecord]:
         """
         处理一批消息
 
+        响应无法解析或请求被拒绝 (4xx) 时把批次二分重试，只丢弃真正出问题的消息；
+        限流、超时等瞬时错误在重试耗尽后抛出异常，由调用方整批重试。
+
         Args:
             messages: 消息列表
+            failed: 若提供，被丢弃的消息会追加到该列表
 
         Returns:
             交易记录列表
@@ -192,37 +439,53 @@ class LLMClient:
         if not messages:
             return []
 
-        # 构建输入文本
-        input_text = "\n".join(
-            f"[{msg.time}] {msg.sender}: {msg.content}"
-            for msg in messages
-        )
-
         try:
-            # 调用 LLM API
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": LLM_PROMPT},
-                    {"role": "user", "content": input_text}
-                ],
-                temperature=0.1,  # 低温度以获得更一致的输出
-            )
+            raw_records = self._extract_once(messages)
+        except Exception as e:
+            return self.bisect_batch(messages, e, failed)
 
-            # 解析响应
-            response_text = response.choices[0].message.content
-            raw_records = self._parse_response(response_text)
+        # 转换为 TransactionRecord，按记录回填的编号归属来源消息
+        return [self._enhance_record(record, self._source_message(record, messages)) for record in raw_records]
+
+    def bisect_batch(
+        self,
+        messages: List[Message],
+        error: Exception,
+        failed: Optional[List[Message]] = None
+    ) -> List[TransactionRecord]:
+        """
+        整批解析失败后把批次二分重试
+
+        只有与批次内容相关的错误才二分，其余错误原样抛出。
+
+        Args:
+            messages: 失败的批次
+            error: 整批解析时的异常
+            failed: 若提供，被丢弃的消息会追加到该列表
+        """
+        if not self._is_batch_error(error):
+            raise error
+        if len(messages) == 1:
+            print(f"消息解析失败，已跳过: {messages[0]} ({error})")
+            if failed is not None:
+                failed.append(messages[0])
+            return []
+        middle = len(messages) // 2
+        return (self.extract_batch(messages[:middle], failed)
+                + self.extract_batch(messages[middle:], failed))
 
-            # 转换为 TransactionRecord
-            records = []
-            for record in raw_records:
-                # 为每条原始消息创建记录
-                # 由于 LLM 可能合并多条消息，我们为第一条消息创建记录
-                enhanced = self._enhance_record(record, messages[0])
-                records.append(enhanced)
+    def process_batch(self, messages: List[Message]) -> List[TransactionRecord]:
+        """
+        处理一批消息
 
-            return records
+        Args:
+            messages: 消息列表
 
+        Returns:
+            交易记录列表
+        """
+        try:
+            return self.extract_batch(messages)
         except Exception as e:
             print(f"LLM 处理出错: {e}")
             # 返回空列表，消息将被标记为未处理
@@ -235,7 +498,14 @@ class NLPProcessor:
     def __init__(self, config: Config):
         self.config = config
         self.llm_client = LLMClient(config)
-        self.batch_size = config.llm.get('batch_size', 20)
+        self.batch_size = config.llm.batch_size
+        self.anomaly_detector = PriceAnomalyDetector(config)
+        self.duplicate_detector = NearDuplicateDetector(config)
+        config.subscribe(self.apply_config, ("llm.batch_size",))
+
+    def apply_config(self, config: Config) -> None:
+        """热加载批大小"""
+        self.batch_size = config.llm.batch_size
 
     def process_messages(self, messages: List[Message]) -> List[TransactionRecord]:
         """
@@ -261,8 +531,60 @@ class NLPProcessor:
             records = self.llm_client.process_batch(batch)
             all_records.extend(records)
 
+        self._annotate(all_records)
         return all_records
 
+    def extract_batch(
+        self,
+        messages: List[Message],
+        failed: Optional[List[Message]] = None
+    ) -> List[TransactionRecord]:
+        """
+        处理一批消息，LLM 调用失败时抛出异常（供消息队列重试）
+
+        Args:
+            messages: 消息列表，不超过 batch_size
+            failed: 若提供，无法解析而被丢弃的消息会追加到该列表
+
+        Returns:
+            已完成异常检测与聚类的交易记录列表
+        """
+        records = self.llm_client.extract_batch(messages, failed)
+        self._annotate(records)
+        return records
+
+    def iter_batch(self, messages: List[Message]) -> Iterator[TransactionRecord]:
+        """
+        逐条产出一批消息的交易记录（已完成异常检测与聚类）
+
+        配合 llm.stream 使用时，下游可在整批响应完成之前处理首批记录。
+        出错时直接抛出异常，调用方丢弃已收到的记录后可交给 bisect_batch 二分重试。
+        """
+        for record in self.llm_client.iter_batch(messages):
+            self._annotate([record])
+            yield record
+
+    def bisect_batch(
+        self,
+        messages: List[Message],
+        error: Exception,
+        failed: Optional[List[Message]] = None
+    ) -> List[TransactionRecord]:
+        """
+        iter_batch 整批失败后二分重试（与 extract_batch 的失败处理相同）
+
+        Raises:
+            与批次内容无关的错误（限流、超时、流式中断等）原样抛出，由调用方整批重试
+        """
+        records = self.llm_client.bisect_batch(messages, error, failed)
+        self._annotate(records)
+        return records
+
+    def _annotate(self, records: List[TransactionRecord]) -> None:
+        """价格异常检测与近似重复聚类"""
+        self.anomaly_detector.check_records(records)
+        self.duplicate_detector.check_records(records)
+
     def process_group_messages(self, group_name: str, messages: List[Message]) -> List[TransactionRecord]:
         """
         处理单个群的消息
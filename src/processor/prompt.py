@@ -1,8 +1,12 @@
 """
 LLM Prompt 模板
-定义消息解析的系统提示词
+定义消息解析的系统提示词，以及把消息批次编码为请求的 PromptBuilder
 """
 
+import hashlib
+import re
+from typing import Any, Dict, Sequence
+
 LLM_PROMPT = """你是一个专业的倒货交易数据分析师。你的任务是从杂乱的聊天记录中提取结构化交易数据。
 
 输入数据格式: [时间] [发送者]: [消息内容]
@@ -30,3 +34,127 @@ LLM_PROMPT = """你是一个专业的倒货交易数据分析师。你的任务
 示例输出: []
 
 请直接输出JSON，不要包含其他文字。"""
+
+
+# 紧凑格式的系统提示词：内容固定不变，作为请求的稳定前缀以命中服务端的前缀缓存。
+# 任何按批次变化的内容（发送者、消息）都只放在用户消息中。
+COMPACT_PROMPT = """你是倒货交易数据分析师，从群聊消息中提取结构化交易数据。
+
+输入格式:
+首行 "#发送者 A=昵称 B=昵称 ..." 为本批发送者代号；
+之后每行一条消息: 编号 发送者代号: 内容
+
+规则:
+1. 忽略闲聊、表情、无意义的语气词；不含交易意图的消息不输出记录。
+2. 交易方向: "出"、"卖"、"甩"、"转" -> SELL; "收"、"求"、"要"、"买" -> BUY。
+3. 提取商品名称、规格、价格；"k"、"w" 单位的价格换算为标准数字。
+4. 每条记录的 id 为其来源消息的编号；一条消息可产生多条记录。
+5. 只输出 JSON List，字段: id, action, item, specs, price, quantity；没有交易时输出 []。
+
+示例输入:
+#发送者 A=老王 B=张三
+1 A: 出两台14pm 256 紫色 电池90 5800到付
+2 B: 下午好，大家今天有什么行情
+3 B: 收13 128 白 4k
+示例输出:
+[{"id":1,"action":"SELL","item":"iPhone 14 Pro Max","specs":"256G 紫色 电池90%","price":5800,"quantity":2},{"id":3,"action":"BUY","item":"iPhone 13","specs":"128G 白色","price":4000,"quantity":1}]"""
+
+
+PROMPT_FORMATS = ("compact", "verbose")
+
+# Emoji 与变体选择符、零宽连接符
+_EMOJI = re.compile(
+    "[\U0001F000-\U0001FAFF\U00002600-\U000027BF\U00002B00-\U00002BFF"
+    "\U0000FE00-\U0000FE0F\U0000200D\U000020E3]+"
+)
+# 常见的微信文字表情，如 [捂脸]
+_WECHAT_EMOTICONS = re.compile(
+    r"\[(微笑|撇嘴|色|发呆|得意|流泪|害羞|闭嘴|睡|大哭|尴尬|发怒|调皮|呲牙|惊讶|难过|囧|抓狂|吐|偷笑|愉快|白眼|"
+    r"傲慢|困|惊恐|憨笑|悠闲|咒骂|疑问|嘘|晕|衰|骷髅|敲打|再见|擦汗|抠鼻|鼓掌|坏笑|右哼哼|鄙视|委屈|快哭了|"
+    r"亲亲|可怜|笑脸|生病|脸红|破涕为笑|恐惧|失望|无语|嘿哈|捂脸|奸笑|机智|皱眉|耶|吃瓜|加油|汗|天啊|"
+    r"社会社会|旺柴|好的|打脸|哇|翻白眼|666|让我看看|叹气|苦涩|裂开|嘴唇|爱心|心碎|拥抱|强|弱|握手|胜利|"
+    r"抱拳|勾引|拳头|OK|合十|啤酒|咖啡|蛋糕|玫瑰|凋谢|菜刀|炸弹|便便|月亮|太阳|庆祝|礼物|红包|發|福|烟花|爆竹|猪头|跳跳|发抖|转圈)\]"
+)
+_LINEBREAK = re.compile(r"\s*\n\s*")
+_WHITESPACE = re.compile(r"\s+")
+# 中日韩字符约 1 字 1 Token，其余按约 4 字符 1 Token 估算
+_CJK = re.compile(r"[\u3000-\u303f\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的 Token 数（无需加载分词器）"""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def compact_text(text: str) -> str:
+    """去掉 Emoji 与文字表情，换行改为 " / "，合并其余空白"""
+    text = _WECHAT_EMOTICONS.sub(" ", _EMOJI.sub(" ", text or ""))
+    return _WHITESPACE.sub(" ", _LINEBREAK.sub(" / ", text.strip())).strip(" /")
+
+
+def _alias(index: int) -> str:
+    """0 -> A, 25 -> Z, 26 -> AA ..."""
+    alias = ""
+    index += 1
+    while index:
+        index, rest = divmod(index - 1, 26)
+        alias = chr(ord("A") + rest) + alias
+    return alias
+
+
+class PromptBuilder:
+    """
+    构建 LLM 请求
+
+    compact: 固定的系统提示词 + 紧凑的消息编码（短编号、发送者代号、去 Emoji 与多余空白，
+    不发送时间，去除后为空的消息不发送），模型按编号回填每条记录的来源消息；
+    verbose: 原始的 "[时间] 发送者: 内容" 格式，记录统一归属批次第一条消息。
+    """
+
+    def __init__(self, style: str = "compact"):
+        if style not in PROMPT_FORMATS:
+            raise ValueError(f"未知的提示词格式: {style}，可选 {', '.join(PROMPT_FORMATS)}")
+        self.style = style
+        self.system = COMPACT_PROMPT if style == "compact" else LLM_PROMPT
+        self.system_tokens = estimate_tokens(self.system)
+
+    @property
+    def fingerprint(self) -> str:
+        """提示词指纹，提示词或格式变化时改变"""
+        return hashlib.sha1(f"{self.style}\n{self.system}".encode("utf-8")).hexdigest()[:8]
+
+    def build(self, messages: Sequence[Any]) -> str:
+        """
+        把一批消息编码为用户消息
+
+        Args:
+            messages: Message 列表，编号从 1 开始与列表顺序对应
+
+        Returns:
+            用户消息文本
+        """
+        if self.style == "verbose":
+            return "\n".join(f"[{msg.time}] {msg.sender}: {msg.content}" for msg in messages)
+
+        aliases: Dict[str, str] = {}
+        lines = []
+        for number, msg in enumerate(messages, 1):
+            content = compact_text(msg.content)
+            if not content:
+                continue
+            sender = compact_text(msg.sender) or "?"
+            alias = aliases.get(sender)
+            if alias is None:
+                alias = aliases[sender] = _alias(len(aliases))
+            lines.append(f"{number} {alias}: {content}")
+
+        header = "#发送者 " + " ".join(f"{alias}={sender}" for sender, alias in aliases.items())
+        return header + "\n" + "\n".join(lines)
+
+    def source_index(self, record: Dict[str, Any], count: int) -> int:
+        """记录对应的消息下标；没有或越界的编号归属第一条消息"""
+        number = record.get("id")
+        if self.style == "compact" and isinstance(number, int) and 1 <= number <= count:
+            return number - 1
+        return 0
@@ -0,0 +1,195 @@
+"""
+重放解析
+把 market_data 中已存储的 raw_text 重新送入 LLM，生成新版本的解析结果
+"""
+
+import hashlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, List, Dict, Deque, Iterator, Optional, Tuple
+
+from src.config import Config
+from src.collector import Message
+from src.processor.processor import LLMClient, TransactionRecord
+from src.processor.prompt import LLM_PROMPT, PromptBuilder
+from src.processor.cache import ResponseCache
+from src.processor.anomaly import PriceAnomalyDetector
+
+
+# 重放读取的列
+SOURCE_COLUMNS = ["id", "capture_time", "message_time", "group_name", "sender_nickname", "raw_text"]
+
+
+def default_version(model: str, prompt: Optional[PromptBuilder] = None) -> str:
+    """默认解析版本：模型名 + 提示词指纹，改动任一项都会产生新版本"""
+    if prompt is not None:
+        fingerprint = prompt.fingerprint
+    else:
+        fingerprint = hashlib.sha1(LLM_PROMPT.encode("utf-8")).hexdigest()[:8]
+    return f"{model}-{fingerprint}"
+
+
+class _Batch:
+    """一次 LLM 调用的输入"""
+    __slots__ = ("messages", "source_ids", "last_key", "rows")
+
+    def __init__(self):
+        self.messages: List[Message] = []
+        self.source_ids: List[int] = []
+        self.last_key: Optional[Tuple[str, int]] = None
+        self.rows = 0
+
+
+class ReplayRunner:
+    """
+    重放执行器
+
+    按 (capture_time, id) 正序流式读取来源记录，并发调用 LLM，
+    按提交顺序写回结果与检查点。任何一批失败即停止，下次从检查点继续。
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        db: Any,
+        llm_client: Optional[LLMClient] = None
+    ):
+        replay_config = config.replay
+        self.db = db
+        self.llm_client = llm_client or LLMClient(config)
+        # 重放默认启用响应缓存，重跑同一版本时不重复调用 LLM
+        if self.llm_client.cache is None:
+            self.llm_client.cache = ResponseCache(replay_config.cache_path)
+        self.batch_size = replay_config.batch_size or config.llm.batch_size
+        self.concurrency = replay_config.concurrency
+        self.page_size = replay_config.page_size
+        self.anomaly_detector = PriceAnomalyDetector(config)
+
+    def _iter_batches(
+        self,
+        after: Optional[Tuple[str, int]],
+        limit: Optional[int]
+    ) -> Iterator[_Batch]:
+        """
+        来源记录 -> LLM 批次
+
+        同一条消息解析出的多条记录在表中相邻且 raw_text 相同，合并为一条消息；
+        批次不跨群，保证记录的群名称正确。
+        """
+        rows = self.db.iter_records(
+            columns=SOURCE_COLUMNS, after=after, descending=False, page_size=self.page_size
+        )
+        batch = _Batch()
+        previous = None
+        seen = 0
+
+        try:
+            for row in rows:
+                if limit is not None and seen >= limit:
+                    break
+                seen += 1
+
+                signature = (row["group_name"], row["sender_nickname"], row["message_time"], row["raw_text"])
+                if batch.messages and row["group_name"] != batch.messages[0].group:
+                    yield batch
+                    batch = _Batch()
+                    previous = None
+                if signature != previous:
+                    if len(batch.messages) >= self.batch_size:
+                        yield batch
+                        batch = _Batch()
+                    batch.messages.append(Message(
+                        sender=row["sender_nickname"] or "",
+                        time=row["message_time"] or "",
+                        content=row["raw_text"] or "",
+                        group=row["group_name"] or "",
+                    ))
+                    batch.source_ids.append(row["id"])
+                    previous = signature
+
+                batch.last_key = (row["capture_time"], row["id"])
+                batch.rows += 1
+        finally:
+            rows.close()
+
+        if batch.messages:
+            yield batch
+
+    def run(
+        self,
+        version: Optional[str] = None,
+        concurrency: Optional[int] = None,
+        limit: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        执行重放
+
+        Args:
+            version: 解析版本，默认由模型与提示词生成
+            concurrency: 并发 LLM 请求数
+            limit: 本次最多处理的来源记录数
+
+        Returns:
+            运行统计
+        """
+        version = version or default_version(self.llm_client.model, self.llm_client.prompt)
+        concurrency = max(1, concurrency or self.concurrency)
+
+        checkpoint = self.db.get_checkpoint(version)
+        after = (checkpoint["capture_time"], checkpoint["record_id"]) if checkpoint else None
+        processed = checkpoint["processed"] if checkpoint else 0
+
+        stats = {"version": version, "rows": 0, "records": 0, "batches": 0, "completed": True}
+        print(f"重放版本 {version}，" + (f"从检查点继续 (已处理 {processed} 条)" if checkpoint else "从头开始"))
+
+        # 在途批次数受限，内存占用与表大小无关
+        pending: Deque[Tuple[_Batch, Future]] = deque()
+        batches = self._iter_batches(after, limit)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            try:
+                for batch in batches:
+                    pending.append((batch, executor.submit(self.llm_client.extract_batch, batch.messages)))
+                    if len(pending) >= concurrency * 2:
+                        processed = self._commit(version, *pending.popleft(), processed, stats)
+                while pending:
+                    processed = self._commit(version, *pending.popleft(), processed, stats)
+            except Exception as e:
+                print(f"重放中断: {e}，下次运行将从检查点继续")
+                stats["completed"] = False
+                for _, future in pending:
+                    future.cancel()
+            finally:
+                batches.close()
+
+        stats["processed"] = processed
+        print(f"重放结束: 本次 {stats['rows']} 条来源记录, 生成 {stats['records']} 条解析结果")
+        return stats
+
+    def _commit(
+        self,
+        version: str,
+        batch: _Batch,
+        future: Future,
+        processed: int,
+        stats: Dict[str, Any]
+    ) -> int:
+        """等待一批结果，写入解析结果并推进检查点"""
+        records: List[TransactionRecord] = future.result()
+        self.anomaly_detector.check_records(records)
+
+        # 记录按来源消息归属到对应的来源记录，无法对应时归属批次第一条
+        sources: Dict[Tuple[str, str, str], int] = {}
+        for message, source_id in zip(batch.messages, batch.source_ids):
+            sources.setdefault((message.sender, message.time, message.content), source_id)
+        rows = [
+            (sources.get((record.sender, record.message_time, record.raw_text), batch.source_ids[0]), record)
+            for record in records
+        ]
+        processed += batch.rows
+        self.db.save_extractions(version, rows, batch.last_key, processed)
+
+        stats["rows"] += batch.rows
+        stats["records"] += len(rows)
+        stats["batches"] += 1
+        return processed
@@ -0,0 +1,248 @@
+"""
+LLM 调用容错
+重试退避（遵循 Retry-After）、熔断器、请求/Token 令牌桶限流
+"""
+
+import random
+import threading
+import time
+from typing import Callable, Optional, TypeVar
+
+import openai
+
+from src.config import EndpointConfig
+
+
+T = TypeVar("T")
+
+# 可重试的 HTTP 状态码
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开，暂停调用"""
+
+
+class ResponseFormatError(ValueError):
+    """LLM 响应不是约定的 JSON 格式"""
+
+
+class StreamInterruptedError(Exception):
+    """流式响应在已输出部分内容后中断，不可透明重试"""
+
+
+def is_retryable(error: Exception) -> bool:
+    """是否为瞬时错误（限流、超时、连接失败、服务端错误）"""
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS
+    return False
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """从响应头读取服务端建议的等待秒数"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            # HTTP 日期格式的 Retry-After
+            from email.utils import parsedate_to_datetime
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+class TokenBucket:
+    """令牌桶限流（线程安全），rate 为每分钟补充的令牌数"""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, per_minute: float) -> None:
+        """调整速率与容量，保留桶中已有的令牌"""
+        with self._lock:
+            self.rate = per_minute / 60.0
+            self.capacity = per_minute
+            self.tokens = min(self.tokens, self.capacity)
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """
+        取出令牌，不足时阻塞等待
+
+        Returns:
+            等待的秒数
+        """
+        # 单次请求超过桶容量时按容量计，避免永远等待
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                delay = (amount - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    连续失败达到阈值后打开，reset_timeout 秒内的调用直接失败；
+    之后进入半开状态放行一次试探调用，成功则关闭，失败则重新打开。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> None:
+        """调用前检查，熔断时抛出 CircuitOpenError"""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    raise CircuitOpenError("LLM 熔断中，暂停调用")
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    raise CircuitOpenError("LLM 熔断试探中，暂停调用")
+                self._probing = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+
+class ResilientCaller:
+    """
+    容错调用器
+
+    每次尝试前经过熔断器与限流器；瞬时错误按指数退避 + 全抖动重试，
+    服务端给出 Retry-After 时以其为准。非瞬时错误直接抛出。
+    """
+
+    def __init__(self, settings: EndpointConfig):
+        self.breaker = CircuitBreaker()
+        self.request_bucket: Optional[TokenBucket] = None
+        self.token_bucket: Optional[TokenBucket] = None
+        self.configure(settings)
+
+        self.stats = {"calls": 0, "retries": 0, "failures": 0, "throttled_seconds": 0.0}
+        self._stats_lock = threading.Lock()
+
+    def configure(self, settings: EndpointConfig) -> None:
+        """应用重试、熔断与限流设置；熔断状态与桶中令牌保留"""
+        self.max_retries = settings.max_retries
+        self.base_delay = settings.retry_base_delay
+        self.max_delay = settings.retry_max_delay
+        self.breaker.failure_threshold = settings.circuit_threshold
+        self.breaker.reset_timeout = settings.circuit_reset_seconds
+        self.request_bucket = self._bucket(self.request_bucket, settings.requests_per_minute)
+        self.token_bucket = self._bucket(self.token_bucket, settings.tokens_per_minute)
+
+    @staticmethod
+    def _bucket(bucket: Optional[TokenBucket], per_minute: Optional[float]) -> Optional[TokenBucket]:
+        if not per_minute:
+            return None
+        if bucket is None:
+            return TokenBucket(per_minute)
+        bucket.set_rate(per_minute)
+        return bucket
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        hinted = retry_after(error)
+        if hinted is not None:
+            return min(hinted, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _count(self, key: str, amount: float = 1) -> None:
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def call(self, func: Callable[[], T], tokens: int = 0) -> T:
+        """
+        执行调用
+
+        Args:
+            func: 无参调用
+            tokens: 估算的 Token 数，用于 Token 限流
+
+        Returns:
+            func 的返回值
+        """
+        attempt = 0
+        while True:
+            self.breaker.allow()
+            if self.request_bucket is not None:
+                self._count("throttled_seconds", self.request_bucket.acquire())
+            if self.token_bucket is not None and tokens:
+                self._count("throttled_seconds", self.token_bucket.acquire(tokens))
+
+            self._count("calls")
+            try:
+                result = func()
+            except Exception as e:
+                if isinstance(e, StreamInterruptedError):
+                    # 已输出部分内容，重试会重复推送
+                    self.breaker.record_failure()
+                    raise
+                if not is_retryable(e):
+                    # 请求本身的问题（如 400），不代表服务不可用
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    self._count("failures")
+                    raise
+                delay = self._backoff(attempt, e)
+                print(f"LLM 调用失败 ({type(e).__name__})，{delay:.1f}s 后重试 ({attempt + 1}/{self.max_retries})")
+                self._count("retries")
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            self.breaker.record_success()
+            return result
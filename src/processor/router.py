@@ -0,0 +1,300 @@
+"""
+多端点 LLM 路由
+在多个 OpenAI 兼容端点之间按负载与延迟分发请求，支持健康检查、对冲请求
+以及从低成本模型到强模型的分级回退
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, List, Dict, Deque, Optional, Set
+
+from openai import OpenAI
+
+from src.config import EndpointConfig, LLMConfig
+from src.processor.resilience import CircuitBreaker, CircuitOpenError, ResilientCaller, is_retryable
+
+
+def _endpoint_name(settings: EndpointConfig) -> str:
+    return settings.name or settings.model
+
+
+def _connection(settings: EndpointConfig) -> tuple:
+    """决定 HTTP 客户端的设置；变化时需要新建端点"""
+    return settings.api_base, settings.api_key, settings.timeout
+
+
+class Endpoint:
+    """一个 OpenAI 兼容端点"""
+
+    def __init__(self, settings: EndpointConfig):
+        self.name = _endpoint_name(settings)
+        self.connection = _connection(settings)
+
+        api_base, api_key, timeout = self.connection
+        self.client = OpenAI(api_key=api_key, base_url=api_base, timeout=timeout, max_retries=0)
+        self.resilience = ResilientCaller(settings)
+        self.configure(settings)
+
+        self.in_flight = 0
+        self.healthy = True
+        self.latency_ewma: Optional[float] = None
+        self.latencies: Deque[float] = deque(maxlen=200)
+        self.stats = {
+            "requests": 0, "successes": 0, "failures": 0,
+            "hedged": 0, "hedge_wins": 0, "tokens": 0, "cost": 0.0,
+        }
+
+    def configure(self, settings: EndpointConfig) -> None:
+        """应用可在线调整的设置（模型、分级、权重、成本、并发上限）"""
+        self.model = settings.model
+        self.tier = settings.tier
+        self.weight = float(settings.weight)
+        self.cost = float(settings.cost)  # 每千 Token 成本
+        self.max_concurrency = settings.max_concurrency
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        return self.resilience.breaker
+
+    def score(self) -> float:
+        """预计等待时间 / 权重，越小越优先；未测得延迟时视为 1 秒"""
+        latency = self.latency_ewma if self.latency_ewma is not None else 1.0
+        return (self.in_flight + 1) * latency / self.weight
+
+    def latency_quantile(self, q: float) -> Optional[float]:
+        if len(self.latencies) < 20:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def record_latency(self, seconds: float) -> None:
+        self.latencies.append(seconds)
+        self.latency_ewma = seconds if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        p50 = self.latency_quantile(0.5)
+        p95 = self.latency_quantile(0.95)
+        return {
+            "name": self.name,
+            "model": self.model,
+            "tier": self.tier,
+            "healthy": self.healthy,
+            "circuit": self.breaker.state,
+            "in_flight": self.in_flight,
+            "latency_ewma": self.latency_ewma,
+            "latency_p50": p50,
+            "latency_p95": p95,
+            "retries": self.resilience.stats["retries"],
+            **self.stats,
+        }
+
+
+class LLMRouter:
+    """
+    端点路由器
+
+    端点按 tier 分级（0 为最便宜的一级）。同一级内选择 预计等待时间/权重
+    最小且未熔断、未满载的端点；请求超过对冲阈值仍未返回时，
+    向另一端点发出对冲请求，取先返回的结果。
+    """
+
+    def __init__(self, llm_config: LLMConfig):
+        self.endpoints = [Endpoint(settings) for settings in llm_config.endpoints]
+        self.tiers = sorted({endpoint.tier for endpoint in self.endpoints})
+
+        # 对冲阈值：数字为固定秒数，"auto" 为所选端点近期延迟的 p95，缺省不对冲
+        self.hedge_after = llm_config.hedge_after
+
+        self._cond = threading.Condition()
+        self._pool = ThreadPoolExecutor(max_workers=self._pool_size(), thread_name_prefix="llm-router")
+
+        interval = llm_config.health_check_interval
+        self._stop = threading.Event()
+        if interval:
+            threading.Thread(target=self._health_loop, args=(interval,), daemon=True).start()
+
+    def _pool_size(self) -> int:
+        return max(4, sum(endpoint.max_concurrency for endpoint in self.endpoints))
+
+    def reconfigure(self, llm_config: LLMConfig) -> None:
+        """
+        在线应用新的端点配置
+
+        名称与连接设置（地址、Key、超时）不变的端点原样保留，只更新模型、权重、
+        并发上限与重试/限流设置，连接、延迟统计与熔断状态不丢失；其余端点新建。
+        进行中的请求在原端点上完成。
+        """
+        current = {endpoint.name: endpoint for endpoint in self.endpoints}
+        endpoints = []
+        for settings in llm_config.endpoints:
+            endpoint = current.get(_endpoint_name(settings))
+            if endpoint is not None and endpoint.connection == _connection(settings):
+                endpoint.configure(settings)
+                endpoint.resilience.configure(settings)
+            else:
+                endpoint = Endpoint(settings)
+            endpoints.append(endpoint)
+
+        with self._cond:
+            self.endpoints = endpoints
+            self.tiers = sorted({endpoint.tier for endpoint in endpoints})
+            self.hedge_after = llm_config.hedge_after
+            if self._pool_size() > self._pool._max_workers:
+                # 线程池不能扩容，换新池；旧池中的请求照常完成
+                old_pool = self._pool
+                self._pool = ThreadPoolExecutor(max_workers=self._pool_size(), thread_name_prefix="llm-router")
+                old_pool.shutdown(wait=False)
+            # 并发上限可能提高，唤醒等待中的请求
+            self._cond.notify_all()
+
+    @property
+    def primary(self) -> Endpoint:
+        return self.endpoints[0]
+
+    def tier_models(self, tier: int) -> List[str]:
+        return sorted({endpoint.model for endpoint in self.endpoints if endpoint.tier == tier})
+
+    def _pick(self, tier: int, exclude: Set[str], block: bool = True) -> Optional[Endpoint]:
+        """选择端点并占用一个并发名额；全部满载时等待"""
+        with self._cond:
+            while True:
+                candidates = [
+                    endpoint for endpoint in self.endpoints
+                    if endpoint.tier == tier and endpoint.name not in exclude
+                    and endpoint.breaker.state != CircuitBreaker.OPEN
+                ]
+                if not candidates:
+                    # 熔断中的端点到期后由熔断器放行试探请求
+                    candidates = [
+                        endpoint for endpoint in self.endpoints
+                        if endpoint.tier == tier and endpoint.name not in exclude
+                    ]
+                if not candidates:
+                    return None
+
+                healthy = [endpoint for endpoint in candidates if endpoint.healthy] or candidates
+                free = [endpoint for endpoint in healthy if endpoint.in_flight < endpoint.max_concurrency]
+                if free:
+                    chosen = min(free, key=lambda endpoint: endpoint.score())
+                    chosen.in_flight += 1
+                    return chosen
+                if not block:
+                    return None
+                self._cond.wait()
+
+    def _call(self, endpoint: Endpoint, request: Callable[[OpenAI, str], Any], tokens: int) -> Any:
+        """在端点上执行请求（含该端点的重试与熔断），记录统计并释放并发名额"""
+        start = time.monotonic()
+        try:
+            result = endpoint.resilience.call(lambda: request(endpoint.client, endpoint.model), tokens=tokens)
+        except Exception:
+            with self._cond:
+                endpoint.in_flight -= 1
+                endpoint.stats["requests"] += 1
+                endpoint.stats["failures"] += 1
+                # 等待者的可用分级与排除端点各不相同，全部唤醒由各自重新判断
+                self._cond.notify_all()
+            raise
+
+        with self._cond:
+            endpoint.in_flight -= 1
+            endpoint.record_latency(time.monotonic() - start)
+            endpoint.stats["requests"] += 1
+            endpoint.stats["successes"] += 1
+            endpoint.stats["tokens"] += tokens
+            endpoint.stats["cost"] += tokens / 1000 * endpoint.cost
+            self._cond.notify_all()
+        return result
+
+    def _hedge_delay(self, endpoint: Endpoint) -> Optional[float]:
+        if self.hedge_after == "auto":
+            return endpoint.latency_quantile(0.95)
+        return self.hedge_after
+
+    def complete(
+        self,
+        request: Callable[[OpenAI, str], Any],
+        tier: int = 0,
+        tokens: int = 0,
+        hedging: bool = True
+    ) -> Any:
+        """
+        在某一级端点上执行请求
+
+        Args:
+            request: request(client, model) -> 响应
+            tier: 端点级别
+            tokens: 估算的 Token 数
+            hedging: 是否允许对冲请求（有副作用的流式请求应关闭）
+
+        Returns:
+            最先成功的响应
+        """
+        tried: Set[str] = set()
+        last_error: Optional[Exception] = None
+
+        while True:
+            endpoint = self._pick(tier, tried)
+            if endpoint is None:
+                raise last_error or CircuitOpenError(f"第 {tier} 级没有可用的 LLM 端点")
+            tried.add(endpoint.name)
+
+            pending = {self._pool.submit(self._call, endpoint, request, tokens)}
+            hedge_future: Optional[Future] = None
+            hedge: Optional[Endpoint] = None
+
+            delay = self._hedge_delay(endpoint) if hedging else None
+            if delay is not None:
+                done, _ = wait(pending, timeout=delay)
+                if not done:
+                    hedge = self._pick(tier, tried, block=False)
+                    if hedge is not None:
+                        tried.add(hedge.name)
+                        with self._cond:
+                            hedge.stats["hedged"] += 1
+                        hedge_future = self._pool.submit(self._call, hedge, request, tokens)
+                        pending.add(hedge_future)
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        last_error = e
+                        continue
+                    if future is hedge_future:
+                        with self._cond:
+                            hedge.stats["hedge_wins"] += 1
+                    # 落后的请求在后台完成，结果丢弃
+                    return result
+
+            # 非瞬时错误换端点也无济于事
+            if last_error is not None and not isinstance(last_error, CircuitOpenError) \
+                    and not is_retryable(last_error):
+                raise last_error
+
+    def check_health(self, timeout: float = 5.0) -> Dict[str, bool]:
+        """主动探测各端点（GET /models）"""
+        for endpoint in self.endpoints:
+            try:
+                endpoint.client.with_options(timeout=timeout).models.list()
+                endpoint.healthy = True
+            except Exception as e:
+                print(f"LLM 端点 {endpoint.name} 不可用: {e}")
+                endpoint.healthy = False
+        return {endpoint.name: endpoint.healthy for endpoint in self.endpoints}
+
+    def _health_loop(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            self.check_health()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """各端点统计"""
+        return [endpoint.snapshot() for endpoint in self.endpoints]
+
+    def close(self) -> None:
+        self._stop.set()
+        self._pool.shutdown(wait=False)
@@ -4,6 +4,13 @@
 """
 
 from .database import DatabaseManager
-from .reports import ReportGenerator
+from .reports import ReportGenerator, ReportWorker
+from .queue import MessageQueue
+from .export import ParquetExporter, load_columns, load_arrow_table
+from .service import QueryCache, QueryService, QueryServer
+from .profiler import QueryProfiler
 
-__all__ = ['DatabaseManager', 'ReportGenerator']
+__all__ = [
+    'DatabaseManager', 'MessageQueue', 'ReportGenerator', 'ReportWorker', 'ParquetExporter', 'load_columns', 'load_arrow_table',
+    'QueryCache', 'QueryService', 'QueryServer', 'QueryProfiler'
+]
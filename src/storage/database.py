@@ -1,65 +1,474 @@
 """
 数据库管理器
 负责 SQLite 数据库的创建和操作
+
+交易记录存放在事实表 market_facts 中，群组、发送者、商品名称规范化到维度表，
+事实行只保存整数 ID；同名视图 market_data 还原出原来的文本列，读取方式不变。
 """
 
+import atexit
+import heapq
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta
+from itertools import islice
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Sequence, Tuple, Union
 
-from src.processor import TransactionRecord
+from src.config import Config
+from src.processor import RecordBatch, TransactionRecord
+from src.processor.processor import row_adapter
+from src.storage.partitions import PartitionManager, register_functions
+from src.storage.profiler import QueryProfiler
 
 
 class DatabaseManager:
     """SQLite 数据库管理器"""
 
-    def __init__(self, db_path: str = "./data/market_data.db"):
+    # market_data 的全部列，用于列投影校验
+    RECORD_COLUMNS = (
+        "id", "capture_time", "message_time", "group_name", "sender_nickname",
+        "raw_text", "action", "item_category", "specs", "price", "quantity",
+        "created_at", "price_flag", "cluster_id",
+    )
+
+    # 建表之后新增的列，旧库启动时自动补齐
+    MIGRATED_COLUMNS = (
+        ("price_flag", "TEXT DEFAULT ''"),
+        ("cluster_id", "TEXT"),
+    )
+
+    # 插入语句使用的列
+    INSERT_COLUMNS = (
+        "capture_time", "message_time", "group_name", "sender_nickname",
+        "raw_text", "action", "item_category", "specs", "price", "quantity",
+        "price_flag", "cluster_id",
+    )
+
+    # 事实表
+    FACT_TABLE = "market_facts"
+
+    # 规范化的文本列: (market_data 列名, 事实表 ID 列, 维度表)
+    DIMENSIONS = (
+        ("group_name", "group_id", "dim_groups"),
+        ("sender_nickname", "sender_id", "dim_senders"),
+        ("item_category", "item_id", "dim_items"),
+    )
+
+    # market_data 列名 -> 事实表列名
+    FACT_COLUMN_NAMES = {name: id_column for name, id_column, _ in DIMENSIONS}
+
+    # 事实表插入使用的列（维度列替换为 ID 列）
+    FACT_COLUMNS = tuple(map(FACT_COLUMN_NAMES.get, INSERT_COLUMNS, INSERT_COLUMNS))
+
+    # 视图 -> (实际表, 列映射)，索引建议据此落到事实表上
+    VIEW_ALIASES = {
+        "market_data": (FACT_TABLE, FACT_COLUMN_NAMES),
+        "market_data_all": (FACT_TABLE, FACT_COLUMN_NAMES),
+    }
+
+    def __init__(
+        self,
+        db_path: str = "./data/market_data.db",
+        partition_dir: Optional[str] = None,
+        archive_codec: str = "zlib",
+        wal: bool = True,
+        read_only: bool = False,
+        profiler: Optional[QueryProfiler] = None
+    ):
+        """
+        Args:
+            profiler: 查询剖析器；设置后本管理器打开的连接上的每条语句都会计时
+        """
         self.db_path = db_path
-        self._ensure_database()
+        self.profiler = profiler
+        self.partitions = PartitionManager(
+            db_path, partition_dir, archive_codec, table=self.FACT_TABLE, read_only=read_only
+        )
+        self._insert_row = row_adapter(self.INSERT_COLUMNS)
+        self.wal = wal
+        self.read_only = read_only
+        # 写入代数：本进程每次写入 market_data 后加一，查询缓存据此失效
+        self.generation = 0
+        # 维度表 -> {名称: ID}，首次使用时整表加载；ID 分配后不再变化，无需失效
+        self._dimension_ids: Dict[str, Dict[str, int]] = {}
+        self._dimension_positions = [
+            (self.INSERT_COLUMNS.index(name), table) for name, _, table in self.DIMENSIONS
+        ]
+        if not read_only:
+            self._ensure_database()
+
+    @classmethod
+    def from_config(cls, config: Config, profile: Optional[bool] = None) -> "DatabaseManager":
+        """
+        根据 database 配置创建管理器
+
+        Args:
+            profile: 是否剖析查询，默认取 database.profile；开启时进程退出前把结果并入 database.query_log
+        """
+        db_config = config.database
+        profiler = None
+        if db_config.profile if profile is None else profile:
+            profiler = QueryProfiler(slow_ms=db_config.slow_query_ms, log_path=db_config.query_log)
+            atexit.register(profiler.save)
+        return cls(
+            db_config.path,
+            partition_dir=db_config.partition_dir,
+            archive_codec=db_config.archive_codec,
+            wal=db_config.wal,
+            profiler=profiler
+        )
+
+    def reader(self) -> "DatabaseManager":
+        """
+        同一数据库的只读管理器
+
+        主库与月度分区均以只读模式打开，表结构同步留给写入端；
+        WAL 模式下读取不阻塞写入，也不被写入阻塞。
+        """
+        return DatabaseManager(
+            self.db_path,
+            partition_dir=self.partitions.partition_dir,
+            archive_codec=self.partitions.codec,
+            wal=self.wal,
+            read_only=True,
+            profiler=self.profiler
+        )
+
+    def _connect(self, check_same_thread: bool = True) -> sqlite3.Connection:
+        """创建数据库连接（只读管理器打开只读连接）"""
+        if self.read_only:
+            uri = Path(self.db_path).resolve().as_uri() + "?mode=ro"
+            database, options = uri, {"uri": True}
+        else:
+            database, options = self.db_path, {}
+        if self.profiler is not None:
+            conn = self.profiler.connect(database, check_same_thread=check_same_thread, **options)
+        else:
+            conn = sqlite3.connect(database, check_same_thread=check_same_thread, **options)
+        register_functions(conn)
+        return conn
+
+    def bump_generation(self) -> None:
+        """标记 market_data 已被写入"""
+        self.generation += 1
 
     def _ensure_database(self) -> None:
         """确保数据库和表存在"""
         Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
 
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
 
-        # 创建 market_data 表
+        if self.wal:
+            # WAL 模式持久保存在库文件中，读连接与写连接互不阻塞
+            cursor.execute("PRAGMA journal_mode=WAL")
+
+        # 维度表：名称唯一，ID 一经分配不再改变
+        for _, _, table in self.DIMENSIONS:
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS {table} (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL UNIQUE
+                )
+            ''')
+
+        # 创建事实表
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS market_data (
+            CREATE TABLE IF NOT EXISTS market_facts (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 capture_time DATETIME NOT NULL,
                 message_time DATETIME,
-                group_name TEXT,
-                sender_nickname TEXT,
+                group_id INTEGER REFERENCES dim_groups(id),
+                sender_id INTEGER REFERENCES dim_senders(id),
                 raw_text TEXT,
                 action TEXT,
-                item_category TEXT,
+                item_id INTEGER REFERENCES dim_items(id),
                 specs TEXT,
                 price REAL,
                 quantity INTEGER,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                price_flag TEXT DEFAULT '',
+                cluster_id TEXT
+            )
+        ''')
+
+        # 创建索引；按群组/发送者/商品查询为整数索引查找
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_market_facts_group
+            ON market_facts(group_id)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_market_facts_sender
+            ON market_facts(sender_id)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_market_facts_item
+            ON market_facts(item_id)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_market_facts_time
+            ON market_facts(message_time)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_market_facts_action
+            ON market_facts(action)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_market_facts_cluster
+            ON market_facts(cluster_id)
+        ''')
+        # 键集分页使用的 (capture_time, id) 复合索引
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_market_facts_capture
+            ON market_facts(capture_time, id)
+        ''')
+        conn.commit()
+
+        migrated = self._migrate_legacy_table(conn)
+        self._create_market_view(cursor)
+
+        # 创建 market_events 表（撮合/套利事件）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS market_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at DATETIME NOT NULL,
+                event_type TEXT,
+                item_key TEXT,
+                item TEXT,
+                specs TEXT,
+                buy_price REAL,
+                sell_price REAL,
+                spread REAL,
+                buy_group TEXT,
+                sell_group TEXT,
+                buy_sender TEXT,
+                sell_sender TEXT,
+                buy_record_id INTEGER,
+                sell_record_id INTEGER,
+                buy_text TEXT,
+                sell_text TEXT
             )
         ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_market_events_created
+            ON market_events(created_at)
+        ''')
 
-        # 创建索引
+        # 重放产生的版本化解析结果，不覆盖 market_data
         cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_market_data_group
-            ON market_data(group_name)
+            CREATE TABLE IF NOT EXISTS extractions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                version TEXT NOT NULL,
+                source_record_id INTEGER NOT NULL,
+                action TEXT,
+                item_category TEXT,
+                specs TEXT,
+                price REAL,
+                quantity INTEGER,
+                price_flag TEXT DEFAULT '',
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
         ''')
         cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_market_data_time
-            ON market_data(message_time)
+            CREATE INDEX IF NOT EXISTS idx_extractions_version
+            ON extractions(version, source_record_id)
         ''')
         cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_market_data_action
-            ON market_data(action)
+            CREATE TABLE IF NOT EXISTS replay_checkpoints (
+                version TEXT PRIMARY KEY,
+                capture_time DATETIME NOT NULL,
+                record_id INTEGER NOT NULL,
+                processed INTEGER DEFAULT 0,
+                updated_at DATETIME
+            )
         ''')
 
         conn.commit()
+        if migrated:
+            # 旧表的页面在 VACUUM 后才归还给文件系统
+            conn.execute("VACUUM")
         conn.close()
 
+    def _migrate_columns(self, cursor: sqlite3.Cursor) -> None:
+        """为旧库补齐新增列"""
+        existing = {row[1] for row in cursor.execute("PRAGMA table_info(market_data)").fetchall()}
+        for name, definition in self.MIGRATED_COLUMNS:
+            if name not in existing:
+                cursor.execute(f"ALTER TABLE market_data ADD COLUMN {name} {definition}")
+
+    def _migrate_legacy_table(self, conn: sqlite3.Connection) -> bool:
+        """
+        把旧版的 market_data 表（文本列）迁移到维度表 + 事实表
+
+        在一个事务中完成，记录 ID 与自增序列保持不变（分区中的记录按 ID 去重）。
+
+        Returns:
+            是否进行了迁移
+        """
+        row = conn.execute("SELECT type FROM sqlite_master WHERE name = 'market_data'").fetchone()
+        if not row or row[0] != "table":
+            return False
+
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            self._migrate_columns(cursor)
+            for name, _, table in self.DIMENSIONS:
+                cursor.execute(
+                    f"INSERT OR IGNORE INTO {table} (name) "
+                    f"SELECT DISTINCT {name} FROM market_data WHERE {name} IS NOT NULL"
+                )
+
+            tables = {name: table for name, _, table in self.DIMENSIONS}
+            targets = [self.FACT_COLUMN_NAMES.get(column, column) for column in self.RECORD_COLUMNS]
+            sources = [
+                f"(SELECT id FROM {tables[column]} WHERE name = m.{column})" if column in tables else f"m.{column}"
+                for column in self.RECORD_COLUMNS
+            ]
+            moved = cursor.execute(
+                f"INSERT INTO market_facts ({', '.join(targets)}) "
+                f"SELECT {', '.join(sources)} FROM market_data m ORDER BY m.id"
+            ).rowcount
+
+            # 保留旧表的自增序列，已归档（已删除）记录的 ID 不会被复用
+            sequence = cursor.execute(
+                "SELECT MAX(seq) FROM sqlite_sequence WHERE name IN ('market_data', 'market_facts')"
+            ).fetchone()[0]
+            cursor.execute("DROP TABLE market_data")
+            if sequence is not None:
+                cursor.execute("DELETE FROM sqlite_sequence WHERE name = 'market_facts'")
+                cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('market_facts', ?)", (sequence,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        print(f"已将 {moved} 条记录迁移到维度表 + 事实表")
+        return True
+
+    def _create_market_view(self, cursor: sqlite3.Cursor) -> None:
+        """
+        创建兼容视图 market_data 及其 INSTEAD OF 触发器
+
+        视图列与旧表一致；对视图的 INSERT / UPDATE / DELETE 由触发器转写到事实表，
+        外部脚本与旧查询无需修改。程序内部的写入直接写事实表。
+        """
+        tables = {name: table for name, _, table in self.DIMENSIONS}
+
+        select = ", ".join(
+            f"{tables[column]}.name AS {column}" if column in tables else f"f.{column} AS {column}"
+            for column in self.RECORD_COLUMNS
+        )
+        joins = " ".join(
+            f"LEFT JOIN {table} ON {table}.id = f.{id_column}" for _, id_column, table in self.DIMENSIONS
+        )
+        cursor.execute(f"CREATE VIEW IF NOT EXISTS market_data AS SELECT {select} FROM market_facts f {joins}")
+
+        ensure_names = " ".join(
+            f"INSERT OR IGNORE INTO {table} (name) SELECT NEW.{name} WHERE NEW.{name} IS NOT NULL;"
+            for name, _, table in self.DIMENSIONS
+        )
+        defaults = {"created_at": "CURRENT_TIMESTAMP", "price_flag": "''"}
+        values = [
+            f"(SELECT id FROM {tables[column]} WHERE name = NEW.{column})" if column in tables
+            else f"COALESCE(NEW.{column}, {defaults[column]})" if column in defaults
+            else f"NEW.{column}"
+            for column in self.RECORD_COLUMNS
+        ]
+        targets = [self.FACT_COLUMN_NAMES.get(column, column) for column in self.RECORD_COLUMNS]
+
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS market_data_insert INSTEAD OF INSERT ON market_data
+            BEGIN
+                {ensure_names}
+                INSERT INTO market_facts ({', '.join(targets)}) VALUES ({', '.join(values)});
+            END
+        ''')
+        assignments = ", ".join(f"{target} = {value}" for target, value in zip(targets, values))
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS market_data_update INSTEAD OF UPDATE ON market_data
+            BEGIN
+                {ensure_names}
+                UPDATE market_facts SET {assignments} WHERE id = OLD.id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS market_data_delete INSTEAD OF DELETE ON market_data
+            BEGIN
+                DELETE FROM market_facts WHERE id = OLD.id;
+            END
+        ''')
+
+    def _insert_sql(self) -> str:
+        """插入语句（直接写事实表，参数由 _fact_rows 生成）"""
+        placeholders = ", ".join("?" for _ in self.FACT_COLUMNS)
+        return f"INSERT INTO {self.FACT_TABLE} ({', '.join(self.FACT_COLUMNS)}) VALUES ({placeholders})"
+
+    def _record_rows(self, records: Union[Iterable[TransactionRecord], RecordBatch]) -> Iterator[tuple]:
+        """一批记录 -> 按 INSERT_COLUMNS 排列的行；列式批直接按列拼行"""
+        if isinstance(records, RecordBatch):
+            return records.db_rows(self.INSERT_COLUMNS)
+        return map(self._insert_row, records)
+
+    def _fact_rows(self, records: Union[Iterable[TransactionRecord], RecordBatch]) -> List[list]:
+        """
+        一批记录 -> 事实表插入参数（群组/发送者/商品名称替换为维度 ID）
+
+        维度 ID 在写入事实行之前单独提交；即使随后的事务回滚，也只会留下未被引用的维度行。
+        """
+        rows = [list(row) for row in self._record_rows(records)]
+        names = {table: {row[index] for row in rows} for index, table in self._dimension_positions}
+        mappings = self.dimension_ids(names)
+        for index, table in self._dimension_positions:
+            mapping = mappings[table]
+            for row in rows:
+                name = row[index]
+                if name is not None:
+                    row[index] = mapping[name]
+        return rows
+
+    def dimension_ids(self, names: Dict[str, Iterable[Optional[str]]]) -> Dict[str, Dict[str, int]]:
+        """
+        取维度名称对应的 ID，不存在的名称先写入维度表
+
+        Args:
+            names: 维度表 -> 名称集合
+
+        Returns:
+            维度表 -> {名称: ID}（进程内缓存，包含此前见过的全部名称）
+        """
+        missing = {
+            table: {name for name in values if name is not None and name not in self._dimension_ids.get(table, ())}
+            for table, values in names.items()
+        }
+        if not any(missing.values()) and all(table in self._dimension_ids for table in names):
+            return self._dimension_ids
+
+        conn = self._connect()
+        try:
+            for table, pending in missing.items():
+                if table not in self._dimension_ids:
+                    self._dimension_ids[table] = {
+                        name: dim_id for dim_id, name in conn.execute(f"SELECT id, name FROM {table}")
+                    }
+                    pending -= self._dimension_ids[table].keys()
+                if not pending:
+                    continue
+                # 其他进程可能同时写入同名维度，以数据库中的 ID 为准
+                with conn:
+                    conn.executemany(f"INSERT OR IGNORE INTO {table} (name) VALUES (?)", [(n,) for n in pending])
+                pending = list(pending)
+                for start in range(0, len(pending), 500):
+                    chunk = pending[start:start + 500]
+                    self._dimension_ids[table].update(
+                        (name, dim_id) for dim_id, name in conn.execute(
+                            f"SELECT id, name FROM {table} WHERE name IN ({', '.join('?' for _ in chunk)})", chunk
+                        )
+                    )
+        finally:
+            conn.close()
+        return self._dimension_ids
+
     def insert_record(self, record: TransactionRecord) -> int:
         """
         插入单条记录
@@ -70,131 +479,429 @@ class DatabaseManager:
         Returns:
             插入记录的 ID
         """
-        conn = sqlite3.connect(self.db_path)
+        row = self._fact_rows([record])[0]
+        conn = self._connect()
         cursor = conn.cursor()
 
-        data = record.to_db_dict()
-
-        cursor.execute('''
-            INSERT INTO market_data (
-                capture_time, message_time, group_name, sender_nickname,
-                raw_text, action, item_category, specs, price, quantity
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data['capture_time'],
-            data.get('message_time'),
-            data.get('group_name'),
-            data.get('sender_nickname'),
-            data.get('raw_text'),
-            data['action'],
-            data['item_category'],
-            data['specs'],
-            data['price'],
-            data['quantity']
-        ))
+        cursor.execute(self._insert_sql(), row)
 
         record_id = cursor.lastrowid
         conn.commit()
         conn.close()
+        self.bump_generation()
 
         return record_id
 
-    def insert_records(self, records: List[TransactionRecord]) -> int:
+    def insert_fact_rows(self, conn: sqlite3.Connection, rows: List[list]) -> List[int]:
+        """
+        在调用方的事务中写入 _fact_rows 生成的事实行
+
+        事实表为 AUTOINCREMENT，事务持有写锁期间新行的 ID 连续递增，
+        因此由最后一行的 ID 倒推整批 ID，无需逐行插入。
+
+        Returns:
+            按 rows 顺序排列的记录 ID
+        """
+        if not rows:
+            return []
+        conn.executemany(self._insert_sql(), rows)
+        last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        return list(range(last_id - len(rows) + 1, last_id + 1))
+
+    def insert_records(self, records: Union[List[TransactionRecord], RecordBatch]) -> List[int]:
         """
         批量插入记录
 
         Args:
-            records: 交易记录列表
+            records: 交易记录列表或列式记录批
 
         Returns:
-            插入的记录数量
+            按输入顺序排列的记录 ID
         """
         if not records:
-            return 0
+            return []
 
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        rows = self._fact_rows(records)
+        conn = self._connect()
+        try:
+            with conn:
+                record_ids = self.insert_fact_rows(conn, rows)
+        finally:
+            conn.close()
+        self.bump_generation()
 
-        for record in records:
-            data = record.to_db_dict()
-            cursor.execute('''
-                INSERT INTO market_data (
-                    capture_time, message_time, group_name, sender_nickname,
-                    raw_text, action, item_category, specs, price, quantity
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                data['capture_time'],
-                data.get('message_time'),
-                data.get('group_name'),
-                data.get('sender_nickname'),
-                data.get('raw_text'),
-                data['action'],
-                data['item_category'],
-                data['specs'],
-                data['price'],
-                data['quantity']
-            ))
-
-        count = len(records)
-        conn.commit()
-        conn.close()
+        return record_ids
 
-        return count
+    def update_price_flags(self, flags: Iterable[Tuple[str, int]]) -> int:
+        """
+        批量更新主库记录的价格异常标记
 
-    def query_records(
+        Args:
+            flags: (price_flag, id) 序列
+
+        Returns:
+            更新的记录数量
+        """
+        conn = self._connect()
+        try:
+            cursor = conn.executemany(f"UPDATE {self.FACT_TABLE} SET price_flag = ? WHERE id = ?", flags)
+            conn.commit()
+            self.bump_generation()
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def insert_events(self, events: List[Any]) -> int:
+        """
+        批量写入撮合/套利事件
+
+        Args:
+            events: MarketEvent 列表
+
+        Returns:
+            写入的事件数量
+        """
+        if not events:
+            return 0
+
+        rows = [event.to_db_dict() for event in events]
+        columns = list(rows[0])
+        conn = self._connect()
+        try:
+            conn.executemany(
+                f"INSERT INTO market_events ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' for _ in columns)})",
+                [tuple(row[col] for col in columns) for row in rows]
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+        return len(rows)
+
+    def save_extractions(
         self,
-        start_time: Optional[str] = None,
-        end_time: Optional[str] = None,
-        group_name: Optional[str] = None,
-        action: Optional[str] = None,
-        limit: int = 1000
-    ) -> List[Dict[str, Any]]:
+        version: str,
+        rows: List[Tuple[int, TransactionRecord]],
+        checkpoint: Tuple[str, int],
+        processed: int
+    ) -> int:
         """
-        查询记录
+        写入一批重放结果并推进检查点（同一事务，保证可断点续跑）
 
         Args:
-            start_time: 开始时间
-            end_time: 结束时间
-            group_name: 群名称
-            action: 交易方向 (SELL/BUY)
-            limit: 返回数量限制
+            version: 解析版本
+            rows: (来源记录 ID, 交易记录) 列表
+            checkpoint: 本批最后一条来源记录的 (capture_time, id)
+            processed: 截至本批已处理的来源记录数
 
         Returns:
-            记录列表
+            写入的解析结果数量
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO extractions (version, source_record_id, action, item_category, "
+                    "specs, price, quantity, price_flag) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (version, record_id, record.action, record.item, record.specs,
+                         record.price, record.quantity, record.price_flag)
+                        for record_id, record in rows
+                    ]
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO replay_checkpoints "
+                    "(version, capture_time, record_id, processed, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (version, checkpoint[0], checkpoint[1], processed, datetime.now().isoformat())
+                )
+        finally:
+            conn.close()
 
-        query = "SELECT * FROM market_data WHERE 1=1"
-        params = []
+        return len(rows)
+
+    def get_checkpoint(self, version: str) -> Optional[Dict[str, Any]]:
+        """读取某个解析版本的重放检查点"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT capture_time, record_id, processed, updated_at "
+                "FROM replay_checkpoints WHERE version = ?",
+                (version,)
+            ).fetchone()
+        finally:
+            conn.close()
+
+        if row is None:
+            return None
+        return {"capture_time": row[0], "record_id": row[1], "processed": row[2], "updated_at": row[3]}
+
+    def query_extractions(self, version: str, limit: int = 1000) -> List[Dict[str, Any]]:
+        """按来源记录顺序查询某个版本的解析结果"""
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "SELECT * FROM extractions WHERE version = ? ORDER BY source_record_id, id LIMIT ?",
+                (version, limit)
+            )
+            columns = [desc[0] for desc in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    def query_events(self, event_type: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """查询最近的撮合/套利事件"""
+        query = "SELECT * FROM market_events"
+        params: List[Any] = []
+        if event_type:
+            query += " WHERE event_type = ?"
+            params.append(event_type)
+        query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit)
+
+        conn = self._connect()
+        try:
+            cursor = conn.execute(query, params)
+            columns = [desc[0] for desc in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    def _build_filters(
+        self,
+        start_time: Optional[str] = None,
+        end_time: Optional[str] = None,
+        group_name: Optional[str] = None,
+        action: Optional[str] = None
+    ) -> Tuple[List[str], List[Any]]:
+        """构建查询条件"""
+        clauses: List[str] = []
+        params: List[Any] = []
 
         if start_time:
-            query += " AND message_time >= ?"
+            clauses.append("message_time >= ?")
             params.append(start_time)
 
         if end_time:
-            query += " AND message_time <= ?"
+            clauses.append("message_time <= ?")
             params.append(end_time)
 
         if group_name:
-            query += " AND group_name = ?"
+            clauses.append("group_name = ?")
             params.append(group_name)
 
         if action:
-            query += " AND action = ?"
+            clauses.append("action = ?")
             params.append(action)
 
-        query += f" ORDER BY capture_time DESC LIMIT {limit}"
+        return clauses, params
 
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
+    def _resolve_columns(self, columns: Optional[Sequence[str]]) -> List[str]:
+        """校验列投影，并保证包含分页键"""
+        if not columns:
+            return list(self.RECORD_COLUMNS)
 
-        # 获取列名
-        columns = [desc[0] for desc in cursor.description]
+        unknown = [col for col in columns if col not in self.RECORD_COLUMNS]
+        if unknown:
+            raise ValueError(f"未知的列: {', '.join(unknown)}")
 
-        conn.close()
+        resolved = list(columns)
+        for key in ("capture_time", "id"):
+            if key not in resolved:
+                resolved.append(key)
+        return resolved
 
-        return [dict(zip(columns, row)) for row in rows]
+    def iter_pages(
+        self,
+        start_time: Optional[str] = None,
+        end_time: Optional[str] = None,
+        group_name: Optional[str] = None,
+        action: Optional[str] = None,
+        columns: Optional[Sequence[str]] = None,
+        after: Optional[tuple] = None,
+        page_size: int = 500,
+        descending: bool = True,
+        order_by_id: bool = False
+    ) -> Iterator[Tuple[List[str], List[tuple]]]:
+        """
+        按页遍历记录（基于 (capture_time, id) 的键集分页）
+
+        参数同 iter_records，每次产出 (列名列表, 行元组列表)，
+        供列式加载等不需要逐行字典的场景使用。
+
+        Args:
+            order_by_id: 按写入顺序 (id) 分页，此时 after 为 (id,)；
+                晚写入但 capture_time 较早的记录（导入、重放）也排在后面，供增量导出使用
+        """
+        if page_size <= 0:
+            raise ValueError("page_size 必须大于 0")
+        keys = ("id",) if order_by_id else ("capture_time", "id")
+
+        selected = self._resolve_columns(columns)
+        conn = self._connect()
+        connections = [conn]
+        try:
+            # 主库 + 相关月度分区，各自按键集分页后归并
+            live = self.partitions.live_columns(conn)
+            sources = [self._iter_source_rows(
+                conn, False, selected, start_time, end_time, group_name,
+                action, after, page_size, descending, keys
+            )]
+            for month in self.partitions.months_since(start_time):
+                part_conn = self.partitions.open_partition(month, live)
+                connections.append(part_conn)
+                sources.append(self._iter_source_rows(
+                    part_conn, True, selected, start_time, end_time, group_name,
+                    action, after, page_size, descending, keys
+                ))
+
+            key_indexes = [selected.index(key) for key in keys]
+            rows = sources[0] if len(sources) == 1 else heapq.merge(
+                *sources,
+                key=lambda row: tuple(row[index] for index in key_indexes),
+                reverse=descending
+            )
+
+            page: List[tuple] = []
+            for row in rows:
+                page.append(row)
+                if len(page) >= page_size:
+                    yield selected, page
+                    page = []
+            if page:
+                yield selected, page
+        finally:
+            for source_conn in connections:
+                source_conn.close()
+
+    def _iter_source_rows(
+        self,
+        conn: sqlite3.Connection,
+        archived: bool,
+        selected: List[str],
+        start_time: Optional[str],
+        end_time: Optional[str],
+        group_name: Optional[str],
+        action: Optional[str],
+        after: Optional[tuple],
+        page_size: int,
+        descending: bool,
+        keys: Sequence[str] = ("capture_time", "id")
+    ) -> Iterator[tuple]:
+        """在单个库（主库或分区）上做键集分页，逐行产出"""
+        clauses, params = self._build_filters(start_time, end_time, group_name, action)
+
+        order = "DESC" if descending else "ASC"
+        compare = "<" if descending else ">"
+        # 只读打开的分区未同步表结构，缺失的列按 NULL 读取
+        available = self.partitions.table_columns(conn) if archived and self.read_only else None
+        select_sql = f"SELECT {self.partitions.select_list(selected, archived, available)} FROM market_data"
+        key_indexes = [selected.index(key) for key in keys]
+        key_sql = f"({', '.join(keys)}) {compare} ({', '.join('?' for _ in keys)})"
+        order_sql = ", ".join(f"{key} {order}" for key in keys)
+
+        cursor_key = after
+        while True:
+            page_clauses = list(clauses)
+            page_params = list(params)
+            if cursor_key is not None:
+                page_clauses.append(key_sql)
+                page_params.extend(cursor_key)
+
+            query = select_sql
+            if page_clauses:
+                query += " WHERE " + " AND ".join(page_clauses)
+            query += f" ORDER BY {order_sql} LIMIT ?"
+            page_params.append(page_size)
+
+            rows = conn.execute(query, page_params).fetchall()
+            yield from rows
+
+            if len(rows) < page_size:
+                break
+            cursor_key = tuple(rows[-1][index] for index in key_indexes)
+
+    def iter_records(
+        self,
+        start_time: Optional[str] = None,
+        end_time: Optional[str] = None,
+        group_name: Optional[str] = None,
+        action: Optional[str] = None,
+        columns: Optional[Sequence[str]] = None,
+        after: Optional[Tuple[str, int]] = None,
+        page_size: int = 500,
+        descending: bool = True
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        流式遍历记录（基于 (capture_time, id) 的键集分页）
+
+        每页只保留 page_size 行，可在常量内存下遍历整张表。
+
+        Args:
+            start_time: 开始时间
+            end_time: 结束时间
+            group_name: 群名称
+            action: 交易方向 (SELL/BUY)
+            columns: 需要返回的列，默认全部列；分页键总会被包含
+            after: 游标 (capture_time, id)，从该位置之后继续遍历
+            page_size: 每页行数
+            descending: 是否按 capture_time 倒序
+
+        Yields:
+            记录字典
+        """
+        pages = self.iter_pages(
+            start_time=start_time,
+            end_time=end_time,
+            group_name=group_name,
+            action=action,
+            columns=columns,
+            after=after,
+            page_size=page_size,
+            descending=descending
+        )
+        try:
+            for selected, rows in pages:
+                for row in rows:
+                    yield dict(zip(selected, row))
+        finally:
+            pages.close()
+
+    def query_records(
+        self,
+        start_time: Optional[str] = None,
+        end_time: Optional[str] = None,
+        group_name: Optional[str] = None,
+        action: Optional[str] = None,
+        limit: int = 1000,
+        columns: Optional[Sequence[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        查询记录
+
+        Args:
+            start_time: 开始时间
+            end_time: 结束时间
+            group_name: 群名称
+            action: 交易方向 (SELL/BUY)
+            limit: 返回数量限制
+            columns: 需要返回的列，默认全部列
+
+        Returns:
+            记录列表
+        """
+        records = self.iter_records(
+            start_time=start_time,
+            end_time=end_time,
+            group_name=group_name,
+            action=action,
+            columns=columns,
+            page_size=max(1, min(limit, 1000))
+        )
+        try:
+            return list(islice(records, max(0, limit)))
+        finally:
+            records.close()
 
     def get_price_trend(self, days: int = 7) -> List[Dict[str, Any]]:
         """
@@ -206,16 +913,20 @@ class DatabaseManager:
         Returns:
             按日期聚合的价格数据
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
 
-        cursor.execute('''
+        # 只挂载时间窗口内的分区
+        since = (datetime.now() - timedelta(days=days)).isoformat()
+        source = self.partitions.attach_union_view(conn, since)
+
+        cursor.execute(f'''
             SELECT
                 DATE(message_time) as date,
                 action,
-                AVG(price) as avg_price,
+                AVG(CASE WHEN COALESCE(price_flag, '') = '' THEN price END) as avg_price,
                 COUNT(*) as count
-            FROM market_data
+            FROM {source}
             WHERE message_time >= datetime('now', ?)
             GROUP BY DATE(message_time), action
             ORDER BY date DESC
@@ -228,41 +939,189 @@ class DatabaseManager:
 
         return [dict(zip(columns, row)) for row in rows]
 
-    def get_statistics(self) -> Dict[str, Any]:
-        """获取数据库统计信息"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    # 报价查询返回的列
+    OFFER_COLUMNS = (
+        "id", "capture_time", "message_time", "group_name", "sender_nickname",
+        "action", "item_category", "specs", "price", "quantity", "cluster_id",
+    )
+
+    def latest_offers(
+        self,
+        item: Optional[str] = None,
+        action: Optional[str] = None,
+        group_name: Optional[str] = None,
+        limit: int = 50
+    ) -> List[Dict[str, Any]]:
+        """
+        最新报价（主库，排除异常价格）
+
+        Args:
+            item: 商品名称（精确匹配）
+            action: 交易方向 (SELL/BUY)
+            group_name: 群名称
+            limit: 返回数量限制
+
+        Returns:
+            按 capture_time 倒序的报价列表
+        """
+        clauses = ["COALESCE(price_flag, '') = ''", "price > 0"]
+        params: List[Any] = []
+        for column, value in (("item_category", item), ("action", action), ("group_name", group_name)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        params.append(max(0, limit))
+
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                f"SELECT {', '.join(self.OFFER_COLUMNS)} FROM market_data WHERE {' AND '.join(clauses)} "
+                f"ORDER BY capture_time DESC, id DESC LIMIT ?",
+                params
+            )
+            return [dict(zip(self.OFFER_COLUMNS, row)) for row in cursor.fetchall()]
+        finally:
+            conn.close()
 
+    def search_records(self, keyword: str, days: Optional[int] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        按商品名称或规格搜索报价（包含时间窗口内的已归档分区）
+
+        Args:
+            keyword: 关键字，不区分大小写的子串匹配
+            days: 只搜索最近若干天，默认不限
+            limit: 返回数量限制
+
+        Returns:
+            按 capture_time 倒序的记录列表
+        """
+        since = (datetime.now() - timedelta(days=days)).isoformat() if days else None
+        pattern = "%" + keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        clauses = ["(item_category LIKE ? ESCAPE '\\' OR specs LIKE ? ESCAPE '\\')"]
+        params: List[Any] = [pattern, pattern]
+        if since:
+            clauses.append("capture_time >= ?")
+            params.append(since)
+        params.append(max(0, limit))
+
+        conn = self._connect()
+        try:
+            source = self.partitions.attach_union_view(conn, since)
+            cursor = conn.execute(
+                f"SELECT {', '.join(self.OFFER_COLUMNS)} FROM {source} WHERE {' AND '.join(clauses)} "
+                f"ORDER BY capture_time DESC, id DESC LIMIT ?",
+                params
+            )
+            return [dict(zip(self.OFFER_COLUMNS, row)) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    def _source_statistics(self, conn: sqlite3.Connection, archived: bool = False) -> Dict[str, Any]:
+        """
+        单个库（主库或分区）的统计信息
+
+        主库直接统计事实表：聚合查询经过 market_data 视图时每行都要连接三张维度表。
+        """
+        cursor = conn.cursor()
         stats = {}
+        table = "market_data" if archived else self.FACT_TABLE
+        if archived and self.read_only:
+            # 只读打开的分区未同步表结构，缺失的列按 NULL 读取
+            columns = ["group_name", "action", "price", "price_flag", "cluster_id"]
+            available = self.partitions.table_columns(conn)
+            table = f"(SELECT {self.partitions.select_list(columns, True, available)} FROM market_data)"
 
         # 总记录数
-        cursor.execute("SELECT COUNT(*) FROM market_data")
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
         stats['total_records'] = cursor.fetchone()[0]
 
         # 按群组统计
-        cursor.execute('''
-            SELECT group_name, COUNT(*) as count
-            FROM market_data
-            GROUP BY group_name
-        ''')
+        if archived:
+            cursor.execute('''
+                SELECT group_name, COUNT(*) as count
+                FROM market_data
+                GROUP BY group_name
+            ''')
+        else:
+            cursor.execute('''
+                SELECT dim_groups.name, COUNT(*) as count
+                FROM market_facts f LEFT JOIN dim_groups ON dim_groups.id = f.group_id
+                GROUP BY f.group_id
+            ''')
         stats['by_group'] = dict(cursor.fetchall())
 
         # 按交易类型统计
-        cursor.execute('''
+        cursor.execute(f'''
             SELECT action, COUNT(*) as count
-            FROM market_data
+            FROM {table}
             GROUP BY action
         ''')
         stats['by_action'] = dict(cursor.fetchall())
 
-        # 平均价格
-        cursor.execute("SELECT AVG(price) FROM market_data WHERE price > 0")
-        stats['avg_price'] = cursor.fetchone()[0]
+        # 价格合计，用于跨分区求平均（排除被标记的异常价格）
+        cursor.execute(f'''
+            SELECT SUM(price), COUNT(price)
+            FROM {table}
+            WHERE price > 0 AND COALESCE(price_flag, '') = ''
+        ''')
+        stats['price_sum'], stats['price_count'] = cursor.fetchone()
 
-        conn.close()
+        # 去重后的报价数（未聚类的记录各算一条）
+        cursor.execute(f'''
+            SELECT COUNT(DISTINCT NULLIF(cluster_id, '')) + COALESCE(SUM(COALESCE(cluster_id, '') = ''), 0)
+            FROM {table}
+        ''')
+        stats['distinct_offers'] = cursor.fetchone()[0]
+
+        # 异常价格记录数
+        cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE COALESCE(price_flag, '') != ''")
+        stats['flagged_records'] = cursor.fetchone()[0]
+
+        return stats
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """获取数据库统计信息（包含已归档分区）"""
+        conn = self._connect()
+        try:
+            live = self.partitions.live_columns(conn)
+            parts = [self._source_statistics(conn)]
+        finally:
+            conn.close()
+
+        for month in self.partitions.months():
+            part_conn = self.partitions.open_partition(month, live)
+            try:
+                parts.append(self._source_statistics(part_conn, archived=True))
+            finally:
+                part_conn.close()
+
+        stats: Dict[str, Any] = {
+            'total_records': 0, 'by_group': {}, 'by_action': {},
+            'flagged_records': 0, 'distinct_offers': 0
+        }
+        price_sum, price_count = 0.0, 0
+        for part in parts:
+            stats['total_records'] += part['total_records']
+            stats['flagged_records'] += part['flagged_records']
+            # 同一聚类极少跨月，分区间直接相加
+            stats['distinct_offers'] += part['distinct_offers']
+            for key in ('by_group', 'by_action'):
+                for name, count in part[key].items():
+                    stats[key][name] = stats[key].get(name, 0) + count
+            price_sum += part['price_sum'] or 0.0
+            price_count += part['price_count']
+
+        # 平均价格
+        stats['avg_price'] = price_sum / price_count if price_count else None
 
         return stats
 
+    def archive(self, hot_months: int = 2) -> Dict[str, int]:
+        """将热窗口之外的数据归档到月度分区"""
+        moved = self.partitions.rotate(hot_months=hot_months)
+        self.bump_generation()
+        return moved
+
 
 if __name__ == "__main__":
     # 测试数据库
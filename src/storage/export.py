@@ -0,0 +1,271 @@
+"""
+列式数据导出
+将 market_data 按天/群组分区导出为 Parquet，并提供 Arrow/NumPy 列式加载
+"""
+
+import json
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Sequence
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.config import Config
+from src.storage.database import DatabaseManager
+
+
+# 各列的 Arrow 类型
+ARROW_SCHEMA = {
+    "id": pa.int64(),
+    "capture_time": pa.string(),
+    "message_time": pa.string(),
+    "group_name": pa.string(),
+    "sender_nickname": pa.string(),
+    "raw_text": pa.string(),
+    "action": pa.string(),
+    "item_category": pa.string(),
+    "specs": pa.string(),
+    "price": pa.float64(),
+    "quantity": pa.int64(),
+    "created_at": pa.string(),
+    "price_flag": pa.string(),
+    "cluster_id": pa.string(),
+}
+
+# 数值列对应的 NumPy 类型，其余列为 object
+NUMPY_DTYPES = {
+    "id": np.int64,
+    "price": np.float64,
+    "quantity": np.int64,
+}
+
+
+def _collect_columns(
+    db: DatabaseManager,
+    columns: Optional[Sequence[str]] = None,
+    limit: Optional[int] = None,
+    **filters: Any
+) -> Dict[str, List[Any]]:
+    """按页读取记录并直接转置为列，不构造逐行字典"""
+    data: Dict[str, List[Any]] = {}
+    remaining = limit
+    page_size = min(limit, 5000) if limit else 5000
+
+    for selected, rows in db.iter_pages(columns=columns, page_size=page_size, **filters):
+        if remaining is not None:
+            rows = rows[:remaining]
+            remaining -= len(rows)
+
+        if not data:
+            data = {col: [] for col in selected}
+        for col, values in zip(selected, zip(*rows)):
+            data[col].extend(values)
+
+        if remaining is not None and remaining <= 0:
+            break
+
+    if not data:
+        data = {col: [] for col in (columns or DatabaseManager.RECORD_COLUMNS)}
+
+    # 只保留调用方请求的列
+    if columns:
+        data = {col: data[col] for col in columns}
+    return data
+
+
+def _to_numpy(column: str, values: List[Any]) -> np.ndarray:
+    """将列值转换为 NumPy 数组"""
+    dtype = NUMPY_DTYPES.get(column)
+    if dtype is None:
+        return np.array(values, dtype=object)
+
+    try:
+        return np.array(values, dtype=dtype)
+    except (TypeError, ValueError):
+        # 整数列含 NULL 时退化为 float64 (NaN)
+        return np.array(values, dtype=np.float64)
+
+
+def load_columns(
+    db: DatabaseManager,
+    columns: Optional[Sequence[str]] = None,
+    limit: Optional[int] = None,
+    **filters: Any
+) -> Dict[str, np.ndarray]:
+    """
+    以 NumPy 列的形式加载 market_data
+
+    Args:
+        db: 数据库管理器
+        columns: 需要的列，默认全部列
+        limit: 最多读取的行数（按 capture_time 倒序）
+        **filters: 透传给 DatabaseManager.iter_pages 的过滤条件
+
+    Returns:
+        列名 -> NumPy 数组
+    """
+    data = _collect_columns(db, columns, limit, **filters)
+    return {col: _to_numpy(col, values) for col, values in data.items()}
+
+
+def load_arrow_table(
+    db: DatabaseManager,
+    columns: Optional[Sequence[str]] = None,
+    limit: Optional[int] = None,
+    **filters: Any
+) -> pa.Table:
+    """
+    以 Arrow Table 的形式加载 market_data
+
+    参数同 load_columns。
+    """
+    data = _collect_columns(db, columns, limit, **filters)
+    return pa.table({
+        col: pa.array(values, type=ARROW_SCHEMA[col])
+        for col, values in data.items()
+    })
+
+
+class ParquetExporter:
+    """Parquet 分区导出器"""
+
+    def __init__(self, config: Config, db: Optional[DatabaseManager] = None):
+        self.config = config
+        export_config = config.export
+        self.output_dir = export_config.output_dir
+        self.watermark_path = export_config.watermark_path
+        self.batch_size = export_config.batch_size
+        self.include_raw_text = export_config.include_raw_text
+
+        self.db = db or DatabaseManager.from_config(config)
+        self.watermarks: Dict[str, Dict[str, Any]] = {}
+        self._load_watermarks()
+
+    def _load_watermarks(self) -> None:
+        """加载导出水位"""
+        path = Path(self.watermark_path)
+        if path.exists():
+            with open(path, 'r', encoding='utf-8') as f:
+                self.watermarks = json.load(f)
+
+    def _save_watermarks(self) -> None:
+        """保存导出水位"""
+        Path(self.watermark_path).parent.mkdir(parents=True, exist_ok=True)
+        with open(self.watermark_path, 'w', encoding='utf-8') as f:
+            json.dump(self.watermarks, f, ensure_ascii=False, indent=2)
+
+    @staticmethod
+    def _slice_key(
+        start_time: Optional[str],
+        end_time: Optional[str],
+        group_name: Optional[str]
+    ) -> str:
+        """导出切片的水位键"""
+        return f"{group_name or '*'}|{start_time or ''}|{end_time or ''}"
+
+    def _export_columns(self) -> List[str]:
+        """导出的列"""
+        columns = [col for col in DatabaseManager.RECORD_COLUMNS if col != 'created_at']
+        if not self.include_raw_text:
+            columns.remove('raw_text')
+        return columns
+
+    def _write_chunk(self, data: Dict[str, List[Any]], run_id: str, chunk_index: int) -> None:
+        """将一个批次写入分区目录"""
+        table = pa.table({
+            col: pa.array(values, type=ARROW_SCHEMA[col])
+            for col, values in data.items()
+        })
+        dates = [value[:10] if value else "unknown" for value in data['capture_time']]
+        groups = [value or "unknown" for value in data['group_name']]
+        table = table.append_column('date', pa.array(dates, type=pa.string()))
+        table = table.append_column('group', pa.array(groups, type=pa.string()))
+
+        pq.write_to_dataset(
+            table,
+            root_path=self.output_dir,
+            partition_cols=['date', 'group'],
+            basename_template=f"part-{run_id}-{chunk_index}-{{i}}.parquet",
+            existing_data_behavior='overwrite_or_ignore',
+        )
+
+    def export(
+        self,
+        start_time: Optional[str] = None,
+        end_time: Optional[str] = None,
+        group_name: Optional[str] = None,
+        incremental: bool = True
+    ) -> Dict[str, Any]:
+        """
+        导出整表或时间/群组切片
+
+        Args:
+            start_time: 开始时间 (message_time)
+            end_time: 结束时间 (message_time)
+            group_name: 群名称
+            incremental: 是否从上次水位继续导出
+
+        Returns:
+            导出统计
+        """
+        key = self._slice_key(start_time, end_time, group_name)
+        watermark = self.watermarks.get(key) if incremental else None
+        # 水位按写入顺序 (id) 推进：导入、重放等晚写入但 capture_time 较早的记录不会落在水位之下
+        after = (watermark['id'],) if watermark else None
+
+        columns = self._export_columns()
+        run_id = uuid.uuid4().hex[:8]
+        pages = self.db.iter_pages(
+            start_time=start_time,
+            end_time=end_time,
+            group_name=group_name,
+            columns=columns,
+            after=after,
+            page_size=min(self.batch_size, 5000),
+            descending=False,
+            order_by_id=True
+        )
+
+        total = 0
+        chunks = 0
+        buffer: Dict[str, List[Any]] = {col: [] for col in columns}
+
+        def flush() -> None:
+            nonlocal buffer, chunks
+            if not buffer['id']:
+                return
+            self._write_chunk(buffer, run_id, chunks)
+            chunks += 1
+
+            # 每个批次落盘后推进水位，中断后可从此处继续
+            self.watermarks[key] = {
+                "id": buffer['id'][-1],
+                "updated_at": datetime.now().isoformat()
+            }
+            self._save_watermarks()
+            buffer = {col: [] for col in columns}
+
+        for selected, rows in pages:
+            for col, values in zip(selected, zip(*rows)):
+                buffer[col].extend(values)
+            total += len(rows)
+
+            if len(buffer['id']) >= self.batch_size:
+                flush()
+
+        flush()
+
+        print(f"Parquet 导出完成: {total} 条记录, {chunks} 个批次 -> {self.output_dir}")
+        return {"rows": total, "chunks": chunks, "output_dir": self.output_dir}
+
+
+if __name__ == "__main__":
+    # 导出全部增量数据
+    from src.config import load_config
+
+    config = load_config("./config.yaml")
+    exporter = ParquetExporter(config)
+    exporter.export()
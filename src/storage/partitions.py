@@ -0,0 +1,305 @@
+"""
+按月分区存储
+将冷数据从主库迁移到按月分区的 SQLite 文件，并压缩归档 raw_text
+"""
+
+import sqlite3
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import List, Dict, Optional, Set, Tuple
+
+try:
+    import zstandard
+except ImportError:  # zstd 为可选依赖，缺省使用 zlib
+    zstandard = None
+
+
+# 压缩块首字节标识编码方式
+_CODEC_ZLIB = b"z"
+_CODEC_ZSTD = b"s"
+
+
+def pack_text(text: Optional[str], codec: str = "zlib") -> Optional[bytes]:
+    """压缩文本，返回带编码标识的二进制块"""
+    if text is None:
+        return None
+
+    data = text.encode("utf-8")
+    if codec == "zstd" and zstandard is not None:
+        return _CODEC_ZSTD + zstandard.ZstdCompressor(level=9).compress(data)
+    return _CODEC_ZLIB + zlib.compress(data, 9)
+
+
+def unpack_text(blob: Optional[bytes]) -> Optional[str]:
+    """解压 pack_text 生成的二进制块"""
+    if blob is None:
+        return None
+
+    codec, payload = blob[:1], blob[1:]
+    if codec == _CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("归档使用了 zstd 压缩，请安装 zstandard")
+        return zstandard.ZstdDecompressor().decompress(payload).decode("utf-8")
+    return zlib.decompress(payload).decode("utf-8")
+
+
+def register_functions(conn: sqlite3.Connection) -> None:
+    """在连接上注册解压函数，供分区查询使用"""
+    conn.create_function("wm_unpack", 1, unpack_text, deterministic=True)
+
+
+def month_of(timestamp: Optional[str]) -> Optional[str]:
+    """从时间字符串中取出月份 (YYYY-MM)"""
+    if not timestamp or len(timestamp) < 7 or timestamp[4] != "-":
+        return None
+    return timestamp[:7]
+
+
+def _next_month(month: str) -> str:
+    """下一个月份 (YYYY-MM)"""
+    year, mon = int(month[:4]), int(month[5:7])
+    year, mon = (year + 1, 1) if mon == 12 else (year, mon + 1)
+    return f"{year:04d}-{mon:02d}"
+
+
+def _shift_month(month: str, delta: int) -> str:
+    """向前/向后偏移若干个月"""
+    year, mon = int(month[:4]), int(month[5:7])
+    index = year * 12 + (mon - 1) + delta
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+class PartitionManager:
+    """按月分区管理器"""
+
+    # 单条查询最多同时 ATTACH 的分区数（SQLite 默认上限 10，预留主库之外的余量）
+    MAX_ATTACHED = 9
+
+    def __init__(
+        self,
+        db_path: str,
+        partition_dir: Optional[str] = None,
+        codec: str = "zlib",
+        table: str = "market_data",
+        read_only: bool = False
+    ):
+        """
+        Args:
+            table: 主库中实际存放记录的表；market_data 为视图时，归档后从该表删除
+            read_only: 以只读方式打开/挂载分区，不同步表结构（由写入端负责），缺失的列按 NULL 读取
+        """
+        self.db_path = db_path
+        self.partition_dir = partition_dir or str(Path(db_path).parent / "partitions")
+        self.codec = codec
+        self.table = table
+        self.read_only = read_only
+
+    def partition_path(self, month: str) -> str:
+        """分区文件路径"""
+        return str(Path(self.partition_dir) / f"market_data_{month.replace('-', '')}.db")
+
+    def partition_uri(self, month: str) -> str:
+        """分区文件的只读 URI"""
+        return Path(self.partition_path(month)).resolve().as_uri() + "?mode=ro"
+
+    def months(self) -> List[str]:
+        """已存在的分区月份（升序）"""
+        path = Path(self.partition_dir)
+        if not path.exists():
+            return []
+
+        months = []
+        for file in path.glob("market_data_*.db"):
+            stamp = file.stem.rsplit("_", 1)[-1]
+            if len(stamp) == 6 and stamp.isdigit():
+                months.append(f"{stamp[:4]}-{stamp[4:]}")
+        return sorted(months)
+
+    def months_since(self, start_time: Optional[str] = None) -> List[str]:
+        """
+        查询需要触及的分区月份
+
+        分区按 capture_time 划分，而 capture_time 不早于 message_time，
+        所以早于 start_time 所在月份的分区可以直接跳过。
+        """
+        start_month = month_of(start_time)
+        return [m for m in self.months() if start_month is None or m >= start_month]
+
+    @staticmethod
+    def live_columns(conn: sqlite3.Connection) -> List[Tuple[str, str]]:
+        """主库 market_data 的列定义 [(列名, 类型)]"""
+        rows = conn.execute("PRAGMA main.table_info(market_data)").fetchall()
+        return [(row[1], row[2]) for row in rows]
+
+    @staticmethod
+    def table_columns(conn: sqlite3.Connection, alias: str = "main") -> Set[str]:
+        """某个库中 market_data 的列名"""
+        return {row[1] for row in conn.execute(f"PRAGMA {alias}.table_info(market_data)").fetchall()}
+
+    def sync_schema(
+        self,
+        conn: sqlite3.Connection,
+        alias: str,
+        live: List[Tuple[str, str]]
+    ) -> None:
+        """确保分区的表结构与主库一致（缺失的列自动补齐）"""
+        existing = self.table_columns(conn, alias)
+
+        if not existing:
+            column_defs = ", ".join(
+                f"{name} {col_type}" + (" PRIMARY KEY" if name == "id" else "")
+                for name, col_type in live
+            )
+            conn.execute(f"CREATE TABLE {alias}.market_data ({column_defs}, raw_blob BLOB)")
+            conn.execute(f'''
+                CREATE INDEX IF NOT EXISTS {alias}.idx_market_data_capture
+                ON market_data(capture_time, id)
+            ''')
+            conn.execute(f'''
+                CREATE INDEX IF NOT EXISTS {alias}.idx_market_data_group
+                ON market_data(group_name)
+            ''')
+            return
+
+        for name, col_type in live:
+            if name not in existing:
+                conn.execute(f"ALTER TABLE {alias}.market_data ADD COLUMN {name} {col_type}")
+
+    def open_partition(self, month: str, live: List[Tuple[str, str]]) -> sqlite3.Connection:
+        """直接打开某个分区文件（不占用主库的 ATTACH 名额）"""
+        if self.read_only:
+            conn = sqlite3.connect(self.partition_uri(month), uri=True)
+            register_functions(conn)
+            return conn
+
+        conn = sqlite3.connect(self.partition_path(month))
+        register_functions(conn)
+        self.sync_schema(conn, "main", live)
+        conn.commit()
+        return conn
+
+    def select_list(self, columns: List[str], archived: bool, available: Optional[Set[str]] = None) -> str:
+        """
+        生成 SELECT 列表，分区中的 raw_text 从压缩块还原
+
+        Args:
+            available: 分区中实际存在的列；给出时缺失的列按 NULL 读取（只读挂载的分区未同步表结构）
+        """
+        if not archived:
+            return ", ".join(columns)
+
+        selects = []
+        for col in columns:
+            if col == "raw_text":
+                selects.append("wm_unpack(raw_blob) AS raw_text")
+            elif available is not None and col not in available:
+                selects.append(f"NULL AS {col}")
+            else:
+                selects.append(col)
+        return ", ".join(selects)
+
+    def attach_union_view(
+        self,
+        conn: sqlite3.Connection,
+        start_time: Optional[str] = None
+    ) -> str:
+        """
+        挂载相关分区并创建联合视图 market_data_all
+
+        只读模式下分区以 mode=ro 挂载（conn 须以 uri=True 打开），不修改分区文件。
+
+        Args:
+            conn: 主库连接
+            start_time: 查询起始时间，用于裁剪分区
+
+        Returns:
+            可查询的表/视图名称
+        """
+        months = self.months_since(start_time)
+        if not months:
+            return "market_data"
+        if len(months) > self.MAX_ATTACHED:
+            raise ValueError(f"查询跨越 {len(months)} 个分区，超过上限 {self.MAX_ATTACHED}")
+
+        register_functions(conn)
+        live = self.live_columns(conn)
+        columns = [name for name, _ in live]
+        selects = [f"SELECT {', '.join(columns)} FROM main.market_data"]
+
+        for month in months:
+            alias = f"p_{month.replace('-', '')}"
+            if self.read_only:
+                conn.execute("ATTACH DATABASE ? AS " + alias, (self.partition_uri(month),))
+                available = self.table_columns(conn, alias)
+            else:
+                conn.execute("ATTACH DATABASE ? AS " + alias, (self.partition_path(month),))
+                self.sync_schema(conn, alias, live)
+                available = None
+            selects.append(f"SELECT {self.select_list(columns, True, available)} FROM {alias}.market_data")
+
+        conn.execute("DROP VIEW IF EXISTS temp.market_data_all")
+        conn.execute(f"CREATE TEMP VIEW market_data_all AS {' UNION ALL '.join(selects)}")
+        return "market_data_all"
+
+    def rotate(self, hot_months: int = 2, now: Optional[datetime] = None, vacuum: bool = True) -> Dict[str, int]:
+        """
+        归档任务：把热窗口之外的月份迁移到分区文件并压缩 raw_text
+
+        Args:
+            hot_months: 主库保留的月份数（含当月）
+            now: 当前时间，默认 datetime.now()
+            vacuum: 迁移后是否 VACUUM 主库以回收空间
+
+        Returns:
+            月份 -> 迁移行数
+        """
+        now = now or datetime.now()
+        cutoff = _shift_month(now.strftime("%Y-%m"), -(max(1, hot_months) - 1))
+
+        Path(self.partition_dir).mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        conn.create_function("wm_pack", 1, lambda text: pack_text(text, self.codec))
+        moved: Dict[str, int] = {}
+
+        try:
+            months = [
+                row[0] for row in conn.execute(
+                    "SELECT DISTINCT substr(capture_time, 1, 7) FROM market_data WHERE capture_time < ?",
+                    (cutoff,)
+                ).fetchall()
+                if month_of(row[0])
+            ]
+
+            live = self.live_columns(conn)
+            columns = [name for name, _ in live]
+            data_columns = [col for col in columns if col != "raw_text"]
+
+            for month in sorted(months):
+                conn.execute("ATTACH DATABASE ? AS part", (self.partition_path(month),))
+                try:
+                    self.sync_schema(conn, "part", live)
+                    bounds = (month, _next_month(month))
+                    cursor = conn.execute(f'''
+                        INSERT OR REPLACE INTO part.market_data ({", ".join(data_columns)}, raw_blob)
+                        SELECT {", ".join(data_columns)}, wm_pack(raw_text)
+                        FROM main.market_data
+                        WHERE capture_time >= ? AND capture_time < ?
+                    ''', bounds)
+                    moved[month] = cursor.rowcount
+                    conn.execute(
+                        f"DELETE FROM main.{self.table} WHERE capture_time >= ? AND capture_time < ?",
+                        bounds
+                    )
+                    conn.commit()
+                finally:
+                    conn.execute("DETACH DATABASE part")
+
+            if moved and vacuum:
+                conn.execute("VACUUM")
+        finally:
+            conn.close()
+
+        if moved:
+            print(f"已归档 {sum(moved.values())} 条记录到 {len(moved)} 个月度分区")
+        return moved
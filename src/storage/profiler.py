@@ -0,0 +1,483 @@
+"""
+查询剖析
+为 DatabaseManager 的连接计时（含取结果的时间），记录最慢的语句及其 EXPLAIN QUERY PLAN，
+标记全表扫描与临时 B 树，并给出复合索引建议
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+# 语句归一化：折叠空白与占位符列表，IN (?, ?, ?) 与 IN (?, ?) 视为同一语句
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?){2,}\s*\)")
+# 需要查看执行计划的语句
+_EXPLAINABLE = re.compile(r"^\s*(?:SELECT|WITH|UPDATE|DELETE)\b", re.I)
+
+# 执行计划中的问题
+_FULL_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$")
+_TEMP_BTREE = re.compile(r"^USE TEMP B-TREE FOR (.+)$")
+_AUTOMATIC_INDEX = re.compile(r"AUTOMATIC (?:PARTIAL )?(?:COVERING )?INDEX")
+
+
+def normalize_sql(sql: str) -> str:
+    """归一化 SQL 文本，作为语句的统计键"""
+    return _PLACEHOLDER_LIST.sub("(?, ...)", _WHITESPACE.sub(" ", sql).strip())
+
+
+def _short_params(parameters: Any) -> List[str]:
+    """参数摘要（长文本截断），只用于报告"""
+    if isinstance(parameters, Mapping):
+        parameters = list(parameters.values())
+    return [value if len(value := repr(item)) <= 60 else value[:57] + "..." for item in parameters or ()]
+
+
+def format_plan(rows: Iterable[Sequence[Any]]) -> List[str]:
+    """EXPLAIN QUERY PLAN 的行 (id, parent, notused, detail) -> 按层级缩进的文本"""
+    depth: Dict[int, int] = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node_id] + detail)
+    return lines
+
+
+def analyze_plan(plan: Sequence[str]) -> Dict[str, List[str]]:
+    """
+    从执行计划中找出问题
+
+    Returns:
+        {"full_scans": 全表扫描的表, "temp_btrees": 临时 B 树的用途, "automatic_indexes": 临时自动索引}
+    """
+    issues: Dict[str, List[str]] = {"full_scans": [], "temp_btrees": [], "automatic_indexes": []}
+    for line in plan:
+        detail = line.strip()
+        match = _FULL_SCAN.match(detail)
+        if match:
+            issues["full_scans"].append(match.group(1))
+            continue
+        match = _TEMP_BTREE.match(detail)
+        if match:
+            issues["temp_btrees"].append(match.group(1))
+        if _AUTOMATIC_INDEX.search(detail):
+            issues["automatic_indexes"].append(detail)
+    return issues
+
+
+class _ProfiledCursor(sqlite3.Cursor):
+    """计时游标：一次执行的耗时 = execute + 之后取结果的时间，结果取完、游标关闭或再次执行时入账"""
+
+    _pending: Optional[List[Any]] = None
+
+    def _begin(self, sql: str, parameters: Any, elapsed: float, explain: bool) -> None:
+        self._pending = [sql, parameters, elapsed]
+        if explain:
+            self.connection._profiler.explain(self.connection, sql, parameters)
+
+    def _add(self, elapsed: float) -> None:
+        if self._pending is not None:
+            self._pending[2] += elapsed
+
+    def _finish(self) -> None:
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            self.connection._profiler.record(*pending)
+
+    def execute(self, sql: str, parameters: Any = ()) -> sqlite3.Cursor:
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._begin(sql, parameters, time.perf_counter() - start, explain=True)
+
+    def executemany(self, sql: str, seq_of_parameters: Iterable[Any]) -> sqlite3.Cursor:
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._begin(sql, (), time.perf_counter() - start, explain=False)
+            self._finish()
+
+    def fetchone(self) -> Any:
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._add(time.perf_counter() - start)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size: int = None) -> List[Any]:
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._add(time.perf_counter() - start)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self) -> List[Any]:
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._add(time.perf_counter() - start)
+        self._finish()
+        return rows
+
+    def __next__(self) -> Any:
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._add(time.perf_counter() - start)
+            self._finish()
+            raise
+        self._add(time.perf_counter() - start)
+        return row
+
+    def close(self) -> None:
+        self._finish()
+        super().close()
+
+    def __del__(self) -> None:
+        self._finish()
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """所有语句（包括 Connection.execute 快捷方式）都经过计时游标"""
+
+    _profiler: "QueryProfiler"
+
+    def cursor(self, factory: type = _ProfiledCursor) -> sqlite3.Cursor:
+        return super().cursor(factory)
+
+    def execute(self, sql: str, parameters: Any = ()) -> sqlite3.Cursor:
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters: Iterable[Any]) -> sqlite3.Cursor:
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class QueryProfiler:
+    """
+    查询剖析器（线程安全）
+
+    按归一化的语句累计调用次数与耗时，保留超过阈值的最慢若干次执行；
+    每条语句首次执行时在同一连接上取一次执行计划（临时视图、挂载的分区都可见）。
+    """
+
+    def __init__(self, slow_ms: float = 100.0, keep: int = 20, log_path: Optional[str] = None):
+        """
+        Args:
+            slow_ms: 慢查询阈值（毫秒）
+            keep: 保留的最慢执行数
+            log_path: 剖析结果文件，save() 时与已有内容合并
+        """
+        self.slow_seconds = slow_ms / 1000
+        self.keep = keep
+        self.log_path = log_path
+        self.statements: Dict[str, Dict[str, float]] = {}
+        self.plans: Dict[str, List[str]] = {}
+        self.slowest: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def connect(self, database: str, **kwargs: Any) -> ProfiledConnection:
+        """打开一个计时连接，参数同 sqlite3.connect"""
+        conn = sqlite3.connect(database, factory=ProfiledConnection, **kwargs)
+        conn._profiler = self
+        return conn
+
+    def explain(self, conn: sqlite3.Connection, sql: str, parameters: Any) -> None:
+        """首次见到该语句时记录执行计划"""
+        key = normalize_sql(sql)
+        if key in self.plans or not _EXPLAINABLE.match(sql):
+            return
+        try:
+            rows = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, parameters).fetchall()
+        except sqlite3.Error:
+            return
+        with self._lock:
+            self.plans[key] = format_plan(rows)
+
+    def record(self, sql: str, parameters: Any, seconds: float) -> None:
+        """记录一次执行"""
+        key = normalize_sql(sql)
+        with self._lock:
+            stats = self.statements.get(key)
+            if stats is None:
+                stats = self.statements[key] = {"calls": 0, "total": 0.0, "max": 0.0}
+            stats["calls"] += 1
+            stats["total"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+
+            if seconds < self.slow_seconds:
+                return
+            if len(self.slowest) >= self.keep and seconds <= self.slowest[-1]["seconds"]:
+                return
+            self.slowest.append({
+                "seconds": seconds,
+                "sql": key,
+                "params": _short_params(parameters),
+                "at": datetime.now().isoformat(timespec="seconds"),
+            })
+            self.slowest.sort(key=lambda entry: entry["seconds"], reverse=True)
+            del self.slowest[self.keep:]
+
+    def reset(self) -> None:
+        with self._lock:
+            self.statements.clear()
+            self.plans.clear()
+            self.slowest.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """可序列化的剖析结果"""
+        with self._lock:
+            return {
+                "statements": {key: dict(stats) for key, stats in self.statements.items()},
+                "plans": dict(self.plans),
+                "slowest": list(self.slowest),
+            }
+
+    def merge(self, other: Mapping[str, Any]) -> None:
+        """并入另一份剖析结果（snapshot 或 load 的返回值）"""
+        with self._lock:
+            for key, stats in other.get("statements", {}).items():
+                mine = self.statements.setdefault(key, {"calls": 0, "total": 0.0, "max": 0.0})
+                mine["calls"] += stats["calls"]
+                mine["total"] += stats["total"]
+                mine["max"] = max(mine["max"], stats["max"])
+            for key, plan in other.get("plans", {}).items():
+                self.plans.setdefault(key, plan)
+            self.slowest = sorted(
+                self.slowest + list(other.get("slowest", [])), key=lambda entry: entry["seconds"], reverse=True
+            )[:self.keep]
+
+    @staticmethod
+    def load(path: str) -> Dict[str, Any]:
+        """读取剖析结果文件，不存在时返回空结果"""
+        if not Path(path).exists():
+            return {"statements": {}, "plans": {}, "slowest": []}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self, path: Optional[str] = None) -> Optional[str]:
+        """
+        把本进程的剖析结果并入结果文件（多个进程可先后写入同一文件）
+
+        Returns:
+            文件路径；没有记录或未配置路径时为 None
+        """
+        path = path or self.log_path
+        if not path or not self.statements:
+            return None
+
+        combined = QueryProfiler(keep=self.keep)
+        combined.merge(self.load(path))
+        combined.merge(self.snapshot())
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        temp = path + ".tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(combined.snapshot(), f, ensure_ascii=False, indent=1)
+        os.replace(temp, path)
+        return path
+
+
+# ---- 索引建议 ----
+
+_TABLE = re.compile(r"\b(?:FROM|UPDATE|DELETE FROM)\s+(?:\w+\.)?(\w+)", re.I)
+_CLAUSE_END = r"(?=\bGROUP BY\b|\bORDER BY\b|\bLIMIT\b|\bHAVING\b|$)"
+_WHERE = re.compile(r"\bWHERE\b(.*?)" + _CLAUSE_END, re.I | re.S)
+_ORDER_BY = re.compile(r"\bORDER BY\b(.*?)(?=\bLIMIT\b|$)", re.I | re.S)
+_GROUP_BY = re.compile(r"\bGROUP BY\b(.*?)(?=\bHAVING\b|\bORDER BY\b|\bLIMIT\b|$)", re.I | re.S)
+_EQUALITY = re.compile(r"(?<![\w(])(?:\w+\.)?(\w+)\s*(?:=|\bIS\b(?!\s+NOT)|\bIN\b)\s*[?(']", re.I)
+_RANGE = re.compile(r"(?<![\w(])(?:\w+\.)?(\w+)\s*(?:>=|<=|>|<|\bBETWEEN\b)", re.I)
+_ROW_VALUE = re.compile(r"\(\s*(?:\w+\.)?(\w+)\s*,[^)]*\)\s*[<>]=?\s*\(", re.I)
+_WRAPPED = re.compile(r"\b(\w+)\(\s*(?:\w+\.)?(\w+)\b", re.I)
+_LEADING_WILDCARD = re.compile(r"(?:\w+\.)?(\w+)\s+LIKE\s+'%", re.I)
+_SQL_FUNCTIONS_IGNORED = {"COUNT", "SUM", "AVG", "MIN", "MAX", "EXISTS", "IN", "VALUES", "WM_UNPACK"}
+
+
+def _sort_columns(clause: str) -> List[str]:
+    columns = []
+    for part in clause.split(","):
+        match = re.fullmatch(r"\s*(?:\w+\.)?(\w+)(?:\s+(?:ASC|DESC))?\s*", part, re.I)
+        if match is None:
+            return []  # 按表达式排序，列索引无法消除排序
+        columns.append(match.group(1))
+    return columns
+
+
+def suggest_index(
+    sql: str,
+    plan: Sequence[str],
+    table_columns: Mapping[str, Sequence[str]],
+    existing: Mapping[str, Sequence[Sequence[str]]],
+    aliases: Optional[Mapping[str, Tuple[str, Mapping[str, str]]]] = None
+) -> Tuple[Optional[str], List[str]]:
+    """
+    为一条有问题的语句建议复合索引
+
+    列顺序遵循 等值条件 -> 排序/分组 -> 范围条件；已有索引以建议列为前缀时不再建议。
+
+    Args:
+        sql: 语句
+        plan: 执行计划
+        table_columns: 表名 -> 列名
+        existing: 表名 -> 已有索引的列序列
+        aliases: 视图名 -> (实际表, {视图列: 表列})，如 market_data -> market_facts
+
+    Returns:
+        (CREATE INDEX 语句或 None, 提示)
+    """
+    issues = analyze_plan(plan)
+    notes = []
+    if not any(issues.values()):
+        return None, notes
+
+    match = _TABLE.search(sql)
+    if match is None:
+        return None, notes
+    table = match.group(1)
+    mapping: Mapping[str, str] = {}
+    if aliases and table in aliases:
+        table, mapping = aliases[table]
+    columns = set(table_columns.get(table, ()))
+    if not columns:
+        return None, notes
+
+    def known(names: Iterable[str]) -> List[str]:
+        resolved = []
+        for name in names:
+            name = mapping.get(name, name)
+            if name in columns and name not in resolved:
+                resolved.append(name)
+        return resolved
+
+    where = _WHERE.search(sql)
+    where_text = where.group(1) if where else ""
+    group_by = _GROUP_BY.search(sql)
+    order_by = _ORDER_BY.search(sql)
+    # 只看条件、分组与排序中的函数；SELECT 列表里的函数不影响索引
+    clauses = " ".join(match.group(1) for match in (where, group_by, order_by) if match)
+    for function, column in _WRAPPED.findall(clauses):
+        if function.upper() not in _SQL_FUNCTIONS_IGNORED and mapping.get(column, column) in columns:
+            notes.append(f"{function}({column}) 使 {column} 上的索引无法用于该条件/排序")
+    for column in _LEADING_WILDCARD.findall(where_text):
+        notes.append(f"{column} LIKE '%...' 以通配符开头，只能扫描")
+
+    unwrapped = _WRAPPED.sub("", where_text)
+    equality = known(_EQUALITY.findall(unwrapped))
+    ranges = known(_ROW_VALUE.findall(unwrapped) + _RANGE.findall(_ROW_VALUE.sub("", unwrapped)))
+
+    sort: List[str] = []
+    purposes = " ".join(issues["temp_btrees"])
+    if "GROUP BY" in purposes and group_by:
+        sort = known(_sort_columns(group_by.group(1)))
+    elif "ORDER BY" in purposes and order_by:
+        sort = known(_sort_columns(order_by.group(1)))
+
+    suggested = equality + [c for c in sort if c not in equality]
+    suggested += [c for c in ranges[:1] if c not in suggested]
+    if not suggested or (suggested == ranges[:1] and not equality and not sort and not issues["full_scans"]):
+        return None, notes
+
+    for index_columns in existing.get(table, ()):
+        if list(index_columns[:len(suggested)]) == suggested:
+            return None, notes
+    name = f"idx_{table}_{'_'.join(suggested)}"
+    return f"CREATE INDEX IF NOT EXISTS {name} ON {table}({', '.join(suggested)})", notes
+
+
+def read_schema(conn: sqlite3.Connection) -> Tuple[Dict[str, List[str]], Dict[str, List[List[str]]]]:
+    """库中各表的列与已有索引的列"""
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    columns = {table: [row[1] for row in conn.execute(f"PRAGMA table_info({table})")] for table in tables}
+    indexes: Dict[str, List[List[str]]] = {}
+    for table in tables:
+        for row in conn.execute(f"PRAGMA index_list({table})"):
+            indexes.setdefault(table, []).append(
+                [info[2] for info in conn.execute(f"PRAGMA index_info({row[1]})")]
+            )
+    return columns, indexes
+
+
+def format_report(
+    profile: Mapping[str, Any],
+    conn: Optional[sqlite3.Connection] = None,
+    aliases: Optional[Mapping[str, Tuple[str, Mapping[str, str]]]] = None,
+    top: int = 10
+) -> str:
+    """
+    生成文本报告：按总耗时排序的语句、最慢的执行及其执行计划、索引建议
+
+    Args:
+        profile: QueryProfiler.snapshot() 或 load() 的结果
+        conn: 用于读取表结构的连接；为空时不给索引建议
+        aliases: 视图 -> 实际表的映射，见 suggest_index
+        top: 每部分列出的条数
+    """
+    statements = profile.get("statements", {})
+    plans = profile.get("plans", {})
+    if not statements:
+        return "没有记录到查询（是否已开启 database.profile？）"
+
+    def short(sql: str, width: int = 110) -> str:
+        return sql if len(sql) <= width else sql[:width - 3] + "..."
+
+    def flags(key: str) -> str:
+        issues = analyze_plan(plans.get(key, []))
+        marks = [f"全表扫描 {', '.join(issues['full_scans'])}"] if issues["full_scans"] else []
+        marks += [f"临时 B 树 ({purpose})" for purpose in issues["temp_btrees"]]
+        marks += ["自动索引"] if issues["automatic_indexes"] else []
+        return "; ".join(marks)
+
+    total = sum(stats["total"] for stats in statements.values())
+    calls = sum(stats["calls"] for stats in statements.values())
+    lines = [f"共 {len(statements)} 条语句, {calls} 次执行, 累计 {total * 1000:.1f} ms", ""]
+
+    lines.append(f"== 总耗时前 {top} 的语句 ==")
+    lines.append(f"{'次数':>8} {'总计ms':>10} {'平均ms':>9} {'最大ms':>9}  语句")
+    ranked = sorted(statements.items(), key=lambda item: item[1]["total"], reverse=True)[:top]
+    for key, stats in ranked:
+        lines.append(f"{stats['calls']:>8} {stats['total'] * 1000:>10.2f} {stats['total'] / stats['calls'] * 1000:>9.3f} "
+                     f"{stats['max'] * 1000:>9.3f}  {short(key)}")
+        mark = flags(key)
+        if mark:
+            lines.append(f"{'':>40}  ! {mark}")
+
+    slowest = profile.get("slowest", [])[:top]
+    lines += ["", f"== 最慢的 {len(slowest)} 次执行 =="]
+    for entry in slowest:
+        lines.append(f"{entry['seconds'] * 1000:.2f} ms  {entry['at']}  {short(entry['sql'])}")
+        if entry.get("params"):
+            lines.append(f"    参数: {', '.join(entry['params'])}")
+        for plan_line in plans.get(entry["sql"], []):
+            lines.append(f"    | {plan_line}")
+
+    if conn is not None:
+        table_columns, existing = read_schema(conn)
+        suggestions: Dict[str, List[str]] = {}
+        notes: Dict[str, List[str]] = {}
+        for key, _ in sorted(statements.items(), key=lambda item: item[1]["total"], reverse=True):
+            index, hints = suggest_index(key, plans.get(key, []), table_columns, existing, aliases)
+            if index:
+                suggestions.setdefault(index, []).append(key)
+            for hint in hints:
+                notes.setdefault(hint, []).append(key)
+
+        lines += ["", "== 索引建议 =="]
+        if not suggestions and not notes:
+            lines.append("无")
+        for index, keys in suggestions.items():
+            cost = sum(statements[key]["total"] for key in keys) * 1000
+            lines.append(f"{index};")
+            lines.append(f"    影响 {len(keys)} 条语句, 累计 {cost:.1f} ms, 如: {short(keys[0], 90)}")
+        for hint, keys in notes.items():
+            lines.append(f"提示: {hint}（{len(keys)} 条语句，如: {short(keys[0], 80)}）")
+
+    return "\n".join(lines)
@@ -0,0 +1,281 @@
+"""
+原始消息队列
+采集到的消息先落库到 raw_messages，处理器从中领取未处理的消息，
+解析结果与处理状态在同一事务中提交
+"""
+
+import hashlib
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, List, Dict, Iterable, Optional, Tuple
+
+from src.collector import Message
+
+
+# 处理状态
+STATUS_PENDING = "pending"
+STATUS_PROCESSING = "processing"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+class _LeaseLost(Exception):
+    """租约失效，回滚提交"""
+
+
+def message_key(message: Message, capture_time: str = "") -> str:
+    """
+    消息指纹，重复采集的同一条消息只入队一次
+
+    UI 采集的消息时间只有 "HH:MM"（或为空），指纹带上采集日期，
+    不同日期在同一时刻重发的相同报价不会被当作重复丢弃。
+    """
+    day = (message.capture_time or capture_time)[:10]
+    raw = "\x00".join((day, message.group or "", message.sender or "", message.time or "", message.content or ""))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class MessageQueue:
+    """
+    基于 raw_messages 表的持久化工作队列
+
+    领取时写入租约令牌；提交时只有令牌仍匹配才会写入解析结果，
+    租约过期被他人重新领取的批次不会重复入库。
+    失败退回的消息按指数退避延后到 next_attempt_at 之后才能再次领取。
+    """
+
+    def __init__(self, db: Any, lease_seconds: int = 600, max_attempts: int = 3, retry_delay: float = 30):
+        self.db = db
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._ensure_table()
+
+    def _ensure_table(self) -> None:
+        conn = self.db._connect()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS raw_messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    message_key TEXT NOT NULL,
+                    capture_time DATETIME NOT NULL,
+                    message_time TEXT,
+                    group_name TEXT,
+                    sender_nickname TEXT,
+                    content TEXT,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    claim_token TEXT,
+                    claimed_at DATETIME,
+                    processed_at DATETIME,
+                    error TEXT,
+                    next_attempt_at DATETIME
+                )
+            ''')
+            # 旧库补齐重试时间列
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(raw_messages)").fetchall()}
+            if "next_attempt_at" not in existing:
+                conn.execute("ALTER TABLE raw_messages ADD COLUMN next_attempt_at DATETIME")
+            conn.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_raw_messages_key
+                ON raw_messages(message_key)
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_raw_messages_status
+                ON raw_messages(status, id)
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def enqueue(self, messages: Iterable[Message], capture_time: Optional[str] = None) -> int:
+        """
+        写入采集到的消息
+
+        Args:
+            messages: 消息列表
+            capture_time: 采集时间，默认当前时间；消息自带 capture_time 时以消息为准
+
+        Returns:
+            新入队的消息数（已存在的消息被忽略）
+        """
+        capture_time = capture_time or datetime.now().isoformat()
+        rows = [
+            (message_key(msg, capture_time), msg.capture_time or capture_time, msg.time, msg.group, msg.sender, msg.content)
+            for msg in messages
+        ]
+        if not rows:
+            return 0
+
+        conn = self.db._connect()
+        try:
+            with conn:
+                before = conn.total_changes
+                conn.executemany(
+                    "INSERT OR IGNORE INTO raw_messages "
+                    "(message_key, capture_time, message_time, group_name, sender_nickname, content) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                return conn.total_changes - before
+        finally:
+            conn.close()
+
+    # 可领取的消息：到了重试时间的待处理消息，以及租约已过期的处理中消息
+    _CLAIMABLE = (
+        "(status = ? AND (next_attempt_at IS NULL OR next_attempt_at <= ?)) "
+        "OR (status = ? AND claimed_at < ?)"
+    )
+
+    def _claimable_params(self, now: datetime) -> Tuple[str, str, str, str]:
+        expired = (now - timedelta(seconds=self.lease_seconds)).isoformat()
+        return STATUS_PENDING, now.isoformat(), STATUS_PROCESSING, expired
+
+    def claimable(self) -> int:
+        """当前可领取的消息数（含租约已过期、崩溃遗留的处理中消息）"""
+        conn = self.db._connect()
+        try:
+            return conn.execute(
+                f"SELECT COUNT(*) FROM raw_messages WHERE {self._CLAIMABLE}",
+                self._claimable_params(datetime.now())
+            ).fetchone()[0]
+        finally:
+            conn.close()
+
+    def claim(self, limit: int = 200) -> Tuple[str, List[Tuple[int, Message]]]:
+        """
+        领取一批待处理消息（含租约已过期的处理中消息，不含尚未到重试时间的消息）
+
+        Returns:
+            (租约令牌, [(消息 ID, 消息)]) ，按入队顺序排列
+        """
+        token = uuid.uuid4().hex
+        now = datetime.now()
+
+        conn = self.db._connect()
+        try:
+            # IMMEDIATE 事务：多个处理进程不会领取到同一批消息
+            conn.isolation_level = None
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    "SELECT id, message_time, group_name, sender_nickname, content, capture_time FROM raw_messages "
+                    f"WHERE {self._CLAIMABLE} ORDER BY id LIMIT ?",
+                    (*self._claimable_params(now), limit)
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE raw_messages SET status = ?, claim_token = ?, claimed_at = ?, "
+                    "attempts = attempts + 1 WHERE id = ?",
+                    [(STATUS_PROCESSING, token, now.isoformat(), row[0]) for row in rows]
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+        return token, [
+            (row[0], Message(
+                sender=row[3] or "", time=row[1] or "", content=row[4] or "", group=row[2] or "",
+                capture_time=row[5] or ""
+            ))
+            for row in rows
+        ]
+
+    def complete(self, token: str, message_ids: List[int], records: List[Any]) -> Optional[List[int]]:
+        """
+        提交一批消息的解析结果并标记为已处理
+
+        解析结果写入 market_data 与状态更新在同一事务中完成；
+        若租约已失效（消息被重新领取），整批回滚。
+
+        Returns:
+            按 records 顺序排列的记录 ID，租约失效时为 None
+        """
+        rows = self.db._fact_rows(records) if records else []
+        conn = self.db._connect()
+        try:
+            with conn:
+                cursor = conn.executemany(
+                    "UPDATE raw_messages SET status = ?, processed_at = ?, error = NULL "
+                    "WHERE id = ? AND claim_token = ? AND status = ?",
+                    [(STATUS_DONE, datetime.now().isoformat(), message_id, token, STATUS_PROCESSING)
+                     for message_id in message_ids]
+                )
+                if cursor.rowcount != len(message_ids):
+                    raise _LeaseLost()
+                record_ids = self.db.insert_fact_rows(conn, rows)
+        except _LeaseLost:
+            print(f"消息租约已失效，放弃提交 {len(message_ids)} 条消息")
+            return None
+        finally:
+            conn.close()
+
+        if records:
+            self.db.bump_generation()
+        return record_ids
+
+    def fail(self, token: str, message_ids: List[int], error: str) -> int:
+        """
+        标记一批消息处理失败
+
+        未超过最大尝试次数的消息退回待处理，并延后 retry_delay * 2^(尝试次数-1) 秒才能再次领取，
+        避免同一批有问题的消息在一次排空中被反复领取；超过最大尝试次数的标记为失败。
+
+        Returns:
+            被最终标记为失败的消息数
+        """
+        now = datetime.now()
+        placeholders = ", ".join("?" for _ in message_ids)
+        conn = self.db._connect()
+        try:
+            with conn:
+                attempts = conn.execute(
+                    f"SELECT id, attempts FROM raw_messages WHERE claim_token = ? AND id IN ({placeholders})",
+                    [token, *message_ids]
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE raw_messages SET error = ?, next_attempt_at = ?, "
+                    "status = CASE WHEN attempts >= ? THEN ? ELSE ? END "
+                    "WHERE id = ? AND claim_token = ?",
+                    [(error[:500], self._next_attempt(now, count), self.max_attempts,
+                      STATUS_FAILED, STATUS_PENDING, message_id, token)
+                     for message_id, count in attempts]
+                )
+                return conn.execute(
+                    f"SELECT COUNT(*) FROM raw_messages WHERE claim_token = ? AND status = ? "
+                    f"AND id IN ({placeholders})",
+                    [token, STATUS_FAILED, *message_ids]
+                ).fetchone()[0]
+        finally:
+            conn.close()
+
+    def _next_attempt(self, now: datetime, attempts: int) -> str:
+        """第 attempts 次尝试失败后的最早重试时间（指数退避）"""
+        delay = self.retry_delay * 2 ** max(0, attempts - 1)
+        return (now + timedelta(seconds=delay)).isoformat()
+
+    def retry_failed(self) -> int:
+        """把失败的消息重新放回队列（立即可领取）"""
+        conn = self.db._connect()
+        try:
+            with conn:
+                return conn.execute(
+                    "UPDATE raw_messages SET status = ?, attempts = 0, next_attempt_at = NULL WHERE status = ?",
+                    (STATUS_PENDING, STATUS_FAILED)
+                ).rowcount
+        finally:
+            conn.close()
+
+    def stats(self) -> Dict[str, int]:
+        """各状态的消息数"""
+        conn = self.db._connect()
+        try:
+            rows = conn.execute("SELECT status, COUNT(*) FROM raw_messages GROUP BY status").fetchall()
+        finally:
+            conn.close()
+
+        counts = {STATUS_PENDING: 0, STATUS_PROCESSING: 0, STATUS_DONE: 0, STATUS_FAILED: 0}
+        counts.update(dict(rows))
+        return counts
@@ -1,28 +1,48 @@
 """
 报表生成器
-负责生成 Excel 格式的分析报表
+负责生成分析报表（会话报表支持 Excel / CSV / JSON Lines / HTML）
 """
 
 import os
 import subprocess
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any, Optional
-
-import pandas as pd
+from typing import List, Dict, Any, Optional, Tuple, Union
 
 from src.config import Config
-from src.processor import TransactionRecord
+from src.metrics import metrics
+from src.processor import RecordBatch, TransactionRecord
+from src.storage.writers import get_writer
 
 
 class ReportGenerator:
     """报表生成器"""
 
+    # 会话报表的字段 -> 列标题（按列顺序）
+    SESSION_COLUMNS = {
+        "message_time": "时间",
+        "group": "群组",
+        "sender": "发送者",
+        "action": "类型",
+        "item": "商品",
+        "specs": "规格",
+        "price": "价格",
+        "quantity": "数量",
+        "price_flag": "价格标记",
+        "cluster_id": "报价聚类",
+        "raw_text": "原始消息",
+    }
+
     def __init__(self, config: Config):
         self.config = config
         reports_config = config.reports
-        self.output_dir = reports_config.get('output_dir', './output')
-        self.auto_open = reports_config.get('auto_open', True)
+        self.output_dir = reports_config.output_dir
+        self.auto_open = reports_config.auto_open
+        # 会话报表格式：xlsx（默认）/ csv / jsonl / html
+        self.format = reports_config.format
+        get_writer(self.format)
 
         # 确保输出目录存在
         Path(self.output_dir).mkdir(parents=True, exist_ok=True)
@@ -36,81 +56,120 @@ class ReportGenerator:
         else:
             return f"{price:.0f}"
 
+    def _session_rows(self, batch: RecordBatch) -> Tuple[List[int], Dict[str, Any]]:
+        """
+        按价格升序的行顺序与统计摘要（单次遍历列，不构建 DataFrame）
+
+        Returns:
+            (行下标列表, 摘要)
+        """
+        prices = batch.column("price")
+        flags = batch.column("price_flag")
+        actions = batch.column("action")
+        groups = batch.column("group")
+        clusters = batch.column("cluster_id")
+
+        clean_count, clean_sum = 0, 0.0
+        clean_min, clean_max = None, None
+        by_group: Dict[str, List[float]] = {}
+        for price, flag, group in zip(prices, flags, groups):
+            if flag:
+                continue
+            clean_count += 1
+            clean_sum += price
+            clean_min = price if clean_min is None or price < clean_min else clean_min
+            clean_max = price if clean_max is None or price > clean_max else clean_max
+            stats = by_group.get(group)
+            if stats is None:
+                by_group[group] = [1, price, price, price]
+            else:
+                stats[0] += 1
+                stats[1] += price
+                stats[2] = min(stats[2], price)
+                stats[3] = max(stats[3], price)
+
+        # 同一报价的多次转发只计一次
+        clustered = {cluster for cluster in clusters if cluster}
+        unclustered = sum(1 for cluster in clusters if not cluster)
+
+        summary = {
+            "总记录数": len(batch),
+            "去重报价数": len(clustered) + unclustered,
+            "卖出记录": sum(1 for action in actions if action == "SELL"),
+            "买入记录": sum(1 for action in actions if action == "BUY"),
+            "异常价格": len(batch) - clean_count,
+            "平均价格": clean_sum / clean_count if clean_count else 0,
+            "最低价格": clean_min or 0,
+            "最高价格": clean_max or 0,
+        }
+        group_stats = {
+            group: (count, round(total / count, 2), low, high)
+            for group, (count, total, low, high) in sorted(by_group.items())
+        }
+        order = sorted(range(len(batch)), key=prices.__getitem__)
+        return order, {"summary": summary, "groups": group_stats, "group_count": len(set(groups))}
+
     def generate_session_report(
         self,
-        records: List[TransactionRecord],
-        session_name: Optional[str] = None
+        records: Union[List[TransactionRecord], RecordBatch],
+        session_name: Optional[str] = None,
+        fmt: Optional[str] = None
     ) -> str:
         """
         生成会话报表
 
         Args:
-            records: 交易记录列表
+            records: 交易记录列表或列式记录批
             session_name: 会话名称
+            fmt: 报表格式 (xlsx / csv / jsonl / html)，默认为 reports.format
 
         Returns:
             生成的报表文件路径
         """
-        if not records:
+        if not len(records):
             print("没有交易记录，跳过报表生成")
             return ""
 
+        writer_class = get_writer(fmt or self.format)
+
         # 生成时间戳
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         session_name = session_name or f"Session_{timestamp}"
 
-        # 构建 DataFrame
-        data = []
-        for record in records:
-            data.append({
-                "时间": record.message_time,
-                "群组": record.group,
-                "发送者": record.sender,
-                "类型": record.action,
-                "商品": record.item,
-                "规格": record.specs,
-                "价格": record.price,
-                "价格(格式化)": self._format_price(record.price),
-                "数量": record.quantity,
-                "原始消息": record.raw_text
-            })
-
-        df = pd.DataFrame(data)
-
-        # 按价格升序排列
-        df = df.sort_values('价格', ascending=True)
+        batch = records if isinstance(records, RecordBatch) else RecordBatch.from_records(records)
+        order, stats = self._session_rows(batch)
 
         # 生成文件路径
-        filename = f"Current_Session_{timestamp}.xlsx"
+        filename = f"Current_Session_{timestamp}.{writer_class.extension}"
         filepath = os.path.join(self.output_dir, filename)
 
-        # 写入 Excel
-        with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
-            # 主数据表
-            df.to_excel(writer, sheet_name='交易记录', index=False)
-
-            # 统计摘要
-            summary_data = {
-                "指标": ["总记录数", "卖出记录", "买入记录", "平均价格", "最低价格", "最高价格"],
-                "数值": [
-                    len(df),
-                    len(df[df['类型'] == 'SELL']),
-                    len(df[df['类型'] == 'BUY']),
-                    df['价格'].mean() if len(df) > 0 else 0,
-                    df['价格'].min() if len(df) > 0 else 0,
-                    df['价格'].max() if len(df) > 0 else 0,
-                ]
-            }
-            summary_df = pd.DataFrame(summary_data)
-            summary_df.to_excel(writer, sheet_name='统计摘要', index=False)
+        # 按价格升序逐行写出，价格后插入格式化价格列
+        names = list(self.SESSION_COLUMNS)
+        columns = [batch.column(name) for name in names]
+        price_at = names.index("price") + 1
+        fields = [(name, self.SESSION_COLUMNS[name]) for name in names]
+        fields.insert(price_at, ("price_text", "价格(格式化)"))
+        format_price = self._format_price
+
+        def rows():
+            for index in order:
+                row = [column[index] for column in columns]
+                row.insert(price_at, format_price(row[price_at - 1]))
+                yield row
+
+        with writer_class(filepath, fields) as writer:
+            writer.write_rows(rows())
+
+            # 统计摘要（价格指标排除被标记的异常价格）
+            writer.write_table("统计摘要", ["指标", "数值"], stats["summary"].items())
 
             # 按群组统计
-            if df['群组'].nunique() > 1:
-                group_stats = df.groupby('群组').agg({
-                    '价格': ['count', 'mean', 'min', 'max']
-                }).round(2)
-                group_stats.columns = ['记录数', '平均价格', '最低价', '最高价']
-                group_stats.to_excel(writer, sheet_name='按群组统计')
+            if stats["group_count"] > 1:
+                writer.write_table(
+                    "按群组统计",
+                    ["群组", "记录数", "平均价格", "最低价", "最高价"],
+                    [(group, *values) for group, values in stats["groups"].items()]
+                )
 
         print(f"报表已生成: {filepath}")
 
@@ -135,17 +194,19 @@ class ReportGenerator:
         Returns:
             生成的报表文件路径
         """
+        import pandas as pd
         from src.storage.database import DatabaseManager
+        from src.storage.export import load_columns
 
-        db = DatabaseManager(self.config.database['path'])
-        records = db.query_records(limit=10000)
+        db = DatabaseManager.from_config(self.config)
+        columns = load_columns(db, limit=10000)
 
-        if not records:
+        if len(columns['id']) == 0:
             print("数据库中没有足够的数据")
             return ""
 
-        # 构建 DataFrame
-        df = pd.DataFrame(records)
+        # 直接由列构建 DataFrame，避免逐行字典
+        df = pd.DataFrame(columns)
 
         # 转换时间
         df['message_time'] = pd.to_datetime(df['message_time'])
@@ -153,6 +214,11 @@ class ReportGenerator:
         # 按日期聚合
         df['date'] = df['message_time'].dt.date
 
+        # 去重后的报价标识：同一聚类只计一次，未聚类的记录各自成一条
+        df['offer_id'] = df['cluster_id'].where(
+            df['cluster_id'].fillna('') != '', 'r' + df['id'].astype(str)
+        )
+
         # 生成时间戳
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"Trend_Report_{days}days_{timestamp}.xlsx"
@@ -162,22 +228,26 @@ class ReportGenerator:
             # 原始数据
             df.to_excel(writer, sheet_name='原始数据', index=False)
 
-            # 价格趋势透视表
-            if len(df) > 0:
+            # 价格趋势透视表（排除被标记的异常价格）
+            priced = df[df['price_flag'].fillna('') == '']
+            if len(priced) > 0:
                 pivot = pd.pivot_table(
-                    df,
-                    values='price',
+                    priced,
+                    values=['offer_id', 'price'],
                     index='date',
                     columns='action',
-                    aggfunc=['count', 'mean']
+                    aggfunc={'offer_id': 'nunique', 'price': 'mean'}
                 ).round(2)
+                pivot = pivot.rename(columns={'offer_id': '报价数', 'price': '平均价格'}, level=0)
                 pivot.to_excel(writer, sheet_name='价格趋势')
 
                 # 按商品统计
-                item_stats = df.groupby('item_category').agg({
-                    'price': ['count', 'mean', 'min', 'max']
-                }).round(2)
-                item_stats.columns = ['出现次数', '平均价格', '最低价', '最高价']
+                item_stats = priced.groupby('item_category').agg(
+                    出现次数=('offer_id', 'nunique'),
+                    平均价格=('price', 'mean'),
+                    最低价=('price', 'min'),
+                    最高价=('price', 'max'),
+                ).round(2)
                 item_stats = item_stats.sort_values('出现次数', ascending=False)
                 item_stats.to_excel(writer, sheet_name='商品统计')
 
@@ -194,11 +264,90 @@ class ReportGenerator:
             if os.name == 'nt':  # Windows
                 os.startfile(filepath)
             elif os.name == 'posix':  # macOS/Linux
-                subprocess.run(['open', filepath] if os.uname().sysname == 'Darwin' else ['xdg-open', filepath])
+                # 不等待查看器退出
+                subprocess.Popen(['open', filepath] if os.uname().sysname == 'Darwin' else ['xdg-open', filepath])
         except Exception as e:
             print(f"无法自动打开文件: {e}")
 
 
+class ReportWorker:
+    """
+    后台报表线程
+
+    submit() 只登记待生成的会话并立即返回，报表在后台线程中生成（含自动打开），
+    不占用采集/解析的时间。生成期间又提交了多个会话时只保留最新的一个，
+    被合并掉的会话计入 reports_coalesced。
+
+    指标: report_seconds（生成耗时）、report_wait_seconds（提交到开始生成的等待）、
+    reports_generated / reports_failed / reports_coalesced 计数器。
+    """
+
+    def __init__(self, generator: ReportGenerator):
+        self.generator = generator
+        self.last_path: Optional[str] = None
+        self._pending: Optional[Tuple[Any, Optional[str], float]] = None
+        self._busy = False
+        self._stopping = False
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, records: Union[List[TransactionRecord], RecordBatch], session_name: Optional[str] = None) -> None:
+        """登记一个会话的报表；尚未开始生成的旧会话被替换"""
+        with self._cond:
+            if self._pending is not None:
+                metrics.inc("reports_coalesced")
+            self._pending = (records, session_name, time.perf_counter())
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="report-worker", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while self._pending is None and not self._stopping:
+                    self._cond.wait()
+                if self._pending is None:
+                    return
+                records, session_name, submitted = self._pending
+                self._pending = None
+                self._busy = True
+
+            start = time.perf_counter()
+            metrics.observe("report_wait_seconds", start - submitted)
+            try:
+                self.last_path = self.generator.generate_session_report(records, session_name)
+                metrics.inc("reports_generated")
+                metrics.observe("report_seconds", time.perf_counter() - start)
+            except Exception as e:
+                metrics.inc("reports_failed")
+                print(f"报表生成失败: {e}")
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待已提交的报表生成完毕
+
+        Returns:
+            超时前全部完成时为 True
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending is None and not self._busy, timeout)
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """生成完待处理的报表后停止线程"""
+        done = self.flush(timeout)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None and done:
+            self._thread.join(timeout)
+        return done
+
+
 if __name__ == "__main__":
     # 测试报表生成
     from src.config import load_config
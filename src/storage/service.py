@@ -0,0 +1,254 @@
+"""
+本地查询服务
+在 DatabaseManager 之上提供只读 HTTP 接口（最新报价、价格趋势、搜索、统计），
+结果缓存在进程内，数据库有写入时失效
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from src.config import Config
+from src.storage.database import DatabaseManager
+
+
+class QueryCache:
+    """
+    LRU 结果缓存（线程安全）
+
+    缓存项带写入代数；代数变化后整体清空，保证不返回写入之前的结果。
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.generation: Any = None
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, generation: Any) -> Optional[bytes]:
+        with self._lock:
+            if generation != self.generation:
+                self._entries.clear()
+                self.generation = generation
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, generation: Any, value: bytes) -> None:
+        with self._lock:
+            # 查询期间发生了写入，结果可能已过期，不缓存
+            if generation != self.generation:
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else None,
+        }
+
+
+def _int_param(params: Dict[str, str], name: str, default: Optional[int], maximum: int) -> Optional[int]:
+    value = params.get(name)
+    if value in (None, ""):
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"参数 {name} 必须为整数")
+    if not 0 < number <= maximum:
+        raise ValueError(f"参数 {name} 必须在 1 - {maximum} 之间")
+    return number
+
+
+class QueryService:
+    """
+    查询服务
+
+    读取走只读连接，不与采集/解析进程的写入争用。缓存的写入代数由两部分组成：
+    本进程 DatabaseManager 的 generation（insert_records 等写入后加一），以及
+    SQLite 的 PRAGMA data_version（其他进程提交写入后变化）。
+    """
+
+    def __init__(self, db: DatabaseManager, cache_size: int = 256):
+        self.db = db
+        self.reader = db.reader()
+        self.cache = QueryCache(cache_size)
+        # 用于读取 data_version 的常驻连接；data_version 只反映其他连接的提交
+        self._version_conn = self.reader._connect(check_same_thread=False)
+        self._version_lock = threading.Lock()
+
+        self.routes: Dict[str, Callable[[Dict[str, str]], Any]] = {
+            "/offers": self._offers,
+            "/trend": self._trend,
+            "/search": self._search,
+            "/stats": self._stats,
+        }
+
+    def generation(self) -> Tuple[int, int]:
+        """当前写入代数"""
+        with self._version_lock:
+            data_version = self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+        return self.db.generation, data_version
+
+    def _offers(self, params: Dict[str, str]) -> Any:
+        return self.reader.latest_offers(
+            item=params.get("item"),
+            action=(params.get("action") or "").upper() or None,
+            group_name=params.get("group"),
+            limit=_int_param(params, "limit", 50, 1000)
+        )
+
+    def _trend(self, params: Dict[str, str]) -> Any:
+        return self.reader.get_price_trend(days=_int_param(params, "days", 7, 366))
+
+    def _search(self, params: Dict[str, str]) -> Any:
+        keyword = (params.get("q") or "").strip()
+        if not keyword:
+            raise ValueError("缺少参数 q")
+        return self.reader.search_records(
+            keyword,
+            days=_int_param(params, "days", None, 3660),
+            limit=_int_param(params, "limit", 50, 1000)
+        )
+
+    def _stats(self, params: Dict[str, str]) -> Any:
+        return self.reader.get_statistics()
+
+    def query(self, path: str, params: Dict[str, str]) -> bytes:
+        """
+        执行查询，返回 JSON 响应体
+
+        Raises:
+            KeyError: 未知路径
+            ValueError: 参数不合法或查询跨越的分区过多
+        """
+        handler = self.routes[path]
+        key = (path, tuple(sorted(params.items())))
+        generation = self.generation()
+        body = self.cache.get(key, generation)
+        if body is None:
+            result = handler(params)
+            body = json.dumps(result, ensure_ascii=False, default=str).encode("utf-8")
+            self.cache.put(key, generation, body)
+        return body
+
+    def close(self) -> None:
+        self._version_conn.close()
+
+
+def _make_handler(service: QueryService) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            # 同名参数取最后一个
+            params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            start = time.perf_counter()
+            try:
+                if url.path == "/health":
+                    status, body = 200, json.dumps({
+                        "status": "ok", "generation": service.generation(), "cache": service.cache.stats()
+                    }).encode("utf-8")
+                elif url.path not in service.routes:
+                    status, body = 404, self._error(f"未知的路径 {url.path}，可用: {', '.join(service.routes)}")
+                else:
+                    status, body = 200, service.query(url.path, params)
+            except ValueError as e:
+                status, body = 400, self._error(str(e))
+            except sqlite3.Error as e:
+                status, body = 500, self._error(f"数据库错误: {e}")
+
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("X-Query-Time", f"{(time.perf_counter() - start) * 1000:.3f}ms")
+            self.end_headers()
+            self.wfile.write(body)
+
+        @staticmethod
+        def _error(message: str) -> bytes:
+            return json.dumps({"error": message}, ensure_ascii=False).encode("utf-8")
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class QueryServer:
+    """本地 HTTP 查询服务器"""
+
+    def __init__(self, service: QueryService, host: str = "127.0.0.1", port: int = 8765):
+        self.service = service
+        self.server = ThreadingHTTPServer((host, port), _make_handler(service))
+        self.server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_config(
+        cls,
+        config: Config,
+        db: Optional[DatabaseManager] = None,
+        host: Optional[str] = None,
+        port: Optional[int] = None
+    ) -> "QueryServer":
+        """
+        根据 service 配置创建服务器
+
+        Args:
+            db: 复用的数据库管理器（同进程写入时缓存可立即失效），默认新建
+            host / port: 覆盖配置中的监听地址与端口
+        """
+        service_config = config.service
+        service = QueryService(db or DatabaseManager.from_config(config), service_config.cache_size)
+        return cls(
+            service,
+            host or service_config.host,
+            port if port is not None else service_config.port
+        )
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> None:
+        """在后台线程中运行"""
+        self._thread = threading.Thread(target=self.server.serve_forever, name="query-server", daemon=True)
+        self._thread.start()
+
+    def serve_forever(self) -> None:
+        print(f"查询服务已启动: {self.url} (/offers /trend /search /stats /health)")
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            print("\n查询服务已停止")
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self.server.shutdown()
+            self._thread = None
+        self.server.server_close()
+        self.service.close()
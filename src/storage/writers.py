@@ -0,0 +1,207 @@
+"""
+报表写入器
+把报表行逐行流式写入 CSV / JSON Lines / HTML / Excel，不经过 pandas
+"""
+
+import csv
+import html
+import json
+from typing import Any, Dict, Iterable, List, Sequence, Tuple, Type
+
+# (字段名, 列标题)；JSON Lines 使用字段名，其余格式使用列标题
+Fields = Sequence[Tuple[str, str]]
+
+
+class ReportWriter:
+    """
+    报表写入器基类
+
+    用法: 构造后调用 write_rows 写入主表（可多次），write_table 追加统计表，最后 close。
+    """
+
+    extension = ""
+
+    def __init__(self, path: str, fields: Fields):
+        self.path = path
+        self.fields = list(fields)
+        self.rows = 0
+
+    def write_rows(self, rows: Iterable[Sequence[Any]]) -> None:
+        raise NotImplementedError
+
+    def write_table(self, title: str, columns: Sequence[str], rows: Iterable[Sequence[Any]]) -> None:
+        """追加一张统计表；纯数据格式（CSV / JSON Lines）忽略"""
+
+    def close(self) -> None:
+        raise NotImplementedError
+
+    def __enter__(self) -> "ReportWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class CsvWriter(ReportWriter):
+    """CSV（UTF-8 BOM，Excel 可直接打开中文）"""
+
+    extension = "csv"
+
+    def __init__(self, path: str, fields: Fields):
+        super().__init__(path, fields)
+        self._file = open(path, "w", encoding="utf-8-sig", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow([title for _, title in self.fields])
+
+    def write_rows(self, rows: Iterable[Sequence[Any]]) -> None:
+        for row in rows:
+            self._writer.writerow(row)
+            self.rows += 1
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class JsonLinesWriter(ReportWriter):
+    """JSON Lines，每行一条记录，键为字段名"""
+
+    extension = "jsonl"
+
+    def __init__(self, path: str, fields: Fields):
+        super().__init__(path, fields)
+        self._file = open(path, "w", encoding="utf-8")
+        self._names = [name for name, _ in self.fields]
+
+    def write_rows(self, rows: Iterable[Sequence[Any]]) -> None:
+        names = self._names
+        write = self._file.write
+        for row in rows:
+            write(json.dumps(dict(zip(names, row)), ensure_ascii=False))
+            write("\n")
+            self.rows += 1
+
+    def close(self) -> None:
+        self._file.close()
+
+
+_HTML_HEAD = """<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: -apple-system, "Segoe UI", "Microsoft YaHei", sans-serif; margin: 24px; color: #222; }}
+table {{ border-collapse: collapse; margin-bottom: 32px; font-size: 13px; }}
+th, td {{ border: 1px solid #ddd; padding: 4px 8px; text-align: left; vertical-align: top; }}
+th {{ background: #f3f4f6; position: sticky; top: 0; }}
+tr:nth-child(even) td {{ background: #fafafa; }}
+td.num {{ text-align: right; font-variant-numeric: tabular-nums; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+"""
+
+
+class HtmlWriter(ReportWriter):
+    """自包含的 HTML 表格（内联样式，无外部资源）"""
+
+    extension = "html"
+
+    def __init__(self, path: str, fields: Fields, title: str = "交易记录"):
+        super().__init__(path, fields)
+        self._file = open(path, "w", encoding="utf-8")
+        self._file.write(_HTML_HEAD.format(title=html.escape(title)))
+        self._open_table([title for _, title in self.fields])
+
+    def _open_table(self, columns: Sequence[str]) -> None:
+        header = "".join(f"<th>{html.escape(str(column))}</th>" for column in columns)
+        self._file.write(f"<table>\n<thead><tr>{header}</tr></thead>\n<tbody>\n")
+
+    @staticmethod
+    def _cell(value: Any) -> str:
+        if value is None:
+            return "<td></td>"
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            if isinstance(value, float) and value.is_integer():
+                value = int(value)
+            return f'<td class="num">{value}</td>'
+        return f"<td>{html.escape(str(value))}</td>"
+
+    def _write(self, rows: Iterable[Sequence[Any]]) -> int:
+        cell = self._cell
+        write = self._file.write
+        count = 0
+        for row in rows:
+            write("<tr>" + "".join(map(cell, row)) + "</tr>\n")
+            count += 1
+        return count
+
+    def write_rows(self, rows: Iterable[Sequence[Any]]) -> None:
+        self.rows += self._write(rows)
+
+    def write_table(self, title: str, columns: Sequence[str], rows: Iterable[Sequence[Any]]) -> None:
+        self._file.write("</tbody>\n</table>\n")
+        self._file.write(f"<h2>{html.escape(title)}</h2>\n")
+        self._open_table(columns)
+        self._write(rows)
+
+    def close(self) -> None:
+        self._file.write("</tbody>\n</table>\n</body>\n</html>\n")
+        self._file.close()
+
+
+class ExcelWriter(ReportWriter):
+    """Excel（openpyxl 只写模式，逐行写出，内存占用与行数无关）"""
+
+    extension = "xlsx"
+
+    def __init__(self, path: str, fields: Fields, sheet: str = "交易记录"):
+        from openpyxl import Workbook
+
+        super().__init__(path, fields)
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet(sheet)
+        self._sheet.append([title for _, title in self.fields])
+
+    def write_rows(self, rows: Iterable[Sequence[Any]]) -> None:
+        append = self._sheet.append
+        for row in rows:
+            append(row)
+            self.rows += 1
+
+    def write_table(self, title: str, columns: Sequence[str], rows: Iterable[Sequence[Any]]) -> None:
+        sheet = self._workbook.create_sheet(title)
+        sheet.append(list(columns))
+        for row in rows:
+            sheet.append(list(row))
+
+    def close(self) -> None:
+        self._workbook.save(self.path)
+
+
+WRITERS: Dict[str, Type[ReportWriter]] = {
+    "xlsx": ExcelWriter,
+    "excel": ExcelWriter,
+    "csv": CsvWriter,
+    "jsonl": JsonLinesWriter,
+    "html": HtmlWriter,
+}
+
+
+def get_writer(fmt: str) -> Type[ReportWriter]:
+    """
+    按格式名取写入器
+
+    Raises:
+        ValueError: 未知的格式
+    """
+    try:
+        return WRITERS[fmt.lower()]
+    except KeyError:
+        raise ValueError(f"未知的报表格式: {fmt}，可选: {', '.join(WRITERS)}")
+
+
+def formats() -> List[str]:
+    """可选的报表格式（不含别名）"""
+    return [name for name, writer in WRITERS.items() if name == writer.extension]
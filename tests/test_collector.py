@@ -0,0 +1,206 @@
+"""
+采集模块测试
+测试消息文本解析、系统消息过滤与聊天记录导入
+"""
+
+import sys
+import os
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import re
+import tempfile
+import unittest
+
+
+class _Element:
+    """只有 Name 属性的 UI 元素替身"""
+
+    def __init__(self, name):
+        self.Name = name
+
+
+class TestMessageExtractor(unittest.TestCase):
+    """测试消息提取器"""
+
+    def setUp(self):
+        from src.collector import MessageExtractor
+
+        self.extractor = MessageExtractor()
+
+    def test_system_messages_filtered(self):
+        """测试撤回、拍一拍、入群等系统消息被过滤"""
+        for text in ["李四撤回了一条消息", "\"老王\" 拍了拍 \"小李\"", "张三邀请李四、王五加入了群聊",
+                     "老王修改了群名为\"数码群\"", "老王将小李移除了群聊"]:
+            self.assertIsNone(self.extractor.parse(text), text)
+        self.assertEqual(self.extractor.extract_batch(["14:02\n李四撤回了一条消息"]), [])
+
+    def test_combined_pattern_matches_each_pattern(self):
+        """测试合并后的系统消息正则与逐个模式匹配结果一致"""
+        from benchmarks.synthetic import synthetic_snapshot
+
+        patterns = [re.compile(p, re.IGNORECASE) for p in self.extractor.SYSTEM_MESSAGE_PATTERNS]
+        for text in synthetic_snapshot(2000, seed=7) + ["老王邀请\n小李加入了群聊"]:
+            expected = any(pattern.search(text) for pattern in patterns)
+            self.assertEqual(self.extractor.is_system_message(text), expected, text)
+
+    def test_message_formats(self):
+        """测试各种文本格式一次解析出时间、发送者和内容"""
+        cases = {
+            "14:02\n老王: 出两台14pm 256 5800": ("14:02", "老王", "出两台14pm 256 5800"),
+            "14:02 老王: 出14pm": ("14:02", "老王", "出14pm"),
+            "昨天 09:15\n小李 手机回收: 收13 4k": ("昨天 09:15", "小李 手机回收", "收13 4k"),
+            "老王: 甩 air5 2.8k\n包邮": (None, "老王", "甩 air5 2.8k\n包邮"),
+            "张三 收一台iPhone 13 预算3000": (None, "张三", "收一台iPhone 13 预算3000"),
+        }
+        for text, (time_str, sender, content) in cases.items():
+            parsed = self.extractor.parse(text)
+            self.assertEqual((parsed["time"], parsed["sender"], parsed["content"]), (time_str, sender, content), text)
+
+    def test_timestamps_and_empty_items_skipped(self):
+        """测试时间分隔条和空元素不被当作消息"""
+        for text in ["14:02", "昨天 14:02", "2024年5月1日 下午3:20", "", "老王: "]:
+            self.assertIsNone(self.extractor.parse(text), repr(text))
+
+    def test_batch_matches_single(self):
+        """测试批量提取与逐条提取结果一致，且同时接受文本与 UI 元素"""
+        from benchmarks.synthetic import synthetic_snapshot
+
+        texts = synthetic_snapshot(500, seed=3)
+        expected = [parsed for parsed in map(self.extractor.parse, texts) if parsed]
+        self.assertEqual(self.extractor.extract_batch(texts), expected)
+        self.assertEqual(self.extractor.extract_batch([_Element(text) for text in texts]), expected)
+        self.assertLess(len(expected), len(texts))
+
+
+class TestChatLogImporter(unittest.TestCase):
+    """测试聊天记录导入"""
+
+    def setUp(self):
+        from src.config import Config
+        from src.storage import DatabaseManager, MessageQueue
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        config_path = self._path("config.yaml")
+        with open(config_path, "w", encoding="utf-8") as f:
+            f.write(f"importer:\n  checkpoint_path: {self._path('import.json')}\n  shard_mb: 0.001\n  batch_size: 2\n")
+        self.config = Config(config_path)
+        self.db = DatabaseManager(self._path("market.db"))
+        self.queue = MessageQueue(self.db)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _path(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+    def _write(self, name, text):
+        with open(self._path(name), "w", encoding="utf-8") as f:
+            f.write(text)
+        return self._path(name)
+
+    def test_export_formats(self):
+        """测试文本（两种消息头布局与单行写法）、HTML、CSV 导出解析为同样的消息"""
+        from src.collector.importer import ChatLogImporter, detect_layout, html_to_text, parse_buffer
+
+        text = ("2024-05-01 09:00:01 老王\n出 14pm 256 5800\n\n有意私聊\n"
+                "2024-05-01 09:01:00 系统\n李四撤回了一条消息\n"
+                "2024/05/01 09:02:00 小李: 收 13 128 4k\n")
+        rows = parse_buffer(text.encode("utf-8"), detect_layout(text.encode("utf-8")))
+        self.assertEqual(rows, [
+            ("2024-05-01 09:00:01", "老王", "出 14pm 256 5800\n\n有意私聊"),
+            ("2024-05-01 09:02:00", "小李", "收 13 128 4k"),
+        ])
+
+        flipped = "老王 2024-05-01 09:00:01\n出 14pm 256 5800\n".encode("utf-8")
+        self.assertEqual(detect_layout(flipped), "sender_first")
+        self.assertEqual(parse_buffer(flipped, "sender_first")[0][1:], ("老王", "出 14pm 256 5800"))
+
+        markup = ("<html><style>p {}</style><body><div>2024-05-01 09:00:01 老王</div>"
+                  "<p>出 14pm &amp; 13</p></body></html>")
+        self.assertEqual(html_to_text(markup), "2024-05-01 09:00:01 老王\n出 14pm & 13")
+
+        path = self._write("export.csv", "StrTime,NickName,StrContent,Type\n"
+                                         "2024-05-01 09:00:01,老王,出 14pm 256 5800,1\n"
+                                         "2024-05-01 09:00:02,老王,[图片],3\n"
+                                         "1714525320,小李,收 13 128 4k,1\n")
+        result = ChatLogImporter(self.config, self.queue).import_file(path, group="数码群")
+        self.assertEqual((result["parsed"], result["queued"]), (2, 2))
+        token, claimed = self.queue.claim(10)
+        self.assertEqual([(m.group, m.sender, m.content) for _, m in claimed],
+                         [("数码群", "老王", "出 14pm 256 5800"), ("数码群", "小李", "收 13 128 4k")])
+
+    def test_imported_messages_keep_message_time(self):
+        """测试导入的历史消息以消息时间作为采集时间，不会作为实时报价进入盘口"""
+        from src.collector.importer import ChatLogImporter
+        from src.market import OrderBook
+        from src.processor.processor import TransactionRecord
+
+        path = self._write("export.txt", "2024-05-01 09:00:01 老王\n出 14pm 5800\n"
+                                         "2024-5-2 10:30 小李\n收 13 4k\n")
+        ChatLogImporter(self.config, self.queue, workers=1).import_file(path, group="数码群")
+        token, claimed = self.queue.claim(10)
+        self.assertEqual([m.capture_time for _, m in claimed], ["2024-05-01T09:00:01", "2024-05-02T10:30:00"])
+
+        message = claimed[0][1]
+        record = TransactionRecord(action="SELL", item="iPhone 14 Pro Max", specs="", price=5800,
+                                   quantity=1, raw_text=message.content,
+                                   sender=message.sender, group=message.group,
+                                   message_time=message.time, capture_time=message.capture_time)
+        self.assertIsNone(OrderBook().add(record))
+
+    def test_sharded_parse_matches_single_pass(self):
+        """测试分片对齐到消息头，进程池分片解析与整体解析结果一致"""
+        import mmap
+        from benchmarks.synthetic import synthetic_export
+        from src.collector.importer import ChatLogImporter, parse_buffer, plan_shards
+
+        path = self._path("export.txt")
+        synthetic_export(path, 500)
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            expected = parse_buffer(buffer, "time_first")
+            shards = plan_shards(buffer, "time_first", 2048)
+            self.assertGreater(len(shards), 5)
+            self.assertEqual(sum((parse_buffer(buffer, "time_first", s, e) for s, e in shards), []), expected)
+
+        result = ChatLogImporter(self.config, self.queue, workers=2).import_file(path, group="数码群")
+        self.assertEqual(result["parsed"], len(expected))
+        self.assertEqual(self.queue.stats()["pending"], len(expected))
+
+    def test_checkpoint_resume(self):
+        """测试中断后从检查点继续，已导入的分片不再解析；文件变化后从头导入且队列去重"""
+        from benchmarks.synthetic import synthetic_export
+        from src.collector.importer import ChatLogImporter, ImportCheckpoint
+
+        path = self._path("export.txt")
+        synthetic_export(path, 200)
+        importer = ChatLogImporter(self.config, self.queue, workers=1)
+        commits = []
+        original = importer._commit
+
+        def interrupted(*args):
+            if len(commits) == 3:
+                raise KeyboardInterrupt
+            commits.append(args[4])
+            return original(*args)
+
+        importer._commit = interrupted
+        with self.assertRaises(KeyboardInterrupt):
+            importer.import_file(path)
+        queued = self.queue.stats()["pending"]
+        self.assertEqual(ImportCheckpoint(importer.checkpoint.checkpoint_path).position(path), commits[-1])
+
+        resumed = ChatLogImporter(self.config, self.queue, workers=1).import_file(path)
+        self.assertEqual(resumed["resumed_from"], commits[-1])
+        self.assertEqual(resumed["queued"], resumed["parsed"])
+        self.assertEqual(self.queue.stats()["pending"], queued + resumed["queued"])
+
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("2024-06-01 10:00:00 老王\n出 15pm 6k\n")
+        again = ChatLogImporter(self.config, self.queue, workers=1).import_file(path)
+        self.assertEqual((again["resumed_from"], again["queued"]), (0, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+"""
+配置模块测试
+测试配置校验与热加载
+"""
+
+import sys
+import os
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tempfile
+import unittest
+
+
+BASE_CONFIG = (
+    "llm:\n  api_base: http://127.0.0.1:9/v1\n  api_key: test\n  model: mock\n  batch_size: 20\n"
+    "  endpoints:\n    - name: a\n      max_concurrency: 2\n"
+    "wechat:\n  random_delay_min: 1\n  random_delay_max: 3\n"
+    "groups:\n  - 数码群\n"
+)
+
+
+class TestConfigReload(unittest.TestCase):
+    """测试配置校验与热加载"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "config.yaml")
+        self._write(BASE_CONFIG + f"checkpoint:\n  path: {os.path.join(self.tmpdir.name, 'cp.json')}\n")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _write(self, text):
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def _edit(self, old, new):
+        with open(self.path, encoding="utf-8") as f:
+            text = f.read()
+        self.assertIn(old, text)
+        self._write(text.replace(old, new))
+
+    def test_validation_lists_all_errors(self):
+        """测试类型、取值范围与枚举错误一并报告，未知键原样保留"""
+        from src.config import Config, ConfigError
+
+        self._write(
+            "llm:\n  batch_size: 0\n  stream: yes please\n  hedge_after: auto\n  custom: 1\n"
+            "  endpoints:\n    - max_concurrency: two\n"
+            "database:\n  archive_codec: lz4\n"
+            "groups: 数码群\n"
+        )
+        with self.assertRaises(ConfigError) as ctx:
+            Config(self.path)
+        message = str(ctx.exception)
+        for key in ["llm.batch_size", "llm.stream", "llm.endpoints[0].max_concurrency",
+                    "database.archive_codec", "groups"]:
+            self.assertIn(key, message)
+        self.assertNotIn("hedge_after", message)
+
+        self._write("llm:\n  hedge_after: auto\n  timeout: 0.5\n  custom: 1\nwechat:\n  random_delay_min: 5\n"
+                    "  random_delay_max: 3\n")
+        with self.assertRaises(ConfigError):
+            Config(self.path)
+
+    def test_reload_notifies_subscribers(self):
+        """测试只通知订阅了变化项的组件，非法的新配置被拒绝并沿用旧配置"""
+        from src.config import Config
+
+        config = Config(self.path)
+        calls = []
+        config.subscribe(lambda c: calls.append(("groups", c.groups)), ("groups",))
+        config.subscribe(lambda c: calls.append(("wechat", c.wechat)), ("wechat",))
+
+        self._edit("  - 数码群\n", "  - 数码群\n  - 回收群\n")
+        self.assertEqual(config.check_for_changes(), ["groups"])
+        self.assertEqual(calls, [("groups", ["数码群", "回收群"])])
+        self.assertEqual(config.generation, 1)
+        self.assertEqual(config.check_for_changes(), [])
+
+        self._edit("batch_size: 20", "batch_size: -1")
+        self.assertEqual(config.reload(), [])
+        self.assertEqual(config.llm.batch_size, 20)
+        self.assertEqual(config.generation, 1)
+
+    def test_sections_are_typed_with_defaults(self):
+        """测试配置节为补齐默认值的数据类，端点沿用 llm.*，重新加载时整体替换实例"""
+        from src.config import Config, LLMConfig, QueueConfig
+
+        config = Config(self.path)
+        self.assertIsInstance(config.llm, LLMConfig)
+        self.assertEqual((config.llm.batch_size, config.llm.prompt_format), (20, "compact"))
+        self.assertEqual(config.queue, QueueConfig())
+        self.assertEqual(config.reload_interval, 5)
+
+        endpoint = config.llm.endpoints[0]
+        self.assertEqual((endpoint.name, endpoint.model, endpoint.api_key, endpoint.max_concurrency),
+                         ("a", "mock", "test", 2))
+        self.assertEqual(endpoint.max_retries, config.llm.max_retries)
+
+        llm = config.llm
+        self._edit("batch_size: 20", "batch_size: 5")
+        config.reload()
+        self.assertIsNot(config.llm, llm)
+        self.assertEqual((llm.batch_size, config.llm.batch_size), (20, 5))
+
+    def test_live_components_pick_up_changes(self):
+        """测试采集器与 LLM 客户端热加载：保留原端点对象，只更新并发上限并新增端点"""
+        from src.config import Config
+        from src.collector import WeChatCollector
+        from src.processor.processor import LLMClient
+
+        config = Config(self.path)
+        collector = WeChatCollector(config)
+        client = LLMClient(config)
+        endpoint = client.router.endpoints[0]
+        endpoint.record_latency(0.3)
+
+        self._edit("random_delay_max: 3", "random_delay_max: 0.5")
+        self._edit("random_delay_min: 1", "random_delay_min: 0.1")
+        self._edit("  - 数码群\n", "  - 回收群\n")
+        self._edit("batch_size: 20", "batch_size: 5")
+        self._edit("      max_concurrency: 2\n",
+                   "      max_concurrency: 6\n    - name: b\n      api_base: http://127.0.0.1:10/v1\n")
+        changed = config.reload()
+        self.assertIn("llm.endpoints", changed)
+
+        self.assertEqual((collector.delay_min, collector.delay_max, collector.groups), (0.1, 0.5, ["回收群"]))
+        self.assertEqual(client.batch_size, 5)
+        self.assertEqual([e.name for e in client.router.endpoints], ["a", "b"])
+        self.assertIs(client.router.endpoints[0], endpoint)
+        self.assertEqual(endpoint.max_concurrency, 6)
+        self.assertEqual(endpoint.latency_ewma, 0.3)
+        client.router.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
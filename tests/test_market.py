@@ -0,0 +1,214 @@
+"""
+行情模块测试
+测试买卖盘维护与查询
+"""
+
+import sys
+import os
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+
+NOW = datetime(2024, 5, 1, 12, 0, 0)
+
+
+def _make_record(action: str, price: float, minutes_ago: int = 0, group: str = "测试群",
+                 item: str = "iPhone 14", specs: str = "256G 紫色"):
+    """构造测试记录"""
+    from src.processor import TransactionRecord
+
+    return TransactionRecord(
+        action=action,
+        item=item,
+        specs=specs,
+        price=price,
+        quantity=1,
+        raw_text=f"{action} {item} {price}",
+        sender="测试",
+        group=group,
+        message_time="",
+        capture_time=(NOW - timedelta(minutes=minutes_ago)).isoformat()
+    )
+
+
+class TestOrderBook(unittest.TestCase):
+    """测试买卖盘"""
+
+    def test_best_prices_and_spread(self):
+        """测试最优价与价差"""
+        from src.market import OrderBook
+
+        book = OrderBook()
+        for price in (5200, 5000, 5100):
+            book.add(_make_record("SELL", price), now=NOW)
+        for price in (4700, 4900, 4800):
+            book.add(_make_record("BUY", price, specs="紫色 256g"), now=NOW)
+
+        key = book.lookup_key("iphone 14", "256G 紫色")
+        self.assertEqual(book.best_ask(key).price, 5000)
+        self.assertEqual(book.best_bid(key).price, 4900)
+        self.assertEqual(book.spread(key), 100)
+        self.assertEqual([o.price for o in book.top(key, "SELL", 2)], [5000, 5100])
+        self.assertEqual([o.price for o in book.top(key, "BUY", 5)], [4900, 4800, 4700])
+        # top 查询不破坏盘口
+        self.assertEqual(len(book), 6)
+
+    def test_expiry(self):
+        """测试报价过期"""
+        from src.market import OrderBook
+
+        book = OrderBook()
+        book.add(_make_record("SELL", 5000, minutes_ago=60 * 23), now=NOW)
+        book.add(_make_record("SELL", 5300, minutes_ago=10), now=NOW)
+        # 已超出时效的记录不会进入盘口
+        self.assertIsNone(book.add(_make_record("SELL", 4000, minutes_ago=60 * 30), now=NOW))
+
+        key = book.lookup_key("iPhone 14", "256G 紫色")
+        self.assertEqual(book.best_ask(key).price, 5000)
+
+        self.assertEqual(book.expire(NOW + timedelta(hours=2)), 1)
+        self.assertEqual(book.best_ask(key).price, 5300)
+        self.assertIsNone(book.spread(key))
+
+    def test_ignores_flagged_prices(self):
+        """测试忽略异常价格"""
+        from src.market import OrderBook
+
+        record = _make_record("SELL", 50)
+        record.price_flag = "low"
+        self.assertIsNone(OrderBook().add(record, now=NOW))
+
+    def test_rebuild_from_database(self):
+        """测试从数据库重建盘口"""
+        from src.market import OrderBook
+        from src.storage.database import DatabaseManager
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db = DatabaseManager(os.path.join(tmpdir, "market.db"))
+            db.insert_records([
+                _make_record("SELL", 5000),
+                _make_record("BUY", 4800),
+                _make_record("SELL", 3000, minutes_ago=60 * 48),
+            ])
+
+            book = OrderBook()
+            self.assertEqual(book.rebuild(db, now=NOW), 2)
+
+            key = book.lookup_key("iPhone 14", "256G 紫色")
+            self.assertEqual(book.best_ask(key).price, 5000)
+            self.assertIsNotNone(book.best_ask(key).record_id)
+
+
+class TestMatchingEngine(unittest.TestCase):
+    """测试撮合与套利提醒"""
+
+    def test_cross_group_arbitrage(self):
+        """测试跨群套利事件"""
+        from src.market import MatchingEngine
+
+        engine = MatchingEngine()
+        events = engine.process([
+            _make_record("SELL", 5000, group="A群"),
+            _make_record("SELL", 5150, group="C群"),
+            _make_record("BUY", 5100, group="B群"),
+            _make_record("BUY", 4000, group="B群"),
+        ], now=NOW)
+
+        self.assertEqual(len(events), 1)
+        event = events[0]
+        self.assertEqual(event.event_type, "arbitrage")
+        self.assertEqual((event.sell.group, event.buy.group), ("A群", "B群"))
+        self.assertEqual(event.spread, 100)
+
+    def test_thresholds_and_persistence(self):
+        """测试阈值与事件持久化"""
+        from src.market import MatchingEngine
+        from src.storage.database import DatabaseManager
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db = DatabaseManager(os.path.join(tmpdir, "market.db"))
+            engine = MatchingEngine(db=db)
+            engine.min_spread = 200
+
+            seller = _make_record("SELL", 4800, group="B群", specs="256g 紫色")
+            seller.sender = "卖家"
+            records = [
+                _make_record("BUY", 5100, group="B群"),
+                _make_record("SELL", 5000, group="A群"),
+                seller,
+            ]
+            record_ids = db.insert_records(records)
+            engine.process(records, record_ids, now=NOW)
+
+            events = db.query_events()
+            self.assertEqual(len(events), 1)
+            self.assertEqual(events[0]["event_type"], "match")
+            self.assertEqual(events[0]["sell_price"], 4800)
+            self.assertEqual((events[0]["buy_record_id"], events[0]["sell_record_id"]),
+                             (record_ids[0], record_ids[2]))
+
+    def test_staged_batch_commit_and_rollback(self):
+        """测试流式批次：到达即撮合，提交后回填记录 ID，失败时撤回报价"""
+        from src.market import MatchingEngine
+
+        engine = MatchingEngine()
+        failed = engine.stage(now=NOW)
+        failed.add(_make_record("SELL", 4000, group="A群"))
+        failed.rollback()
+        self.assertEqual(len(engine.order_book), 0)
+
+        staged = engine.stage(now=NOW)
+        staged.add(_make_record("SELL", 5000, group="A群"))
+        self.assertEqual(len(staged.add(_make_record("BUY", 5200, group="B群"))), 1)
+        events = staged.commit([11, 12])
+
+        self.assertEqual(len(events), 1)
+        self.assertEqual((events[0].sell.record_id, events[0].buy.record_id), (11, 12))
+        self.assertEqual(len(engine.order_book), 2)
+
+    def test_webhook_push(self):
+        """测试推送到本地 webhook"""
+        import json
+        import threading
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+        from src.market import MatchingEngine, WebhookNotifier
+
+        received = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers["Content-Length"])
+                received.append(json.loads(self.rfile.read(length)))
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(("127.0.0.1", 0), Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            engine = MatchingEngine()
+            engine.notifier = WebhookNotifier(f"http://127.0.0.1:{server.server_port}/events")
+            engine.process([
+                _make_record("SELL", 5000, group="A群"),
+                _make_record("BUY", 5200, group="B群"),
+            ], now=NOW)
+            engine.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(len(received), 1)
+        self.assertEqual(received[0]["event_type"], "arbitrage")
+        self.assertEqual(received[0]["sell"]["price"], 5000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -75,6 +75,60 @@ class TestQuantityParsing(unittest.TestCase):
         self.assertEqual(client._parse_quantity("一台"), 1)
 
 
+class TestBatchNormalization(unittest.TestCase):
+    """测试价格与数量规范化"""
+
+    def test_chinese_numerals_and_units(self):
+        """测试中文数字、混合写法与口语省略单位"""
+        from src.processor.normalize import parse_price
+
+        cases = {
+            "五千八": 5800, "1万2": 12000, "一千零五": 1005, "一点五万": 15000, "5.8千": 5800,
+            "1.15w": 11500, "¥5,800元": 5800, "5800/台": 5800, "6000左右": 6000, "两万": 20000,
+            "1亿2000万": 120000000, "十二": 12, "1万零5": 10005, "一万零五百": 10500, "3千零50": 3050,
+            "十": 10, "十万": 100000, "十元": 10, "一十万": 100000,
+        }
+        for text, expected in cases.items():
+            self.assertEqual(parse_price(text), expected, text)
+        for text in ["5800-6000", "暂无", "k", "", None, True]:
+            self.assertIsNone(parse_price(text), repr(text))
+
+    def test_quantity_grammar(self):
+        """测试数量的单位、前缀与默认值"""
+        from src.processor.normalize import parse_quantity
+
+        cases = {"三台": 3, "十二个": 12, "十台": 10, "x3": 3, "×3": 3, "共5台": 5, "两台以上": 2, 4.0: 4}
+        for value, expected in cases.items():
+            self.assertEqual(parse_quantity(value), expected, value)
+        self.assertEqual(parse_quantity("若干"), 1)
+        self.assertEqual(parse_quantity("0"), 1)
+        self.assertIsNone(parse_quantity("1.5", default=None))
+        self.assertEqual(parse_quantity("十台", default=None), 10)
+
+    def test_column_normalization(self):
+        """测试整列批量解析：混合列与数值数组"""
+        import numpy as np
+        from src.processor.normalize import normalize_prices, normalize_quantities
+
+        prices = normalize_prices(["5.8k", 5800, "五千八", "暂无", None])
+        self.assertEqual(prices.dtype, np.float64)
+        self.assertEqual(prices[:3].tolist(), [5800.0] * 3)
+        self.assertTrue(np.isnan(prices[3:]).all())
+        self.assertEqual(normalize_prices(np.array([1, 2], dtype=np.int32)).tolist(), [1.0, 2.0])
+
+        quantities = normalize_quantities(["三台", 2, "若干"], default=1)
+        self.assertEqual(quantities.dtype, np.int64)
+        self.assertEqual(quantities.tolist(), [3, 2, 1])
+
+    def test_schema_accepts_written_numbers(self):
+        """测试响应模式校验接受中文数字价格与带单位数量"""
+        from src.processor.parser import validate_record
+
+        record, error = validate_record({"action": "SELL", "item": "iPhone 14", "price": "5.8千", "quantity": "三台"})
+        self.assertIsNone(error)
+        self.assertEqual((record["price"], record["quantity"]), ("5.8千", 3))
+
+
 class TestTransactionRecord(unittest.TestCase):
     """测试交易记录"""
 
@@ -101,6 +155,794 @@ class TestTransactionRecord(unittest.TestCase):
         self.assertEqual(data["item"], "iPhone 14 Pro Max")
         self.assertEqual(data["price"], 5800)
 
+    def test_compact_representation(self):
+        """测试记录与消息没有实例字典，重复字符串共享同一对象"""
+        from src.collector import Message
+        from src.processor import TransactionRecord
+
+        group = "".join(["测试", "群"])
+        first = TransactionRecord("SELL", "iPhone 14", "", 5800, 1, "出14", sender="老王", group=group)
+        second = TransactionRecord("BUY", "iPhone 14", "", 5700, 1, "收14", sender="老王", group="测试群")
+        self.assertFalse(hasattr(first, "__dict__"))
+        self.assertIs(first.group, second.group)
+
+        message = Message("老王", "10:00", "出14", group)
+        self.assertFalse(hasattr(message, "__dict__"))
+        self.assertIs(message.group, second.group)
+
+    def test_row_adapter_matches_db_dict(self):
+        """测试元组行适配器与 to_db_dict 取值一致"""
+        from src.processor import TransactionRecord
+        from src.processor.processor import row_adapter
+
+        record = TransactionRecord("SELL", "iPhone 14", "256G", 5800, 2, "出14", sender="老王", group="测试群",
+                                   message_time="10:00", capture_time="2024-01-01T10:00:00", price_flag="high")
+        columns = ("group_name", "item_category", "price", "price_flag")
+        data = record.to_db_dict()
+        self.assertEqual(row_adapter(columns)(record), tuple(data[column] for column in columns))
+        self.assertEqual(row_adapter(("price",))(record), (5800,))
+
+
+class TestRecordBatch(unittest.TestCase):
+    """测试列式记录批"""
+
+    def _records(self):
+        from src.processor import TransactionRecord
+
+        return [
+            TransactionRecord("SELL" if i % 2 else "BUY", f"iPhone {i % 3}", "256G", 5000.0 + i, i % 4 + 1,
+                              f"消息 {i}", sender="老王", group="测试群", message_time="10:00", cluster_id=f"c{i % 2}")
+            for i in range(10)
+        ]
+
+    def test_round_trip(self):
+        """测试按列存储后还原的记录与原记录一致"""
+        from src.processor import RecordBatch
+
+        records = self._records()
+        batch = RecordBatch.from_records(records)
+        self.assertEqual(len(batch), 10)
+        self.assertEqual(list(batch), records)
+        self.assertEqual(batch.column("price").typecode, "d")
+        self.assertEqual(batch.column("price")[3], 5003.0)
+
+    def test_db_rows_and_frame(self):
+        """测试直接按列生成数据库行与 DataFrame"""
+        from src.processor import RecordBatch
+        from src.processor.processor import row_adapter
+
+        records = self._records()
+        batch = RecordBatch.from_records(records)
+        columns = ("action", "item_category", "price", "quantity", "group_name")
+        self.assertEqual(list(batch.db_rows(columns)), [row_adapter(columns)(r) for r in records])
+
+        frame = batch.to_frame({"price": "价格"}, ["item", "price"])
+        self.assertEqual(list(frame.columns), ["item", "价格"])
+        self.assertEqual(frame["价格"].sum(), sum(r.price for r in records))
+
+
+class TestPriceAnomalyDetector(unittest.TestCase):
+    """测试价格异常检测"""
+
+    def test_flags_scale_errors(self):
+        """测试量级错误被标记"""
+        from src.processor.anomaly import PriceAnomalyDetector, FLAG_LOW, FLAG_HIGH, FLAG_INVALID
+
+        detector = PriceAnomalyDetector()
+        detector.warm_up(["iPhone 14 Pro Max"] * 20, [5600 + 20 * i for i in range(20)])
+
+        flags, scores = detector.detect(
+            ["iphone14promax", "iPhone 14 Pro Max", "iPhone 14 Pro Max", "iPhone 14 Pro Max", "未知商品"],
+            [5800, 58, 58000, 0, 58]
+        )
+
+        self.assertEqual(flags.tolist(), ["", FLAG_LOW, FLAG_HIGH, FLAG_INVALID, ""])
+        self.assertLess(scores[1], -3.5)
+
+    def test_bulk_batch_without_history(self):
+        """测试无历史时按批次内分布判断"""
+        import numpy as np
+        from src.processor.anomaly import PriceAnomalyDetector
+
+        rng = np.random.default_rng(0)
+        prices = rng.normal(3000, 100, 10000)
+        prices[::1000] /= 100
+        items = np.where(np.arange(10000) % 2, "iPhone 13", "iPhone 12")
+
+        detector = PriceAnomalyDetector()
+        flags, _ = detector.detect(items, prices)
+
+        self.assertEqual(set(np.flatnonzero(flags != "")), set(range(0, 10000, 1000)))
+        self.assertIn("iphone13", detector.history)
+
+
+class TestNearDuplicateDetector(unittest.TestCase):
+    """测试近似重复报价聚类"""
+
+    def test_cross_posted_offers_share_cluster(self):
+        """测试跨群转发的相同报价归入同一聚类"""
+        from src.processor.dedup import NearDuplicateDetector
+
+        detector = NearDuplicateDetector()
+        texts = [
+            "出两台14pm 256 紫色 电池90 5800到付",
+            "出两台 14pm 256紫色 电池90，5800到付!!",
+            "出两台14pm 256 紫色 电池90 5800到付 🔥",
+            "出两台14pm 256 紫色 电池90 5800到付",
+            "收一台iPhone 13 256G 预算3000",
+        ]
+        ids = detector.assign(
+            texts,
+            ["老王", "老王", "老王", "老李", "老王"],
+            ["iPhone 14 Pro Max"] * 4 + ["iPhone 13"],
+            [5800, 5800, 5800, 5800, 3000],
+            ["2024-05-01T12:00:00", "2024-05-01T12:01:00", "2024-05-02T09:00:00",
+             "2024-05-01T12:00:00", "2024-05-01T12:00:00"],
+        )
+
+        self.assertEqual(ids[0], ids[1])
+        self.assertEqual(ids[0], ids[2])
+        # 不同发送者、不同商品不合并
+        self.assertNotEqual(ids[0], ids[3])
+        self.assertNotEqual(ids[0], ids[4])
+
+    def test_price_change_breaks_cluster(self):
+        """测试改价后的报价视为新报价"""
+        from src.processor.dedup import NearDuplicateDetector
+
+        detector = NearDuplicateDetector()
+        ids = detector.assign(
+            ["出14pm 256 紫色 5800", "出14pm 256 紫色 5500"],
+            ["老王", "老王"],
+            ["iPhone 14 Pro Max", "iPhone 14 Pro Max"],
+            [5800, 5500],
+            ["2024-05-01T12:00:00", "2024-05-01T13:00:00"],
+        )
+        self.assertNotEqual(ids[0], ids[1])
+
+    def test_offers_from_one_message_get_separate_clusters(self):
+        """测试同一条消息中的多条报价各自成簇，重发时分别计为重复"""
+        from src.processor import TransactionRecord
+        from src.processor.dedup import NearDuplicateDetector
+
+        def records(capture_time):
+            text = "出 Mate60Pro 5500，P60 3200"
+            return [
+                TransactionRecord(action="SELL", item=item, specs="", price=price, quantity=1,
+                                  raw_text=text, sender="老王", group="数码群", capture_time=capture_time)
+                for item, price in (("Mate60 Pro", 5500), ("P60", 3200))
+            ]
+
+        detector = NearDuplicateDetector()
+        first = records("2024-05-01T12:00:00")
+        self.assertEqual(detector.check_records(first), 0)
+        self.assertNotEqual(first[0].cluster_id, first[1].cluster_id)
+
+        repost = records("2024-05-01T15:00:00")
+        self.assertEqual(detector.check_records(repost), 2)
+        self.assertEqual([r.cluster_id for r in repost], [r.cluster_id for r in first])
+
+
+class _MockLLMServer:
+    """
+    本地 OpenAI 兼容桩服务，可注入故障
+
+    faults 中的每一项依次作用于一次请求：
+    ("status", code, headers) 返回错误状态码，("delay", seconds) 延迟后正常响应；
+    faults 用完后每次请求都应用 default。
+    用户消息中含 BAD 的批次（garbage=True 时为所有批次）返回无法解析的文本。
+    stream=True 的请求按 SSE 分块返回，每块间隔 chunk_delay 秒；
+    ("cut", n) 在发送 n 块后断开连接。
+    """
+
+    def __init__(self, faults=None, default=None, garbage=False, chunk_delay=0.0):
+        import json
+        import threading
+        import time
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        self.faults = list(faults or [])
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers["Content-Length"])
+                body = json.loads(self.rfile.read(length))
+                server.requests += 1
+                fault = server.faults.pop(0) if server.faults else default
+
+                if fault and fault[0] == "status":
+                    self.send_response(fault[1])
+                    for name, value in fault[2].items():
+                        self.send_header(name, value)
+                    self.send_header("Content-Type", "application/json")
+                    self.end_headers()
+                    self.wfile.write(b'{"error": {"message": "injected"}}')
+                    return
+                if fault and fault[0] == "delay":
+                    time.sleep(fault[1])
+
+                # 跳过紧凑格式的发送者代号行，每条消息行 "编号 代号: 内容"
+                lines = [line for line in body["messages"][-1]["content"].splitlines()
+                         if not line.startswith("#")]
+                if garbage or any("BAD" in line for line in lines):
+                    content = "抱歉，我无法处理"
+                else:
+                    content = json.dumps([
+                        {"id": int(line.split(" ", 1)[0]), "action": "SELL", "item": line.split(": ", 1)[1],
+                         "specs": "", "price": 5000, "quantity": 1}
+                        for line in lines
+                    ], ensure_ascii=False)
+                if body.get("stream"):
+                    self._stream(content, body["model"], fault)
+                    return
+
+                payload = json.dumps({
+                    "id": "mock", "object": "chat.completion", "created": 0, "model": body["model"],
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": content}}],
+                }).encode("utf-8")
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def _stream(self, content, model, fault):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                pieces = [content[i:i + 16] for i in range(0, len(content), 16)]
+                for index, piece in enumerate(pieces):
+                    if fault and fault[0] == "cut" and index == fault[1]:
+                        self.wfile.write(b"data: {broken")
+                        self.wfile.flush()
+                        self.connection.shutdown(2)
+                        return
+                    chunk = {"id": "mock", "object": "chat.completion.chunk", "created": 0, "model": model,
+                             "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(chunk_delay)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _make_llm_config(tmpdir: str, api_base: str, extra: str = ""):
+    """生成指向桩服务的 LLM 配置"""
+    from src.config import Config
+
+    path = os.path.join(tmpdir, "config.yaml")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(
+            f"llm:\n  api_base: {api_base}\n  api_key: test\n  model: mock\n"
+            f"  timeout: 0.5\n  retry_base_delay: 0.01\n  max_retries: 3\n" + extra
+        )
+    return Config(path)
+
+
+def _messages(*contents):
+    from src.collector import Message
+
+    return [Message(sender="老王", time="10:00", content=content, group="测试群") for content in contents]
+
+
+class TestLLMResilience(unittest.TestCase):
+    """测试 LLM 调用容错（本地故障注入桩服务）"""
+
+    def setUp(self):
+        import tempfile
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _client(self, server, extra: str = ""):
+        from src.processor import LLMClient
+
+        return LLMClient(_make_llm_config(self.tmpdir.name, server.url, extra))
+
+    def test_retries_rate_limit_and_server_errors(self):
+        """测试 429 (Retry-After) 与 5xx 后重试成功"""
+        server = _MockLLMServer([
+            ("status", 429, {"Retry-After": "0.05"}),
+            ("status", 503, {}),
+        ])
+        try:
+            client = self._client(server)
+            records = client.extract_batch(_messages("出14pm", "收13"))
+        finally:
+            server.close()
+
+        self.assertEqual(len(records), 2)
+        self.assertEqual(server.requests, 3)
+        self.assertEqual(client.router.primary.resilience.stats["retries"], 2)
+
+    def test_retries_timeout(self):
+        """测试超时后重试"""
+        server = _MockLLMServer([("delay", 1.0)])
+        try:
+            client = self._client(server)
+            records = client.extract_batch(_messages("出14pm"))
+        finally:
+            server.close()
+
+        self.assertEqual(len(records), 1)
+        self.assertEqual(server.requests, 2)
+
+    def test_bisects_unparseable_batch(self):
+        """测试二分重试只丢弃无法解析的消息"""
+        server = _MockLLMServer()
+        try:
+            client = self._client(server)
+            failed = []
+            records = client.extract_batch(_messages("出14pm", "出13", "BAD", "收12"), failed)
+        finally:
+            server.close()
+
+        self.assertEqual(len(records), 3)
+        self.assertEqual([msg.content for msg in failed], ["BAD"])
+
+    def test_circuit_breaker_opens(self):
+        """测试连续失败后熔断，不再请求服务"""
+        import openai
+        from src.processor.resilience import CircuitOpenError
+
+        server = _MockLLMServer([("status", 500, {})] * 10)
+        try:
+            client = self._client(server, "  max_retries: 1\n  circuit_threshold: 2\n")
+            with self.assertRaises(openai.InternalServerError):
+                client.extract_batch(_messages("出14pm"))
+            with self.assertRaises(CircuitOpenError):
+                client.extract_batch(_messages("出14pm"))
+        finally:
+            server.close()
+
+        self.assertEqual(server.requests, 2)
+        self.assertEqual(client.process_batch(_messages("出14pm")), [])
+
+    def test_token_bucket_throttles(self):
+        """测试令牌桶限流"""
+        import time
+        from src.processor.resilience import TokenBucket
+
+        bucket = TokenBucket(per_minute=600, capacity=1)
+        start = time.monotonic()
+        for _ in range(3):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+
+
+class TestLLMRouter(unittest.TestCase):
+    """测试多端点路由（多个本地桩服务）"""
+
+    def setUp(self):
+        import tempfile
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.close()
+        self.tmpdir.cleanup()
+
+    def _server(self, **kwargs):
+        server = _MockLLMServer(**kwargs)
+        self.servers.append(server)
+        return server
+
+    def _client(self, endpoints, extra: str = ""):
+        from src.processor import LLMClient
+
+        lines = "  endpoints:\n"
+        for name, server, settings in endpoints:
+            lines += f"    - name: {name}\n      api_base: {server.url}\n      model: {name}-model\n"
+            lines += "".join(f"      {key}: {value}\n" for key, value in settings.items())
+        return LLMClient(_make_llm_config(self.tmpdir.name, "http://unused/v1", lines + extra))
+
+    def _stats(self, client):
+        return {row["name"]: row for row in client.router.stats()}
+
+    def test_fails_over_from_broken_endpoint(self):
+        """测试端点故障时切换到其他端点"""
+        broken = self._server(default=("status", 503, {}))
+        healthy = self._server()
+        client = self._client([
+            ("broken", broken, {"weight": 10, "max_retries": 0, "circuit_threshold": 1}),
+            ("healthy", healthy, {}),
+        ])
+
+        for _ in range(3):
+            self.assertEqual(len(client.extract_batch(_messages("出14pm"))), 1)
+
+        stats = self._stats(client)
+        self.assertEqual(stats["broken"]["failures"], 1)
+        self.assertEqual(stats["broken"]["circuit"], "open")
+        self.assertEqual(stats["healthy"]["successes"], 3)
+
+    def test_hedges_slow_endpoint(self):
+        """测试慢端点超过对冲阈值后由另一端点先返回"""
+        import time
+
+        slow = self._server(default=("delay", 1.0))
+        fast = self._server()
+        client = self._client(
+            [("slow", slow, {"weight": 10, "timeout": 5}), ("fast", fast, {})],
+            "  hedge_after: 0.1\n"
+        )
+
+        start = time.monotonic()
+        records = client.extract_batch(_messages("出14pm"))
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(len(records), 1)
+        self.assertLess(elapsed, 0.8)
+        stats = self._stats(client)
+        self.assertEqual(stats["fast"]["hedged"], 1)
+        self.assertEqual(stats["fast"]["hedge_wins"], 1)
+
+    def test_falls_back_to_strong_model(self):
+        """测试低成本模型输出无法解析时升级到强模型"""
+        cheap = self._server(garbage=True)
+        strong = self._server()
+        client = self._client([
+            ("cheap", cheap, {"tier": 0, "cost": 0.1}),
+            ("strong", strong, {"tier": 1, "cost": 2.0}),
+        ])
+
+        failed = []
+        records = client.extract_batch(_messages("出14pm", "收13"), failed)
+
+        self.assertEqual(len(records), 2)
+        self.assertEqual(failed, [])
+        stats = self._stats(client)
+        self.assertEqual(stats["cheap"]["successes"], 1)
+        self.assertEqual(stats["strong"]["successes"], 1)
+        self.assertGreater(stats["strong"]["cost"], stats["cheap"]["cost"])
+
+    def test_spreads_concurrent_load(self):
+        """测试并发请求按负载分散到多个端点"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        first = self._server(default=("delay", 0.2))
+        second = self._server(default=("delay", 0.2))
+        client = self._client([
+            ("first", first, {"max_concurrency": 2}),
+            ("second", second, {"max_concurrency": 2}),
+        ])
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(lambda i: client.extract_batch(_messages(f"出{i}")), range(4)))
+
+        self.assertTrue(all(len(records) == 1 for records in results))
+        self.assertEqual(first.requests, 2)
+        self.assertEqual(second.requests, 2)
+
+
+class TestResponseParser(unittest.TestCase):
+    """测试增量响应解析与模式校验"""
+
+    def test_emits_records_as_objects_close(self):
+        """测试逐块喂入时对象闭合即产出记录"""
+        from src.processor.parser import StreamingRecordParser
+
+        response = (
+            '好的，结果如下 [14:02]:\n[\n'
+            '  {"action": "sell", "item": "iPhone 14 Pro Max", "specs": "256G {紫色} \\"国行\\"", '
+            '"price": 5800, "quantity": 2},\n'
+            '  {"action": "BUY", "item": "iPhone 13", "price": "3.2k"}\n]'
+        )
+        parser = StreamingRecordParser()
+        emitted_at = []
+        for i, char in enumerate(response):
+            for record in parser.feed(char):
+                emitted_at.append((i, record))
+
+        self.assertEqual(len(emitted_at), 2)
+        # 第一条记录在第一个对象闭合时就已产出
+        self.assertEqual(response[emitted_at[0][0]], "}")
+        self.assertLess(emitted_at[0][0], response.index("iPhone 13"))
+        first = emitted_at[0][1]
+        self.assertEqual(first["action"], "SELL")
+        self.assertEqual(first["specs"], '256G {紫色} "国行"')
+        self.assertEqual(emitted_at[1][1]["quantity"], 1)
+        self.assertTrue(parser.complete)
+
+    def test_rejects_invalid_records(self):
+        """测试不合法记录被拒绝并给出原因"""
+        from src.processor.parser import parse_records
+
+        parser = parse_records(
+            '[{"action": "SWAP", "item": "a", "price": 1},'
+            ' {"action": "SELL", "item": "b", "price": "面议"},'
+            ' {"action": "SELL", "price": 100},'
+            ' {"action": "BUY", "item": "c", "price": 100, "quantity": 1.5},'
+            ' {"action": "BUY", "item": "d", "price": 100, "quantity": "3"}]'
+        )
+
+        self.assertEqual([r["item"] for r in parser.records], ["d"])
+        self.assertEqual(parser.records[0]["quantity"], 3)
+        reasons = [reject.reason for reject in parser.rejects]
+        self.assertEqual(len(reasons), 4)
+        self.assertIn("action", reasons[0])
+        self.assertIn("price", reasons[1])
+        self.assertIn("缺少字段 item", reasons[2])
+        self.assertIn("quantity", reasons[3])
+
+    def test_wrapped_and_truncated_responses(self):
+        """测试包装对象、空数组与被截断的响应"""
+        from src.processor.parser import parse_records
+
+        wrapped = parse_records('{"results": [{"action": "SELL", "item": "x", "price": 1}]}')
+        self.assertEqual(len(wrapped.records), 1)
+        self.assertTrue(parse_records("没有交易信息：[]").complete)
+
+        truncated = parse_records('[{"action": "SELL", "item": "x", "price": 1}, {"action": "SE')
+        self.assertEqual(len(truncated.records), 1)
+        self.assertFalse(truncated.complete)
+        self.assertFalse(parse_records("抱歉，我无法处理").complete)
+
+
+class TestLLMStreaming(unittest.TestCase):
+    """测试流式响应"""
+
+    def setUp(self):
+        import tempfile
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _client(self, server, stream: bool = True):
+        from src.processor import LLMClient
+
+        extra = "  stream: true\n" if stream else ""
+        return LLMClient(_make_llm_config(self.tmpdir.name, server.url, extra))
+
+    def test_first_record_before_response_completes(self):
+        """测试首条记录在完整响应之前产出，并记录首条记录耗时"""
+        import time
+        from src.metrics import metrics
+
+        metrics.reset()
+        server = _MockLLMServer(chunk_delay=0.02)
+        try:
+            client = self._client(server)
+            start = time.monotonic()
+            arrivals = []
+            for record in client.iter_batch(_messages("出14pm", "收13", "出12", "出11")):
+                arrivals.append((time.monotonic() - start, record.item))
+        finally:
+            server.close()
+
+        self.assertEqual([item for _, item in arrivals], ["出14pm", "收13", "出12", "出11"])
+        self.assertLess(arrivals[0][0], arrivals[-1][0] / 2)
+        ttfr = metrics.histogram("llm_time_to_first_record_seconds")
+        self.assertEqual(ttfr["count"], 1)
+        self.assertLess(ttfr["p50"], metrics.histogram("llm_batch_seconds")["p50"])
+
+    def test_stream_matches_blocking_result(self):
+        """测试流式与非流式解析结果一致"""
+        server = _MockLLMServer()
+        try:
+            streamed = self._client(server).extract_batch(_messages("出14pm", "收13"))
+            blocking = self._client(server, stream=False).extract_batch(_messages("出14pm", "收13"))
+        finally:
+            server.close()
+
+        self.assertEqual([r.to_dict()["item"] for r in streamed], [r.to_dict()["item"] for r in blocking])
+
+    def test_interrupted_stream_is_not_retried(self):
+        """测试已输出部分内容后中断的流不重试，整批报错"""
+        from src.processor.resilience import StreamInterruptedError
+
+        server = _MockLLMServer([("cut", 8)])
+        try:
+            client = self._client(server)
+            with self.assertRaises(StreamInterruptedError):
+                client.extract_batch(_messages("出14pm", "收13", "出12"))
+        finally:
+            server.close()
+
+        self.assertEqual(server.requests, 1)
+
+    def test_failed_stream_falls_back_to_bisect(self):
+        """测试流式整批失败后二分重试，只丢弃无法解析的消息"""
+        from src.processor.resilience import ResponseFormatError
+
+        messages = _messages("出14pm", "出13", "BAD", "收12")
+        server = _MockLLMServer()
+        try:
+            client = self._client(server)
+            with self.assertRaises(ResponseFormatError) as caught:
+                list(client.iter_batch(messages))
+            failed = []
+            records = client.bisect_batch(messages, caught.exception, failed)
+        finally:
+            server.close()
+
+        self.assertEqual(len(records), 3)
+        self.assertEqual([msg.content for msg in failed], ["BAD"])
+
+
+def _load_labeled():
+    """标注样本：每条消息及其应提取出的记录"""
+    import json
+    from src.collector import Message
+
+    path = os.path.join(os.path.dirname(__file__), "fixtures", "labeled_messages.json")
+    with open(path, encoding="utf-8") as f:
+        samples = json.load(f)
+    messages = [Message(sender=s["sender"], time=s["time"], content=s["content"], group="测试群") for s in samples]
+    return messages, [s["records"] for s in samples]
+
+
+class _LabeledCompletions:
+    """按标注样本作答的 chat.completions，校验紧凑编码能否把记录对应回来源消息"""
+
+    def __init__(self, messages, labels):
+        from src.processor.prompt import compact_text
+
+        self.answers = {compact_text(m.content): records for m, records in zip(messages, labels)}
+
+    def create(self, model, messages, **kwargs):
+        import json
+        from types import SimpleNamespace
+
+        results = []
+        for line in messages[-1]["content"].splitlines():
+            if line.startswith("#"):
+                continue
+            head, content = line.split(": ", 1)
+            number = int(head.split(" ", 1)[0])
+            results.extend({"id": number, **record} for record in self.answers[content])
+        content = json.dumps(results, ensure_ascii=False)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+
+class TestPromptBuilder(unittest.TestCase):
+    """测试提示词紧凑编码（标注样本）"""
+
+    def test_compact_input_uses_fewer_tokens(self):
+        """测试紧凑编码显著减少输入 Token"""
+        from src.processor.prompt import PromptBuilder, estimate_tokens
+
+        messages, _ = _load_labeled()
+        compact = estimate_tokens(PromptBuilder("compact").build(messages))
+        verbose = estimate_tokens(PromptBuilder("verbose").build(messages))
+        self.assertLess(compact, verbose * 0.7)
+
+    def test_compaction_keeps_trade_details(self):
+        """测试去除 Emoji 与空白后价格、数量、型号等数字信息不变，交易消息不会被清空"""
+        import re
+        from src.processor.prompt import compact_text
+
+        numbers = re.compile(r"\d+(?:\.\d+)?[kKwW]?")
+        messages, labels = _load_labeled()
+        for message, records in zip(messages, labels):
+            compacted = compact_text(message.content)
+            self.assertEqual(numbers.findall(compacted), numbers.findall(message.content))
+            self.assertNotIn("\n", compacted)
+            if records:
+                self.assertTrue(compacted)
+
+    def test_sender_aliases_are_stable_within_batch(self):
+        """测试同一发送者在批内共用代号，空消息不发送但编号保持不变"""
+        from src.processor.prompt import PromptBuilder
+
+        text = PromptBuilder().build(_messages("出14pm 5800", "👍👍", "收13 4k"))
+        lines = text.splitlines()
+        self.assertEqual(lines[0], "#发送者 A=老王")
+        self.assertEqual(lines[1:], ["1 A: 出14pm 5800", "3 A: 收13 4k"])
+
+    def test_records_attributed_to_source_message(self):
+        """测试记录按编号归属到各自的来源消息"""
+        import tempfile
+        from src.processor import LLMClient
+
+        messages, labels = _load_labeled()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            client = LLMClient(_make_llm_config(tmpdir, "http://127.0.0.1:9/v1"))
+            fake = type("FakeClient", (), {})()
+            fake.chat = type("FakeChat", (), {})()
+            fake.chat.completions = _LabeledCompletions(messages, labels)
+            client.router.primary.client = fake
+            records = client.extract_batch(messages)
+
+        expected = [
+            (message.sender, message.content, record["item"], record["price"])
+            for message, message_records in zip(messages, labels) for record in message_records
+        ]
+        self.assertEqual([(r.sender, r.raw_text, r.item, r.price) for r in records], expected)
+
+
+class TestBenchmark(unittest.TestCase):
+    """测试解析质量基准"""
+
+    CORPUS = os.path.join(os.path.dirname(os.path.dirname(__file__)), "benchmarks", "golden_corpus.jsonl")
+
+    def setUp(self):
+        import tempfile
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_score_by_field(self):
+        """测试字段级准确率/召回率：价格错误只影响价格与记录级，漏提取影响召回率"""
+        from src.collector import Message
+        from src.processor.benchmark import CorpusMessage, score
+
+        gold = [
+            {"action": "SELL", "item": "iPhone 14 Pro Max", "specs": "256G 紫色", "price": 5800, "quantity": 2},
+            {"action": "BUY", "item": "iPhone 13", "specs": "128G", "price": 4000, "quantity": 1},
+        ]
+        corpus = [CorpusMessage("m1", Message("老王", "10:00", "出14pm 收13"), gold)]
+        predicted = [
+            {"action": "SELL", "item": "iphone14promax", "specs": "紫色 256g", "price": 5000, "quantity": 2},
+        ]
+
+        report = score(corpus, {"m1": predicted})
+        self.assertEqual(report["fields"]["item"]["precision"], 1.0)
+        self.assertEqual(report["fields"]["item"]["recall"], 0.5)
+        self.assertEqual(report["fields"]["specs"]["precision"], 1.0)
+        self.assertEqual(report["fields"]["price"]["precision"], 0.0)
+        self.assertEqual(report["records"]["precision"], 0.0)
+
+    def test_stub_run(self):
+        """测试本地桩：紧凑格式下所有字段完全正确，并报告 Token 与成本"""
+        from src.processor.benchmark import run_benchmark
+
+        config = _make_llm_config(self.tmpdir.name, "http://127.0.0.1:9/v1", "  cost: 0.002\n")
+        report = run_benchmark(config, self.CORPUS, stub_latency=0.0)
+
+        self.assertGreater(report["expected"], 100)
+        self.assertEqual(report["records"]["precision"], 1.0)
+        self.assertEqual(report["records"]["recall"], 1.0)
+        self.assertGreater(report["tokens"]["input"], 0)
+        self.assertGreater(report["cost_per_1k_messages"], 0)
+
+    def test_record_then_replay(self):
+        """测试录制后离线回放得到相同结果，缺少录制的批次计为失败"""
+        from src.processor.benchmark import run_benchmark
+
+        responses = os.path.join(self.tmpdir.name, "responses.jsonl")
+        server = _MockLLMServer()
+        try:
+            config = _make_llm_config(self.tmpdir.name, server.url)
+            recorded = run_benchmark(config, self.CORPUS, responses=responses, record=True, limit=30)
+        finally:
+            server.close()
+        self.assertEqual(server.requests, recorded["calls"])
+
+        config = _make_llm_config(self.tmpdir.name, "http://127.0.0.1:9/v1")
+        replayed = run_benchmark(config, self.CORPUS, responses=responses, limit=30)
+        self.assertEqual(replayed["errors"], 0)
+        self.assertEqual(replayed["predicted"], recorded["predicted"])
+        self.assertEqual(replayed["fields"], recorded["fields"])
+
+        missing = run_benchmark(config, self.CORPUS, responses=responses, limit=60)
+        self.assertGreater(missing["errors"], 0)
+
 
 class TestDatabaseSchema(unittest.TestCase):
     """测试数据库"""
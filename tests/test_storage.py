@@ -0,0 +1,834 @@
+"""
+存储模块测试
+测试数据库查询、分页等功能
+"""
+
+import sys
+import os
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tempfile
+import unittest
+
+
+def _make_record(index: int, group: str = "测试群", action: str = "SELL"):
+    """构造测试记录"""
+    from src.processor import TransactionRecord
+
+    return TransactionRecord(
+        action=action,
+        item="iPhone 14",
+        specs="256G",
+        price=5000 + index,
+        quantity=1,
+        raw_text=f"出iPhone 14 {index}",
+        sender="测试",
+        group=group,
+        message_time=f"2024-01-01 10:{index % 60:02d}",
+        capture_time=f"2024-01-01T12:00:{index % 5:02d}"
+    )
+
+
+class TestKeysetPagination(unittest.TestCase):
+    """测试键集分页查询"""
+
+    def setUp(self):
+        from src.storage.database import DatabaseManager
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.tmpdir.name, "market.db"))
+        self.db.insert_records([_make_record(i) for i in range(23)])
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_iterates_all_pages_in_order(self):
+        """测试跨页遍历顺序"""
+        rows = list(self.db.iter_records(page_size=4))
+        keys = [(row["capture_time"], row["id"]) for row in rows]
+
+        self.assertEqual(len(rows), 23)
+        self.assertEqual(keys, sorted(keys, reverse=True))
+        self.assertEqual(len(set(keys)), 23)
+
+    def test_ascending_and_resume_after_cursor(self):
+        """测试正序遍历与游标续读"""
+        rows = list(self.db.iter_records(page_size=5, descending=False))
+        cursor = (rows[9]["capture_time"], rows[9]["id"])
+
+        resumed = list(self.db.iter_records(after=cursor, page_size=5, descending=False))
+        self.assertEqual([r["id"] for r in resumed], [r["id"] for r in rows[10:]])
+
+    def test_column_projection(self):
+        """测试列投影不读取 raw_text"""
+        row = next(self.db.iter_records(columns=["price"]))
+
+        self.assertNotIn("raw_text", row)
+        self.assertIn("price", row)
+        self.assertIn("id", row)
+
+        with self.assertRaises(ValueError):
+            list(self.db.iter_records(columns=["price; DROP TABLE market_data"]))
+
+    def test_statistics_exclude_flagged_prices(self):
+        """测试平均价格排除异常标记"""
+        record = _make_record(0)
+        record.price = 50
+        record.price_flag = "low"
+        self.db.insert_records([record])
+
+        stats = self.db.get_statistics()
+        self.assertEqual(stats["flagged_records"], 1)
+        self.assertGreater(stats["avg_price"], 5000)
+
+    def test_statistics_count_distinct_offers(self):
+        """测试去重报价数"""
+        records = [_make_record(i) for i in range(3)]
+        for record in records:
+            record.cluster_id = "c1"
+        self.db.insert_records(records)
+
+        stats = self.db.get_statistics()
+        self.assertEqual(stats["total_records"], 26)
+        self.assertEqual(stats["distinct_offers"], 24)
+
+    def test_insert_record_batch(self):
+        """测试列式记录批直接批量写入"""
+        from src.processor import RecordBatch
+
+        batch = RecordBatch.from_records(_make_record(i, group="列式群") for i in range(5))
+        self.assertEqual(len(self.db.insert_records(batch)), 5)
+        rows = self.db.query_records(group_name="列式群", limit=10)
+        self.assertEqual(sorted(row["price"] for row in rows), [5000, 5001, 5002, 5003, 5004])
+
+    def test_query_records_limit(self):
+        """测试 query_records 数量限制"""
+        self.assertEqual(len(self.db.query_records(limit=7)), 7)
+        self.assertEqual(len(self.db.query_records(action="BUY")), 0)
+
+
+class TestDimensionTables(unittest.TestCase):
+    """测试群组/发送者/商品维度表与兼容视图"""
+
+    def setUp(self):
+        from src.storage.database import DatabaseManager
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "market.db")
+        self.DatabaseManager = DatabaseManager
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _connect(self):
+        import sqlite3
+
+        return sqlite3.connect(self.path)
+
+    def test_names_stored_once_and_view_round_trips(self):
+        """测试名称只在维度表中存一份，视图还原文本列，视图写入经触发器转写"""
+        db = self.DatabaseManager(self.path)
+        records = [_make_record(i, group=f"群{i % 3}") for i in range(12)]
+        records[0].sender = None
+        db.insert_records(records)
+        # 新实例从空缓存开始，复用已有 ID
+        self.DatabaseManager(self.path).insert_records([_make_record(20, group="群1")])
+
+        conn = self._connect()
+        try:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM dim_groups").fetchone()[0], 3)
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM dim_senders").fetchone()[0], 1)
+            self.assertEqual(conn.execute("SELECT typeof(group_id), typeof(item_id) FROM market_facts LIMIT 1")
+                             .fetchone(), ("integer", "integer"))
+            plan = " ".join(row[3] for row in conn.execute(
+                "EXPLAIN QUERY PLAN SELECT * FROM market_data WHERE group_name = ?", ("群1",)))
+            self.assertIn("idx_market_facts_group", plan)
+
+            conn.execute("INSERT INTO market_data (capture_time, group_name, sender_nickname, item_category, price) "
+                         "VALUES ('2024-01-02T00:00:00', '新群', '新人', 'iPad', 100)")
+            conn.execute("UPDATE market_data SET item_category = 'iPad Pro' WHERE group_name = '新群'")
+            conn.commit()
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM dim_items").fetchone()[0], 3)
+        finally:
+            conn.close()
+
+        rows = db.query_records(group_name="群1", columns=["group_name", "sender_nickname", "item_category", "price"])
+        self.assertEqual(len(rows), 5)
+        self.assertEqual({(r["group_name"], r["sender_nickname"], r["item_category"]) for r in rows},
+                         {("群1", "测试", "iPhone 14")})
+        added = db.query_records(group_name="新群")[0]
+        self.assertEqual((added["item_category"], added["price_flag"]), ("iPad Pro", ""))
+        # 空名称保存为 NULL，不占用维度行
+        self.assertEqual({r["sender_nickname"] for r in db.query_records(group_name="群0")}, {None, "测试"})
+
+    def test_legacy_table_migrated(self):
+        """测试旧表迁移：记录与 ID 不变，自增序列延续，只迁移一次"""
+        from benchmarks.database import legacy_database
+
+        legacy_database(self.path, [_make_record(i, group=f"群{i % 2}") for i in range(10)])
+        conn = self._connect()
+        conn.execute("DELETE FROM market_data WHERE id = 10")
+        conn.commit()
+        before = conn.execute("SELECT * FROM market_data ORDER BY id").fetchall()
+        conn.close()
+
+        db = self.DatabaseManager(self.path)
+        conn = self._connect()
+        try:
+            self.assertEqual(conn.execute("SELECT type FROM sqlite_master WHERE name = 'market_data'").fetchone()[0],
+                             "view")
+            self.assertEqual(conn.execute("SELECT * FROM market_data ORDER BY id").fetchall(), before)
+        finally:
+            conn.close()
+
+        self.assertEqual(db.insert_record(_make_record(99)), 11)
+        self.assertEqual(self.DatabaseManager(self.path).get_statistics()["by_group"], {"群0": 5, "群1": 4, "测试群": 1})
+
+
+class TestQueryProfiler(unittest.TestCase):
+    """测试查询剖析与索引建议"""
+
+    def setUp(self):
+        from src.storage import DatabaseManager, QueryProfiler
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.profiler = QueryProfiler(slow_ms=0, keep=5)
+        self.db = DatabaseManager(os.path.join(self.tmpdir.name, "market.db"), profiler=self.profiler)
+        self.db.insert_records([_make_record(i, group=f"群{i % 3}") for i in range(30)])
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _statement(self, fragment):
+        matches = [key for key in self.profiler.statements if fragment in key]
+        self.assertEqual(len(matches), 1, matches)
+        return matches[0]
+
+    def test_statements_timed_with_plans(self):
+        """测试各种取结果方式都会入账，记录执行计划并标记临时 B 树与全表扫描"""
+        from src.storage.profiler import analyze_plan
+
+        self.db.query_records(group_name="群1", limit=5)
+        self.db.get_statistics()
+        next(self.db.iter_records(page_size=2))
+
+        paged = self._statement("WHERE group_name = ?")
+        self.assertEqual(self.profiler.statements[paged]["calls"], 1)
+        self.assertIn("idx_market_facts_group", " ".join(self.profiler.plans[paged]))
+        self.assertEqual(analyze_plan(self.profiler.plans[paged])["temp_btrees"], ["ORDER BY"])
+        self.assertEqual(self.profiler.statements[self._statement("SELECT COUNT(*) FROM market_facts WHERE")]["calls"], 1)
+        self.assertEqual(analyze_plan(self.profiler.plans[self._statement("SUM(price)")])["full_scans"], ["market_facts"])
+        self.assertEqual(len(self.profiler.slowest), 5)
+        self.assertGreaterEqual(self.profiler.slowest[0]["seconds"], self.profiler.slowest[-1]["seconds"])
+
+        path = os.path.join(self.tmpdir.name, "profile.json")
+        self.profiler.save(path)
+        self.profiler.save(path)
+        self.assertEqual(self.profiler.load(path)["statements"][paged]["calls"], 2)
+
+    def test_index_advice_and_report(self):
+        """测试按 等值 -> 排序 -> 范围 建议复合索引（映射到事实表），建立后不再建议"""
+        import sqlite3
+        from src.storage import DatabaseManager
+        from src.storage.profiler import format_report, read_schema, suggest_index
+
+        self.db.query_records(group_name="群1", limit=5)
+        self.db.get_price_trend(days=30)
+        key = self._statement("WHERE group_name = ?")
+        conn = sqlite3.connect(self.db.db_path)
+        try:
+            columns, indexes = read_schema(conn)
+            index, _ = suggest_index(key, self.profiler.plans[key], columns, indexes, DatabaseManager.VIEW_ALIASES)
+            self.assertEqual(index, "CREATE INDEX IF NOT EXISTS idx_market_facts_group_id_capture_time_id "
+                                    "ON market_facts(group_id, capture_time, id)")
+
+            report = format_report(self.profiler.snapshot(), conn, DatabaseManager.VIEW_ALIASES)
+            self.assertIn(index, report)
+            self.assertIn("DATE(message_time)", report)
+
+            conn.execute(index)
+            columns, indexes = read_schema(conn)
+            self.assertEqual(suggest_index(key, self.profiler.plans[key], columns, indexes,
+                                           DatabaseManager.VIEW_ALIASES)[0], None)
+        finally:
+            conn.close()
+
+
+def _make_config(tmpdir: str, extra: str = ""):
+    """在临时目录中生成配置文件"""
+    from src.config import Config
+
+    path = os.path.join(tmpdir, "config.yaml")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(
+            f"database:\n  path: {os.path.join(tmpdir, 'market.db')}\n"
+            f"reports:\n  output_dir: {os.path.join(tmpdir, 'output')}\n  auto_open: false\n"
+            f"export:\n  output_dir: {os.path.join(tmpdir, 'parquet')}\n"
+            f"  watermark_path: {os.path.join(tmpdir, 'watermark.json')}\n"
+            f"  batch_size: 10\n"
+            + extra
+        )
+    return Config(path)
+
+
+class TestColumnarExport(unittest.TestCase):
+    """测试列式加载与 Parquet 导出"""
+
+    def setUp(self):
+        from src.storage.database import DatabaseManager
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.config = _make_config(self.tmpdir.name)
+        self.db = DatabaseManager(self.config.database.path)
+        self.db.insert_records(
+            [_make_record(i, group="A群" if i % 2 else "B群") for i in range(25)]
+        )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_load_columns(self):
+        """测试 NumPy 列式加载"""
+        from src.storage.export import load_columns, load_arrow_table
+
+        columns = load_columns(self.db, columns=["price", "group_name"], limit=12)
+
+        self.assertEqual(list(columns), ["price", "group_name"])
+        self.assertEqual(columns["price"].dtype.kind, "f")
+        self.assertEqual(len(columns["price"]), 12)
+
+        table = load_arrow_table(self.db, columns=["id", "quantity"], group_name="A群")
+        self.assertEqual(table.num_rows, 12)
+
+    def test_incremental_partitioned_export(self):
+        """测试按水位增量导出分区 Parquet"""
+        import pyarrow.parquet as pq
+        from src.storage.export import ParquetExporter
+
+        exporter = ParquetExporter(self.config, self.db)
+        result = exporter.export()
+        self.assertEqual(result["rows"], 25)
+        self.assertEqual(result["chunks"], 3)
+
+        self.assertEqual(exporter.export()["rows"], 0)
+
+        self.db.insert_records([_make_record(99)])
+        self.assertEqual(ParquetExporter(self.config, self.db).export()["rows"], 1)
+
+        table = pq.read_table(exporter.output_dir)
+        self.assertEqual(table.num_rows, 26)
+        self.assertEqual(set(table.column("group").to_pylist()), {"A群", "B群", "测试群"})
+
+    def test_export_picks_up_late_rows_with_older_capture_time(self):
+        """测试晚写入但 capture_time 较早的记录（导入/重放）仍会被增量导出"""
+        from src.storage.export import ParquetExporter
+
+        exporter = ParquetExporter(self.config, self.db)
+        self.assertEqual(exporter.export()["rows"], 25)
+
+        backfilled = _make_record(0)
+        backfilled.capture_time = "2023-06-01T08:00:00"
+        self.db.insert_records([backfilled])
+        self.assertEqual(exporter.export()["rows"], 1)
+        self.assertEqual(exporter.export()["rows"], 0)
+
+
+class TestMonthlyPartitions(unittest.TestCase):
+    """测试月度分区与 raw_text 归档"""
+
+    def setUp(self):
+        from src.storage.database import DatabaseManager
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.tmpdir.name, "market.db"))
+
+        records = []
+        for month in (1, 2, 3):
+            for i in range(6):
+                record = _make_record(i, group=f"{month}月群")
+                record.capture_time = f"2024-{month:02d}-0{i + 1}T12:00:00"
+                records.append(record)
+        self.db.insert_records(records)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _rotate(self):
+        from datetime import datetime
+
+        return self.db.partitions.rotate(hot_months=1, now=datetime(2024, 3, 15))
+
+    def test_rotate_moves_cold_months(self):
+        """测试冷数据迁移到分区并可透明查询"""
+        moved = self._rotate()
+
+        self.assertEqual(moved, {"2024-01": 6, "2024-02": 6})
+        self.assertEqual(self.db.partitions.months(), ["2024-01", "2024-02"])
+
+        rows = list(self.db.iter_records(page_size=4))
+        keys = [(row["capture_time"], row["id"]) for row in rows]
+        self.assertEqual(len(rows), 18)
+        self.assertEqual(keys, sorted(keys, reverse=True))
+        self.assertTrue(all(row["raw_text"].startswith("出iPhone") for row in rows))
+
+        stats = self.db.get_statistics()
+        self.assertEqual(stats["total_records"], 18)
+        self.assertEqual(stats["by_group"]["1月群"], 6)
+
+    def test_raw_text_is_compressed(self):
+        """测试分区中 raw_text 以压缩块存储"""
+        import sqlite3
+        from src.storage.partitions import unpack_text
+
+        self._rotate()
+        conn = sqlite3.connect(self.db.partitions.partition_path("2024-01"))
+        raw_text, blob = conn.execute(
+            "SELECT raw_text, raw_blob FROM market_data LIMIT 1"
+        ).fetchone()
+        conn.close()
+
+        self.assertIsNone(raw_text)
+        self.assertTrue(unpack_text(blob).startswith("出iPhone"))
+
+    def test_hot_window_prunes_partitions(self):
+        """测试热窗口查询只触及近期分区，联合视图可用"""
+        self._rotate()
+
+        self.assertEqual(self.db.partitions.months_since("2024-02-10"), ["2024-02"])
+
+        conn = self.db._connect()
+        try:
+            source = self.db.partitions.attach_union_view(conn, "2024-02-01")
+            count = conn.execute(f"SELECT COUNT(*) FROM {source}").fetchone()[0]
+        finally:
+            conn.close()
+        self.assertEqual(source, "market_data_all")
+        self.assertEqual(count, 12)
+
+    def test_reader_opens_partitions_read_only(self):
+        """测试只读管理器读取分区时不修改分区文件，且无法经挂载写入"""
+        import sqlite3
+
+        self._rotate()
+        # 模拟结构落后于主库的旧分区：只读读取不补列，缺失的列按 NULL 读取
+        path = self.db.partitions.partition_path("2024-01")
+        conn = sqlite3.connect(path)
+        conn.execute("ALTER TABLE market_data DROP COLUMN cluster_id")
+        conn.commit()
+        conn.close()
+        before = os.stat(path).st_mtime_ns, os.path.getsize(path)
+
+        reader = self.db.reader()
+        rows = list(reader.iter_records(columns=["cluster_id"], page_size=4))
+        self.assertEqual(len(rows), 18)
+        self.assertEqual(sum(row["cluster_id"] is None for row in rows), 6)
+        self.assertEqual(reader.get_statistics()["total_records"], 18)
+
+        conn = reader._connect()
+        try:
+            source = reader.partitions.attach_union_view(conn, "2024-01-01")
+            self.assertEqual(conn.execute(f"SELECT COUNT(*) FROM {source}").fetchone()[0], 18)
+            with self.assertRaises(sqlite3.OperationalError):
+                conn.execute("DELETE FROM p_202401.market_data")
+        finally:
+            conn.close()
+        self.assertEqual((os.stat(path).st_mtime_ns, os.path.getsize(path)), before)
+
+
+class _FakeCompletions:
+    """模拟 chat.completions，按调用次数决定成功或失败"""
+
+    def __init__(self, fail_on=None):
+        self.calls = 0
+        self.fail_on = fail_on
+
+    def create(self, model, messages, **kwargs):
+        import json
+        from types import SimpleNamespace
+
+        self.calls += 1
+        if self.fail_on is not None and self.calls == self.fail_on:
+            raise RuntimeError("模拟 LLM 故障")
+        lines = [line for line in messages[-1]["content"].splitlines() if not line.startswith("#")]
+        content = json.dumps([
+            {"id": number, "action": "SELL", "item": "iPhone 14", "specs": "256G", "price": "5k", "quantity": 1}
+            for number, _ in enumerate(lines, 1)
+        ])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class TestReplay(unittest.TestCase):
+    """测试重放解析"""
+
+    def setUp(self):
+        from src.storage.database import DatabaseManager
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.config = _make_config(
+            self.tmpdir.name,
+            f"llm:\n  api_key: test\n"
+            f"replay:\n  batch_size: 3\n  concurrency: 2\n"
+            f"  cache_path: {os.path.join(self.tmpdir.name, 'cache.db')}\n"
+        )
+        self.db = DatabaseManager(self.config.database.path)
+        self.db.insert_records([_make_record(i) for i in range(10)])
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _runner(self, completions):
+        from src.processor import LLMClient, ReplayRunner
+
+        client = LLMClient(self.config)
+        fake = type("FakeClient", (), {})()
+        fake.chat = type("FakeChat", (), {})()
+        fake.chat.completions = completions
+        client.router.primary.client = fake
+        return ReplayRunner(self.config, self.db, llm_client=client)
+
+    def test_resume_after_failure(self):
+        """测试失败后从检查点继续，不重复写入"""
+        first = self._runner(_FakeCompletions(fail_on=3)).run(version="v2", concurrency=1)
+        self.assertFalse(first["completed"])
+        self.assertEqual(first["rows"], 6)
+        self.assertEqual(self.db.get_checkpoint("v2")["processed"], 6)
+
+        second = self._runner(_FakeCompletions()).run(version="v2")
+        self.assertTrue(second["completed"])
+        self.assertEqual(second["rows"], 4)
+
+        extractions = self.db.query_extractions("v2")
+        self.assertEqual(len(extractions), 10)
+        self.assertTrue(all(row["price"] == 5000 for row in extractions))
+        # 原始记录不被改写
+        self.assertEqual(self.db.get_statistics()["total_records"], 10)
+
+    def test_cache_avoids_repeat_calls(self):
+        """测试同一输入重放时命中响应缓存"""
+        self._runner(_FakeCompletions()).run(version="a")
+
+        completions = _FakeCompletions()
+        stats = self._runner(completions).run(version="b")
+        self.assertEqual(stats["rows"], 10)
+        self.assertEqual(completions.calls, 0)
+
+    def test_merges_rows_of_same_message(self):
+        """测试同一消息解析出的多条记录只重放一次"""
+        # 与最后一条记录同一消息、同一采集时间，键集顺序上相邻
+        self.db.insert_records([_make_record(9)])
+
+        completions = _FakeCompletions()
+        stats = self._runner(completions).run(version="v3")
+        self.assertEqual(stats["rows"], 11)
+        self.assertEqual(len(self.db.query_extractions("v3")), 10)
+
+
+class TestMessageQueue(unittest.TestCase):
+    """测试原始消息队列"""
+
+    def setUp(self):
+        from src.storage import DatabaseManager, MessageQueue
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.tmpdir.name, "market.db"))
+        self.queue = MessageQueue(self.db, lease_seconds=60, max_attempts=2, retry_delay=0)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _messages(self, count: int):
+        from src.collector import Message
+
+        return [Message(sender="卖家", time=f"10:{i:02d}", content=f"出iPhone 14 {i}", group="测试群")
+                for i in range(count)]
+
+    def test_enqueue_is_idempotent(self):
+        """测试重复采集的消息只入队一次"""
+        self.assertEqual(self.queue.enqueue(self._messages(5)), 5)
+        self.assertEqual(self.queue.enqueue(self._messages(7)), 2)
+        self.assertEqual(self.queue.stats()["pending"], 7)
+
+    def test_same_message_on_another_day_is_kept(self):
+        """测试不同日期同一时刻重发的相同报价都会入队"""
+        self.assertEqual(self.queue.enqueue(self._messages(1), capture_time="2024-05-01T10:00:30"), 1)
+        self.assertEqual(self.queue.enqueue(self._messages(1), capture_time="2024-05-01T18:00:00"), 0)
+        self.assertEqual(self.queue.enqueue(self._messages(1), capture_time="2024-05-02T10:00:30"), 1)
+        self.assertEqual(self.queue.stats()["pending"], 2)
+
+    def test_complete_commits_records_with_state(self):
+        """测试解析结果与处理状态一起提交"""
+        self.queue.enqueue(self._messages(3))
+        token, claimed = self.queue.claim(10)
+        self.assertEqual(len(claimed), 3)
+        self.assertEqual(self.queue.claim(10)[1], [])
+
+        ids = [message_id for message_id, _ in claimed]
+        record_ids = self.queue.complete(token, ids, [_make_record(0), _make_record(1)])
+        self.assertEqual(len(record_ids), 2)
+        rows = {row["id"]: row["price"] for row in self.db.iter_records()}
+        self.assertEqual([rows[record_id] for record_id in record_ids], [5000, 5001])
+        self.assertEqual(self.queue.stats()["done"], 3)
+        self.assertEqual(self.db.get_statistics()["total_records"], 2)
+
+    def test_stale_lease_cannot_commit(self):
+        """测试租约过期被重新领取后，旧的处理者无法重复入库"""
+        self.queue.enqueue(self._messages(2))
+        old_token, claimed = self.queue.claim(10)
+
+        self.queue.lease_seconds = -1
+        new_token, reclaimed = self.queue.claim(10)
+        self.assertEqual([m for m, _ in reclaimed], [m for m, _ in claimed])
+
+        ids = [message_id for message_id, _ in claimed]
+        self.assertIsNone(self.queue.complete(old_token, ids, [_make_record(0)]))
+        self.assertEqual(len(self.queue.complete(new_token, ids, [_make_record(0)])), 1)
+        self.assertEqual(self.db.get_statistics()["total_records"], 1)
+
+    def test_failed_batches_retry_then_give_up(self):
+        """测试失败消息退回队列，超过尝试次数后标记失败"""
+        self.queue.enqueue(self._messages(2))
+
+        token, claimed = self.queue.claim(10)
+        ids = [message_id for message_id, _ in claimed]
+        self.assertEqual(self.queue.fail(token, ids, "timeout"), 0)
+        self.assertEqual(self.queue.stats()["pending"], 2)
+
+        token, claimed = self.queue.claim(10)
+        self.assertEqual(self.queue.fail(token, ids, "timeout"), 2)
+        self.assertEqual(self.queue.stats()["failed"], 2)
+
+        self.assertEqual(self.queue.retry_failed(), 2)
+        self.assertEqual(len(self.queue.claim(10)[1]), 2)
+
+    def test_failed_batch_backs_off(self):
+        """测试失败的批次在退避到期前不会被再次领取"""
+        self.queue.retry_delay = 60
+        self.queue.enqueue(self._messages(3))
+
+        token, claimed = self.queue.claim(2)
+        self.queue.fail(token, [message_id for message_id, _ in claimed], "bad batch")
+        self.assertEqual(self.queue.claimable(), 1)
+        self.assertEqual([m for m, _ in self.queue.claim(10)[1]], [3])
+        self.assertEqual(self.queue.claim(10)[1], [])
+
+        # 退避到期后可再次领取
+        conn = self.db._connect()
+        with conn:
+            conn.execute("UPDATE raw_messages SET next_attempt_at = '2000-01-01T00:00:00' WHERE id = 1")
+        conn.close()
+        self.assertEqual([m for m, _ in self.queue.claim(10)[1]], [1])
+
+    def test_expired_leases_are_claimable(self):
+        """测试崩溃遗留、租约已过期的处理中消息计入可领取数"""
+        self.queue.enqueue(self._messages(2))
+        self.queue.claim(10)
+        self.assertEqual(self.queue.stats()["pending"], 0)
+        self.assertEqual(self.queue.claimable(), 0)
+
+        self.queue.lease_seconds = -1
+        self.assertEqual(self.queue.claimable(), 2)
+        self.assertEqual(len(self.queue.claim(10)[1]), 2)
+
+
+
+class TestReportWriters(unittest.TestCase):
+    """测试各格式的会话报表"""
+
+    def setUp(self):
+        from src.storage.reports import ReportGenerator
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.generator = ReportGenerator(_make_config(self.tmpdir.name))
+        self.records = [_make_record(i, group="AB"[i % 2]) for i in (3, 1, 2)]
+        self.records[0].raw_text = "<script>alert(1)</script>"
+        self.records[1].price_flag = "outlier"
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_csv_and_jsonl_sorted_by_price(self):
+        """测试 CSV / JSON Lines 按价格升序，含格式化价格列"""
+        import csv
+        import json
+
+        path = self.generator.generate_session_report(self.records, fmt="csv")
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0][6:9], ["价格", "价格(格式化)", "数量"])
+        self.assertEqual([row[6] for row in rows[1:]], ["5001.0", "5002.0", "5003.0"])
+        self.assertEqual(rows[1][7], "5.0k")
+
+        path = self.generator.generate_session_report(self.records, fmt="jsonl")
+        with open(path, encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual([line["price"] for line in lines], [5001, 5002, 5003])
+        self.assertEqual(lines[2]["raw_text"], "<script>alert(1)</script>")
+
+    def test_html_and_excel_include_summary(self):
+        """测试 HTML 转义单元格并附带统计表，Excel 包含摘要与按群组统计"""
+        from openpyxl import load_workbook
+
+        path = self.generator.generate_session_report(self.records, fmt="html")
+        with open(path, encoding="utf-8") as f:
+            page = f.read()
+        self.assertIn("&lt;script&gt;", page)
+        self.assertNotIn("<script>", page)
+        self.assertIn("统计摘要", page)
+
+        path = self.generator.generate_session_report(self.records, fmt="xlsx")
+        workbook = load_workbook(path, read_only=True)
+        self.assertEqual(workbook.sheetnames, ["交易记录", "统计摘要", "按群组统计"])
+        summary = dict(workbook["统计摘要"].iter_rows(min_row=2, values_only=True))
+        self.assertEqual((summary["总记录数"], summary["异常价格"], summary["平均价格"]), (3, 1, 5002.5))
+        workbook.close()
+
+        with self.assertRaises(ValueError):
+            self.generator.generate_session_report(self.records, fmt="pdf")
+
+
+class _BlockingGenerator:
+    """第一次生成时阻塞，直到测试放行"""
+
+    def __init__(self):
+        import threading
+
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.sessions = []
+
+    def generate_session_report(self, records, session_name=None):
+        self.started.set()
+        self.release.wait(5)
+        if session_name == "bad":
+            raise RuntimeError("disk full")
+        self.sessions.append(session_name)
+        return f"{session_name}.xlsx"
+
+
+class TestReportWorker(unittest.TestCase):
+    """测试后台报表生成"""
+
+    def setUp(self):
+        from src.metrics import metrics
+
+        metrics.reset()
+
+    def test_submit_does_not_block_and_coalesces(self):
+        """测试提交立即返回，积压的会话只生成最新一份，并记录指标"""
+        import time
+        from src.metrics import metrics
+        from src.storage import ReportWorker
+
+        generator = _BlockingGenerator()
+        worker = ReportWorker(generator)
+
+        start = time.perf_counter()
+        worker.submit([_make_record(0)], "s1")
+        self.assertTrue(generator.started.wait(5))
+        for name in ("s2", "s3", "s4"):
+            worker.submit([_make_record(0)], name)
+        self.assertLess(time.perf_counter() - start, 1)
+
+        generator.release.set()
+        self.assertTrue(worker.close(timeout=5))
+        self.assertEqual(generator.sessions, ["s1", "s4"])
+        self.assertEqual(worker.last_path, "s4.xlsx")
+        self.assertEqual(metrics.counter("reports_generated"), 2)
+        self.assertEqual(metrics.counter("reports_coalesced"), 2)
+        self.assertEqual(metrics.histogram("report_seconds")["count"], 2)
+
+    def test_failure_is_counted(self):
+        """测试生成失败不终止线程"""
+        from src.metrics import metrics
+        from src.storage import ReportWorker
+
+        generator = _BlockingGenerator()
+        generator.release.set()
+        worker = ReportWorker(generator)
+        worker.submit([_make_record(0)], "bad")
+        self.assertTrue(worker.flush(timeout=5))
+        worker.submit([_make_record(0)], "ok")
+        self.assertTrue(worker.close(timeout=5))
+        self.assertEqual(generator.sessions, ["ok"])
+        self.assertEqual(metrics.counter("reports_failed"), 1)
+
+
+class TestQueryService(unittest.TestCase):
+    """测试本地查询服务"""
+
+    def setUp(self):
+        from src.storage import DatabaseManager, QueryServer, QueryService
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.tmpdir.name, "market.db"))
+        self.db.insert_records([_make_record(i) for i in range(5)])
+        self.server = QueryServer(QueryService(self.db), port=0)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.close()
+        self.tmpdir.cleanup()
+
+    def _get(self, path):
+        import json
+        import urllib.error
+        import urllib.request
+
+        try:
+            with urllib.request.urlopen(self.server.url + path, timeout=5) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def test_endpoints(self):
+        """测试最新报价、搜索、统计与参数错误"""
+        status, offers = self._get("/offers?limit=3&action=sell")
+        self.assertEqual(status, 200)
+        self.assertEqual([offer["price"] for offer in offers], [5004, 5003, 5002])
+
+        self.assertEqual(len(self._get("/search?q=iphone")[1]), 5)
+        self.assertEqual(self._get("/search?q=galaxy")[1], [])
+        self.assertEqual(self._get("/stats")[1]["total_records"], 5)
+        self.assertEqual(self._get("/trend?days=3")[0], 200)
+
+        self.assertEqual(self._get("/offers?limit=abc")[0], 400)
+        self.assertEqual(self._get("/search")[0], 400)
+        self.assertEqual(self._get("/missing")[0], 404)
+
+    def test_cache_invalidated_by_writes(self):
+        """测试重复查询命中缓存，本进程写入与其他连接的写入都会使缓存失效"""
+        import sqlite3
+
+        service = self.server.service
+        first = service.query("/offers", {"limit": "1"})
+        self.assertEqual(service.query("/offers", {"limit": "1"}), first)
+        self.assertEqual(service.cache.hits, 1)
+
+        record = _make_record(9)
+        record.price = 9999
+        self.db.insert_records([record])
+        self.assertIn(b"9999", service.query("/offers", {"limit": "1"}))
+
+        # 其他进程的写入通过 PRAGMA data_version 发现
+        conn = sqlite3.connect(self.db.db_path)
+        conn.execute("UPDATE market_data SET price = 7777 WHERE price = 9999")
+        conn.commit()
+        conn.close()
+        self.assertIn(b"7777", service.query("/offers", {"limit": "1"}))
+        self.assertEqual(service.cache.hits, 1)
+
+    def test_reader_is_read_only(self):
+        """测试查询服务使用的连接无法写入"""
+        import sqlite3
+
+        conn = self.server.service.reader._connect()
+        try:
+            with self.assertRaises(sqlite3.OperationalError):
+                conn.execute("DELETE FROM market_data")
+        finally:
+            conn.close()
+
+if __name__ == "__main__":
+    unittest.main()